@@ -0,0 +1,208 @@
+import contextvars
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+# Degradation levels, from a full turn to turning requests away. Each level also applies the ones before it.
+FULL = 0
+DEFER_IMAGE = 1  # Generate the image on the background workers instead of inside the request
+CACHED_IMAGE = 2  # No new image: reuse the story's latest image (or a cached introduction's)
+SHORT_TEXT = 3  # Also ask for shorter story text
+REJECT = 4  # Answer 503 with Retry-After
+LEVELS = ('full', 'defer_image', 'cached_image', 'short_text', 'reject')
+
+# Tasks whose output the short_text level shortens: the story text itself, not its choices or image prompt
+SHORTENED_TASKS = ('introduction', 'continuation', 'modification')
+
+# Level of the admitted turn running in this context. Coroutines the turn runs on the background event
+# loop see it too; speculation, summary and image workers do not, so their calls are never shortened.
+_turn_level = contextvars.ContextVar('turn_level', default=FULL)
+
+
+class OverloadedError(Exception):
+    """Raised when a turn is not admitted; `retry_after` is the suggested wait in seconds"""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(f"Turn not admitted ({reason}), retry after {retry_after}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ('session_id', 'granted', 'since')
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.granted = False
+        self.since = time.monotonic()
+
+
+class AdmissionController:
+    """Bounds the story turns running at once and degrades them step by step as load grows.
+
+    At most `max_in_flight` turns run at once. Further turns wait for a slot, and free
+    slots go to the waiting sessions in turn, so one session's burst cannot starve the
+    others; a session may have at most `per_session` turns running or waiting. Load is
+    the larger of (running + waiting) / max_in_flight and the queue wait over the last
+    `window` seconds relative to `target_wait`. Each threshold in `thresholds` that the
+    load reaches moves new turns one level down LEVELS; past the last one they are
+    rejected, as are turns that waited `max_wait` seconds for a slot.
+    """
+
+    def __init__(self, max_in_flight=16, per_session=2, max_wait=10, target_wait=1.0,
+                 thresholds=(0.75, 1.0, 1.5, 2.0), short_tokens=0.5, window=10, metrics=None):
+        if len(thresholds) != REJECT:
+            raise ValueError(f"Expected {REJECT} thresholds, one per level after 'full'")
+        self.max_in_flight = max_in_flight
+        self.per_session = per_session
+        self.max_wait = max_wait
+        self.target_wait = target_wait
+        self.thresholds = tuple(thresholds)
+        self.short_tokens = short_tokens
+        self.window = window
+        self.running = 0
+        self.admitted = [0] * REJECT  # Turns admitted at each level
+        self.rejected = {}  # reason -> count
+        self._sessions = {}  # session id -> turns running or waiting
+        self._waiting = OrderedDict()  # session id -> deque of _Waiter; served round-robin
+        self._queued = 0
+        self._waits = deque()  # (time.monotonic(), seconds waited) of recent admissions
+        self._turn_seconds = None  # Moving average of a turn's duration, for Retry-After
+        self._cond = threading.Condition()
+
+        if metrics is not None:
+            metrics.gauge('admission_turns', "Story turns running and waiting for a slot",
+                          lambda: [({'state': 'running'}, self.running), ({'state': 'waiting'}, self._queued)])
+            metrics.gauge('admission_level', "Degradation level new turns are admitted at (0 is full)",
+                          lambda: [({}, self.level())])
+
+    @contextmanager
+    def admit(self, session_id):
+        """Run the enclosed turn in a slot, yielding its degradation level; raises OverloadedError instead"""
+        level = self._acquire(session_id)
+        token = _turn_level.set(level)
+        start = time.monotonic()
+        try:
+            yield level
+        finally:
+            _turn_level.reset(token)
+            self._release(session_id, time.monotonic() - start)
+
+    def level(self):
+        """The degradation level a turn arriving now would get"""
+        with self._cond:
+            return self._level(extra=1)
+
+    def token_scale(self, task):
+        """Fraction of a task's max_tokens to ask for, set by the level the calling turn was admitted at"""
+        if task in SHORTENED_TASKS and _turn_level.get() >= SHORT_TEXT:
+            return self.short_tokens
+        return 1.0
+
+    def stats(self):
+        """Current load and admission counters"""
+        with self._cond:
+            return {
+                'running': self.running,
+                'waiting': self._queued,
+                'level': LEVELS[self._level(extra=1)],
+                'load': round(self._load(extra=1), 3),
+                'admitted': dict(zip(LEVELS, self.admitted)),
+                'rejected': dict(self.rejected),
+                'retry_after': self._retry_after()
+            }
+
+    def _acquire(self, session_id):
+        with self._cond:
+            if self._level(extra=1) >= REJECT:
+                self._reject('overloaded')
+            if self._sessions.get(session_id, 0) >= self.per_session:
+                self._reject('session_limit')
+
+            waiter = _Waiter(session_id)
+            self._sessions[session_id] = self._sessions.get(session_id, 0) + 1
+            self._waiting.setdefault(session_id, deque()).append(waiter)
+            self._queued += 1
+            self._grant()
+
+            deadline = waiter.since + self.max_wait
+            while not waiter.granted:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._withdraw(waiter)
+                    self._reject('timeout')
+                self._cond.wait(remaining)
+
+            now = time.monotonic()
+            self._waits.append((now, now - waiter.since))
+            # The level reflects the load the turn was admitted into, counting itself
+            level = min(self._level(extra=0), SHORT_TEXT)
+            self.admitted[level] += 1
+            return level
+
+    def _release(self, session_id, seconds):
+        with self._cond:
+            self.running -= 1
+            self._leave(session_id)
+            average = self._turn_seconds
+            self._turn_seconds = seconds if average is None else 0.8 * average + 0.2 * seconds
+            self._grant()
+
+    def _grant(self):
+        """Hand free slots to waiting sessions, one session at a time"""
+        granted = False
+        while self.running < self.max_in_flight and self._waiting:
+            session_id, waiters = next(iter(self._waiting.items()))
+            waiter = waiters.popleft()
+            if waiters:
+                self._waiting.move_to_end(session_id)
+            else:
+                del self._waiting[session_id]
+            waiter.granted = True
+            self._queued -= 1
+            self.running += 1
+            granted = True
+        if granted:
+            self._cond.notify_all()
+
+    def _withdraw(self, waiter):
+        waiters = self._waiting[waiter.session_id]
+        waiters.remove(waiter)
+        if not waiters:
+            del self._waiting[waiter.session_id]
+        self._queued -= 1
+        self._leave(waiter.session_id)
+
+    def _leave(self, session_id):
+        count = self._sessions[session_id] - 1
+        if count:
+            self._sessions[session_id] = count
+        else:
+            del self._sessions[session_id]
+
+    def _load(self, extra):
+        now = time.monotonic()
+        while self._waits and now - self._waits[0][0] > self.window:
+            self._waits.popleft()
+        waits = [seconds for _, seconds in self._waits]
+        # Turns still waiting count with their wait so far, so a stalled queue raises the load right away
+        waits += [now - waiters[0].since for waiters in self._waiting.values()]
+        queue_wait = sum(waits) / len(waits) if waits else 0.0
+        occupancy = (self.running + self._queued + extra) / self.max_in_flight
+        return max(occupancy, queue_wait / self.target_wait)
+
+    def _level(self, extra):
+        load = self._load(extra)
+        return sum(1 for threshold in self.thresholds if load >= threshold)
+
+    def _retry_after(self):
+        """Seconds until the turns ahead have likely finished, at least one"""
+        turn_seconds = self._turn_seconds if self._turn_seconds is not None else self.target_wait
+        rounds = (self.running + self._queued) / self.max_in_flight
+        return max(1, math.ceil(rounds * turn_seconds))
+
+    def _reject(self, reason):
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        raise OverloadedError(reason, self._retry_after())
@@ -1,23 +1,240 @@
-from flask import Flask, render_template, request, jsonify, session
+from flask import Flask, render_template, request, jsonify, session, Response, abort, send_file, url_for, g
 import os
+import hmac
 from dotenv import load_dotenv
 import json
+import uuid
 from story_generator import StoryGenerator
+from async_story_generator import AsyncStoryGenerator, BlockingStoryGenerator
+from image_jobs import ImageJobQueue, QueueFullError
+from streaming import sse_event
+from session_store import create_session_store
+from context_window import ContextWindow
+from speculation import Speculator
+from model_router import ModelRouter, load_routes
+from admission import AdmissionController, OverloadedError, FULL, DEFER_IMAGE, CACHED_IMAGE, LEVELS
+from metrics import Metrics, NULL_METRICS
+from single_flight import SingleFlight
+from story_store import create_story_store
+from story_history import StoryHistory
+from image_store import MIME_TYPES
+from components import response_cache_from_env, rate_limiter_from_env, resilience_from_env, image_store_from_env
+from profiling import SamplingProfiler, MemoryProfiler, largest
+import assets
 
 # Load environment variables
 load_dotenv()
 
+def load_secret_key(path):
+    """SECRET_KEY from the environment, else a random key created once in `path` and reused after that."""
+    key = os.getenv('SECRET_KEY')
+    if key:
+        return key
+    if not os.path.exists(path):
+        # Write to a private temp file and link it into place, so concurrent first starts agree on one key
+        temp = f"{path}.{os.getpid()}.tmp"
+        fd = os.open(temp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(os.urandom(32))
+        try:
+            os.link(temp, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.unlink(temp)
+    with open(path, 'rb') as f:
+        return f.read()
+
 # Initialize Flask app
 app = Flask(__name__)
-app.secret_key = os.urandom(24)  # For session management
+# Session cookies must verify in every worker process and across restarts
+app.secret_key = load_secret_key(os.getenv('SECRET_KEY_FILE', '.secret_key'))
+
+# Return story text as soon as it is ready and generate images in the background
+app.config['ASYNC_IMAGES'] = os.getenv('ASYNC_IMAGES', 'false').lower() == 'true'
+
+# Offer the Server-Sent Events routes to the page so story text appears as it is written
+app.config['STREAM_TURNS'] = os.getenv('STREAM_TURNS', 'false').lower() == 'true'
+
+# Serve the page's CSS and JavaScript as minified, fingerprinted bundles with gzip/brotli variants
+# built ahead of time (see assets.py); rebuilt here when the sources changed since the last build
+asset_dir = os.getenv('ASSET_DIR', os.path.join(app.static_folder, 'dist'))
+asset_manifest = None
+if os.getenv('ASSET_PIPELINE', 'true').lower() == 'true':
+    try:
+        asset_manifest = assets.load_or_build(app.static_folder, asset_dir)
+    except Exception as e:
+        print(f"Error building static assets, serving the source files instead: {e}")
+asset_files = {asset['file']: asset for asset in asset_manifest['assets'].values()} if asset_manifest else {}
+
+# Background workers for deferred image generation
+image_jobs = ImageJobQueue(
+    workers=int(os.getenv('IMAGE_WORKERS', '2')),
+    max_queue=int(os.getenv('IMAGE_QUEUE_SIZE', '32')),
+    timeout=float(os.getenv('IMAGE_JOB_TIMEOUT', '60'))
+)
+
+# Story contexts live server-side; the session cookie only carries their id
+session_store = create_session_store(
+    os.getenv('SESSION_STORE', 'memory'),
+    path=os.getenv('SESSION_DB', 'sessions.db'),
+    ttl=int(os.getenv('SESSION_TTL', '3600')),
+    max_entries=int(os.getenv('SESSION_MAX_ENTRIES', '10000'))
+)
+
+# Prompts carry a rolling summary plus the latest turns instead of the whole history
+context_window = None
+if os.getenv('CONTEXT_WINDOW', 'true').lower() == 'true':
+    context_window = ContextWindow(
+        session_store,
+        recent_turns=int(os.getenv('CONTEXT_RECENT_TURNS', '6')),
+        token_budget=int(os.getenv('CONTEXT_TOKEN_BUDGET', '2000')),
+        fold_turns=int(os.getenv('CONTEXT_FOLD_TURNS', '4'))
+    )
+
+# Durable story archive with append-only turn records, for listing and resuming stories
+story_store = create_story_store(os.getenv('STORY_STORE', 'off'), path=os.getenv('STORY_DB', 'stories.db'))
+
+# Reuse introductions and image prompts for repeated story preferences (opt-in: repeat players see repeat stories)
+response_cache = response_cache_from_env()
+
+# Stage timings and token usage, exposed at /metrics in the Prometheus text format
+metrics = Metrics() if os.getenv('METRICS', 'false').lower() == 'true' else NULL_METRICS
+
+# Token buckets keeping every OpenAI call under the organization's RPM/TPM limits; background work yields
+rate_limiter = rate_limiter_from_env(metrics)
+
+# Deadlines, retries and circuit breakers for every OpenAI call
+resilience = resilience_from_env(rate_limiter)
+
+# Opt-in: bound the story turns running at once in this worker process and degrade them as running turns
+# and queue waits grow: images move to the background workers, then the story's last image is reused, then
+# story text gets shorter, and finally turns are turned away with 503 and Retry-After. Slots are handed to
+# waiting sessions in turn, and one session may hold at most ADMISSION_PER_SESSION of them.
+admission = None
+if os.getenv('ADMISSION_CONTROL', 'false').lower() == 'true':
+    admission = AdmissionController(
+        max_in_flight=int(os.getenv('ADMISSION_MAX_IN_FLIGHT', '16')),
+        per_session=int(os.getenv('ADMISSION_PER_SESSION', '2')),
+        max_wait=float(os.getenv('ADMISSION_MAX_WAIT', '10')),
+        target_wait=float(os.getenv('ADMISSION_TARGET_WAIT', '1')),
+        thresholds=[float(value) for value in os.getenv('ADMISSION_THRESHOLDS', '0.75,1,1.5,2').split(',')],
+        short_tokens=float(os.getenv('ADMISSION_SHORT_TOKENS', '0.5')),
+        metrics=metrics
+    )
+
+# Model, max_tokens, temperature and timeout per task. MODEL_ROUTES (inline JSON or a JSON file) overrides
+# the defaults in model_router.py; a route with "fallback" and "slo" moves to the fallback model while
+# the primary's recent p95 latency is over the SLO
+model_router = ModelRouter(
+    load_routes(os.getenv('MODEL_ROUTES')),
+    window=int(os.getenv('MODEL_SLO_WINDOW', '20')),
+    probe_interval=float(os.getenv('MODEL_PROBE_INTERVAL', '30')),
+    metrics=metrics,
+    token_scale=admission.token_scale if admission is not None else None
+)
 
-# Initialize story generator
-story_generator = StoryGenerator()
+# Have story responses describe their own illustration, saving an image prompt round-trip per turn
+inline_image_prompt = os.getenv('INLINE_IMAGE_PROMPT', 'true').lower() == 'true'
+
+# Opt-in: download each generated image once and serve it from /images/ instead of the expiring upstream URL
+image_store = image_store_from_env()
+
+# Initialize story generator. With ASYNC_OPENAI the worker threads share one event loop
+# and one pooled async client instead of each opening its own connections. The routes
+# stay synchronous, so each in-flight turn still holds a worker thread while it waits.
+if os.getenv('ASYNC_OPENAI', 'false').lower() == 'true':
+    story_generator = BlockingStoryGenerator(
+        AsyncStoryGenerator(
+            max_concurrency=int(os.getenv('OPENAI_MAX_CONCURRENCY', '100')),
+            context_window=context_window,
+            cache=response_cache,
+            inline_image_prompt=inline_image_prompt,
+            resilience=resilience,
+            metrics=metrics,
+            image_store=image_store,
+            router=model_router
+        )
+    )
+else:
+    story_generator = StoryGenerator(
+        context_window=context_window,
+        cache=response_cache,
+        inline_image_prompt=inline_image_prompt,
+        resilience=resilience,
+        metrics=metrics,
+        image_store=image_store,
+        router=model_router
+    )
+
+# Opt-in: pre-generate the continuation for every offered choice while the user is reading
+speculator = None
+if os.getenv('SPECULATIVE_TURNS', 'false').lower() == 'true':
+    speculator = Speculator(
+        story_generator,
+        workers=int(os.getenv('SPECULATION_WORKERS', '3')),
+        token_budget=int(os.getenv('SPECULATION_TOKEN_BUDGET', '20000')),
+        max_wait=float(os.getenv('SPECULATION_MAX_WAIT', '10'))
+    )
+
+# Duplicate turn requests (double clicks, client retries) share one generation
+turns_in_flight = SingleFlight(linger=float(os.getenv('DUPLICATE_TURN_WINDOW', '10')))
+
+# Admin-only profiling of this worker process (see profiling.py): with PROFILING_TOKEN as a bearer token,
+# /admin/profile switches sampling of story requests and tracemalloc on and off at runtime and reads their
+# output. Without the token those routes answer 404. PROFILE_SAMPLE_RATE samples from startup.
+profiling_token = os.getenv('PROFILING_TOKEN')
+profiler = SamplingProfiler(
+    rate=float(os.getenv('PROFILE_SAMPLE_RATE', '0')),
+    interval=float(os.getenv('PROFILE_INTERVAL', '0.005'))
+)
+memory_profiler = MemoryProfiler(frames=int(os.getenv('PROFILE_MEMORY_FRAMES', '10')))
+PROFILED_ENDPOINTS = ('initialize_story', 'continue_story', 'modify_story')
+
+@app.before_request
+def start_profile():
+    """Sample this story request with the profiler when it is on and picks the request."""
+    if profiler.rate and request.endpoint in PROFILED_ENDPOINTS:
+        g.profiled = profiler.begin(request.endpoint)
+
+@app.teardown_request
+def stop_profile(exception=None):
+    if g.pop('profiled', False):
+        profiler.end()
 
 @app.route('/')
 def index():
     """Render the main page of the application."""
-    return render_template('index.html')
+    return render_template('index.html', stream_turns=app.config['STREAM_TURNS'])
+
+@app.context_processor
+def asset_helpers():
+    return {'asset_urls': asset_urls}
+
+def asset_urls(name):
+    """URLs the page loads a bundle from: the built file, or its source files when the pipeline is off."""
+    if asset_manifest is None:
+        return [url_for('static', filename=source) for source in assets.BUNDLES[name]]
+    return [url_for('bundled_asset', filename=asset_manifest['assets'][name]['file'])]
+
+@app.route('/assets/<filename>')
+def bundled_asset(filename):
+    """Serve a built bundle in the best encoding the client accepts."""
+    asset = asset_files.get(filename)
+    if asset is None:
+        abort(404)
+    encoding = next((name for name in asset['encodings'] if request.accept_encodings.quality(name) > 0), None)
+    suffix = dict(assets.ENCODINGS)[encoding] if encoding else ''
+    # Bundles are named after their content, so they never change and can be cached for good
+    mimetype = assets.MIME_TYPES[os.path.splitext(filename)[1]]
+    response = send_file(os.path.join(asset_dir, filename + suffix), mimetype=mimetype, etag=filename + suffix,
+                         conditional=True, max_age=31536000)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
 
 @app.route('/initialize_story', methods=['POST'])
 def initialize_story():
@@ -26,87 +243,612 @@ def initialize_story():
     genre = data.get('genre', '')
     character = data.get('character', '')
     mood = data.get('mood', '')
-    
-    # Store user preferences in session
-    session['story_context'] = {
+    use_cache = data.get('use_cache', True)  # Clients can ask for a freshly generated story
+    return run_turn_once(
+        load_story_context(), 'initialize', (genre, character, mood),
+        lambda level: initialize_turn(genre, character, mood, use_cache, level)
+    )
+
+def initialize_turn(genre, character, mood, use_cache, level=FULL):
+    """Generate and record a story introduction; returns the JSON response body."""
+    # Store user preferences in the story context
+    context = {
         'genre': genre,
         'character': character,
         'mood': mood,
-        'history': []  # To store conversation history
+        'story_id': uuid.uuid4().hex,
+        'history': StoryHistory()  # To store conversation history
     }
     
-    # Generate story introduction using OpenAI
-    introduction, choices, image_url = story_generator.generate_introduction(genre, character, mood)
+    # Generate story introduction using OpenAI; under load a cached introduction comes with its image
+    images = image_mode(level)
+    introduction, choices, image_url = story_generator.generate_introduction(
+        genre, character, mood, include_image=images == 'inline', use_cache=use_cache or images == 'reuse'
+    )
     
     # Update story context with the introduction
-    session['story_context']['history'].append({
+    context['history'].append({
         'role': 'assistant',
         'content': introduction
     })
+    image_url = turn_image(context, images, image_url)
+    save_story_context(context, choices, image_url)
+    speculate_turns(context, choices)
     
-    return jsonify({
+    response = {
         'introduction': introduction,
         'choices': choices,
         'image_url': image_url
-    })
+    }
+    # A cached introduction may already come with its image
+    if images == 'queued' and not image_url:
+        response['image_job_id'] = queue_image(genre, character, mood, introduction)
+    return degraded(response, level)
 
 @app.route('/continue_story', methods=['POST'])
 def continue_story():
     """Continue the story based on user's choice."""
     data = request.json
     choice = data.get('choice', '')
-    
+    context = load_story_context()
+    if context is None:
+        return no_story_response()
+    return run_turn_once(context, 'continue', choice, lambda level: continue_turn(context, choice, level))
+
+def continue_turn(context, choice, level=FULL):
+    """Generate and record the continuation for a choice; returns the JSON response body."""
     # Add user's choice to history
-    session['story_context']['history'].append({
+    context['history'].append({
         'role': 'user',
         'content': choice
     })
     
-    # Generate story continuation
-    continuation, choices, image_url = story_generator.generate_continuation(session['story_context'], choice)
+    # Generate story continuation, unless it was already generated while the user was reading
+    images = image_mode(level)
+    speculated = speculator.take(session['session_id'], context, choice) if speculator else None
+    if speculated is not None:
+        continuation, choices = speculated
+        image_url = None
+        if images == 'inline':
+            image_url = story_generator.generate_illustration(
+                context['genre'], context.get('character', 'protagonist'), context['mood'], continuation
+            )
+    else:
+        continuation, choices, image_url = story_generator.generate_continuation(
+            context, choice, include_image=images == 'inline'
+        )
     
     # Add continuation to history
-    session['story_context']['history'].append({
+    context['history'].append({
         'role': 'assistant',
         'content': continuation
     })
+    image_url = turn_image(context, images, image_url)
+    save_story_context(context, choices, image_url)
+    speculate_turns(context, choices)
     
-    return jsonify({
+    response = {
         'continuation': continuation,
         'choices': choices,
         'image_url': image_url
-    })
+    }
+    if images == 'queued':
+        response['image_job_id'] = queue_image(
+            context['genre'], context.get('character', 'protagonist'), context['mood'], continuation
+        )
+    return degraded(response, level)
 
 @app.route('/modify_story', methods=['POST'])
 def modify_story():
     """Modify the story based on user's command."""
     data = request.json
     command = data.get('command', '')
-    
+    context = load_story_context()
+    if context is None:
+        return no_story_response()
+    return run_turn_once(context, 'modify', command, lambda level: modify_turn(context, command, level))
+
+def modify_turn(context, command, level=FULL):
+    """Generate and record the story modification for a command; returns the JSON response body."""
     # Add user's command to history
-    session['story_context']['history'].append({
+    context['history'].append({
         'role': 'user',
         'content': f"COMMAND: {command}"
     })
     
     # Process the command and modify story context
-    process_story_command(session['story_context'], command)
+    process_story_command(context, command)
     
     # Generate story continuation based on the command
-    continuation, choices, image_url = story_generator.generate_modification(session['story_context'], command)
+    images = image_mode(level)
+    continuation, choices, image_url = story_generator.generate_modification(
+        context, command, include_image=images == 'inline'
+    )
     
     # Add continuation to history
-    session['story_context']['history'].append({
+    context['history'].append({
         'role': 'assistant',
         'content': continuation
     })
+    image_url = turn_image(context, images, image_url)
+    save_story_context(context, choices, image_url)
+    speculate_turns(context, choices)
     
-    return jsonify({
+    response = {
         'continuation': continuation,
         'choices': choices,
         'image_url': image_url
+    }
+    if images == 'queued':
+        response['image_job_id'] = queue_image(
+            context['genre'], context.get('character', 'protagonist'), context['mood'], continuation
+        )
+    return degraded(response, level)
+
+@app.route('/stream/initialize_story', methods=['POST'])
+def stream_initialize_story():
+    """Stream a new story introduction to the browser as Server-Sent Events."""
+    data = request.json
+    genre = data.get('genre', '')
+    character = data.get('character', '')
+    mood = data.get('mood', '')
+    store_key = idempotency_store_key()
+    stored = stored_turn(store_key)
+    if stored is not None:
+        return stream_stored_response(stored)
+    
+    context = {
+        'genre': genre,
+        'character': character,
+        'mood': mood,
+        'story_id': uuid.uuid4().hex,
+        'history': StoryHistory()
+    }
+    # The cookie goes out with the stream's headers; the story is stored once its first turn is done
+    issue_session_id(context)
+    
+    events = story_generator.stream_introduction(genre, character, mood)
+    return stream_story_response(events, context, 'introduction', store_key)
+
+@app.route('/stream/continue_story', methods=['POST'])
+def stream_continue_story():
+    """Stream the story continuation for the user's choice as Server-Sent Events."""
+    data = request.json
+    choice = data.get('choice', '')
+    store_key = idempotency_store_key()
+    stored = stored_turn(store_key)
+    if stored is not None:
+        return stream_stored_response(stored)
+    context = load_story_context()
+    if context is None:
+        return no_story_response()
+    
+    # Stored with the continuation, so a stream that fails leaves no unanswered choice behind
+    context['history'].append({
+        'role': 'user',
+        'content': choice
+    })
+    
+    speculated = speculator.take(session['session_id'], context, choice) if speculator else None
+    if speculated is not None:
+        continuation, choices = speculated
+        events = iter([
+            {'type': 'delta', 'text': continuation},
+            {'type': 'done', 'text': continuation, 'choices': choices}
+        ])
+    else:
+        events = story_generator.stream_continuation(context, choice)
+    return stream_story_response(events, context, 'continuation', store_key)
+
+@app.route('/stream/modify_story', methods=['POST'])
+def stream_modify_story():
+    """Stream the story modification for the user's command as Server-Sent Events."""
+    data = request.json
+    command = data.get('command', '')
+    store_key = idempotency_store_key()
+    stored = stored_turn(store_key)
+    if stored is not None:
+        return stream_stored_response(stored)
+    context = load_story_context()
+    if context is None:
+        return no_story_response()
+    
+    context['history'].append({
+        'role': 'user',
+        'content': f"COMMAND: {command}"
+    })
+    process_story_command(context, command)
+    
+    events = story_generator.stream_modification(context, command)
+    return stream_story_response(events, context, 'continuation', store_key)
+
+def run_turn_once(context, kind, value, generate):
+    """Run a story turn once: identical concurrent requests share its response, and a retry carrying
+    the same Idempotency-Key header gets the stored response back instead of a second turn."""
+    session_id = session.get('session_id')
+    store_key = idempotency_store_key()
+    stored = stored_turn(store_key)
+    if stored is not None:
+        return jsonify(stored)
+    
+    def admitted():
+        if admission is None:
+            return generate(FULL)
+        # A browser without a session yet has nothing to be held to a share by
+        with admission.admit(session_id or uuid.uuid4().hex) as level:
+            return generate(level)
+    
+    try:
+        if session_id is None:
+            # Nothing ties concurrent requests from a browser without a session together
+            response = admitted()
+        else:
+            # Count finished turns only: the first request appends the user's choice before its turn is done.
+            # The story id keeps a new story (even with the same preferences) from replaying the last one's turn
+            story_id, turn = (context['story_id'], context['history'].role_count('assistant')) if context else (None, 0)
+            response = turns_in_flight.do((session_id, story_id, turn, kind, value), admitted)
+    except OverloadedError as e:
+        return overloaded_response(e)
+    store_turn(store_key, session['session_id'], response)
+    return jsonify(response)
+
+def idempotency_store_key():
+    """Session store key for this request's Idempotency-Key header, or None without one."""
+    idempotency_key = request.headers.get('Idempotency-Key')
+    return f"idempotency:{session.get('session_id') or ''}:{idempotency_key}" if idempotency_key else None
+
+def stored_turn(store_key):
+    """The response stored for an idempotency key, or None if that turn has not finished."""
+    stored = session_store.get(store_key) if store_key is not None else None
+    if stored is None:
+        return None
+    # A first attempt that timed out may also have lost the cookie for a new session
+    session['session_id'] = stored['session_id']
+    return stored['response']
+
+def store_turn(store_key, session_id, response):
+    """Remember a finished turn's response for retries carrying the same idempotency key."""
+    if store_key is not None:
+        session_store.set(store_key, {'session_id': session_id, 'response': response})
+
+def image_mode(level):
+    """How a turn at this degradation level gets its image: 'inline', 'queued' for the background workers,
+    or 'reuse' for none beyond the story's latest one."""
+    if level >= CACHED_IMAGE:
+        return 'reuse'
+    if level >= DEFER_IMAGE or app.config['ASYNC_IMAGES']:
+        return 'queued'
+    return 'inline'
+
+def turn_image(context, images, image_url):
+    """The image to show with a turn, remembering it in the context so a degraded turn can reuse it."""
+    if image_url is None and images == 'reuse':
+        image_url = context.get('image_url')
+    if image_url is not None:
+        context['image_url'] = image_url
+    return image_url
+
+def degraded(response, level):
+    """Tag a turn's response with its degradation level when it was not served in full."""
+    if level > FULL:
+        response['degraded'] = LEVELS[level]
+    return response
+
+def overloaded_response(error):
+    """503 for a turn turned away under load (429 when its session is over its share), with Retry-After."""
+    response = jsonify({
+        'error': 'The storyteller is busy right now. Please try again in a moment.',
+        'retry_after': error.retry_after
+    })
+    response.status_code = 429 if error.reason == 'session_limit' else 503
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+def stream_story_response(events, context, text_key, store_key=None):
+    """Relay generator events as SSE: text deltas, then the finished turn, then its image.
+    The finished turn is stored under `store_key` for retries carrying the same idempotency key."""
+    session_id = session['session_id']
+    genre, character, mood = context['genre'], context.get('character', 'protagonist'), context['mood']
+    
+    def relay(level):
+        images = image_mode(level)
+        for event in events:
+            if event['type'] == 'delta':
+                yield sse_event('delta', {'text': event['text']})
+                continue
+            
+            # Record the turn before the client sees it finish, so its next request has it
+            text = event['text']
+            context['history'].append({
+                'role': 'assistant',
+                'content': text
+            })
+            image_url = turn_image(context, images, None)
+            persist_story(session_id, context, event['choices'], image_url)
+            if speculator is not None:
+                speculator.speculate(session_id, context, event['choices'])
+            
+            done = degraded({text_key: text, 'choices': event['choices'], 'image_url': image_url}, level)
+            if images == 'queued':
+                done['image_job_id'] = queue_image(genre, character, mood, text)
+            store_turn(store_key, session_id, done)
+            yield sse_event('done', done)
+            
+            # The text is already on screen, so an inline image only delays the end of the stream
+            if images == 'inline':
+                image_url = story_generator.generate_illustration(genre, character, mood, text)
+                store_turn(store_key, session_id, dict(done, image_url=image_url))
+                yield sse_event('image', {'image_url': image_url})
+    
+    try:
+        frames = admitted_stream(session_id, relay)
+    except OverloadedError as e:
+        return overloaded_response(e)
+    return sse_response(frames)
+
+def admitted_stream(session_id, relay):
+    """The frames of relay(level), run in an admission slot that is held until the stream ends.
+    The slot is taken before the response starts, so a turn turned away still gets its 503 or 429."""
+    if admission is None:
+        return relay(FULL)
+    
+    def held():
+        with admission.admit(session_id) as level:
+            yield None
+            yield from relay(level)
+    
+    frames = held()
+    next(frames)  # Raises OverloadedError before any frame is sent
+    return frames
+
+def stream_stored_response(response):
+    """A retried stream request's finished turn, replayed as its single done event."""
+    return sse_response(iter([sse_event('done', response)]))
+
+def sse_response(frames):
+    """A streamed text/event-stream response over SSE frames."""
+    response = Response(frames, mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Stop proxies from buffering the stream
+    return response
+
+def load_story_context():
+    """Fetch this browser's story context from the server-side store."""
+    session_id = session.get('session_id')
+    if session_id is None:
+        return None
+    with metrics.span('session_load'):
+        context = session_store.get(session_id)
+        if context is not None:
+            # Stores that serialize contexts hand back the history as a list of dicts
+            context['history'] = StoryHistory.of(context['history'])
+    
+    # An expired session (or a restart of the memory store) picks the story up from the story store
+    if context is None and story_store is not None and session.get('story_id'):
+        context, _ = load_owned_story(session_id, session['story_id'])
+        if context is not None:
+            session_store.set(session_id, context)
+    return context
+
+def save_story_context(context, choices=None, image_url=None):
+    """Write the story context to the server-side store, issuing a session id if needed."""
+    persist_story(issue_session_id(context), context, choices, image_url)
+
+def issue_session_id(context):
+    """This browser's session id, issued if it has none, with the cookie pointed at the context's story."""
+    session_id = session.get('session_id')
+    if session_id is None:
+        session_id = uuid.uuid4().hex
+        session['session_id'] = session_id
+    if story_store is not None:
+        session['story_id'] = context['story_id']
+    return session_id
+
+def persist_story(session_id, context, choices=None, image_url=None):
+    """Append the context's new turns to the story store and write it to the session store."""
+    if story_store is not None:
+        with metrics.span('story_append'):
+            story_store.append(session_id, context, choices, image_url)
+    with metrics.span('session_save'):
+        session_store.set(session_id, context)
+
+def load_owned_story(session_id, story_id):
+    """A stored story's context and latest turn if it belongs to this browser, else (None, None)."""
+    story = story_store.get_story(story_id)
+    if story is None or story['owner'] != session_id:
+        return None, None
+    return story_store.load_context(story_id)
+
+def speculate_turns(context, choices):
+    """Start pre-generating the next turn for each choice while the user reads this one."""
+    if speculator is not None:
+        speculator.speculate(session['session_id'], context, choices)
+
+def no_story_response():
+    """Response for story requests that arrive without a story in progress."""
+    return jsonify({'error': 'No story in progress. Please start a new story.'}), 400
+
+@app.route('/stories')
+def list_stories():
+    """List this browser's stories, newest first; pass `before` from the previous page for the next one."""
+    if story_store is None:
+        abort(404)
+    session_id = session.get('session_id')
+    limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+    stories = story_store.list_stories(session_id, limit, request.args.get('before', type=float)) if session_id else []
+    next_before = stories[-1]['created_at'] if len(stories) == limit else None
+    return jsonify({'stories': stories, 'next_before': next_before})
+
+@app.route('/stories/<story_id>')
+def get_story(story_id):
+    """Fetch a story with a page of its turns; pass `after` from the previous page for the next one."""
+    if story_store is None:
+        abort(404)
+    story = story_store.get_story(story_id)
+    if story is None or story.pop('owner') != session.get('session_id'):
+        abort(404)
+    limit = max(1, min(request.args.get('limit', 50, type=int), 200))
+    turns = story_store.get_turns(story_id, request.args.get('after', -1, type=int), limit)
+    next_after = turns[-1]['turn'] if len(turns) == limit else None
+    return jsonify(dict(story, turns=turns, next_after=next_after))
+
+@app.route('/stories/<story_id>/resume', methods=['POST'])
+def resume_story(story_id):
+    """Make a stored story the one in progress and return its latest turn."""
+    if story_store is None:
+        abort(404)
+    context, latest = load_owned_story(session.get('session_id'), story_id)
+    if context is None:
+        abort(404)
+    save_story_context(context)
+    latest = latest or {}
+    return jsonify({
+        'story_id': story_id,
+        'genre': context['genre'],
+        'character': context['character'],
+        'mood': context['mood'],
+        'continuation': latest.get('content', ''),
+        'choices': latest.get('choices') or [],
+        'image_url': latest.get('image_url')
+    })
+
+@app.route('/image_status/<job_id>')
+def image_status(job_id):
+    """Report the state of a background image job so the page can fill in the image."""
+    job = image_jobs.status(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown image job'}), 404
+    return jsonify(job)
+
+def queue_image(genre, character, mood, story_text):
+    """Hand image generation to the background workers, returning the job id (None if the queue is full)."""
+    try:
+        return image_jobs.submit(story_generator.generate_illustration, genre, character, mood, story_text)
+    except QueueFullError:
+        print("Image queue is full, returning the story without an image")
+        return None
+
+@app.route('/images/<image_id>')
+def stored_image(image_id):
+    """Serve a generated image from the image store; `w` and `fmt` ask for a smaller variant."""
+    if image_store is None:
+        abort(404)
+    path, fmt = image_store.path(image_id, width=request.args.get('w', type=int), fmt=request.args.get('fmt'))
+    if path is None:
+        abort(404)
+    # Files are named after their content, so they never change and can be cached for good
+    response = send_file(path, mimetype=MIME_TYPES[fmt], etag=os.path.basename(path), conditional=True,
+                         max_age=31536000)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+@app.route('/cache_stats')
+def cache_stats():
+    """Report response cache hit, miss and eviction counters."""
+    if response_cache is None:
+        return jsonify({'enabled': False})
+    return jsonify(dict(response_cache.stats(), enabled=True))
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Expose stage latency histograms and token counters for Prometheus."""
+    if not metrics.enabled:
+        abort(404)
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/healthz')
+def healthz():
+    """Liveness check: the process is up and serving requests."""
+    return jsonify({'status': 'ok'})
+
+@app.route('/readyz')
+def readyz():
+    """Readiness check of the local stores; never calls the OpenAI API."""
+    checks = {}
+    for name, check in (('session_store', lambda: session_store.get('readyz')),
+                        ('story_store', lambda: story_store is None or story_store.get_story('readyz'))):
+        try:
+            check()
+            checks[name] = 'ok'
+        except Exception as e:
+            checks[name] = f"error: {e}"
+    ready = all(status == 'ok' for status in checks.values())
+    # Reported for information only: an open circuit degrades turns but the worker can still serve them
+    openai_status = {endpoint: 'ok' if resilience.available(endpoint) else 'circuit open'
+                     for endpoint in ('chat', 'images')}
+    body = {'status': 'ready' if ready else 'unavailable', 'checks': checks, 'openai': openai_status}
+    return jsonify(body), 200 if ready else 503
+
+@app.route('/speculation_stats')
+def speculation_stats():
+    """Report speculation hit rate, wasted tokens and latency saved."""
+    if speculator is None:
+        return jsonify({'enabled': False})
+    return jsonify(dict(speculator.stats(), enabled=True))
+
+@app.route('/admission_stats')
+def admission_stats():
+    """Report running and waiting turns, the current degradation level and admission counts."""
+    if admission is None:
+        return jsonify({'enabled': False})
+    return jsonify(dict(admission.stats(), enabled=True))
+
+@app.route('/admin/profile', methods=['GET', 'POST'])
+def admin_profile():
+    """Report the profilers' state; a POST changes it with any of sample_rate, interval, memory,
+    memory_frames and reset."""
+    require_admin()
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        try:
+            if data.get('reset'):
+                profiler.reset()
+            profiler.configure(rate=data.get('sample_rate'), interval=data.get('interval'))
+            if 'memory' in data:
+                memory_profiler.configure(bool(data['memory']), frames=data.get('memory_frames'))
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': f"Invalid profiling setting: {e}"}), 400
+    return jsonify({'cpu': profiler.stats(), 'memory': memory_profiler.stats()})
+
+@app.route('/admin/profile/cpu')
+def admin_profile_cpu():
+    """Sampled stacks in collapsed form for flamegraph.pl or speedscope; `format=json` lists the top functions."""
+    require_admin()
+    if request.args.get('format') == 'json':
+        limit = request.args.get('limit', 20, type=int)
+        return jsonify({'stats': profiler.stats(), 'top': profiler.top(limit)})
+    return Response(profiler.collapsed(), mimetype='text/plain')
+
+@app.route('/admin/profile/memory')
+def admin_profile_memory():
+    """A tracemalloc snapshot (while tracing) with the changes since the last one, and the largest session
+    contexts and cached objects held in memory."""
+    require_admin()
+    limit = max(1, min(request.args.get('limit', 20, type=int), 200))
+    group_by = request.args.get('group_by', 'lineno')
+    if group_by not in ('lineno', 'filename', 'traceback'):
+        return jsonify({'error': 'group_by must be lineno, filename or traceback'}), 400
+    # Only the in-process backends hold their entries in this worker's memory
+    cache_backend = response_cache.backend if response_cache is not None else None
+    return jsonify({
+        'tracemalloc': memory_profiler.snapshot(limit, group_by),
+        'sessions': largest(session_store.items(), limit) if hasattr(session_store, 'items') else None,
+        'cache': largest(cache_backend.items(), limit) if hasattr(cache_backend, 'items') else None
     })
 
+def require_admin():
+    """404 unless the request carries the profiling token, so the admin routes do not reveal themselves."""
+    expected = f"Bearer {profiling_token}".encode('utf-8')
+    supplied = request.headers.get('Authorization', '').encode('utf-8')
+    if not profiling_token or not hmac.compare_digest(supplied, expected):
+        abort(404)
+
+@app.route('/model_stats')
+def model_stats():
+    """Report the model route table and each route's latency and token usage, for tuning MODEL_ROUTES."""
+    return jsonify({'routes': model_router.table(), 'stats': model_router.stats()})
+
 def process_story_command(context, command):
     """Process a user command to modify the story."""
     command = command.lower()
@@ -123,7 +865,12 @@ def process_story_command(context, command):
     elif "start over with" in command and "genre" in command:
         new_genre = command.replace("start over with", "").replace("genre", "").strip()
         context['genre'] = new_genre
-        context['history'] = []  # Clear history for a fresh start
+        context['history'] = StoryHistory()  # Clear history for a fresh start
+        # The fresh start is a new story in the story store; the old one stays resumable as it was
+        context['story_id'] = uuid.uuid4().hex
+        context['stored_turns'] = 0
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    # Development server; see gunicorn.conf.py for production
+    debug = os.getenv('FLASK_DEBUG', 'false').lower() == 'true'
+    app.run(host='0.0.0.0', port=int(os.getenv('PORT', '5000')), debug=debug)
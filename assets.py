@@ -0,0 +1,293 @@
+"""Build the page's CSS and JavaScript into minified, fingerprinted, precompressed bundles.
+
+Each bundle in BUNDLES is concatenated from its source files under static/, minified,
+named after the hash of its content (app.<hash>.css) and written to the output
+directory together with .gz and, when the brotli package is installed, .br variants.
+manifest.json maps bundle names to the built files. app.py rebuilds on startup when
+the sources changed; run this module to build ahead of time (e.g. in a deploy step).
+
+Usage: python assets.py [--static static] [--output static/dist]
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import tempfile
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; without it only gzip variants are written
+    brotli = None
+
+# Bundle name -> source files (relative to the static folder), in page order
+BUNDLES = {
+    'app.css': ('css/styles.css', 'css/additional.css'),
+    'app.js': ('js/story_log.js', 'js/script.js')
+}
+
+MIME_TYPES = {'.css': 'text/css', '.js': 'text/javascript'}
+
+# Content-Encoding -> file suffix, best compression first
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+# A `/` after one of these (or at the start) begins a regular expression literal, not a division
+_REGEX_PRECEDERS = set('(,=:[!&|?{};+-*%<>~^')
+_REGEX_KEYWORDS = ('return', 'typeof', 'case', 'do', 'else', 'in', 'of', 'void', 'yield', 'await', 'delete', 'throw')
+
+
+def _skip_string(text, i):
+    """Index just past the quoted string or template literal starting at text[i]"""
+    quote = text[i]
+    i += 1
+    while i < len(text):
+        char = text[i]
+        if char == '\\':
+            i += 2
+            continue
+        if char == quote:
+            return i + 1
+        if quote == '`' and text.startswith('${', i):
+            i = _skip_expression(text, i + 2)
+            continue
+        if char == '\n' and quote != '`':
+            return i  # Unterminated; leave the rest alone
+        i += 1
+    return i
+
+
+def _skip_expression(text, i):
+    """Index just past the `}` closing a template literal's ${...} expression"""
+    depth = 1
+    while i < len(text):
+        char = text[i]
+        if char in '\'"`':
+            i = _skip_string(text, i)
+            continue
+        if char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                return i + 1
+        i += 1
+    return i
+
+
+def _skip_regex(text, i):
+    """Index just past the regular expression literal (with its flags) starting at text[i]"""
+    i += 1
+    in_class = False
+    while i < len(text) and text[i] != '\n':
+        char = text[i]
+        if char == '\\':
+            i += 2
+            continue
+        if char == '[':
+            in_class = True
+        elif char == ']':
+            in_class = False
+        elif char == '/' and not in_class:
+            i += 1
+            while i < len(text) and (text[i].isalnum() or text[i] == '_'):
+                i += 1
+            return i
+        i += 1
+    return i
+
+
+def _tokens(text, javascript):
+    """Split source into ('code', text) and ('literal', text) pieces, dropping comments"""
+    pieces = []
+    code_start = i = 0
+
+    def add_code(code):
+        # Keep code contiguous across dropped comments, so whitespace on both sides is collapsed together
+        if pieces and pieces[-1][0] == 'code':
+            pieces[-1] = ('code', pieces[-1][1] + code)
+        else:
+            pieces.append(('code', code))
+
+    def flush(end):
+        if end > code_start:
+            add_code(text[code_start:end])
+
+    while i < len(text):
+        char = text[i]
+        if char in '\'"' or (javascript and char == '`'):
+            flush(i)
+            end = _skip_string(text, i)
+            pieces.append(('literal', text[i:end]))
+            code_start = i = end
+        elif text.startswith('/*', i):
+            flush(i)
+            end = text.find('*/', i + 2)
+            end = len(text) if end < 0 else end + 2
+            # Keep a line break so the comment cannot join two statements
+            add_code('\n' if '\n' in text[i:end] else ' ')
+            code_start = i = end
+        elif javascript and text.startswith('//', i):
+            flush(i)
+            end = text.find('\n', i)
+            code_start = i = len(text) if end < 0 else end
+        elif javascript and char == '/' and _starts_regex(text, i):
+            flush(i)
+            end = _skip_regex(text, i)
+            pieces.append(('literal', text[i:end]))
+            code_start = i = end
+        else:
+            i += 1
+    flush(len(text))
+    return pieces
+
+
+def _starts_regex(text, i):
+    before = text[:i].rstrip()
+    if not before or before[-1] in _REGEX_PRECEDERS:
+        return True
+    word = re.search(r'[A-Za-z_$][\w$]*$', before)
+    return word is not None and word.group() in _REGEX_KEYWORDS
+
+
+def minify_js(text):
+    """Drop comments, indentation and blank lines; line breaks are kept where they may end a statement"""
+    out = []
+    for kind, piece in _tokens(text, javascript=True):
+        if kind == 'literal':
+            out.append(piece)
+            continue
+        piece = re.sub(r'[ \t]*\n\s*', '\n', piece)
+        piece = re.sub(r'[ \t]+', ' ', piece)
+        # Spaces next to punctuation that cannot merge with a neighbouring token
+        piece = re.sub(r' ?([{}()\[\];,:=<>?!&|]) ?', r'\1', piece)
+        # Line breaks after these never end a statement, nor do those before a closing brace
+        piece = re.sub(r'([{;,(\[])\n', r'\1', piece)
+        piece = re.sub(r'\n(?=[}\])])', '', piece)
+        out.append(piece)
+    return ''.join(out).strip() + '\n'
+
+
+def minify_css(text):
+    """Drop comments and whitespace that CSS does not need"""
+    out = []
+    for kind, piece in _tokens(text, javascript=False):
+        if kind != 'literal':
+            piece = re.sub(r'\s+', ' ', piece)
+            piece = re.sub(r' ?([{};,>]) ?', r'\1', piece)
+            piece = piece.replace(';}', '}')
+        out.append((kind, piece))
+    return ''.join(piece for kind, piece in _tighten_declarations(out)).strip() + '\n'
+
+
+def _tighten_declarations(pieces):
+    # "margin: 0" loses its space, but only in declarations: text ending in "{" is a selector or an at-rule
+    # prelude, where spacing is meaningful. Walk backwards so each piece knows what ends its text.
+    ends = '}'
+    for index in range(len(pieces) - 1, -1, -1):
+        kind, piece = pieces[index]
+        if kind == 'literal':
+            continue
+        parts = re.split(r'([{};])', piece)
+        for part in range(len(parts) - 1, -1, -1):
+            if parts[part] in ('{', '}', ';'):
+                ends = parts[part]
+            elif ends != '{':
+                parts[part] = parts[part].replace(': ', ':')
+        pieces[index] = (kind, ''.join(parts))
+    return pieces
+
+
+def source_digest(static_dir, bundles=BUNDLES):
+    """Hash of every bundle's sources, to tell whether a build is current"""
+    digest = hashlib.sha256()
+    for name, sources in sorted(bundles.items()):
+        digest.update(name.encode('utf-8'))
+        for source in sources:
+            with open(os.path.join(static_dir, source), 'rb') as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+def build(static_dir, output_dir, bundles=BUNDLES):
+    """Write every bundle with its compressed variants and manifest.json, and return the manifest"""
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = {'sources': source_digest(static_dir, bundles), 'assets': {}}
+    for name, sources in bundles.items():
+        texts = []
+        for source in sources:
+            with open(os.path.join(static_dir, source), encoding='utf-8') as f:
+                texts.append(f.read())
+        stem, ext = os.path.splitext(name)
+        minify = minify_css if ext == '.css' else minify_js
+        data = minify('\n'.join(texts)).encode('utf-8')
+
+        filename = f"{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+        sizes = {'identity': len(data)}
+        _write(output_dir, filename, data)
+        for encoding, suffix in ENCODINGS:
+            compressed = _compress(data, encoding)
+            if compressed is not None:
+                _write(output_dir, filename + suffix, compressed)
+                sizes[encoding] = len(compressed)
+        manifest['assets'][name] = {
+            'file': filename,
+            'sources': list(sources),
+            'encodings': [encoding for encoding, _ in ENCODINGS if encoding in sizes],
+            'bytes': sizes
+        }
+    _write(output_dir, 'manifest.json', json.dumps(manifest, indent=2).encode('utf-8'))
+    return manifest
+
+
+def load_or_build(static_dir, output_dir, bundles=BUNDLES):
+    """The manifest in output_dir, rebuilding first when it is missing or its sources changed"""
+    try:
+        with open(os.path.join(output_dir, 'manifest.json'), encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('sources') == source_digest(static_dir, bundles):
+            return manifest
+    except (OSError, ValueError):
+        pass
+    return build(static_dir, output_dir, bundles)
+
+
+def _compress(data, encoding):
+    if encoding == 'gzip':
+        # mtime=0 keeps the output identical across builds
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    if encoding == 'br' and brotli is not None:
+        return brotli.compress(data, quality=11)
+    return None
+
+
+def _write(directory, filename, data):
+    # Write to a temp file and rename, so a server never reads a half-written asset
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.chmod(tmp_path, 0o644)  # Readable by a front proxy serving the static folder
+        os.replace(tmp_path, os.path.join(directory, filename))
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    root = os.path.dirname(os.path.abspath(__file__))
+    parser.add_argument('--static', default=os.path.join(root, 'static'), help="Folder the sources are under")
+    parser.add_argument('--output', default=os.path.join(root, 'static', 'dist'), help="Where bundles are written")
+    args = parser.parse_args()
+
+    manifest = build(args.static, args.output)
+    for name, asset in manifest['assets'].items():
+        sizes = ", ".join(f"{encoding} {size}" for encoding, size in asset['bytes'].items())
+        print(f"{name} -> {asset['file']} ({sizes} bytes)")
+    if brotli is None:
+        print("brotli is not installed; only gzip variants were written")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,334 @@
+import asyncio
+import threading
+from story_generator import StoryGenerator, openai
+from rate_limiter import background
+import prompts
+from streaming import ChoicesStreamParser
+from metrics import tally_usage
+
+
+class AsyncStoryGenerator(StoryGenerator):
+    """StoryGenerator whose OpenAI calls are coroutines sharing one pooled AsyncOpenAI client.
+
+    The generate_* and stream_* methods keep their names and return values but must be
+    awaited (or iterated with `async for`). An instance belongs to the event loop that
+    first uses it, since the client's connection pool is bound to that loop.
+    """
+
+    def __init__(self, client=None, max_concurrency=100, context_window=None, cache=None, inline_image_prompt=False,
+                 resilience=None, metrics=None, image_store=None, router=None):
+        super().__init__(context_window=context_window, cache=cache, inline_image_prompt=inline_image_prompt,
+                         resilience=resilience, metrics=metrics, image_store=image_store, router=router)
+
+        # Upper bound on in-flight OpenAI requests; also bounds the connection pool
+        self.max_concurrency = max_concurrency
+        self._client = client
+        self._semaphore = None
+        self._loop = None  # The loop this generator belongs to, once it has made a request
+
+    @property
+    def client(self):
+        """The shared async client, created on first use so it binds to the running loop"""
+        if self._client is None:
+            # Retries are handled by self.resilience
+            self._client = openai.AsyncOpenAI(api_key=self.api_key, max_retries=0)
+        return self._client
+
+    @property
+    def limiter(self):
+        """Semaphore capping concurrent OpenAI requests from this generator"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = asyncio.get_running_loop()
+        return self._semaphore
+
+    async def aclose(self):
+        """Close the client's connection pool"""
+        if self._client is not None:
+            await self._client.close()
+
+    async def generate_introduction(self, genre, character, mood, include_image=True, use_cache=True):
+        """Generate a story introduction based on user preferences with embedded choices and image"""
+        with self.resilience.turn():
+            cached = await self._off_loop(self._cached_introduction, genre, character, mood) if use_cache else None
+            if cached is not None:
+                image_url = cached['image_url']
+                if include_image and not image_url:
+                    image_url = await self.generate_illustration(genre, character, mood, cached['text'])
+                return cached['text'], cached['choices'], image_url
+
+            try:
+                content = await self._complete('introduction', self._introduction_messages(genre, character, mood))
+                introduction, choices = self._parse_story(content)
+
+                image_url = None
+                if include_image:
+                    image_url = await self.generate_illustration(genre, character, mood, introduction, use_cache)
+
+                await self._off_loop(self._remember_introduction, genre, character, mood, introduction, choices, image_url)
+                return introduction, choices, image_url
+            except Exception as e:
+                print(f"Error generating story introduction: {e}")
+                return f"Error generating story introduction: {str(e)}", ["Continue the story", "Try a different approach", "Start over"], None
+
+    async def generate_choices(self, story_context):
+        """Generate 2-3 choices for the next part of the story"""
+        try:
+            content = await self._complete('choices', await self._off_loop(self._choices_messages, story_context))
+            return self._parse_choices_list(content)
+        except Exception as e:
+            print(f"Error generating story choices: {e}")
+            return ["Continue the adventure", "Take a different path", "Rest and reconsider"]
+
+    async def generate_continuation(self, story_context, choice, include_image=True):
+        """Generate the next part of the story based on the user's choice with embedded choices and image"""
+        with self.resilience.turn():
+            try:
+                messages = await self._off_loop(self._continuation_messages, story_context, choice)
+                content = await self._complete('continuation', messages)
+                continuation, choices = self._parse_story(content)
+
+                image_url = None
+                if include_image:
+                    image_url = await self.generate_illustration(
+                        story_context['genre'],
+                        story_context.get('character', 'protagonist'),
+                        story_context['mood'],
+                        continuation
+                    )
+
+                return continuation, choices, image_url
+            except Exception as e:
+                print(f"Error generating story continuation: {e}")
+                return f"Error generating story continuation: {str(e)}", ["Continue the adventure", "Take a different path", "Rest and reconsider"], None
+
+    async def generate_modification(self, story_context, command, include_image=True):
+        """Generate a modified story continuation based on the user's command with embedded choices and image"""
+        with self.resilience.turn():
+            try:
+                messages = await self._off_loop(self._modification_messages, story_context, command)
+                content = await self._complete('modification', messages)
+                modification, choices = self._parse_story(content)
+
+                image_url = None
+                if include_image:
+                    image_url = await self.generate_illustration(
+                        story_context['genre'],
+                        story_context.get('character', 'protagonist'),
+                        self._modification_mood(story_context, command),
+                        modification
+                    )
+
+                return modification, choices, image_url
+            except Exception as e:
+                print(f"Error generating story modification: {e}")
+                return f"Error generating story modification: {str(e)}", ["Continue the adventure", "Take a different path", "Rest and reconsider"], None
+
+    def stream_introduction(self, genre, character, mood):
+        """Stream a story introduction as an async iterator of delta and done events"""
+        return self._stream_story(
+            'introduction',
+            self._introduction_messages(genre, character, mood),
+            error_message="Error generating story introduction",
+            fallback_choices=["Continue the story", "Try a different approach", "Start over"]
+        )
+
+    def stream_continuation(self, story_context, choice):
+        """Stream the next part of the story as an async iterator of delta and done events"""
+        return self._stream_story(
+            'continuation',
+            self._continuation_messages(story_context, choice),
+            error_message="Error generating story continuation",
+            fallback_choices=["Continue the adventure", "Take a different path", "Rest and reconsider"]
+        )
+
+    def stream_modification(self, story_context, command):
+        """Stream a modified story continuation as an async iterator of delta and done events"""
+        return self._stream_story(
+            'modification',
+            self._modification_messages(story_context, command),
+            error_message="Error generating story modification",
+            fallback_choices=["Continue the adventure", "Take a different path", "Rest and reconsider"]
+        )
+
+    async def asummarize_story(self, previous_summary, turns):
+        """Fold older story turns into a running summary"""
+        with background():
+            content = await self._complete('summary', prompts.summary_messages(previous_summary, turns))
+        return content.strip()
+
+    def summarize_story(self, previous_summary, turns):
+        """Blocking summarize for the context window's worker thread, run on this generator's loop"""
+        loop = self._loop
+        if loop is None or not loop.is_running():
+            # No request has bound the generator to a loop yet, so there is no async client to share
+            return super().summarize_story(previous_summary, turns)
+        return asyncio.run_coroutine_threadsafe(self.asummarize_story(previous_summary, turns), loop).result()
+
+    async def _stream_story(self, task, messages, error_message, fallback_choices):
+        parser = ChoicesStreamParser()
+        try:
+            # The concurrency slot is held for as long as the stream is open
+            async with self.limiter:
+                with self.router.call(task) as call, self.metrics.span('chat_completion', 'stream'):
+                    stream = call.response = await self.resilience.acall(
+                        'chat', self.client.chat.completions.create, timeout=call.timeout,
+                        **call.chat_request(messages, stream=True)
+                    )
+                async for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    text = parser.feed(chunk.choices[0].delta.content or "")
+                    if text:
+                        yield {'type': 'delta', 'text': text}
+
+            text = parser.close()
+            if text:
+                yield {'type': 'delta', 'text': text}
+
+            self._remember_image_prompt(parser.text, parser.image_prompt)
+            yield {'type': 'done', 'text': parser.text, 'choices': parser.choices or fallback_choices}
+        except Exception as e:
+            print(f"{error_message}: {e}")
+            yield {'type': 'done', 'text': f"{error_message}: {str(e)}", 'choices': fallback_choices}
+
+    async def generate_illustration(self, genre, character, mood, story_text, use_cache=True):
+        """Generate an image for a story passage"""
+        if not self.resilience.available('images'):
+            return None
+        with self.metrics.span('image_prompt'):
+            image_prompt = await self._generate_image_prompt(genre, character, mood, story_text, use_cache)
+        with self.metrics.span('image'):
+            return await self._generate_image(image_prompt)
+
+    async def _generate_image_prompt(self, genre, character, mood, story_text, use_cache=True):
+        """Generate a prompt for image generation based on the story"""
+        inline = self._inline_image_prompts.get(story_text)
+        if inline is not None:
+            return inline
+
+        if use_cache and self.cache is not None:
+            cached = await self._off_loop(self.cache.get_image_prompt, genre, mood, story_text)
+            if cached is not None:
+                return cached
+
+        try:
+            content = await self._complete('image_prompt', self._image_prompt_messages(genre, mood, story_text))
+
+            # Add style guidance for consistency
+            image_prompt = content.strip() + ", digital art, detailed, atmospheric lighting"
+            if self.cache is not None:
+                await self._off_loop(self.cache.set_image_prompt, genre, mood, story_text, image_prompt)
+            return image_prompt
+        except Exception as e:
+            print(f"Error generating image prompt: {e}")
+            return f"A scene from a {genre} story with {mood} mood featuring the main character"
+
+    async def _generate_image(self, prompt):
+        """Generate an image based on the prompt using OpenAI's DALL-E"""
+        try:
+            async with self.limiter:
+                with self.router.call('image') as call:
+                    response = call.response = await self.resilience.acall(
+                        'images', self.client.images.generate, timeout=call.timeout,
+                        **call.image_request(prompt, **self._image_format())
+                    )
+            if self.image_store is None:
+                return response.data[0].url
+            # Downloading and writing the file blocks, so keep it off the event loop
+            return await asyncio.get_running_loop().run_in_executor(None, self._image_url, response.data[0])
+        except Exception as e:
+            print(f"Error generating image: {e}")
+            return None
+
+    async def _off_loop(self, function, *args):
+        """Run a call that may block on the response cache or session store on a worker thread, with the turn's contextvars"""
+        # Story prompts read their window's cached summary from the session store, which may be SQLite
+        if self.cache is None and self.context_window is None:
+            return function(*args)
+        return await asyncio.to_thread(function, *args)
+
+    async def _complete(self, task, messages):
+        """Run a chat completion on the task's routed model within the concurrency limit and return its text"""
+        async with self.limiter:
+            with self.router.call(task) as call, self.metrics.span('chat_completion', task):
+                response = call.response = await self.resilience.acall(
+                    'chat', self.client.chat.completions.create, timeout=call.timeout,
+                    **call.chat_request(messages)
+                )
+        self.metrics.record_usage(task, response)
+        tally_usage(response)
+        return response.choices[0].message.content
+
+
+class BackgroundLoop:
+    """Event loop on a daemon thread, letting synchronous code share async clients"""
+
+    def __init__(self):
+        self._loop = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self):
+        """The running loop, started on first use"""
+        if self._loop is None:
+            with self._lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    threading.Thread(target=loop.run_forever, name="story-event-loop", daemon=True).start()
+                    self._loop = loop
+        return self._loop
+
+    def submit(self, coro):
+        """Schedule a coroutine on the loop and return a concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        """Run a coroutine on the loop and block the calling thread for its result"""
+        return self.submit(coro).result(timeout)
+
+
+class BlockingStoryGenerator:
+    """Synchronous StoryGenerator interface over an AsyncStoryGenerator.
+
+    Calls from any number of Flask worker threads are multiplexed onto one background
+    event loop, so they share the async client's connection pool and concurrency limit.
+    Each caller still blocks its own thread until the result arrives, so the number of
+    turns in flight is bounded by the WSGI server's threads, not by the loop.
+    """
+
+    def __init__(self, generator=None, loop=None):
+        self.generator = generator if generator is not None else AsyncStoryGenerator()
+        self.loop = loop if loop is not None else BackgroundLoop()
+
+    def generate_introduction(self, genre, character, mood, include_image=True, use_cache=True):
+        return self.loop.run(self.generator.generate_introduction(genre, character, mood, include_image, use_cache))
+
+    def generate_choices(self, story_context):
+        return self.loop.run(self.generator.generate_choices(story_context))
+
+    def generate_continuation(self, story_context, choice, include_image=True):
+        return self.loop.run(self.generator.generate_continuation(story_context, choice, include_image))
+
+    def generate_modification(self, story_context, command, include_image=True):
+        return self.loop.run(self.generator.generate_modification(story_context, command, include_image))
+
+    def generate_illustration(self, genre, character, mood, story_text, use_cache=True):
+        return self.loop.run(self.generator.generate_illustration(genre, character, mood, story_text, use_cache))
+
+    def stream_introduction(self, genre, character, mood):
+        return self._iterate(self.generator.stream_introduction(genre, character, mood))
+
+    def stream_continuation(self, story_context, choice):
+        return self._iterate(self.generator.stream_continuation(story_context, choice))
+
+    def stream_modification(self, story_context, command):
+        return self._iterate(self.generator.stream_modification(story_context, command))
+
+    def _iterate(self, events):
+        # Pull one event at a time from the async generator running on the loop
+        while True:
+            try:
+                yield self.loop.run(events.__anext__())
+            except StopAsyncIteration:
+                return
@@ -0,0 +1,258 @@
+"""Pre-render story libraries from a JSONL file of seeds and choice paths.
+
+Each seed line looks like:
+    {"id": "castle-1", "genre": "fantasy", "character": "a knight", "mood": "eerie", "choices": [1, "Open the door"]}
+
+A choice is either the text to send or the 1-based index of one of the choices the
+story offered at that point. Finished stories are appended to the output JSONL as
+they complete; the output doubles as the checkpoint, so re-running the same command
+skips stories that already succeeded and retries the ones that failed.
+
+Usage:
+    python batch.py seeds.jsonl --output library.jsonl --workers 8 --images
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+from rate_limiter import background
+from story_history import StoryHistory
+
+# Generator methods report failures in the returned text rather than raising
+ERROR_PREFIX = "Error generating"
+
+
+class StoryFailed(Exception):
+    """Raised when a turn of a batch story comes back as an error"""
+
+
+def read_seeds(path):
+    """Seeds from a JSONL file, each with an id (the line number when none is given)"""
+    seeds = []
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            if line.strip():
+                seed = json.loads(line)
+                seed.setdefault('id', f"line-{number}")
+                seeds.append(seed)
+    return seeds
+
+
+def completed_ids(path):
+    """Ids of stories already written successfully to an output file"""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # A line cut short by an interrupted run
+            if record.get('error'):
+                done.discard(record.get('id'))
+            else:
+                done.add(record.get('id'))
+    return done
+
+
+class BatchRunner:
+    """Generates whole stories from seeds on a bounded pool of worker threads.
+
+    Workers share one generator, so its ResilientCaller retries rate limits with
+    backoff; before each turn a worker also waits while the chat circuit breaker is
+    open, and `turns_per_minute` optionally paces turns across all workers. A story
+    whose turn fails is retried from the start up to `attempts` times.
+    """
+
+    def __init__(self, generator, workers=4, include_images=False, use_cache=False, turns_per_minute=None,
+                 attempts=3):
+        self.generator = generator
+        self.workers = workers
+        self.include_images = include_images
+        self.use_cache = use_cache  # Off by default so every pre-rendered story is distinct
+        self.interval = 60.0 / turns_per_minute if turns_per_minute else 0.0
+        self.attempts = attempts
+        self._next_turn = 0.0
+        self._pace_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._stats = {}
+
+    def run(self, seeds, output_path, progress=None):
+        """Generate every seed not already in output_path, appending results; returns a throughput report.
+
+        `progress` is called as progress(stats) after each story.
+        """
+        done = completed_ids(output_path)
+        pending = [seed for seed in seeds if seed['id'] not in done]
+        self._stats = {'stories': 0, 'failed': 0, 'skipped': len(seeds) - len(pending), 'turns': 0}
+
+        start = time.perf_counter()
+        with open(output_path, 'a') as output:
+            if output.tell() > 0 and not _ends_with_newline(output_path):
+                output.write("\n")  # Do not glue the first new record to a cut-off line
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                for seed in pending:
+                    pool.submit(self._run_seed, seed, output, progress)
+        elapsed = time.perf_counter() - start
+
+        report = dict(self._stats, seconds=round(elapsed, 3))
+        report['stories_per_sec'] = round(report['stories'] / elapsed, 3) if elapsed else 0.0
+        report['turns_per_sec'] = round(report['turns'] / elapsed, 3) if elapsed else 0.0
+        return report
+
+    def generate(self, seed):
+        """Play one seed through the generator and return its turns"""
+        genre, character, mood = seed.get('genre', ''), seed.get('character', ''), seed.get('mood', '')
+        self._wait_for_turn()
+        text, choices, image_url = self.generator.generate_introduction(
+            genre, character, mood, include_image=self.include_images, use_cache=self.use_cache
+        )
+        self._check(text)
+        turns = [{'choice': None, 'text': text, 'choices': choices, 'image_url': image_url}]
+        context = {'genre': genre, 'character': character, 'mood': mood, 'story_id': seed['id'],
+                   'history': StoryHistory([{'role': 'assistant', 'content': text}])}
+
+        for pick in seed.get('choices', []):
+            choice = _resolve_choice(pick, choices)
+            context['history'].append({'role': 'user', 'content': choice})
+            self._wait_for_turn()
+            text, choices, image_url = self.generator.generate_continuation(
+                context, choice, include_image=self.include_images
+            )
+            self._check(text)
+            context['history'].append({'role': 'assistant', 'content': text})
+            turns.append({'choice': choice, 'text': text, 'choices': choices, 'image_url': image_url})
+        return turns
+
+    def _run_seed(self, seed, output, progress):
+        start = time.perf_counter()
+        record = {'id': seed['id']}
+        for attempt in range(self.attempts):
+            try:
+                # Pre-rendering yields rate limit capacity to interactive requests
+                with background():
+                    turns = self.generate(seed)
+            except Exception as e:
+                record['error'] = str(e)
+                continue
+            record = {'id': seed['id'], 'genre': seed.get('genre', ''), 'character': seed.get('character', ''),
+                      'mood': seed.get('mood', ''), 'turns': turns}
+            break
+        record['seconds'] = round(time.perf_counter() - start, 3)
+
+        with self._write_lock:
+            output.write(json.dumps(record) + "\n")
+            output.flush()
+            failed = 'error' in record
+            self._stats['failed' if failed else 'stories'] += 1
+            self._stats['turns'] += 0 if failed else len(record['turns'])
+            if progress is not None:
+                progress(dict(self._stats))
+
+    def _check(self, text):
+        if text.startswith(ERROR_PREFIX):
+            raise StoryFailed(text)
+
+    def _wait_for_turn(self):
+        """Hold the worker while upstream is failing, then keep to the configured turn rate"""
+        resilience = getattr(self.generator, 'resilience', None)
+        while resilience is not None and not resilience.available('chat'):
+            time.sleep(0.5)
+        if not self.interval:
+            return
+        with self._pace_lock:
+            now = time.monotonic()
+            start = max(now, self._next_turn)
+            self._next_turn = start + self.interval
+        time.sleep(start - now)
+
+
+def _resolve_choice(pick, offered):
+    """The text of a choice given as text or as a 1-based index into the offered choices"""
+    if isinstance(pick, int):
+        if not 1 <= pick <= len(offered):
+            raise IndexError(f"Choice {pick} is not one of the {len(offered)} offered")
+        return offered[pick - 1]
+    return str(pick)
+
+
+def _ends_with_newline(path):
+    with open(path, 'rb') as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('seeds', help="JSONL file of story seeds")
+    parser.add_argument('--output', required=True, help="JSONL file results are appended to (and resumed from)")
+    parser.add_argument('--workers', type=int, default=4, help="Stories generated at once")
+    parser.add_argument('--images', action='store_true', help="Generate an illustration for every turn")
+    parser.add_argument('--use-cache', action='store_true', help="Allow cached introductions")
+    parser.add_argument('--turns-per-minute', type=float, help="Pace turns across all workers")
+    parser.add_argument('--attempts', type=int, default=3, help="Tries per story before it is recorded as failed")
+    args = parser.parse_args()
+
+    load_dotenv()
+    from story_generator import StoryGenerator
+    from metrics import Metrics
+    from model_router import ModelRouter, load_routes
+    from components import response_cache_from_env, rate_limiter_from_env, resilience_from_env, image_store_from_env
+
+    metrics = Metrics()
+    router = ModelRouter(load_routes(os.getenv('MODEL_ROUTES')))
+
+    # The web app's settings: with the sqlite backends, batch runs share its cached introductions and
+    # rate limit buckets, and their calls leave interactive requests RATE_LIMIT_RESERVE of every bucket.
+    # With IMAGE_STORE the library links to /images/ files the web app serves, not expiring upstream URLs
+    if os.getenv('RATE_LIMIT', 'off') != 'sqlite':
+        print("Note: batch calls only yield to the web app's requests with RATE_LIMIT=sqlite", file=sys.stderr)
+    if args.images and os.getenv('IMAGE_STORE', 'false').lower() != 'true':
+        print("Note: without IMAGE_STORE=true the library's image URLs expire after about an hour", file=sys.stderr)
+    generator = StoryGenerator(
+        inline_image_prompt=True,
+        metrics=metrics,
+        router=router,
+        cache=response_cache_from_env(),
+        resilience=resilience_from_env(rate_limiter_from_env(metrics)),
+        image_store=image_store_from_env()
+    )
+
+    runner = BatchRunner(
+        generator,
+        workers=args.workers,
+        include_images=args.images,
+        use_cache=args.use_cache,
+        turns_per_minute=args.turns_per_minute,
+        attempts=args.attempts
+    )
+
+    def progress(stats):
+        print(f"\r{stats['stories']} done, {stats['failed']} failed, {stats['turns']} turns",
+              end="", file=sys.stderr, flush=True)
+
+    report = runner.run(read_seeds(args.seeds), args.output, progress)
+    print(file=sys.stderr)
+    print(f"{report['stories']} stories ({report['turns']} turns) in {report['seconds']}s, "
+          f"{report['failed']} failed, {report['skipped']} already done")
+    print(f"{report['stories_per_sec']} stories/s, {report['turns_per_sec']} turns/s")
+    tokens = metrics.summary()['tokens']
+    if tokens:
+        total = sum(count for key, count in tokens.items() if not key.endswith(':cached'))  # Cached is part of prompt
+        print(f"Tokens: {total} ({', '.join(f'{k} {v}' for k, v in sorted(tokens.items()))})")
+    for task, models in router.stats().items():
+        for model, stats in models.items():
+            print(f"{task} on {model}: {stats['calls']} calls, p50 {stats['p50_s']}s, p95 {stats['p95_s']}s, "
+                  f"{stats['prompt_tokens'] + stats['completion_tokens']} tokens")
+    return 1 if report['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
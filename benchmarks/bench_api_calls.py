@@ -0,0 +1,59 @@
+"""Count OpenAI API calls per story turn with and without the inline image prompt.
+
+Plays a story (introduction, continuations, one modification) through the Flask
+routes against a fake OpenAI client with fixed per-call latency, once with a
+separate image prompt completion and once with the image prompt folded into the
+story completion. Runs offline.
+
+Usage: python benchmarks/bench_api_calls.py [--turns 10] [--latency 0.05]
+"""
+import argparse
+import os
+import sys
+import time
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests.fake_openai import FakeOpenAI
+
+
+def run(turns, latency, inline):
+    import app as app_module
+
+    fake_openai = FakeOpenAI(chat_latency=latency, image_latency=latency)
+    with patch('story_generator.openai', fake_openai), \
+            patch.object(app_module, 'story_generator', app_module.StoryGenerator(inline_image_prompt=inline)):
+        app_module.app.config['ASYNC_IMAGES'] = False
+        client = app_module.app.test_client()
+
+        start = time.perf_counter()
+        client.post('/initialize_story', json={'genre': 'fantasy', 'character': 'knight', 'mood': 'eerie'})
+        for _ in range(turns - 2):
+            client.post('/continue_story', json={'choice': 'Option 1'})
+        client.post('/modify_story', json={'command': 'Change the mood to hopeful'})
+        elapsed = time.perf_counter() - start
+
+    return {
+        'chat': fake_openai.call_count('chat') / turns,
+        'images': fake_openai.call_count('images') / turns,
+        'latency_ms': elapsed / turns * 1000
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--turns', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0.05, help="Seconds per fake API call")
+    args = parser.parse_args()
+
+    with patch.dict(os.environ, {'OPENAI_API_KEY': 'fake-api-key', 'RESPONSE_CACHE': 'off'}):
+        print(f"{'mode':>18} {'chat/turn':>10} {'images/turn':>12} {'calls/turn':>11} {'latency ms':>11}")
+        for label, inline in (('separate prompt', False), ('inline prompt', True)):
+            result = run(args.turns, args.latency, inline)
+            calls = result['chat'] + result['images']
+            print(f"{label:>18} {result['chat']:>10.1f} {result['images']:>12.1f} {calls:>11.1f} {result['latency_ms']:>11.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Compare per-turn latency with one model for everything against per-task routing with an SLO fallback.
+
+Plays story turns through StoryGenerator against a fake OpenAI client in which the
+primary model slows down (a brownout) halfway through the run, while a smaller
+model stays fast. Three routing tables are compared: every task on the primary,
+the cheap sub-tasks (choices, image prompts, summaries) on the small model, and
+additionally a fallback from the primary to the small model when its p95 latency
+exceeds --slo. Reports p50/p95 turn latency and the calls each model served.
+Runs offline.
+
+Usage: python benchmarks/bench_model_routing.py [--turns 40] [--fast 0.02] [--slow 0.08] [--brownout 0.25] [--slo 0.2]
+"""
+import argparse
+import os
+import sys
+import time
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests.fake_openai import FakeOpenAI
+from model_router import ModelRouter
+from resilience import ResilientCaller
+from story_history import StoryHistory
+
+SUB_TASKS = ('choices', 'image_prompt', 'summary')
+
+
+def routing_tables(slo):
+    cheap = {task: {'model': 'small-model'} for task in SUB_TASKS}
+    story = {task: {'model': 'big-model'} for task in ('introduction', 'continuation', 'modification')}
+    fallback = {task: {'model': 'big-model', 'fallback': 'small-model', 'slo': slo} for task in story}
+    return [
+        ('single model', dict(story, **{task: {'model': 'big-model'} for task in SUB_TASKS})),
+        ('per-task', dict(story, **cheap)),
+        ('per-task + fallback', dict(fallback, **cheap))
+    ]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run(args, routes):
+    from story_generator import StoryGenerator
+
+    fake_openai = FakeOpenAI(model_latency={'big-model': args.slow, 'small-model': args.fast})
+    router = ModelRouter(routes, window=10, min_samples=3, probe_interval=args.probe_interval)
+    with patch('story_generator.openai', fake_openai):
+        generator = StoryGenerator(router=router, resilience=ResilientCaller(retries=0))
+        context = {'genre': 'fantasy', 'character': 'knight', 'mood': 'eerie', 'history': StoryHistory()}
+        latencies = []
+        for turn in range(args.turns):
+            if turn == args.turns // 2:
+                fake_openai.model_latency['big-model'] = args.brownout
+            start = time.perf_counter()
+            text, choices, _ = generator.generate_continuation(context, "Option 1", include_image=False)
+            generator.generate_choices(context)
+            latencies.append(time.perf_counter() - start)
+            context['history'].append({'role': 'user', 'content': "Option 1"})
+            context['history'].append({'role': 'assistant', 'content': text})
+
+    served = {}
+    for endpoint, kwargs in fake_openai.calls:
+        served[kwargs['model']] = served.get(kwargs['model'], 0) + 1
+    return latencies, served
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--turns', type=int, default=40)
+    parser.add_argument('--fast', type=float, default=0.02, help="Seconds per call on the small model")
+    parser.add_argument('--slow', type=float, default=0.08, help="Seconds per call on the primary model")
+    parser.add_argument('--brownout', type=float, default=0.25, help="Primary latency in the second half of the run")
+    parser.add_argument('--slo', type=float, default=0.2, help="p95 seconds before falling back")
+    parser.add_argument('--probe-interval', type=float, default=2.0)
+    args = parser.parse_args()
+
+    with patch.dict(os.environ, {'OPENAI_API_KEY': 'fake-api-key'}):
+        print(f"{'routing':>20} {'p50 ms':>8} {'p95 ms':>8} {'calls per model':>24}")
+        for label, routes in routing_tables(args.slo):
+            latencies, served = run(args, routes)
+            calls = ", ".join(f"{model} {count}" for model, count in sorted(served.items()))
+            print(f"{label:>20} {percentile(latencies, 0.5) * 1000:>8.0f} {percentile(latencies, 0.95) * 1000:>8.0f} "
+                  f"{calls:>24}")
+
+
+if __name__ == '__main__':
+    main()
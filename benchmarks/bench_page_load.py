@@ -0,0 +1,40 @@
+"""Compare requests and bytes of cold and warm page loads with the source files and the built bundles.
+
+Loads the page through the Flask test client with a browser-like HTTP cache (see
+tests/fake_browser.py): once with an empty cache and once more with the cache the
+first load filled. The source files are served by Flask's static route and get
+revalidated on every load; the bundles from assets.py are fingerprinted, precompressed
+and cached as immutable. Byte counts are response bodies. Runs offline.
+
+Usage: python benchmarks/bench_page_load.py [--accept-encoding "gzip, deflate, br"]
+"""
+import argparse
+import os
+import sys
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests.fake_browser import FakeBrowser
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--accept-encoding', default='gzip, deflate, br')
+    args = parser.parse_args()
+
+    with patch.dict(os.environ, {'OPENAI_API_KEY': 'fake-api-key'}):
+        import app as app_module
+
+    client = app_module.app.test_client()
+    print(f"{'assets':>14} {'load':>5} {'requests':>9} {'304s':>5} {'bytes':>8}")
+    for label, manifest in (('source files', None), ('bundles', app_module.asset_manifest)):
+        with patch.object(app_module, 'asset_manifest', manifest):
+            browser = FakeBrowser(client, accept_encoding=args.accept_encoding)
+            for load in ('cold', 'warm'):
+                stats = browser.load()
+                print(f"{label:>14} {load:>5} {stats['requests']:>9} {stats['not_modified']:>5} {stats['bytes']:>8}")
+
+
+if __name__ == '__main__':
+    main()
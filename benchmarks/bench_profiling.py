@@ -0,0 +1,66 @@
+"""Measure the per-request cost of the profiling hooks: off, sampling a fraction of requests, and tracemalloc.
+
+Plays /initialize_story requests (uncached, so each does the same work) through the Flask
+test client against an instant fake OpenAI client, so the time measured is the app's own
+work: with profiling off, with the sampling profiler at --rate and at 1.0, and with
+tracemalloc tracing. Runs offline.
+
+Usage: python benchmarks/bench_profiling.py [--requests 300] [--rate 0.1] [--interval 0.005]
+"""
+import argparse
+import os
+import sys
+import time
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests.fake_openai import FakeOpenAI
+
+STORY = {'genre': 'fantasy', 'character': 'knight', 'mood': 'eerie', 'use_cache': False}
+
+
+def timed_requests(client, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        client.post('/initialize_story', json=STORY)
+    return (time.perf_counter() - start) / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--rate', type=float, default=0.1, help="Fraction of requests sampled")
+    parser.add_argument('--interval', type=float, default=0.005, help="Seconds between stack samples")
+    args = parser.parse_args()
+
+    with patch.dict(os.environ, {'OPENAI_API_KEY': 'fake-api-key'}):
+        import app as app_module
+        from profiling import SamplingProfiler, MemoryProfiler
+
+        with patch('story_generator.openai', FakeOpenAI()), \
+                patch.object(app_module, 'story_generator', app_module.StoryGenerator()), \
+                patch.object(app_module, 'profiler', SamplingProfiler(interval=args.interval)), \
+                patch.object(app_module, 'memory_profiler', MemoryProfiler()):
+            client = app_module.app.test_client()
+            timed_requests(client, 20)  # Warm up
+
+            settings = [
+                ('off', lambda: None),
+                (f'sampling {args.rate:g}', lambda: app_module.profiler.configure(rate=args.rate)),
+                ('sampling 1', lambda: app_module.profiler.configure(rate=1.0)),
+                ('tracemalloc', lambda: (app_module.profiler.configure(rate=0),
+                                         app_module.memory_profiler.configure(True)))
+            ]
+            print(f"{'profiling':>14} {'ms/request':>11} {'overhead':>9}")
+            baseline = None
+            for label, apply in settings:
+                apply()
+                seconds = timed_requests(client, args.requests)
+                baseline = baseline or seconds
+                print(f"{label:>14} {seconds * 1000:>11.3f} {(seconds / baseline - 1) * 100:>8.1f}%")
+            app_module.memory_profiler.configure(False)
+
+
+if __name__ == '__main__':
+    main()
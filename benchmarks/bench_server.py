@@ -0,0 +1,117 @@
+"""Compare cold start and steady-state throughput of the development server and gunicorn.
+
+Starts a fake OpenAI server, then each server mode as a subprocess: the Flask
+development server with the debugger and reloader (how app.py used to start), the
+development server without them, and gunicorn with gunicorn.conf.py when gunicorn
+is installed. Cold start is the time from spawning the server to the first 200
+from /readyz. Throughput comes from playing story sessions over HTTP as in
+load_test.py.
+
+Usage: python benchmarks/bench_server.py [--sessions 40] [--concurrency 20] [--chat-latency fixed:0.2]
+"""
+import argparse
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from tests.fake_openai import FakeOpenAIServer
+from load_test import latency_sampler, play_session, summarize
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def server_modes():
+    modes = [
+        ('dev (debug)', [sys.executable, 'app.py'], {'FLASK_DEBUG': 'true'}),
+        ('dev', [sys.executable, 'app.py'], {})
+    ]
+    if shutil.which('gunicorn'):
+        modes.append(('gunicorn', ['gunicorn', '-c', 'gunicorn.conf.py', 'app:app'], {'SESSION_STORE': 'sqlite'}))
+    return modes
+
+
+def wait_ready(base_url, process, deadline=60):
+    start = time.perf_counter()
+    while time.perf_counter() - start < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("server exited during startup")
+        try:
+            if requests.get(base_url + '/readyz', timeout=1).status_code == 200:
+                return time.perf_counter() - start
+        except requests.RequestException:
+            pass
+        time.sleep(0.01)
+    raise RuntimeError("server did not become ready")
+
+
+def measure(args, upstream, command, settings, tmpdir):
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    env = dict(os.environ, OPENAI_API_KEY='fake-api-key', OPENAI_BASE_URL=upstream.base_url, PORT=str(port),
+               SESSION_DB=os.path.join(tmpdir, f"sessions-{port}.db"), SECRET_KEY='bench-secret', **settings)
+    # A session of its own, so the reloader's child process is stopped with it
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                               start_new_session=True)
+    try:
+        cold_start = wait_ready(base_url, process)
+        latencies = []
+        lock = threading.Lock()
+
+        def record(path, seconds, ok):
+            with lock:
+                latencies.append(seconds if ok else None)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            for _ in range(args.sessions):
+                pool.submit(play_session, base_url, args.continues, record)
+        elapsed = time.perf_counter() - start
+    finally:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=30)
+
+    ok = [value for value in latencies if value is not None]
+    return cold_start, len(ok) / elapsed, len(latencies) - len(ok), summarize(ok)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=40)
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--continues', type=int, default=3)
+    parser.add_argument('--chat-latency', default='fixed:0.2')
+    parser.add_argument('--image-latency', default='fixed:0.3')
+    args = parser.parse_args()
+
+    upstream = FakeOpenAIServer(
+        latency=latency_sampler(args.chat_latency, 1), image_latency=latency_sampler(args.image_latency, 2)
+    ).start()
+    if not shutil.which('gunicorn'):
+        print("gunicorn is not installed; measuring the development server only")
+    print(f"{'server':>12} {'cold start s':>13} {'req/s':>8} {'errors':>7} {'p50 ms':>8} {'p95 ms':>8}")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for label, command, settings in server_modes():
+            cold_start, throughput, errors, latency = measure(args, upstream, command, settings, tmpdir)
+            print(f"{label:>12} {cold_start:>13.2f} {throughput:>8.1f} {errors:>7} "
+                  f"{latency['p50_ms']!s:>8} {latency['p95_ms']!s:>8}")
+    upstream.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""Measure per-turn cookie size and route latency as a story grows.
+
+Compares the session cookie the browser sends with server-side sessions against
+the signed cookie the old cookie-only session would have needed for the same
+history. Runs offline against a fake OpenAI client.
+
+Usage: python benchmarks/bench_session_payload.py [--turns 60] [--store memory|sqlite]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from session_store import create_session_store
+from story_history import StoryHistory
+from tests.fake_openai import FakeOpenAI
+
+WORDS = ("lantern light trembled across wet cobblestones knight pressed onward shadows whispered "
+         "ancient gate creaked silver mist curled around towers distant bells tolled midnight").split()
+
+
+def make_story(rng):
+    """A 2-3 paragraph turn (~1.5 KB of varied text, so cookie compression can't hide it)"""
+    paragraphs = [" ".join(rng.choice(WORDS) for _ in range(85)) for _ in range(3)]
+    return "\n\n".join(paragraphs) + "\n\nCHOICES: [\"Follow the lights\", \"Return to the inn\", \"Call out\"]"
+
+
+def run(turns, backend):
+    with patch.dict(os.environ, {'OPENAI_API_KEY': 'fake-api-key'}):
+        import app as app_module
+
+        with tempfile.TemporaryDirectory() as tmpdir, \
+                patch('story_generator.openai', FakeOpenAI()) as fake_openai:
+            rng = random.Random(42)
+            store = create_session_store(backend, path=os.path.join(tmpdir, 'sessions.db'))
+            app_module.session_store = store
+            app_module.story_generator = app_module.StoryGenerator()
+            client = app_module.app.test_client()
+            serializer = app_module.app.session_interface.get_signing_serializer(app_module.app)
+
+            fake_openai.story_text = make_story(rng)
+            client.post('/initialize_story', json={'genre': 'fantasy', 'character': 'knight', 'mood': 'eerie'})
+            print(f"{'turn':>5} {'cookie bytes':>13} {'legacy cookie bytes':>20} {'latency ms':>11}")
+            for turn in range(1, turns + 1):
+                fake_openai.story_text = make_story(rng)
+                cookie = client.get_cookie('session')
+                start = time.perf_counter()
+                client.post('/continue_story', json={'choice': 'Follow the lights'})
+                latency = (time.perf_counter() - start) * 1000
+
+                if turn in (1, 5, 10, 25, 50) or turn == turns:
+                    with client.session_transaction() as sess:
+                        context = store.get(sess['session_id'])
+                    history = StoryHistory.of(context['history']).messages()
+                    legacy = len(serializer.dumps({'story_context': dict(context, history=history)}))
+                    print(f"{turn:>5} {len(cookie.value):>13} {legacy:>20} {latency:>11.2f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--turns', type=int, default=60)
+    parser.add_argument('--store', choices=['memory', 'sqlite'], default='memory')
+    args = parser.parse_args()
+    run(args.turns, args.store)
@@ -0,0 +1,84 @@
+"""Measure how long `import app` takes and which modules it spends that time on.
+
+Runs `python -X importtime -c "import app"` in fresh interpreters and reports the
+median cumulative import time of app.py, the slowest top-level imports, and the
+wall-clock time until the interpreter exits. Exits non-zero when the median import
+time exceeds --max-ms or when one of the --lazy modules was imported at startup,
+so the script can guard against startup regressions in CI.
+
+Usage: python benchmarks/bench_startup.py [--runs 5] [--max-ms 600] [--lazy openai requests tiktoken]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Prints the lazily loaded modules that `import app` pulled in anyway
+PROBE = "import sys, app; print(' '.join(name for name in sys.argv[1:] if name in sys.modules))"
+
+
+def app_imports(stderr):
+    """Cumulative microseconds of `import app` and of each module app.py imports directly"""
+    children = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        # -X importtime lists a module after everything it imported
+        if depth == 0 and name.strip() == 'app':
+            return int(cumulative), children
+        if depth == 0:
+            children = []
+        elif depth == 1:
+            children.append((int(cumulative), name.strip()))
+    raise RuntimeError("app was not imported")
+
+
+def run_once(lazy):
+    env = dict(os.environ, OPENAI_API_KEY=os.getenv('OPENAI_API_KEY', 'fake-api-key'), SECRET_KEY='bench-secret')
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', PROBE, *lazy], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True)
+    wall = time.perf_counter() - start
+    return app_imports(result.stderr), wall, result.stdout.split()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--max-ms', type=float, default=600, help="fail when the median import of app exceeds this")
+    parser.add_argument('--lazy', nargs='*', default=['openai', 'requests', 'tiktoken'],
+                        help="modules that must not be imported by `import app`")
+    args = parser.parse_args()
+
+    runs = [run_once(args.lazy) for _ in range(args.runs)]
+    app_ms = statistics.median(total / 1000 for (total, _), _, _ in runs)
+    wall_ms = statistics.median(wall * 1000 for _, wall, _ in runs)
+
+    # The slowest imports of app.py itself, from the last run
+    children = sorted(runs[-1][0][1], reverse=True)
+    print(f"{'module':>24} {'cumulative ms':>14}")
+    for cumulative, name in children[:args.top]:
+        print(f"{name:>24} {cumulative / 1000:>14.1f}")
+    print(f"\nimport app: {app_ms:.1f} ms median over {args.runs} runs (limit {args.max_ms:g} ms)")
+    print(f"interpreter start to exit: {wall_ms:.1f} ms median")
+
+    failed = False
+    eager = sorted(set(name for _, _, loaded in runs for name in loaded))
+    if eager:
+        print(f"FAIL: imported at startup: {', '.join(eager)}")
+        failed = True
+    if app_ms > args.max_ms:
+        print(f"FAIL: import app took {app_ms:.1f} ms, over the {args.max_ms:g} ms limit")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Measure per-turn CPU and allocation of story history bookkeeping at 10, 100 and 1000 turns.
+
+Compares the list of {'role', 'content'} dicts the app used to keep, which builds
+every turn's message and counts every turn's tokens again for each prompt, with
+StoryHistory, which extends its message list and counts each turn once. A turn
+is: append the user's choice, render the history as messages, total its tokens,
+append the story passage. Also reports the bytes held by the history structure,
+excluding the turn texts, and for StoryHistory its cached message list.
+
+Usage: python benchmarks/bench_story_history.py [--turns 10 100 1000] [--runs 200]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from context_window import count_tokens
+from story_history import StoryHistory
+
+PASSAGE = "The lantern light trembled across the wet cobblestones as the knight pressed onward. " * 12
+CHOICE = "Follow the lights"
+
+
+def legacy_turn(history):
+    history.append({'role': 'user', 'content': CHOICE})
+    messages = [{'role': item['role'], 'content': item['content']} for item in history]
+    tokens = sum(count_tokens(item['content']) for item in history)
+    history.append({'role': 'assistant', 'content': PASSAGE})
+    return messages, tokens
+
+
+def compact_turn(history):
+    history.append({'role': 'user', 'content': CHOICE})
+    messages = history.messages()
+    tokens = sum(history.tokens(count_tokens))
+    history.append({'role': 'assistant', 'content': PASSAGE})
+    return messages, tokens
+
+
+def build(kind, turns):
+    """A history of `turns` turns, rendered after every turn as the app would have"""
+    history = [] if kind == 'legacy' else StoryHistory()
+    play = legacy_turn if kind == 'legacy' else compact_turn
+    history.append({'role': 'assistant', 'content': PASSAGE})
+    while len(history) < turns:
+        play(history)
+    return history
+
+
+def measure(kind, turns, runs):
+    play = legacy_turn if kind == 'legacy' else compact_turn
+    history = build(kind, turns)
+
+    elapsed = 0.0
+    for _ in range(runs):
+        copy = history.copy()  # Every run plays the same turn
+        start = time.perf_counter()
+        play(copy)
+        elapsed += time.perf_counter() - start
+
+    tracemalloc.start()
+    copy = history.copy()
+    before = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    play(copy)
+    allocated = tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+
+    # The turn texts themselves are shared by both structures
+    if kind == 'legacy':
+        size = sys.getsizeof(history) + sum(sys.getsizeof(item) for item in history)
+        cached = 0
+    else:
+        size = sys.getsizeof(history) + sys.getsizeof(history._turns) + sum(sys.getsizeof(turn) for turn in history)
+        cached = sys.getsizeof(history.messages())
+
+    return elapsed / runs * 1e6, allocated, size, cached
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--turns', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--runs', type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'turns':>6} {'history':>9} {'us/turn':>9} {'alloc/turn':>11} {'structure bytes':>16} {'msg cache':>11}")
+    for turns in args.turns:
+        for kind in ('legacy', 'compact'):
+            micros, allocated, size, cached = measure(kind, turns, args.runs)
+            print(f"{turns:>6} {kind:>9} {micros:>9.1f} {allocated:>11} {size:>16} {cached:>11}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+// Compare render time and DOM size of a long story between appending HTML and the windowed StoryLog.
+//
+// Builds a story turn by turn in jsdom, once the way the page used to (every turn appended as
+// HTML to one growing container) and once through static/js/story_log.js with one animation
+// frame per turn, then scrolls the StoryLog from top to bottom a screen at a time. jsdom does
+// no layout, so the StoryLog works from its estimated entry heights in a 500px tall container.
+// Reports total and p95 per-turn time and the number of nodes left in the story container.
+// Runs offline; needs jsdom (`npm install --no-save jsdom` in the repository root).
+//
+// Usage: node benchmarks/bench_story_render.js [--turns 200] [--paragraphs 3] [--json]
+
+const path = require('path');
+const { performance } = require('perf_hooks');
+const { JSDOM } = require('jsdom');
+const StoryLog = require(path.join(__dirname, '..', 'static', 'js', 'story_log.js'));
+
+const VIEW_HEIGHT = 500; // #story-text's max-height
+
+function parseArgs(argv) {
+    const args = { turns: 200, paragraphs: 3, json: false };
+    for (let i = 0; i < argv.length; i++) {
+        if (argv[i] === '--json') args.json = true;
+        else if (argv[i] === '--turns') args.turns = parseInt(argv[++i], 10);
+        else if (argv[i] === '--paragraphs') args.paragraphs = parseInt(argv[++i], 10);
+    }
+    return args;
+}
+
+function turnEntries(turn, paragraphs) {
+    const sentence = `On turn ${turn} the path bends toward the old tower, and the wind carries a song nobody remembers. `;
+    const text = Array.from({ length: paragraphs }, () => `<p>${sentence.repeat(4).trim()}</p>`).join('');
+    const entries = [`<p class="user-choice">You chose: Option ${turn % 3 + 1}</p>`, text];
+    if (turn % 3 === 0) entries.push('<p class="reflection-question">What do you hope will happen next?</p>');
+    return entries;
+}
+
+function createContainer() {
+    const dom = new JSDOM('<!DOCTYPE html><div id="story-text"></div>');
+    const container = dom.window.document.getElementById('story-text');
+    // jsdom has no layout: give the container a viewport and a scroll position to work with
+    let scrollTop = 0;
+    Object.defineProperty(container, 'clientHeight', { get: () => VIEW_HEIGHT });
+    Object.defineProperty(container, 'scrollTop', { get: () => scrollTop, set: value => { scrollTop = value; } });
+    return { dom, container };
+}
+
+function percentile(values, fraction) {
+    const ordered = [...values].sort((a, b) => a - b);
+    return ordered[Math.min(ordered.length - 1, Math.floor(fraction * ordered.length))];
+}
+
+function countNodes(container) {
+    return container.getElementsByTagName('*').length;
+}
+
+function runAppend(args) {
+    const { dom, container } = createContainer();
+    const document = dom.window.document;
+    const times = [];
+    for (let turn = 0; turn < args.turns; turn++) {
+        const start = performance.now();
+        turnEntries(turn, args.paragraphs).forEach(html => {
+            const div = document.createElement('div');
+            div.innerHTML = html;
+            container.appendChild(div);
+        });
+        container.lastChild.scrollIntoView();
+        times.push(performance.now() - start);
+    }
+    return { times, nodes: countNodes(container) };
+}
+
+function runStoryLog(args) {
+    const { container } = createContainer();
+    let pending = null;
+    const log = new StoryLog(container, { requestFrame: callback => { pending = callback; return 1; } });
+    const frame = () => {
+        const callback = pending;
+        pending = null;
+        if (callback) callback();
+    };
+
+    const times = [];
+    for (let turn = 0; turn < args.turns; turn++) {
+        const start = performance.now();
+        turnEntries(turn, args.paragraphs).forEach(html => log.append(html));
+        log.scrollToEnd();
+        frame();
+        times.push(performance.now() - start);
+    }
+    const nodes = countNodes(container);
+
+    // Scroll back to the top, then down through the whole story a screen at a time
+    const scrollTimes = [];
+    let maxNodes = 0;
+    const total = log.entries.length * log.estimatedHeight;
+    for (let top = 0; top <= total; top += VIEW_HEIGHT) {
+        const start = performance.now();
+        container.scrollTop = top;
+        log.schedule();
+        frame();
+        scrollTimes.push(performance.now() - start);
+        maxNodes = Math.max(maxNodes, countNodes(container));
+    }
+    return { times, nodes, scrollTimes, maxNodes };
+}
+
+function main() {
+    const args = parseArgs(process.argv.slice(2));
+    const results = { append: runAppend(args), story_log: runStoryLog(args) };
+    const summary = {};
+    Object.entries(results).forEach(([name, result]) => {
+        summary[name] = {
+            total_ms: result.times.reduce((sum, time) => sum + time, 0),
+            p95_turn_ms: percentile(result.times, 0.95),
+            last_turn_ms: result.times[result.times.length - 1],
+            nodes: result.nodes
+        };
+        if (result.scrollTimes) {
+            summary[name].p95_scroll_frame_ms = percentile(result.scrollTimes, 0.95);
+            summary[name].max_scroll_nodes = result.maxNodes;
+        }
+    });
+
+    if (args.json) {
+        console.log(JSON.stringify(summary));
+        return;
+    }
+    console.log(`${args.turns} turns, ${args.paragraphs} paragraphs each`);
+    console.log(`${'rendering'.padStart(10)} ${'total ms'.padStart(9)} ${'p95 turn ms'.padStart(12)} ` +
+                `${'last turn ms'.padStart(13)} ${'nodes'.padStart(6)} ${'p95 scroll ms'.padStart(14)}`);
+    Object.entries(summary).forEach(([name, row]) => {
+        const scroll = row.p95_scroll_frame_ms === undefined ? '-' : row.p95_scroll_frame_ms.toFixed(2);
+        console.log(`${name.padStart(10)} ${row.total_ms.toFixed(1).padStart(9)} ${row.p95_turn_ms.toFixed(2).padStart(12)} ` +
+                    `${row.last_turn_ms.toFixed(2).padStart(13)} ${String(row.nodes).padStart(6)} ${scroll.padStart(14)}`);
+    });
+}
+
+main();
@@ -0,0 +1,112 @@
+"""Measure story archive append and read latency with a large number of stories.
+
+Fills a temporary SQLite story store with `--stories` stories of `--turns` turns
+spread over `--owners` owners, then times appending a turn to a story, listing
+an owner's stories a page at a time and reading a story's turns a page at a time.
+Reports p50/p99 latency and the database size.
+
+Usage: python benchmarks/bench_story_store.py [--stories 100000] [--turns 10] [--owners 10000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from story_store import SQLiteStoryStore
+
+
+def context(story_id, turns):
+    return {
+        'genre': 'fantasy', 'character': 'knight', 'mood': 'eerie', 'story_id': story_id,
+        'history': [{'role': 'assistant' if i % 2 == 0 else 'user', 'content': "Story text. " * 60}
+                    for i in range(turns)]
+    }
+
+
+def populate(store, stories, turns, owners):
+    """Bulk insert stories in large transactions, outside the timed section"""
+    connection = store._connection()
+    now = time.time() - stories
+    for start in range(0, stories, 5000):
+        with connection:
+            for i in range(start, min(start + 5000, stories)):
+                story_id = f"story-{i}"
+                connection.execute(
+                    "INSERT INTO stories (id, owner, genre, character, mood, created_at, updated_at, turn_count) "
+                    "VALUES (?, ?, 'fantasy', 'knight', 'eerie', ?, ?, ?)",
+                    (story_id, f"owner-{i % owners}", now + i, now + i, turns)
+                )
+                connection.executemany(
+                    "INSERT INTO story_turns (story_id, turn, role, content, choices, image_url, created_at) "
+                    "VALUES (?, ?, ?, ?, NULL, NULL, ?)",
+                    [(story_id, turn, 'assistant' if turn % 2 == 0 else 'user', "Story text. " * 60, now + i)
+                     for turn in range(turns)]
+                )
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return (samples[len(samples) // 2] * 1000, samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000)
+
+
+def timed(func, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return percentiles(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--stories', type=int, default=100000)
+    parser.add_argument('--turns', type=int, default=10)
+    parser.add_argument('--owners', type=int, default=10000)
+    parser.add_argument('--runs', type=int, default=1000)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "stories.db")
+        store = SQLiteStoryStore(path)
+
+        start = time.perf_counter()
+        populate(store, args.stories, args.turns, args.owners)
+        print(f"populated {args.stories} stories x {args.turns} turns in {time.perf_counter() - start:.1f}s")
+
+        growing = context("bench-story", 1)
+
+        def append():
+            growing['history'].append({'role': 'user', 'content': "Option 1"})
+            growing['history'].append({'role': 'assistant', 'content': "Story text. " * 60})
+            store.append("owner-0", growing, choices=["Option 1", "Option 2", "Option 3"])
+
+        def list_pages():
+            owner = f"owner-{rng.randrange(args.owners)}"
+            page = store.list_stories(owner, limit=5)
+            if page:
+                store.list_stories(owner, limit=5, before=page[-1]['created_at'])
+
+        def read_turns():
+            story_id = f"story-{rng.randrange(args.stories)}"
+            store.get_turns(story_id, limit=5)
+            store.get_turns(story_id, after=4, limit=5)
+
+        store.append("owner-0", growing)
+        print(f"{'operation':>22} {'p50 ms':>8} {'p99 ms':>8}")
+        for label, func in (('append turn', append), ('list stories (2 pages)', list_pages),
+                            ('read turns (2 pages)', read_turns)):
+            p50, p99 = timed(func, args.runs)
+            print(f"{label:>22} {p50:>8.3f} {p99:>8.3f}")
+
+        size = sum(os.path.getsize(os.path.join(tmpdir, name)) for name in os.listdir(tmpdir))
+        print(f"database size: {size / 1e6:.0f} MB")
+
+
+if __name__ == '__main__':
+    main()
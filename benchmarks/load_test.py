@@ -0,0 +1,242 @@
+"""Load-test the Flask app against a deterministic local stand-in for the OpenAI API.
+
+Starts a fake chat/images server with seeded latency distributions and the app
+on a threaded WSGI server, then plays story sessions (initialize, continue,
+modify) at the requested concurrency over real HTTP. Reports p50/p95/p99
+latency per route, requests/sec and upstream API calls per turn, and writes a
+JSON report that can be compared with an earlier one.
+
+Usage:
+    python benchmarks/load_test.py --sessions 50 --concurrency 10 --output report.json
+    python benchmarks/load_test.py --compare report.json
+    python benchmarks/load_test.py --set ASYNC_OPENAI=true --set ASYNC_IMAGES=true
+    python benchmarks/load_test.py --concurrency 40 --upstream-capacity 8 --set ADMISSION_CONTROL=true
+
+Latency specs: "fixed:0.5", "uniform:0.2,0.8" or "lognormal:MEDIAN,SIGMA" (seconds).
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests.fake_openai import FakeOpenAIServer
+
+ROUTES = ('/initialize_story', '/continue_story', '/modify_story')
+RETRIES = 2  # Retries of a 503 per turn, as the page makes
+
+
+def latency_sampler(spec, seed):
+    """A thread-safe, seeded sampler for a latency spec"""
+    kind, _, params = spec.partition(':')
+    values = [float(value) for value in params.split(',') if value]
+    rng = random.Random(seed)
+    lock = threading.Lock()
+
+    if kind == 'fixed':
+        return lambda: values[0]
+    if kind == 'uniform':
+        low, high = values
+
+        def sample():
+            with lock:
+                return rng.uniform(low, high)
+        return sample
+    if kind == 'lognormal':
+        median, sigma = values
+
+        def sample():
+            with lock:
+                return rng.lognormvariate(math.log(median), sigma)
+        return sample
+    raise ValueError(f"Unknown latency spec: {spec}")
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = max(0, math.ceil(fraction * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def summarize(latencies):
+    values = sorted(latencies)
+    return {
+        'count': len(values),
+        'p50_ms': round(percentile(values, 0.50) * 1000, 1) if values else None,
+        'p95_ms': round(percentile(values, 0.95) * 1000, 1) if values else None,
+        'p99_ms': round(percentile(values, 0.99) * 1000, 1) if values else None,
+        'max_ms': round(values[-1] * 1000, 1) if values else None
+    }
+
+
+def play_session(base_url, continues, record):
+    """One user: start a story, pick a few choices, then issue a command; gives up on the first failed turn.
+
+    Like the page, a 503 is retried up to RETRIES times after the Retry-After it names.
+    """
+    http = requests.Session()
+    steps = [('/initialize_story', {'genre': 'fantasy', 'character': 'a wandering knight', 'mood': 'eerie'})]
+    steps += [('/continue_story', {'choice': 'Option 1'})] * continues
+    steps += [('/modify_story', {'command': 'Change the mood to hopeful'})]
+    for path, payload in steps:
+        start = time.perf_counter()
+        degraded = None
+        try:
+            for retry in range(RETRIES + 1):
+                response = http.post(base_url + path, json=payload, timeout=300)
+                status = response.status_code
+                if status != 503 or retry == RETRIES:
+                    break
+                time.sleep(float(response.headers.get('Retry-After', 1)))
+            if status == 200:
+                degraded = response.json().get('degraded')
+        except requests.RequestException:
+            status = 'error'
+        record(path, time.perf_counter() - start, status, degraded)
+        if status != 200:
+            return
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    upstream = FakeOpenAIServer(
+        latency=latency_sampler(args.chat_latency, args.seed),
+        image_latency=latency_sampler(args.image_latency, args.seed + 1),
+        capacity=args.upstream_capacity
+    ).start()
+
+    # The app reads its configuration at import time, and the OpenAI clients read OPENAI_BASE_URL
+    os.environ.update({'OPENAI_API_KEY': 'fake-api-key', 'OPENAI_BASE_URL': upstream.base_url})
+    for setting in args.set:
+        key, _, value = setting.partition('=')
+        os.environ[key] = value
+    import app as app_module
+    from werkzeug.serving import make_server
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)  # No per-request access log
+    server = make_server('127.0.0.1', 0, app_module.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+
+    latencies = {route: [] for route in ROUTES}
+    errors = {route: 0 for route in ROUTES}
+    statuses = {}
+    degraded_turns = {}
+    lock = threading.Lock()
+
+    def record(path, seconds, status, degraded):
+        with lock:
+            latencies[path].append(seconds)
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+            if status != 200:
+                errors[path] += 1
+            if degraded is not None:
+                degraded_turns[degraded] = degraded_turns.get(degraded, 0) + 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for _ in range(args.sessions):
+            pool.submit(play_session, base_url, args.continues, record)
+    elapsed = time.perf_counter() - start
+
+    server.shutdown()
+    upstream.stop()
+
+    turns = sum(len(values) for values in latencies.values())
+    return {
+        'commit': git_commit(),
+        'config': {
+            'sessions': args.sessions,
+            'concurrency': args.concurrency,
+            'continues': args.continues,
+            'chat_latency': args.chat_latency,
+            'image_latency': args.image_latency,
+            'upstream_capacity': args.upstream_capacity,
+            'seed': args.seed,
+            'settings': args.set
+        },
+        'duration_s': round(elapsed, 3),
+        'requests': turns,
+        'errors': sum(errors.values()),
+        'statuses': statuses,
+        'degraded': degraded_turns,
+        'requests_per_sec': round(turns / elapsed, 2),
+        'latency': dict({route: summarize(values) for route, values in latencies.items()},
+                        all=summarize([value for values in latencies.values() for value in values])),
+        'api_calls_per_turn': {
+            'chat': round(upstream.request_count('chat') / turns, 3),
+            'images': round(upstream.request_count('images') / turns, 3),
+            'total': round(upstream.request_count() / turns, 3)
+        }
+    }
+
+
+def print_report(report, baseline=None):
+    def delta(new, old):
+        if baseline is None or new is None or old is None:
+            return ""
+        return f" ({(new - old) / old * 100:+.1f}%)" if old else ""
+
+    print(f"{report['requests']} requests in {report['duration_s']}s, {report['errors']} errors, "
+          f"{report['requests_per_sec']} req/s"
+          f"{delta(report['requests_per_sec'], baseline and baseline['requests_per_sec'])}")
+    print(f"{'route':>18} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for route, stats in report['latency'].items():
+        old = baseline['latency'].get(route, {}) if baseline else {}
+        print(f"{route:>18} {stats['p50_ms']!s:>9} {stats['p95_ms']!s:>9} {stats['p99_ms']!s:>9}"
+              f"{delta(stats['p95_ms'], old.get('p95_ms'))}")
+    calls = report['api_calls_per_turn']
+    print(f"API calls per turn: {calls['total']} (chat {calls['chat']}, images {calls['images']})")
+    print("Responses: " + ", ".join(f"{status} x{count}" for status, count in sorted(report['statuses'].items())))
+    if report['degraded']:
+        print("Degraded turns: " + ", ".join(f"{level} x{count}" for level, count in sorted(report['degraded'].items())))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=50, help="Story sessions to play")
+    parser.add_argument('--concurrency', type=int, default=10, help="Sessions in flight at once")
+    parser.add_argument('--continues', type=int, default=3, help="Choices picked per session")
+    parser.add_argument('--chat-latency', default='lognormal:0.8,0.3')
+    parser.add_argument('--image-latency', default='lognormal:2.0,0.3')
+    parser.add_argument('--upstream-capacity', type=int, help="Requests the fake API works on at once (default unlimited)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--set', action='append', default=[], metavar='KEY=VALUE',
+                        help="App setting (environment variable) for this run; repeatable")
+    parser.add_argument('--output', help="Write the JSON report here")
+    parser.add_argument('--compare', help="Earlier JSON report to show changes against")
+    args = parser.parse_args()
+
+    report = run(args)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""Components configured from the environment, shared by the web app (app.py) and batch runs (batch.py).
+
+Both entry points build these from the same variables, so a batch run uses the same cache,
+rate limit buckets, resilience settings and image store as the web workers on the host.
+"""
+import os
+from image_store import ImageStore
+from rate_limiter import create_rate_limiter
+from resilience import ResilientCaller
+from response_cache import create_response_cache
+
+
+def response_cache_from_env():
+    """RESPONSE_CACHE and its settings, or None when it is off"""
+    return create_response_cache(
+        os.getenv('RESPONSE_CACHE', 'off'),
+        path=os.getenv('RESPONSE_CACHE_DB', 'response_cache.db'),
+        ttl=int(os.getenv('RESPONSE_CACHE_TTL', '3000')),
+        max_entries=int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '1000')),
+        variants=int(os.getenv('RESPONSE_CACHE_VARIANTS', '3')),
+        image_url_ttl=int(os.getenv('RESPONSE_CACHE_IMAGE_TTL', '3000'))
+    )
+
+
+def rate_limiter_from_env(metrics):
+    """RATE_LIMIT token buckets and their settings, or None when it is off"""
+    return create_rate_limiter(
+        os.getenv('RATE_LIMIT', 'off'),
+        path=os.getenv('RATE_LIMIT_DB', 'rate_limits.db'),
+        metrics=metrics,
+        chat_rpm=int(os.getenv('CHAT_RPM', '3500')),
+        chat_tpm=int(os.getenv('CHAT_TPM', '90000')),
+        image_rpm=int(os.getenv('IMAGE_RPM', '50')),
+        burst=float(os.getenv('RATE_LIMIT_BURST', '10')),
+        reserve=float(os.getenv('RATE_LIMIT_RESERVE', '0.2'))
+    )
+
+
+def resilience_from_env(limiter):
+    """Deadlines, retries and circuit breakers from the OPENAI_*, TURN_LATENCY_BUDGET and CIRCUIT_* settings"""
+    return ResilientCaller(
+        timeout=float(os.getenv('OPENAI_TIMEOUT', '30')),
+        retries=int(os.getenv('OPENAI_RETRIES', '2')),
+        turn_budget=float(os.getenv('TURN_LATENCY_BUDGET', '60')),
+        failure_threshold=int(os.getenv('CIRCUIT_FAILURES', '5')),
+        reset_timeout=float(os.getenv('CIRCUIT_RESET', '30')),
+        limiter=limiter
+    )
+
+
+def image_store_from_env():
+    """The IMAGE_STORE directory store, or None when it is off"""
+    if os.getenv('IMAGE_STORE', 'false').lower() != 'true':
+        return None
+    return ImageStore(
+        os.getenv('IMAGE_STORE_DIR', 'image_store'),
+        max_bytes=int(float(os.getenv('IMAGE_STORE_MAX_MB', '500')) * 1024 * 1024),
+        b64=os.getenv('IMAGE_B64', 'false').lower() == 'true'
+    )
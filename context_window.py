@@ -0,0 +1,135 @@
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from story_history import StoryHistory
+from prompts import summary_text
+
+_encoding = None
+_encoding_loaded = False
+
+
+def _get_encoding():
+    # Loading the tokenizer reads (and on first run downloads) its vocabulary, so wait until a count is needed
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:  # tiktoken is optional
+            _encoding = None
+        _encoding_loaded = True
+    return _encoding
+
+
+def count_tokens(text):
+    """Count tokens with tiktoken when installed, otherwise estimate ~4 characters per token"""
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return (len(text) + 3) // 4
+
+
+def count_message_tokens(messages):
+    """Approximate prompt tokens for a list of chat messages"""
+    # Each message carries a few tokens of role/formatting overhead
+    return sum(count_tokens(message['content']) + 4 for message in messages)
+
+
+class ContextWindow:
+    """Bounded story history for prompts: a rolling summary plus the most recent turns verbatim.
+
+    Older turns are folded into the summary by a background worker, so building a
+    prompt never waits on summarization. Summaries are cached per story in a
+    SessionStore under "summary:<story_id>", which lets several workers share them.
+
+    Turns are folded `fold_turns` at a time, once more than `recent_turns` turns
+    follow the summary, and every turn after the summary stays verbatim. Between two
+    folds each prompt therefore starts with the previous one, which keeps the prefix
+    the API's prompt cache matches on.
+    """
+
+    def __init__(self, store, recent_turns=6, token_budget=2000, workers=1, fold_turns=4):
+        self.store = store
+        self.recent_turns = recent_turns
+        self.fold_turns = max(1, fold_turns)
+        self.token_budget = token_budget  # Tokens allowed for the rendered history
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="story-summary")
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def window(self, story_context, summarize):
+        """(summary, start, end): the summary to show (or None) and the range of turns to keep verbatim.
+
+        Queues summarization of turns that fell out of the window.
+        """
+        history = StoryHistory.of(story_context['history'])
+        end = len(history)
+        story_id = story_context.get('story_id')
+
+        summary, covered = self._cached_summary(story_id, history, end)
+
+        # Keep within budget by dropping the oldest verbatim turns a block at a time, always keeping the latest one
+        budget = self.token_budget - (count_tokens(summary_text(summary)) if summary else 0)
+        tokens = history.tokens(count_tokens, covered, end)
+        start, total = covered, sum(tokens)
+        while end - start > 1 and total > budget:
+            step = min(self.fold_turns, end - 1 - start)
+            total -= sum(tokens[start - covered:start - covered + step])
+            start += step
+
+        # The summary only ever ends on a block boundary; until it catches up, the turns stay verbatim.
+        # Turns dropped for the budget are folded in at once, so they are only missing until the summary lands.
+        fold_to = max((end - self.recent_turns) // self.fold_turns * self.fold_turns, start)
+        if fold_to > covered and story_id is not None:
+            self._schedule(story_id, history[:fold_to], summarize)
+        return summary, start, end
+
+    def wait(self):
+        """Block until queued summaries are written (used by tests and benchmarks)"""
+        self._executor.submit(lambda: None).result()
+
+    def _cached_summary(self, story_id, history, count=None):
+        count = len(history) if count is None else count
+        if story_id is None:
+            return None, 0
+        cached = self.store.get(f"summary:{story_id}")
+        if not cached:
+            return None, 0
+        covered = cached['covered']
+        # A summary only applies if the turns it covers are still the start of the history
+        if covered > count or cached['anchor'] != self._anchor(history, covered):
+            return None, 0
+        return cached['text'], covered
+
+    def _schedule(self, story_id, turns, summarize):
+        with self._lock:
+            if story_id in self._pending:
+                return
+            self._pending.add(story_id)
+        self._executor.submit(self._summarize, story_id, list(turns), summarize)
+
+    def _summarize(self, story_id, turns, summarize):
+        try:
+            summary, covered = self._cached_summary(story_id, turns)
+            if covered >= len(turns):
+                return
+            new_turns = [item['content'] for item in turns[covered:]]
+            text = summarize(summary, new_turns)
+            if text:
+                self.store.set(f"summary:{story_id}", {
+                    'text': text,
+                    'covered': len(turns),
+                    'anchor': self._anchor(turns, len(turns))
+                })
+        except Exception as e:
+            print(f"Error summarizing story history: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(story_id)
+
+    def _anchor(self, history, count):
+        # Fingerprint of the first `count` turns, so a restarted story never reuses a stale summary
+        if count == 0:
+            return None
+        last = history[count - 1]['content'].encode('utf-8')
+        return f"{count}:{hashlib.sha1(last).hexdigest()}"
@@ -0,0 +1,45 @@
+# Production server settings: gunicorn -c gunicorn.conf.py app:app
+import multiprocessing
+import os
+
+bind = os.getenv('BIND', f"0.0.0.0:{os.getenv('PORT', '5000')}")
+
+# Import app.py once in the master, so the story generator, stores and caches are built a single
+# time and shared copy-on-write. Worker threads, the asyncio loop, HTTP connection pools and the
+# SQLite stores' connections are all opened on first use in the worker, so none is inherited across
+# the fork. The one exception, the profiler's sampler thread, is restarted in post_fork below.
+preload_app = True
+
+# A turn spends nearly all of its time waiting on OpenAI, so each worker serves many requests on
+# threads and the worker count only needs to cover CPU work. Memory session stores are per process,
+# so stories only survive across requests with one worker unless SESSION_STORE=sqlite.
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '32'))
+if os.getenv('WEB_CONCURRENCY'):
+    workers = int(os.getenv('WEB_CONCURRENCY'))
+elif os.getenv('SESSION_STORE', 'memory') == 'memory':
+    workers = 1
+else:
+    workers = multiprocessing.cpu_count()
+
+# Streamed and slow turns may legitimately run up to the turn latency budget
+timeout = int(float(os.getenv('TURN_LATENCY_BUDGET', '60'))) + 30
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = os.getenv('ACCESS_LOG')  # e.g. "-" for stdout; off by default
+
+
+def when_ready(server):
+    # story_generator imports openai on first use; do it once in the master before the workers are
+    # forked, so they share it and no worker's first turn pays for the import
+    import openai  # noqa: F401
+
+
+def post_fork(server, worker):
+    # Threads do not survive fork, so a sampler PROFILE_SAMPLE_RATE started in the master is gone
+    import app
+    rate = app.profiler.rate
+    if rate:
+        app.profiler.configure(rate=0)
+        app.profiler.configure(rate=rate)
@@ -0,0 +1,155 @@
+import queue
+import threading
+import time
+import uuid
+
+from rate_limiter import background
+
+
+class QueueFullError(Exception):
+    """Raised when the image queue cannot accept any more jobs"""
+
+
+class ImageJob:
+    """State of a single background image generation"""
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    TIMEOUT = 'timeout'
+
+    def __init__(self, func, args, timeout):
+        self.id = uuid.uuid4().hex
+        self.func = func
+        self.args = args
+        self.status = self.PENDING
+        self.image_url = None
+        self.error = None
+        self.created_at = time.monotonic()
+        self.deadline = self.created_at + timeout
+        self.finished_at = None
+
+    def expired(self, now=None):
+        """Whether the job has run past its deadline without finishing"""
+        now = time.monotonic() if now is None else now
+        return self.status in (self.PENDING, self.RUNNING) and now > self.deadline
+
+    def to_dict(self):
+        """Serialize the job for the polling endpoint"""
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'image_url': self.image_url,
+            'error': self.error
+        }
+
+
+class ImageJobQueue:
+    """Bounded worker pool that generates story images off the request path"""
+
+    def __init__(self, workers=2, max_queue=32, timeout=60, retention=600):
+        self.workers = workers
+        self.timeout = timeout
+        self.retention = retention  # Seconds a finished job stays pollable
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def submit(self, func, *args):
+        """Queue func(*args) to produce an image URL and return the job id"""
+        self._ensure_workers()
+        job = ImageJob(func, args, self.timeout)
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job.id]
+            raise QueueFullError("Image queue is full")
+        return job.id
+
+    def status(self, job_id):
+        """Return the job's current state as a dict, or None if the id is unknown"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            if job.expired():
+                job.status = ImageJob.TIMEOUT
+                job.finished_at = time.monotonic()
+            return job.to_dict()
+
+    def wait(self, job_id, timeout=None):
+        """Block until the job leaves the pending/running states (mainly for tests and scripts)"""
+        end = time.monotonic() + (self.timeout if timeout is None else timeout)
+        while time.monotonic() < end:
+            state = self.status(job_id)
+            if state is None or state['status'] not in (ImageJob.PENDING, ImageJob.RUNNING):
+                return state
+            time.sleep(0.01)
+        return self.status(job_id)
+
+    def pending(self):
+        """Number of jobs waiting for a worker"""
+        return self._queue.qsize()
+
+    def _ensure_workers(self):
+        if self._threads:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"image-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            try:
+                self._run(job)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job):
+        with self._lock:
+            # Jobs that waited in the queue past their deadline are not worth starting
+            if job.expired():
+                job.status = ImageJob.TIMEOUT
+                job.finished_at = time.monotonic()
+                return
+            job.status = ImageJob.RUNNING
+
+        try:
+            # Deferred images yield rate limit capacity to interactive requests
+            with background():
+                image_url = job.func(*job.args)
+            error = None if image_url else "No image was generated"
+        except Exception as e:
+            print(f"Error in background image job: {e}")
+            image_url, error = None, str(e)
+
+        with self._lock:
+            # A job reported as timed out keeps that status even if it finishes later
+            if job.status != ImageJob.RUNNING:
+                return
+            if job.expired():
+                job.status = ImageJob.TIMEOUT
+            elif error:
+                job.status, job.error = ImageJob.FAILED, error
+            else:
+                job.status, job.image_url = ImageJob.DONE, image_url
+            job.finished_at = time.monotonic()
+
+    def _prune(self):
+        # Caller holds the lock
+        now = time.monotonic()
+        stale = [job_id for job_id, job in self._jobs.items()
+                 if job.finished_at is not None and now - job.finished_at > self.retention]
+        for job_id in stale:
+            del self._jobs[job_id]
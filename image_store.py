@@ -0,0 +1,210 @@
+import base64
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional; without it variants fall back to the original
+    Image = None
+
+try:
+    import fcntl
+except ImportError:  # Not on Windows; there the bound is only kept per process
+    fcntl = None
+
+# Widths a client may ask for, so variants cannot be used to fill the disk
+VARIANT_WIDTHS = (256, 384, 512)
+VARIANT_FORMATS = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+MIME_TYPES = {'png': 'image/png', 'webp': 'image/webp', 'jpeg': 'image/jpeg'}
+
+_IMAGE_ID = re.compile(r"^[0-9a-f]{64}$")
+
+
+class ImageStore:
+    """Content-addressed on-disk store for generated images.
+
+    Images are saved once under the SHA-256 of their bytes, either downloaded
+    from the expiring upstream URL (streamed to disk) or decoded from b64_json.
+    The store is bounded to `max_bytes`, counted over the files on disk so that
+    worker processes sharing the directory share the bound. The least recently
+    served images are evicted first, together with their variants. Smaller
+    variants for mobile clients are transcoded on first request when Pillow is
+    installed.
+    """
+
+    # Temp files older than this are left over from a crashed write, not another process's download
+    STALE_PART_AGE = 3600
+
+    def __init__(self, root, max_bytes=500 * 1024 * 1024, download_timeout=30, b64=False):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.download_timeout = download_timeout
+        self.b64 = b64  # Ask the API for b64_json instead of a URL to download
+        self._size = 0  # Bytes on disk as of the last scan
+        self._lock = threading.Lock()
+
+        os.makedirs(root, exist_ok=True)
+        self._load()
+
+    def save(self, image):
+        """Store one item of an images.generate response and return the URL it is served at"""
+        if getattr(image, 'b64_json', None):
+            return self.url(self.save_b64(image.b64_json))
+        return self.url(self.save_url(image.url))
+
+    def url(self, image_id):
+        """Path of the Flask route serving an image"""
+        return f"/images/{image_id}"
+
+    def save_url(self, url):
+        """Download an image once, streaming it to disk, and return its id"""
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix='.part')
+        try:
+            import requests  # Only needed for downloads; skipped at startup
+            with os.fdopen(fd, 'wb') as f, requests.get(url, stream=True, timeout=self.download_timeout) as response:
+                response.raise_for_status()
+                for chunk in response.iter_content(chunk_size=64 * 1024):
+                    digest.update(chunk)
+                    f.write(chunk)
+            return self._commit(tmp_path, digest.hexdigest())
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def save_b64(self, b64_json):
+        """Store an image returned inline by the API and return its id"""
+        data = base64.b64decode(b64_json)
+        image_id = hashlib.sha256(data).hexdigest()
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            return self._commit(tmp_path, image_id)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def path(self, image_id, width=None, fmt=None):
+        """Path of a stored image (or a variant of it) and its format, or (None, None) if unknown"""
+        if not _IMAGE_ID.match(image_id):
+            return None, None
+        original = self._path(image_id, 'png')
+        if not os.path.exists(original):
+            return None, None
+        if (width is None and fmt is None) or Image is None:
+            self._touch(original)
+            return original, 'png'
+
+        width = min((w for w in VARIANT_WIDTHS if w >= (width or 0)), default=VARIANT_WIDTHS[-1])
+        fmt = fmt if fmt in VARIANT_FORMATS else 'webp'
+        variant = self._path(image_id, f"{width}.{fmt}")
+        if not os.path.exists(variant):
+            try:
+                self._transcode(original, variant, width, fmt)
+            except OSError as e:
+                print(f"Error transcoding image {image_id}: {e}")
+                self._touch(original)
+                return original, 'png'
+        self._touch(variant)
+        return variant, fmt
+
+    def size(self):
+        """Bytes stored, as of the last write or eviction"""
+        return self._size
+
+    def _path(self, image_id, suffix):
+        # Two-level fan-out keeps directories small
+        return os.path.join(self.root, image_id[:2], f"{image_id}.{suffix}")
+
+    def _commit(self, tmp_path, image_id):
+        path = self._path(image_id, 'png')
+        if os.path.exists(path):
+            self._touch(path)
+            return image_id
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+        self._add(path)
+        return image_id
+
+    def _transcode(self, original, variant, width, fmt):
+        with Image.open(original) as image:
+            image.thumbnail((width, width))
+            if fmt == 'jpeg':
+                image = image.convert('RGB')
+            tmp_path = f"{variant}.{threading.get_ident()}.part"
+            image.save(tmp_path, VARIANT_FORMATS[fmt], quality=80)
+        os.replace(tmp_path, variant)
+        self._add(variant)
+
+    def _load(self):
+        for _, path, _ in self._scan(parts=True):
+            if path.endswith('.part'):
+                os.remove(path)
+        self._size = sum(size for _, _, size in self._scan())
+
+    def _scan(self, parts=False):
+        """(last used, path, size) of the files on disk; .part files are another write in progress"""
+        stale = time.time() - self.STALE_PART_AGE
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:  # Evicted by another process meanwhile
+                    continue
+                if name.endswith('.part') and not (parts and stat.st_mtime < stale):
+                    continue
+                yield stat.st_mtime_ns, path, stat.st_size
+
+    def _add(self, path):
+        self._touch(path)
+        with self._lock, self._directory_lock():
+            self._evict()
+
+    def _touch(self, path):
+        # Recency lives in the modification time, so every process sharing the directory sees it;
+        # set from the clock to the nanosecond, as the file system may record coarser times
+        now = time.time_ns()
+        try:
+            os.utime(path, ns=(now, now))
+        except OSError:
+            pass
+
+    @contextmanager
+    def _directory_lock(self):
+        # Serializes eviction between the worker processes sharing the directory
+        if fcntl is None:
+            yield
+            return
+        fd = os.open(self.root, os.O_RDONLY)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+    def _evict(self):
+        # An image and its variants are used and evicted as one
+        images = {}  # image id -> [last used, bytes, paths]
+        for used, path, size in self._scan():
+            entry = images.setdefault(os.path.basename(path).split('.', 1)[0], [0, 0, []])
+            entry[0] = max(entry[0], used)
+            entry[1] += size
+            entry[2].append(path)
+        self._size = sum(entry[1] for entry in images.values())
+        # The most recently used image is kept even if it alone is over the bound
+        for _, size, paths in sorted(images.values())[:-1]:
+            if self._size <= self.max_bytes:
+                break
+            for path in paths:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._size -= size
@@ -0,0 +1,49 @@
+import importlib
+import sys
+import threading
+
+
+class LazyModule:
+    """Stands in for a module that is only imported when one of its attributes is first used.
+
+    Attributes set before then (e.g. `openai.api_key`) are applied to the module once it
+    is imported, so configuring a client library does not pay for importing it.
+    """
+
+    def __init__(self, name):
+        object.__setattr__(self, '_name', name)
+        object.__setattr__(self, '_module', None)
+        object.__setattr__(self, '_pending', {})
+        object.__setattr__(self, '_lock', threading.Lock())
+
+    def _load(self):
+        module = self._module
+        if module is None:
+            with self._lock:
+                module = self._module
+                if module is None:
+                    module = importlib.import_module(self._name)
+                    for attribute, value in self._pending.items():
+                        setattr(module, attribute, value)
+                    self._pending.clear()
+                    object.__setattr__(self, '_module', module)
+        return module
+
+    @property
+    def loaded(self):
+        """Whether the module has been imported, by this proxy or anything else"""
+        return self._module is not None or self._name in sys.modules
+
+    def __getattr__(self, attribute):
+        return getattr(self._load(), attribute)
+
+    def __setattr__(self, attribute, value):
+        with self._lock:
+            if self._module is None:
+                self._pending[attribute] = value
+                return
+        setattr(self._module, attribute, value)
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return f"<lazy module {self._name!r} ({state})>"
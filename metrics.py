@@ -0,0 +1,200 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+# Token tally of the usage_tally() block running in this thread or task, if any
+_usage_tally = contextvars.ContextVar('usage_tally', default=None)
+
+# Histogram bucket bounds in seconds, from cache hits up to slow image generations
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class _Span:
+    """Times the enclosed block and records it under a stage and task"""
+
+    __slots__ = ('metrics', 'stage', 'task', 'start')
+
+    def __init__(self, metrics, stage, task):
+        self.metrics = metrics
+        self.stage = stage
+        self.task = task
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.observe(self.stage, self.task, time.perf_counter() - self.start, failed=exc_type is not None)
+        return False
+
+
+class Metrics:
+    """Per-stage latency histograms and token counters, rendered in the Prometheus text format.
+
+    Stages are timed with `with metrics.span('chat_completion', 'continuation'):`;
+    token usage is read from API responses with record_usage().
+    """
+
+    enabled = True
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._histograms = {}  # (stage, task) -> [bucket counts..., sum, count]
+        self._errors = {}  # (stage, task) -> count
+        self._tokens = {}  # (task, kind) -> count
+        self._gauges = []  # (name, help text, callback)
+        self._lock = threading.Lock()
+
+    def span(self, stage, task=""):
+        """Context manager timing one stage of a turn"""
+        return _Span(self, stage, task)
+
+    def observe(self, stage, task, seconds, failed=False):
+        """Record one timing for a stage"""
+        key = (stage, task)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    histogram[i] += 1
+            histogram[-2] += seconds
+            histogram[-1] += 1
+            if failed:
+                self._errors[key] = self._errors.get(key, 0) + 1
+
+    def record_usage(self, task, response):
+        """Count the prompt, completion and cached prompt tokens reported on an API response"""
+        usage = getattr(response, 'usage', None)
+        details = getattr(usage, 'prompt_tokens_details', None)
+        counts = {
+            'prompt': getattr(usage, 'prompt_tokens', None),
+            'completion': getattr(usage, 'completion_tokens', None),
+            # Prompt tokens served from the provider's prompt cache (already included in 'prompt')
+            'cached': getattr(details, 'cached_tokens', None)
+        }
+        for kind, tokens in counts.items():
+            if isinstance(tokens, int):
+                with self._lock:
+                    self._tokens[(task, kind)] = self._tokens.get((task, kind), 0) + tokens
+
+    def gauge(self, name, help_text, callback):
+        """Render a gauge read at scrape time from callback(), which returns [(labels dict, value), ...]"""
+        with self._lock:
+            self._gauges.append((name, help_text, callback))
+
+    def summary(self):
+        """Count and total seconds per stage across tasks, plus token counts (for tests and benchmarks)"""
+        with self._lock:
+            stages = {}
+            for (stage, task), histogram in self._histograms.items():
+                totals = stages.setdefault(stage, {'count': 0, 'seconds': 0.0})
+                totals['count'] += histogram[-1]
+                totals['seconds'] += histogram[-2]
+            tokens = {f"{task}:{kind}": count for (task, kind), count in self._tokens.items()}
+        return {'stages': stages, 'tokens': tokens}
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = [
+            "# HELP story_stage_seconds Time spent in each stage of a story turn",
+            "# TYPE story_stage_seconds histogram"
+        ]
+        with self._lock:
+            histograms = sorted((key, list(value)) for key, value in self._histograms.items())
+            errors = sorted(self._errors.items())
+            tokens = sorted(self._tokens.items())
+            gauges = list(self._gauges)
+
+        for (stage, task), histogram in histograms:
+            labels = f'stage="{_escape(stage)}",task="{_escape(task)}"'
+            for bound, count in zip(self.buckets, histogram):
+                lines.append(f'story_stage_seconds_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'story_stage_seconds_bucket{{{labels},le="+Inf"}} {histogram[-1]}')
+            lines.append(f"story_stage_seconds_sum{{{labels}}} {histogram[-2]:.6f}")
+            lines.append(f"story_stage_seconds_count{{{labels}}} {histogram[-1]}")
+
+        lines += [
+            "# HELP story_stage_errors_total Stages that ended with an exception",
+            "# TYPE story_stage_errors_total counter"
+        ]
+        for (stage, task), count in errors:
+            lines.append(f'story_stage_errors_total{{stage="{_escape(stage)}",task="{_escape(task)}"}} {count}')
+
+        lines += [
+            "# HELP openai_tokens_total Tokens reported by the OpenAI API (cached prompt tokens are also counted as prompt)",
+            "# TYPE openai_tokens_total counter"
+        ]
+        for (task, kind), count in tokens:
+            lines.append(f'openai_tokens_total{{task="{_escape(task)}",kind="{kind}"}} {count}')
+
+        for name, help_text, callback in gauges:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+            for labels, value in callback():
+                label_text = ",".join(f'{key}="{_escape(label)}"' for key, label in labels.items())
+                lines.append(f"{name}{{{label_text}}} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class NullMetrics:
+    """Stand-in used when metrics are disabled; every call is a no-op"""
+
+    enabled = False
+    _span = nullcontext()
+
+    def span(self, stage, task=""):
+        return self._span
+
+    def observe(self, stage, task, seconds, failed=False):
+        pass
+
+    def record_usage(self, task, response):
+        pass
+
+    def gauge(self, name, help_text, callback):
+        pass
+
+
+NULL_METRICS = NullMetrics()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class UsageTally:
+    """Total tokens (prompt plus completion) of the API responses recorded in a usage_tally() block"""
+
+    __slots__ = ('tokens', 'responses')
+
+    def __init__(self):
+        self.tokens = 0
+        self.responses = 0
+
+
+@contextmanager
+def usage_tally():
+    """Add up the token usage of the API calls made in the enclosed block, including on other threads'
+    event loops it waits for (contextvars follow run_coroutine_threadsafe)"""
+    tally = UsageTally()
+    token = _usage_tally.set(tally)
+    try:
+        yield tally
+    finally:
+        _usage_tally.reset(token)
+
+
+def tally_usage(response):
+    """Count an API response's token usage towards the enclosing usage_tally(), if any"""
+    tally = _usage_tally.get()
+    usage = getattr(response, 'usage', None)
+    if tally is None or usage is None:
+        return
+    total = getattr(usage, 'total_tokens', None)
+    if not isinstance(total, int):
+        parts = (getattr(usage, 'prompt_tokens', None), getattr(usage, 'completion_tokens', None))
+        total = sum(tokens for tokens in parts if isinstance(tokens, int))
+    tally.tokens += total
+    tally.responses += 1
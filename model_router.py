@@ -0,0 +1,247 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Request settings per task. Any task can name a faster "fallback" model that takes over while
+# the primary's recent p95 latency is above "slo" seconds; "timeout" caps each attempt.
+DEFAULT_ROUTES = {
+    'introduction': {'model': 'gpt-3.5-turbo', 'max_tokens': 700, 'temperature': 0.7},
+    'continuation': {'model': 'gpt-3.5-turbo', 'max_tokens': 700, 'temperature': 0.7},
+    'modification': {'model': 'gpt-3.5-turbo', 'max_tokens': 700, 'temperature': 0.8},
+    'choices': {'model': 'gpt-3.5-turbo', 'max_tokens': 200, 'temperature': 0.8},
+    'image_prompt': {'model': 'gpt-3.5-turbo', 'max_tokens': 100, 'temperature': 0.7},
+    'summary': {'model': 'gpt-3.5-turbo', 'max_tokens': 250, 'temperature': 0.3},
+    'image': {'model': 'dall-e-2', 'size': '512x512'}  # DALL-E 2 for faster generation
+}
+
+
+class Route:
+    """How one task is sent upstream: model, output settings, per-attempt timeout and fallback"""
+
+    __slots__ = ('task', 'model', 'max_tokens', 'temperature', 'size', 'timeout', 'fallback', 'slo')
+
+    def __init__(self, task, model, max_tokens=None, temperature=None, size=None, timeout=None, fallback=None,
+                 slo=None):
+        self.task = task
+        self.model = model
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.size = size
+        self.timeout = timeout
+        self.fallback = fallback
+        self.slo = slo
+
+
+class RoutedCall:
+    """One upstream call made through a ModelRouter; set `response` so its token usage is recorded"""
+
+    __slots__ = ('route', 'model', 'max_tokens', 'response')
+
+    def __init__(self, route, model, max_tokens=None):
+        self.route = route
+        self.model = model
+        self.max_tokens = route.max_tokens if max_tokens is None else max_tokens
+        self.response = None
+
+    @property
+    def timeout(self):
+        return self.route.timeout
+
+    def chat_request(self, messages, **kwargs):
+        """Keyword arguments for chat.completions.create"""
+        return dict(model=self.model, messages=messages, max_tokens=self.max_tokens,
+                    temperature=self.route.temperature, **kwargs)
+
+    def image_request(self, prompt, **kwargs):
+        """Keyword arguments for images.generate"""
+        return dict(model=self.model, prompt=prompt, n=1, size=self.route.size, **kwargs)
+
+
+class _RouteStats:
+    """Recent latencies and running totals for one (task, model) pair"""
+
+    __slots__ = ('latencies', 'calls', 'errors', 'seconds', 'prompt_tokens', 'completion_tokens')
+
+    def __init__(self, window):
+        self.latencies = deque(maxlen=window)
+        self.calls = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def percentile(self, fraction):
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class ModelRouter:
+    """Chooses the model and request settings for each task and tracks how every route performs.
+
+    A task whose route has a `fallback` and an `slo` moves to the fallback model once at
+    least `min_samples` of the primary's last `window` calls put its p95 latency above the
+    SLO. While on the fallback, one call every `probe_interval` seconds still goes to the
+    primary; when that call meets the SLO the task moves back. Per-route latency and token
+    totals are available from stats() and, with `metrics`, on /metrics. `token_scale`, if
+    given, is called with the task of every chat call and returns the fraction of the
+    route's max_tokens to ask for (see admission.py, which shortens turns under overload).
+    """
+
+    def __init__(self, routes=None, window=20, min_samples=5, probe_interval=30, metrics=None, token_scale=None):
+        table = {task: dict(settings) for task, settings in DEFAULT_ROUTES.items()}
+        for task, settings in (routes or {}).items():
+            table.setdefault(task, {}).update(settings)
+        self.routes = {task: Route(task, **settings) for task, settings in table.items()}
+        self.window = window
+        self.min_samples = min_samples
+        self.probe_interval = probe_interval
+        self.token_scale = token_scale
+        self._stats = {}  # (task, model) -> _RouteStats
+        self._degraded = {}  # task -> time.monotonic() of the last call sent to the primary
+        self._lock = threading.Lock()
+
+        if metrics is not None:
+            metrics.gauge('openai_route_latency_p95_seconds', "Recent p95 latency of each task's models",
+                          self._p95_gauge)
+            metrics.gauge('openai_route_fallback_active', "Whether a task is currently routed to its fallback model",
+                          self._fallback_gauge)
+            metrics.gauge('openai_route_calls', "Calls per task and model since startup", self._calls_gauge)
+            metrics.gauge('openai_route_tokens', "Prompt and completion tokens per task and model since startup",
+                          self._tokens_gauge)
+
+    def route(self, task):
+        """The configured route for a task"""
+        return self.routes[task]
+
+    def select(self, task):
+        """The route for a task and the model to send this call to"""
+        route = self.routes[task]
+        if route.fallback is None or route.slo is None:
+            return route, route.model
+        with self._lock:
+            last_probe = self._degraded.get(task)
+            if last_probe is None:
+                return route, route.model
+            now = time.monotonic()
+            if now - last_probe >= self.probe_interval:
+                self._degraded[task] = now
+                return route, route.model
+        return route, route.fallback
+
+    @contextmanager
+    def call(self, task):
+        """Route one call and record its latency, outcome and token usage"""
+        route, model = self.select(task)
+        call = RoutedCall(route, model, self._max_tokens(route))
+        start = time.perf_counter()
+        try:
+            yield call
+        except BaseException:
+            self.observe(task, call.model, time.perf_counter() - start, failed=True)
+            raise
+        self.observe(task, call.model, time.perf_counter() - start, call.response)
+
+    def _max_tokens(self, route):
+        if self.token_scale is None or route.max_tokens is None:
+            return route.max_tokens
+        return max(1, int(route.max_tokens * self.token_scale(route.task)))
+
+    def observe(self, task, model, seconds, response=None, failed=False):
+        """Record one call; a failure's latency only counts when it took at least the SLO (i.e. timed out)"""
+        route = self.routes.get(task)
+        slo = route.slo if route is not None else None
+        usage = getattr(response, 'usage', None)
+        with self._lock:
+            stats = self._stats.get((task, model))
+            if stats is None:
+                stats = self._stats[(task, model)] = _RouteStats(self.window)
+            stats.calls += 1
+            stats.seconds += seconds
+            if failed:
+                stats.errors += 1
+                if slo is None or seconds < slo:
+                    return
+            stats.latencies.append(seconds)
+            for kind in ('prompt_tokens', 'completion_tokens'):
+                tokens = getattr(usage, kind, None)
+                if isinstance(tokens, int):
+                    setattr(stats, kind, getattr(stats, kind) + tokens)
+            if route is not None and model == route.model and slo is not None and route.fallback is not None:
+                self._update_degraded(task, route, stats, seconds)
+
+    def _update_degraded(self, task, route, stats, seconds):
+        if task in self._degraded:
+            if seconds <= route.slo:
+                # The probe met the SLO: forget the slow samples and move back to the primary
+                stats.latencies.clear()
+                del self._degraded[task]
+        elif len(stats.latencies) >= self.min_samples and stats.percentile(0.95) > route.slo:
+            self._degraded[task] = time.monotonic()
+
+    def using_fallback(self, task):
+        """Whether calls for a task currently go to its fallback model"""
+        with self._lock:
+            return task in self._degraded
+
+    def table(self):
+        """The configured routes, with whether each task is on its fallback model right now"""
+        with self._lock:
+            return {task: dict({name: getattr(route, name) for name in Route.__slots__[1:]},
+                               fallback_active=task in self._degraded)
+                    for task, route in sorted(self.routes.items())}
+
+    def stats(self):
+        """Per task and model: calls, errors, mean/p50/p95 seconds and token totals"""
+        with self._lock:
+            result = {}
+            for (task, model), stats in sorted(self._stats.items()):
+                p50, p95 = stats.percentile(0.5), stats.percentile(0.95)
+                result.setdefault(task, {})[model] = {
+                    'calls': stats.calls,
+                    'errors': stats.errors,
+                    'mean_s': round(stats.seconds / stats.calls, 4) if stats.calls else None,
+                    'p50_s': None if p50 is None else round(p50, 4),
+                    'p95_s': None if p95 is None else round(p95, 4),
+                    'prompt_tokens': stats.prompt_tokens,
+                    'completion_tokens': stats.completion_tokens
+                }
+            return result
+
+    def _p95_gauge(self):
+        with self._lock:
+            return [({'task': task, 'model': model}, round(stats.percentile(0.95), 6))
+                    for (task, model), stats in sorted(self._stats.items()) if stats.latencies]
+
+    def _calls_gauge(self):
+        with self._lock:
+            return [({'task': task, 'model': model}, stats.calls) for (task, model), stats in sorted(self._stats.items())]
+
+    def _tokens_gauge(self):
+        with self._lock:
+            return [({'task': task, 'model': model, 'kind': kind}, getattr(stats, f'{kind}_tokens'))
+                    for (task, model), stats in sorted(self._stats.items()) for kind in ('prompt', 'completion')]
+
+    def _fallback_gauge(self):
+        with self._lock:
+            return [({'task': task}, int(task in self._degraded))
+                    for task, route in sorted(self.routes.items()) if route.fallback is not None]
+
+
+def load_routes(value):
+    """Route overrides from MODEL_ROUTES: inline JSON or the path of a JSON file, {task: {setting: value}}"""
+    if not value:
+        return {}
+    if not value.lstrip().startswith('{'):
+        with open(os.path.expanduser(value)) as f:
+            value = f.read()
+    routes = json.loads(value)
+    for task, settings in routes.items():
+        unknown = set(settings) - set(Route.__slots__[1:])
+        if unknown:
+            raise ValueError(f"Unknown settings for route {task!r}: {', '.join(sorted(unknown))}")
+    return routes
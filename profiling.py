@@ -0,0 +1,220 @@
+import gc
+import os
+import random
+import sys
+import threading
+import tracemalloc
+import types
+from collections import Counter
+
+# Referenced by almost everything and owned by nobody in particular, so left out of per-object sizes
+_SHARED_TYPES = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.CodeType)
+
+# Distinct stacks kept before further new ones are counted together
+MAX_STACKS = 10000
+
+
+class SamplingProfiler:
+    """Statistical profiler for a fraction of requests, safe to switch on and off in a live worker.
+
+    With a `rate` above 0, begin() picks that fraction of the requests it is called for,
+    and a background thread records the Python stack of each picked request's thread
+    every `interval` seconds. Stacks are wall-clock samples (time spent waiting on the
+    OpenAI API shows up too) counted in collapsed form, one "frame;frame;frame count"
+    line per stack, which flamegraph.pl and speedscope read. With a rate of 0 no thread
+    runs and callers only check `rate`.
+    """
+
+    def __init__(self, rate=0.0, interval=0.005):
+        self.rate = 0.0
+        self.interval = interval
+        self.samples = 0
+        self.requests = 0
+        self._threads = {}  # thread ident -> request label, for the requests being sampled
+        self._stacks = Counter()
+        self._lock = threading.Lock()
+        self._stop = None
+        self.configure(rate=rate)
+
+    def configure(self, rate=None, interval=None):
+        """Change the sampled fraction of requests or the sampling interval; a rate of 0 stops sampling"""
+        with self._lock:
+            if interval is not None:
+                self.interval = max(0.001, float(interval))
+            if rate is not None:
+                self.rate = min(1.0, max(0.0, float(rate)))
+            if self.rate > 0 and self._stop is None:
+                self._stop = threading.Event()
+                threading.Thread(target=self._run, args=(self._stop,), name="profile-sampler", daemon=True).start()
+            elif self.rate == 0 and self._stop is not None:
+                self._stop.set()
+                self._stop = None
+                self._threads.clear()
+
+    @property
+    def running(self):
+        return self._stop is not None
+
+    def begin(self, label):
+        """Sample the calling thread until end() if this request is picked; returns whether it was"""
+        if self.rate == 0 or random.random() >= self.rate:
+            return False
+        with self._lock:
+            if self._stop is None:
+                return False
+            self._threads[threading.get_ident()] = label
+            self.requests += 1
+        return True
+
+    def end(self):
+        """Stop sampling the calling thread"""
+        with self._lock:
+            self._threads.pop(threading.get_ident(), None)
+
+    def collapsed(self):
+        """Collected stacks in collapsed form, most sampled first"""
+        with self._lock:
+            stacks = self._stacks.most_common()
+        return "".join(f"{stack} {count}\n" for stack, count in stacks)
+
+    def top(self, limit=20):
+        """Functions by samples spent in them (self) and under them (total)"""
+        own, total = Counter(), Counter()
+        with self._lock:
+            stacks = list(self._stacks.items())
+        for stack, count in stacks:
+            frames = stack.split(';')
+            own[frames[-1]] += count
+            for frame in set(frames[1:]):  # The first frame is the request label
+                total[frame] += count
+        return [{'function': frame, 'self': own[frame], 'total': count} for frame, count in total.most_common(limit)]
+
+    def reset(self):
+        with self._lock:
+            self._stacks.clear()
+            self.samples = 0
+            self.requests = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'rate': self.rate,
+                'interval': self.interval,
+                'running': self._stop is not None,
+                'requests_sampled': self.requests,
+                'samples': self.samples,
+                'stacks': len(self._stacks)
+            }
+
+    def _run(self, stop):
+        while not stop.wait(self.interval):
+            with self._lock:
+                threads = dict(self._threads)
+            if not threads:
+                continue
+            frames = sys._current_frames()
+            stacks = [_collapse(label, frames[ident]) for ident, label in threads.items() if ident in frames]
+            with self._lock:
+                for stack in stacks:
+                    if stack not in self._stacks and len(self._stacks) >= MAX_STACKS:
+                        stack = f"{stack.split(';', 1)[0]};[other stacks]"
+                    self._stacks[stack] += 1
+                self.samples += len(stacks)
+
+
+def _collapse(label, frame):
+    """One stack as "label;module:function;..." from the outermost frame in"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.splitext(os.path.basename(code.co_filename))[0]}:{code.co_name}")
+        frame = frame.f_back
+    names.append(label)
+    return ";".join(reversed(names))
+
+
+class MemoryProfiler:
+    """tracemalloc snapshots of a live worker, plus the sizes of individual objects such as session contexts.
+
+    Tracing costs memory and time on every allocation, so it only runs between
+    configure(True) and configure(False). Each snapshot() reports the largest
+    allocation sites and what changed since the previous snapshot.
+    """
+
+    def __init__(self, frames=10):
+        self.frames = frames
+        self._previous = None
+        self._lock = threading.Lock()
+
+    @property
+    def tracing(self):
+        return tracemalloc.is_tracing()
+
+    def configure(self, enabled, frames=None):
+        """Start or stop tracing allocations, keeping `frames` frames of each allocation's traceback"""
+        with self._lock:
+            if frames is not None:
+                self.frames = max(1, int(frames))
+            if enabled and not tracemalloc.is_tracing():
+                tracemalloc.start(self.frames)
+            elif not enabled and tracemalloc.is_tracing():
+                tracemalloc.stop()
+                self._previous = None
+
+    def snapshot(self, limit=20, group_by='lineno'):
+        """The largest allocation sites and the largest changes since the last snapshot, or None if not tracing"""
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                return None
+            snapshot = tracemalloc.take_snapshot().filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap*>")
+            ))
+            previous, self._previous = self._previous, snapshot
+        current, peak = tracemalloc.get_traced_memory()
+        report = {
+            'traced_bytes': current,
+            'peak_bytes': peak,
+            'top': [_stat(stat) for stat in snapshot.statistics(group_by)[:limit]]
+        }
+        if previous is not None:
+            report['changes'] = [_stat(stat) for stat in snapshot.compare_to(previous, group_by)[:limit]]
+        return report
+
+    def stats(self):
+        traced = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+        return {'tracing': tracemalloc.is_tracing(), 'frames': self.frames, 'traced_bytes': traced[0]}
+
+
+def _stat(stat):
+    entry = {'where': [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback], 'bytes': stat.size,
+             'count': stat.count}
+    if hasattr(stat, 'size_diff'):
+        entry['bytes_diff'] = stat.size_diff
+        entry['count_diff'] = stat.count_diff
+    return entry
+
+
+def deep_size(obj):
+    """Bytes taken by an object and everything it references, leaving out classes, modules and functions"""
+    seen = set()
+    pending = [obj]
+    size = 0
+    while pending:
+        item = pending.pop()
+        if id(item) in seen or isinstance(item, _SHARED_TYPES):
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item)
+        pending.extend(gc.get_referents(item))
+    return size
+
+
+def largest(items, limit=20):
+    """The `limit` largest of (key, object) pairs by deep_size, with their count and total size"""
+    sizes = sorted(((deep_size(value), key) for key, value in items), reverse=True)
+    return {
+        'count': len(sizes),
+        'bytes': sum(size for size, _ in sizes),
+        'largest': [{'key': key, 'bytes': size} for size, key in sizes[:limit]]
+    }
@@ -0,0 +1,129 @@
+from story_history import StoryHistory
+
+# Every story request starts with the same system prompt and story preamble, followed by the story
+# so far as assistant/user messages rendered the same way every turn. A request therefore begins
+# with the previous turn's request byte for byte, which is what provider-side prompt caching matches.
+
+_STORYTELLER = """You are an expert storyteller creating an interactive narrative.
+
+The reader steers the story with their replies:
+- A reply is the choice the reader picked. Continue the story for 2-3 paragraphs based on this choice. Make it engaging and immersive, maintaining the established genre and mood. Include rich descriptions, dramatic tension, and emotional involvement.
+- A reply starting with "COMMAND:" asks you to modify the story. Write 2-3 paragraphs that continue the narrative while adapting to the requested modification. Maintain character continuity and coherence. If the command is to change the mood, adjust the tone accordingly. If the command is to change a character role, reframe the narrative from that perspective. If the command is to change the setting, transition the story to that new environment. If the command is to start over with a new genre, begin a new story in that genre.
+
+After every passage, provide 3 possible choices for what could happen next in the story.
+{trailer}
+
+Make sure the choices are diverse and would lead to different narrative paths."""
+
+_CHOICES_TRAILER = """Format the choices as a JSON array at the end of your response, like this:
+CHOICES: ["First option", "Second option", "Third option"]"""
+
+_INLINE_IMAGE_TRAILER = """Format them as JSON at the end of your response, together with a concise image prompt (max 50 words) describing the visual elements, setting and atmosphere of a key scene from your text, like this:
+CHOICES: {"choices": ["First option", "Second option", "Third option"], "image_prompt": "Scene description"}"""
+
+STORY_SYSTEM_PROMPT = _STORYTELLER.format(trailer=_CHOICES_TRAILER)
+INLINE_IMAGE_SYSTEM_PROMPT = _STORYTELLER.format(trailer=_INLINE_IMAGE_TRAILER)
+
+_PREAMBLE = """Create a compelling introduction (2-3 paragraphs) for an interactive story with the following parameters:
+- Genre/Theme: {genre}
+- Main Character: {character}
+- Mood/Feeling: {mood}
+
+The introduction should set the scene and introduce the characters. Make it engaging and immersive."""
+
+_CHOICES_REQUEST = """Generate 3 interesting choices for what could happen next in the story, without continuing it.
+Reply with only a JSON array of strings, each representing a possible choice.
+Example: ["Investigate the strange noise", "Return to the village", "Follow the glowing trail"]"""
+
+
+def system_prompt(inline_image_prompt=False):
+    """The fixed system prompt for story requests"""
+    return INLINE_IMAGE_SYSTEM_PROMPT if inline_image_prompt else STORY_SYSTEM_PROMPT
+
+
+def introduction_messages(genre, character, mood, inline_image_prompt=False):
+    """System prompt and story preamble; every later request for the story starts with these"""
+    return [
+        {"role": "system", "content": system_prompt(inline_image_prompt)},
+        {"role": "user", "content": _PREAMBLE.format(genre=genre, character=character, mood=mood)}
+    ]
+
+
+def story_messages(story_context, inline_image_prompt=False, window=None):
+    """The story so far as chat messages: the introduction request, then the told turns in order.
+
+    `window` is an optional (summary, start, end) from a ContextWindow; turns before
+    `start` are then represented by the summary.
+    """
+    history = StoryHistory.of(story_context['history'])
+    messages = introduction_messages(
+        story_context['genre'], story_context.get('character', 'protagonist'), story_context['mood'],
+        inline_image_prompt
+    )
+    summary, start, end = window or (None, 0, len(history))
+    if summary:
+        messages.append({"role": "user", "content": summary_text(summary)})
+    return messages + history.messages()[start:end]
+
+
+def continuation_messages(story_context, choice, inline_image_prompt=False, window=None):
+    """Messages asking for the next passage after the reader's choice"""
+    return _ending_with(story_messages(story_context, inline_image_prompt, window), choice)
+
+
+def modification_messages(story_context, command, inline_image_prompt=False, window=None):
+    """Messages asking for the story to be modified by the reader's command"""
+    return _ending_with(story_messages(story_context, inline_image_prompt, window), f"COMMAND: {command}")
+
+
+def choices_messages(story_context, inline_image_prompt=False, window=None):
+    """Messages asking for a standalone set of choices for the story so far"""
+    return story_messages(story_context, inline_image_prompt, window) + [
+        {"role": "user", "content": _CHOICES_REQUEST}
+    ]
+
+
+def summary_text(summary):
+    """How a rolling summary of the earlier turns is shown to the model"""
+    return f"Summary of the story so far: {summary}"
+
+
+def image_prompt_messages(genre, mood, story_text):
+    """Messages turning a story excerpt into an image prompt"""
+    prompt = f"""
+        Based on the following story excerpt:
+
+        {story_text[:500]}  # Limit to first 500 chars to avoid token limits
+
+        Create a concise image prompt (max 50 words) that captures a key scene from this {genre} story with a {mood} mood.
+        Focus on the visual elements, setting, and atmosphere. Don't include any instructions about style or quality.
+        Just describe the scene itself in vivid detail.
+        """
+    return [
+        {"role": "system", "content": "You are an expert at creating concise, vivid image prompts from story excerpts."},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def summary_messages(previous_summary, turns):
+    """Messages folding story passages into a running summary"""
+    earlier = f"Summary so far:\n{previous_summary}\n\n" if previous_summary else ""
+    passages = "\n".join(turns)
+    prompt = f"""
+        {earlier}Story passages to add:
+        {passages}
+
+        Write an updated summary of the whole story in at most 150 words. Keep the names, places,
+        unresolved threads and choices that later parts of the story may depend on.
+        """
+    return [
+        {"role": "system", "content": "You summarize interactive stories so they can be continued faithfully."},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def _ending_with(messages, content):
+    # Callers record the reader's reply in the history before asking for the next passage
+    if messages[-1] != {"role": "user", "content": content}:
+        messages.append({"role": "user", "content": content})
+    return messages
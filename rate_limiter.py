@@ -0,0 +1,222 @@
+import asyncio
+import contextvars
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from context_window import count_message_tokens
+
+INTERACTIVE = 'interactive'
+BACKGROUND = 'background'
+
+# Priority of the OpenAI calls made in this thread or task
+_priority = contextvars.ContextVar('request_priority', default=INTERACTIVE)
+
+# Longest a waiting call sleeps before checking the buckets again
+MAX_POLL = 0.25
+
+
+@contextmanager
+def background():
+    """Mark the OpenAI calls made in the enclosed block as background work, which yields to interactive calls"""
+    token = _priority.set(BACKGROUND)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def _take_all(buckets, state, now):
+    """Take from every bucket or from none; returns the new state and the seconds to wait (0 when taken).
+
+    `buckets` holds (name, amount, capacity, rate, floor) and `state` maps names to
+    (level, updated). A bucket grants a take once its level reaches amount + floor,
+    capped at its capacity so a single large call can always go through eventually.
+    """
+    levels = {}
+    wait = 0.0
+    for name, amount, capacity, rate, floor in buckets:
+        level, updated = state.get(name, (capacity, now))
+        level = min(capacity, level + max(0.0, now - updated) * rate)
+        levels[name] = level
+        need = min(amount + floor, capacity)
+        if level < need:
+            wait = max(wait, (need - level) / rate)
+    if wait == 0.0:
+        for name, amount, _, _, _ in buckets:
+            levels[name] -= amount
+    return {name: (level, now) for name, level in levels.items()}, wait
+
+
+class MemoryBucketBackend:
+    """Token buckets for a single worker process"""
+
+    def __init__(self):
+        self._state = {}
+        self._lock = threading.Lock()
+
+    def take(self, buckets):
+        with self._lock:
+            state, wait = _take_all(buckets, self._state, time.time())
+            self._state.update(state)
+            return wait
+
+
+class SQLiteBucketBackend:
+    """Token buckets in a SQLite file, shared by every worker process on the host"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+        # Set up the table without keeping a connection, as for the other SQLite stores
+        connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS rate_buckets (name TEXT PRIMARY KEY, level REAL NOT NULL, updated REAL NOT NULL)"
+            )
+        finally:
+            connection.close()
+
+    def take(self, buckets):
+        connection = self._connection()
+        names = [bucket[0] for bucket in buckets]
+        # IMMEDIATE takes the write lock up front, so two processes cannot both spend the same tokens
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            rows = connection.execute(
+                f"SELECT name, level, updated FROM rate_buckets WHERE name IN ({', '.join('?' * len(names))})", names
+            ).fetchall()
+            state, wait = _take_all(buckets, {name: (level, updated) for name, level, updated in rows}, time.time())
+            if wait == 0.0:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO rate_buckets (name, level, updated) VALUES (?, ?, ?)",
+                    [(name, level, updated) for name, (level, updated) in state.items()]
+                )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return wait
+
+    def _connection(self):
+        # sqlite3 connections cannot be shared between threads; autocommit so transactions are explicit
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            self._local.connection = connection
+        return connection
+
+
+class RateLimiter:
+    """Keeps OpenAI calls under the organization's requests-per-minute and tokens-per-minute limits.
+
+    Chat requests, chat tokens and image requests each have a token bucket refilled
+    at the per-minute limit and holding up to `burst` seconds' worth. A chat call is
+    charged its prompt tokens plus max_tokens, which is how the API counts it. Calls
+    made under background() leave `reserve` of every bucket to interactive calls and
+    wait while interactive calls from this process are queued. Limits of 0 are off.
+    """
+
+    def __init__(self, backend=None, chat_rpm=3500, chat_tpm=90000, image_rpm=50, burst=10, reserve=0.2,
+                 metrics=None):
+        self.backend = backend or MemoryBucketBackend()
+        self.limits = {'chat_requests': chat_rpm, 'chat_tokens': chat_tpm, 'image_requests': image_rpm}
+        self.burst = burst
+        self.reserve = reserve
+        self._waiting = {}  # (endpoint, priority) -> calls waiting in this process
+        self._lock = threading.Lock()
+
+        self.metrics = metrics
+        if metrics is not None:
+            metrics.gauge('openai_rate_limit_queue_depth', "Calls waiting for rate limit capacity",
+                          self.queue_depths)
+
+    def costs(self, endpoint, kwargs):
+        """What a call takes from each bucket"""
+        if endpoint == 'images':
+            return {'image_requests': kwargs.get('n', 1)}
+        tokens = count_message_tokens(kwargs.get('messages', [])) + kwargs.get('max_tokens', 0)
+        return {'chat_requests': 1, 'chat_tokens': tokens}
+
+    def acquire(self, endpoint, kwargs, max_wait=None):
+        """Block until the call fits its buckets; False if that would take longer than max_wait seconds"""
+        priority = _priority.get()
+        start = time.monotonic()
+        buckets = self._buckets(endpoint, kwargs, priority)  # Counting message tokens is too slow to repeat per poll
+        self._enter(endpoint, priority)
+        try:
+            while True:
+                wait = self._try(endpoint, buckets, priority)
+                if wait == 0.0:
+                    return True
+                if max_wait is not None and time.monotonic() - start + wait > max_wait:
+                    return False
+                time.sleep(min(wait, MAX_POLL))
+        finally:
+            self._leave(endpoint, priority, time.monotonic() - start)
+
+    async def aacquire(self, endpoint, kwargs, max_wait=None):
+        """Coroutine version of acquire() for async clients"""
+        priority = _priority.get()
+        start = time.monotonic()
+        buckets = self._buckets(endpoint, kwargs, priority)
+        self._enter(endpoint, priority)
+        try:
+            while True:
+                wait = self._try(endpoint, buckets, priority)
+                if wait == 0.0:
+                    return True
+                if max_wait is not None and time.monotonic() - start + wait > max_wait:
+                    return False
+                await asyncio.sleep(min(wait, MAX_POLL))
+        finally:
+            self._leave(endpoint, priority, time.monotonic() - start)
+
+    def queue_depths(self):
+        """Calls currently waiting, as ({'endpoint', 'priority'}, count) samples"""
+        with self._lock:
+            return [({'endpoint': endpoint, 'priority': priority}, count)
+                    for (endpoint, priority), count in sorted(self._waiting.items())]
+
+    def _buckets(self, endpoint, kwargs, priority):
+        # (name, amount, capacity, rate, floor) for each limited bucket the call takes from
+        buckets = []
+        for name, amount in self.costs(endpoint, kwargs).items():
+            limit = self.limits.get(name)
+            if limit:
+                rate = limit / 60.0
+                capacity = max(rate * self.burst, 1.0)  # Room for at least one request
+                floor = capacity * self.reserve if priority == BACKGROUND else 0.0
+                buckets.append((name, amount, capacity, rate, floor))
+        return buckets
+
+    def _try(self, endpoint, buckets, priority):
+        if priority == BACKGROUND:
+            with self._lock:
+                if self._waiting.get((endpoint, INTERACTIVE)):
+                    return MAX_POLL
+        return self.backend.take(buckets) if buckets else 0.0
+
+    def _enter(self, endpoint, priority):
+        with self._lock:
+            self._waiting[(endpoint, priority)] = self._waiting.get((endpoint, priority), 0) + 1
+
+    def _leave(self, endpoint, priority, waited):
+        with self._lock:
+            self._waiting[(endpoint, priority)] -= 1
+        if self.metrics is not None:
+            self.metrics.observe('rate_limit_wait', f"{endpoint}_{priority}", waited)
+
+
+def create_rate_limiter(backend, path=None, metrics=None, **limits):
+    """Build the configured rate limiter ('memory', 'sqlite' or 'off')"""
+    if backend == 'off':
+        return None
+    if backend == 'memory':
+        return RateLimiter(MemoryBucketBackend(), metrics=metrics, **limits)
+    if backend == 'sqlite':
+        return RateLimiter(SQLiteBucketBackend(path or 'rate_limits.db'), metrics=metrics, **limits)
+    raise ValueError(f"Unknown rate limiter backend: {backend}")
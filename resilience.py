@@ -0,0 +1,225 @@
+import asyncio
+import contextvars
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Deadline of the story turn being generated in this thread or task, if any
+_turn_deadline = contextvars.ContextVar('turn_deadline', default=None)
+
+_CONNECTION_ERRORS = (ConnectionError, TimeoutError)
+
+
+def _connection_errors():
+    # openai is imported lazily (see story_generator.py); until it is, none of its errors can be raised
+    openai = sys.modules.get('openai')
+    if isinstance(getattr(openai, 'APIConnectionError', None), type):
+        return _CONNECTION_ERRORS + (openai.APIConnectionError,)  # Also covers APITimeoutError
+    return _CONNECTION_ERRORS
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream endpoint that is currently failing"""
+
+
+class TurnBudgetExceeded(Exception):
+    """Raised when a story turn has used up its latency budget"""
+
+
+def is_retryable(error):
+    """Whether an upstream error is worth retrying: rate limits, server errors, timeouts and dropped connections"""
+    status = getattr(error, 'status_code', None)
+    if isinstance(status, int):
+        return status in (408, 409, 429) or status >= 500
+    return isinstance(error, _connection_errors())
+
+
+class CircuitBreaker:
+    """Stops calling an endpoint after repeated failures, then lets a single trial call through.
+
+    Closed: calls go through. After `failure_threshold` consecutive failures the breaker
+    opens and calls fail fast for `reset_timeout` seconds; then it is half-open and the
+    next call decides whether it closes again or re-opens.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return 'open'
+        return 'half_open'
+
+    def available(self):
+        """Whether a call would be let through right now, without claiming the half-open trial"""
+        with self._lock:
+            state = self.state
+            return state == 'closed' or (state == 'half_open' and not self._trial_running)
+
+    def allow(self):
+        """Claim permission for one call"""
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half_open' and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_running or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial_running = False
+
+    def release(self):
+        """Give back a half-open trial that ended without telling us anything about upstream health"""
+        with self._lock:
+            self._trial_running = False
+
+
+class ResilientCaller:
+    """Wraps upstream API calls with per-call deadlines, jittered exponential backoff and circuit breakers.
+
+    Each endpoint ('chat', 'images') has its own breaker, so an image brownout still
+    lets story text through. turn() sets a latency budget shared by every call made
+    while generating one story turn; per-call timeouts and backoff sleeps are capped
+    by whatever is left of it. An optional RateLimiter (see rate_limiter.py) is
+    waited on before every attempt.
+    """
+
+    def __init__(self, timeout=30, retries=2, backoff=0.5, max_backoff=8, turn_budget=60,
+                 failure_threshold=5, reset_timeout=30, limiter=None):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.turn_budget = turn_budget
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.limiter = limiter
+        self.breakers = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, endpoint):
+        """The circuit breaker for an endpoint, created on first use"""
+        with self._lock:
+            if endpoint not in self.breakers:
+                self.breakers[endpoint] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return self.breakers[endpoint]
+
+    def available(self, endpoint):
+        """Whether calls to the endpoint are currently let through"""
+        return self.breaker(endpoint).available()
+
+    @contextmanager
+    def turn(self):
+        """Run the enclosed calls under one per-turn latency budget (nested turns keep the outer one)"""
+        if _turn_deadline.get() is not None:
+            yield
+            return
+        token = _turn_deadline.set(time.monotonic() + self.turn_budget)
+        try:
+            yield
+        finally:
+            _turn_deadline.reset(token)
+
+    def call(self, endpoint, func, timeout=None, **kwargs):
+        """Call func(timeout=..., **kwargs), retrying retryable errors; `timeout` overrides the per-attempt default"""
+        breaker = self._claim(endpoint)
+        for attempt in range(self.retries + 1):
+            try:
+                if self.limiter is not None:
+                    self._check_capacity(breaker, self.limiter.acquire(endpoint, kwargs, self._remaining()))
+                result = func(timeout=self._attempt_timeout(breaker, timeout), **kwargs)
+            except Exception as e:
+                time.sleep(self._retry_delay(breaker, e, attempt))
+                continue
+            breaker.record_success()
+            return result
+
+    async def acall(self, endpoint, func, timeout=None, **kwargs):
+        """Coroutine version of call() for async clients"""
+        breaker = self._claim(endpoint)
+        for attempt in range(self.retries + 1):
+            try:
+                if self.limiter is not None:
+                    self._check_capacity(breaker, await self.limiter.aacquire(endpoint, kwargs, self._remaining()))
+                result = await func(timeout=self._attempt_timeout(breaker, timeout), **kwargs)
+            except Exception as e:
+                await asyncio.sleep(self._retry_delay(breaker, e, attempt))
+                continue
+            breaker.record_success()
+            return result
+
+    def _claim(self, endpoint):
+        breaker = self.breaker(endpoint)
+        if not breaker.allow():
+            raise CircuitOpenError(f"OpenAI {endpoint} calls are failing, not retrying for now")
+        return breaker
+
+    def _remaining(self):
+        deadline = _turn_deadline.get()
+        return None if deadline is None else deadline - time.monotonic()
+
+    def _attempt_timeout(self, breaker, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        remaining = self._remaining()
+        if remaining is None:
+            return timeout
+        if remaining <= 0:
+            breaker.release()
+            raise TurnBudgetExceeded("Story turn ran out of time")
+        return min(timeout, remaining)
+
+    def _check_capacity(self, breaker, acquired):
+        if not acquired:
+            breaker.release()
+            raise TurnBudgetExceeded("Story turn ran out of time waiting for rate limit capacity")
+
+    def _retry_delay(self, breaker, error, attempt):
+        """Delay before the next attempt; re-raises the error when it should not be retried"""
+        if isinstance(error, TurnBudgetExceeded):
+            raise error
+        if not is_retryable(error):
+            # The request itself was bad; upstream is healthy
+            breaker.release()
+            raise error
+        breaker.record_failure()
+        if attempt >= self.retries or not breaker.allow():
+            raise error
+
+        # Full jitter, but never sooner than the server asked us to wait
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        delay = max(delay, _retry_after(error))
+        remaining = self._remaining()
+        if remaining is not None and delay >= remaining:
+            raise error
+        return delay
+
+
+def _retry_after(error):
+    """Seconds from a Retry-After header on an API error, or 0"""
+    response = getattr(error, 'response', None)
+    try:
+        return min(float(response.headers.get('retry-after', 0)), 60.0)
+    except (AttributeError, TypeError, ValueError):
+        return 0.0
@@ -0,0 +1,230 @@
+import hashlib
+import json
+import random
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCacheBackend:
+    """In-process LRU cache with TTL expiry"""
+
+    def __init__(self, max_entries=1000, ttl=3000):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                self.evictions += 1
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def items(self):
+        """Snapshot of the stored (key, value) pairs, without touching their recency (for memory reports)"""
+        with self._lock:
+            return [(key, entry[1]) for key, entry in self._entries.items()]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCacheBackend:
+    """On-disk cache that survives restarts and can be shared by worker processes"""
+
+    def __init__(self, path, max_entries=10000, ttl=3000):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.evictions = 0
+        self._local = threading.local()
+
+        # A throwaway connection for the schema, so none is inherited by forked workers
+        connection = sqlite3.connect(self.path, timeout=10)
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, used_at REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS response_cache_used ON response_cache (used_at)")
+            connection.commit()
+        finally:
+            connection.close()
+
+    def get(self, key):
+        connection = self._connection()
+        row = connection.execute("SELECT value, expires_at FROM response_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if row[1] < now:
+            connection.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+            connection.commit()
+            self.evictions += 1
+            return None
+        connection.execute("UPDATE response_cache SET used_at = ? WHERE key = ?", (now, key))
+        connection.commit()
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        now = time.time()
+        connection = self._connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO response_cache (key, value, expires_at, used_at) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value), now + self.ttl, now)
+        )
+        # Drop the least recently used rows beyond the size bound
+        cursor = connection.execute(
+            "DELETE FROM response_cache WHERE key IN ("
+            "SELECT key FROM response_cache ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+        self.evictions += max(cursor.rowcount, 0)
+        connection.commit()
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM response_cache").fetchone()[0]
+
+    def _connection(self):
+        # sqlite3 connections cannot be shared between threads
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=10)
+            self._local.connection = connection
+        return connection
+
+
+class ResponseCache:
+    """Caches story introductions and image prompts keyed on normalized inputs.
+
+    Introductions are kept as a pool of up to `variants` different generations per
+    (genre, character, mood); the cache only serves from a pool once it is full, so
+    users picking the same presets still see some variety. Each variant records when
+    it was generated: since the API's image URLs expire, a variant whose upstream
+    image URL is older than `image_url_ttl` seconds is served once without its image
+    and dropped from the pool, and variants older than the backend's TTL are dropped
+    whenever the pool is written. Images from an ImageStore ("/images/...")
+    do not expire.
+    """
+
+    # Pools this process saw filling up, remembered so misses skip reading the backend
+    MAX_FILLING = 10000
+
+    def __init__(self, backend, variants=3, image_url_ttl=3000):
+        self.backend = backend
+        self.variants = variants
+        self.image_url_ttl = image_url_ttl
+        self.hits = 0
+        self.misses = 0
+        self._filling = OrderedDict()  # key -> variants in the pool when this process last read or wrote it
+        self._lock = threading.Lock()
+
+    def get_introduction(self, genre, character, mood):
+        """Return a random cached variant for these preferences, or None"""
+        key = self._key('introduction', genre, character, mood)
+        # Only add_introduction() can fill a pool this process saw filling, and it reads the pool again
+        if key in self._filling:
+            self._count(hit=False)
+            return None
+        pool = self.backend.get(key)
+        if not pool or len(pool) < self.variants:
+            self._remember_filling(key, len(pool or []))
+            self._count(hit=False)
+            return None
+        self._count(hit=True)
+        variant = random.choice(pool)
+        if self._image_expired(variant):
+            # Its text is still good for this request, but the pool refills with variants whose image works
+            with self._lock:
+                pool = [item for item in self.backend.get(key) or [] if not self._image_expired(item)]
+                self.backend.set(key, pool)
+            self._remember_filling(key, len(pool))
+            variant = dict(variant, image_url=None)  # The caller generates a fresh image
+        return variant
+
+    def add_introduction(self, genre, character, mood, variant):
+        """Add a freshly generated introduction to the pool for these preferences"""
+        key = self._key('introduction', genre, character, mood)
+        now = time.time()
+        with self._lock:
+            pool = [item for item in self.backend.get(key) or []
+                    if now - item.get('created_at', 0) < self.backend.ttl]
+            if len(pool) < self.variants:
+                pool = pool + [dict(variant, created_at=now)]
+                self.backend.set(key, pool)
+        self._remember_filling(key, len(pool))
+
+    def get_image_prompt(self, genre, mood, story_text):
+        """Return the memoized image prompt for this excerpt, or None"""
+        image_prompt = self.backend.get(self._key('image_prompt', genre, mood, story_text[:500]))
+        self._count(hit=image_prompt is not None)
+        return image_prompt
+
+    def set_image_prompt(self, genre, mood, story_text, image_prompt):
+        """Memoize the image prompt generated for this excerpt"""
+        self.backend.set(self._key('image_prompt', genre, mood, story_text[:500]), image_prompt)
+
+    def stats(self):
+        """Hit, miss and eviction counters"""
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.backend.evictions}
+
+    def _image_expired(self, variant):
+        image_url = variant.get('image_url')
+        if not image_url or image_url.startswith('/'):
+            return False
+        return time.time() - variant.get('created_at', 0) >= self.image_url_ttl
+
+    def _remember_filling(self, key, count):
+        with self._lock:
+            if count >= self.variants:
+                self._filling.pop(key, None)
+                return
+            self._filling[key] = count
+            self._filling.move_to_end(key)
+            while len(self._filling) > self.MAX_FILLING:
+                self._filling.popitem(last=False)
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _key(self, kind, *parts):
+        # Case and whitespace differences should not split the cache
+        normalized = [re.sub(r"\s+", " ", str(part)).strip().lower() for part in parts]
+        digest = hashlib.sha256("\0".join(normalized).encode('utf-8')).hexdigest()
+        return f"{kind}:{digest}"
+
+
+def create_response_cache(backend, path=None, ttl=3000, max_entries=1000, variants=3, image_url_ttl=3000):
+    """Build the configured response cache ('memory', 'sqlite' or 'off' for none)"""
+    if backend == 'off':
+        return None
+    if backend == 'memory':
+        return ResponseCache(LRUCacheBackend(max_entries=max_entries, ttl=ttl), variants=variants,
+                             image_url_ttl=image_url_ttl)
+    if backend == 'sqlite':
+        return ResponseCache(SQLiteCacheBackend(path or 'response_cache.db', max_entries=max_entries, ttl=ttl),
+                             variants=variants, image_url_ttl=image_url_ttl)
+    raise ValueError(f"Unknown response cache backend: {backend}")
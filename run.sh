@@ -18,18 +18,31 @@ if grep -q "your_openai_api_key_here" .env; then
     echo "The application will not work properly without a valid API key."
 fi
 
-# Run the test script to verify OpenAI API connection
-echo "Testing OpenAI API connection..."
-python3 test_openai.py
-
-# If the test fails, exit
-if [ $? -ne 0 ]; then
-    echo "OpenAI API test failed. Please check your API key and internet connection."
-    exit 1
+# Start the application: gunicorn when it is installed (see gunicorn.conf.py), the Flask
+# development server otherwise or with --dev
+PORT=${PORT:-5000}
+export PORT
+if [ "$1" != "--dev" ] && command -v gunicorn >/dev/null 2>&1; then
+    echo "Starting the application with gunicorn..."
+    gunicorn -c gunicorn.conf.py app:app &
+else
+    echo "Starting the Flask development server..."
+    python3 app.py &
 fi
+SERVER_PID=$!
+trap 'kill $SERVER_PID 2>/dev/null' INT TERM
 
-# Start the Flask application
-echo "Starting the Flask application..."
-echo "The application will be available at http://localhost:5000"
-echo "Press Ctrl+C to stop the server"
-python3 app.py
+# Wait for the local readiness check (no OpenAI API call; run test_openai.py to check the API key)
+for _ in $(seq 1 100); do
+    if python3 -c "import urllib.request; urllib.request.urlopen('http://127.0.0.1:$PORT/readyz', timeout=1)" 2>/dev/null; then
+        echo "The application is available at http://localhost:$PORT"
+        echo "Press Ctrl+C to stop the server"
+        break
+    fi
+    if ! kill -0 $SERVER_PID 2>/dev/null; then
+        echo "The application failed to start."
+        exit 1
+    fi
+    sleep 0.2
+done
+wait $SERVER_PID
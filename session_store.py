@@ -0,0 +1,157 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from story_history import StoryHistory
+
+
+class SessionStore:
+    """Server-side storage for story contexts, keyed by the session id kept in the cookie"""
+
+    def get(self, session_id):
+        """Return the stored context, or None if it is missing or expired"""
+        raise NotImplementedError
+
+    def set(self, session_id, context):
+        """Store the context, resetting its time to live"""
+        raise NotImplementedError
+
+    def delete(self, session_id):
+        """Forget the context"""
+        raise NotImplementedError
+
+
+class MemorySessionStore(SessionStore):
+    """In-process LRU store with TTL expiry; contexts are copied in and out.
+
+    Each request works on its own copy, so two requests of one session cannot
+    interleave turns in one history, and a turn that fails is never stored.
+
+    Suitable for a single worker process. Use SQLiteSessionStore when several
+    workers need to see the same sessions.
+    """
+
+    def __init__(self, max_entries=10000, ttl=3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # session id -> (expires_at, context)
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[session_id]
+                return None
+            self._entries.move_to_end(session_id)
+            return _copy(entry[1])
+
+    def set(self, session_id, context):
+        with self._lock:
+            self._entries[session_id] = (time.monotonic() + self.ttl, _copy(context))
+            self._entries.move_to_end(session_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, session_id):
+        with self._lock:
+            self._entries.pop(session_id, None)
+
+    def items(self):
+        """Snapshot of the stored (session id, context) pairs, without touching their recency (for memory reports)"""
+        with self._lock:
+            return [(key, entry[1]) for key, entry in self._entries.items()]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def _copy(context):
+    # Copying the history shares its turns and renders, which nothing modifies in place
+    if not isinstance(context, dict):
+        return context
+    context = dict(context)
+    if 'history' in context:
+        context['history'] = StoryHistory.of(context['history']).copy()
+    return context
+
+
+class SQLiteSessionStore(SessionStore):
+    """SQLite-backed store that can be shared by several worker processes on one host"""
+
+    def __init__(self, path, ttl=3600, prune_interval=300):
+        self.path = path
+        self.ttl = ttl
+        self.prune_interval = prune_interval
+        self._local = threading.local()
+        self._last_prune = 0.0
+
+        # Threads connect on first use; this one only creates the schema (see gunicorn.conf.py)
+        connection = sqlite3.connect(self.path, timeout=10)
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS story_sessions ("
+                "id TEXT PRIMARY KEY, context TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS story_sessions_expiry ON story_sessions (expires_at)")
+            connection.commit()
+        finally:
+            connection.close()
+
+    def get(self, session_id):
+        row = self._connection().execute(
+            "SELECT context FROM story_sessions WHERE id = ? AND expires_at >= ?",
+            (session_id, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, session_id, context):
+        connection = self._connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO story_sessions (id, context, expires_at) VALUES (?, ?, ?)",
+            (session_id, json.dumps(context, default=_to_json), time.time() + self.ttl)
+        )
+        connection.commit()
+        self._maybe_prune()
+
+    def delete(self, session_id):
+        connection = self._connection()
+        connection.execute("DELETE FROM story_sessions WHERE id = ?", (session_id,))
+        connection.commit()
+
+    def _connection(self):
+        # sqlite3 connections cannot be shared between threads
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=10)
+            self._local.connection = connection
+        return connection
+
+    def _maybe_prune(self):
+        now = time.time()
+        if now - self._last_prune < self.prune_interval:
+            return
+        self._last_prune = now
+        connection = self._connection()
+        connection.execute("DELETE FROM story_sessions WHERE expires_at < ?", (now,))
+        connection.commit()
+
+
+def _to_json(value):
+    # Story histories are stored as their list of {'role', 'content'} dicts
+    if isinstance(value, StoryHistory):
+        return value.messages()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def create_session_store(backend, path=None, ttl=3600, max_entries=10000):
+    """Build the configured session store ('memory' or 'sqlite')"""
+    if backend == 'memory':
+        return MemorySessionStore(max_entries=max_entries, ttl=ttl)
+    if backend == 'sqlite':
+        return SQLiteSessionStore(path or 'sessions.db', ttl=ttl)
+    raise ValueError(f"Unknown session store backend: {backend}")
@@ -0,0 +1,73 @@
+import threading
+import time
+
+
+class _Call:
+    """One in-flight (or recently finished) call and its outcome"""
+
+    __slots__ = ('done', 'result', 'error', 'finished_at')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.finished_at = None
+
+
+class SingleFlight:
+    """Runs a function once per key while callers with the same key share its result.
+
+    Callers arriving while the call runs wait for it instead of starting their own.
+    Successful results are also handed to callers arriving up to `linger` seconds
+    after it finished, which covers duplicates that read their input before the
+    first call saved its output. Errors are shared with waiters but not kept.
+    """
+
+    def __init__(self, linger=10):
+        self.linger = linger
+        self.calls = 0
+        self.shared = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func):
+        """Return func()'s result, running it only if no call with this key is in flight or just finished"""
+        with self._lock:
+            self._prune()
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+        except Exception as e:
+            call.error = e
+            with self._lock:
+                self._calls.pop(key, None)
+            raise
+        finally:
+            call.finished_at = time.monotonic()
+            call.done.set()
+        return call.result
+
+    def stats(self):
+        """Calls run and duplicate callers served from them"""
+        with self._lock:
+            in_flight = sum(1 for call in self._calls.values() if not call.done.is_set())
+            return {'calls': self.calls, 'shared': self.shared, 'in_flight': in_flight}
+
+    def _prune(self):
+        now = time.monotonic()
+        for key in [key for key, call in self._calls.items()
+                    if call.finished_at is not None and now - call.finished_at > self.linger]:
+            del self._calls[key]
@@ -0,0 +1,207 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from context_window import count_tokens
+from metrics import usage_tally
+from rate_limiter import background
+
+
+class _Speculation:
+    """A background continuation for one offered choice"""
+
+    def __init__(self, choice):
+        self.choice = choice
+        self.future = None
+        self.started_at = None
+        self.finished_at = None
+        self.tokens = None  # Set once the completion has been charged
+        self.discarded = False
+
+
+class Speculator:
+    """Pre-generates the continuation for each offered choice while the reader is still reading.
+
+    When a turn's choices are produced, speculate() starts a background continuation
+    for each of them; take() hands back the one the user picked and discards the rest.
+    Queued losers are cancelled; running ones finish and count as wasted tokens.
+    A picked speculation that has not started yet is cancelled too, and one still
+    running is waited for at most `max_wait` seconds: either way the turn is
+    generated directly rather than queued behind other sessions' speculations.
+    Speculations are charged their full usage, prompt included, against a token
+    budget per window, so the extra spend stays bounded under load. Results are held in-process, per session.
+    """
+
+    # Prompt and completion tokens reserved per speculation until its real usage is known
+    RESERVED_TOKENS = 1500
+
+    def __init__(self, generator, workers=3, max_choices=3, token_budget=20000, budget_window=60, max_sessions=1000,
+                 max_wait=10):
+        self.generator = generator
+        self.max_wait = max_wait
+        self.max_choices = max_choices
+        self.token_budget = token_budget
+        self.budget_window = budget_window
+        self.max_sessions = max_sessions
+
+        self.started = 0
+        self.skipped = 0  # Choices not speculated on because the budget was spent
+        self.hits = 0
+        self.misses = 0
+        self.timeouts = 0  # Picked speculations given up on because they were still running after max_wait
+        self.wasted_tokens = 0
+        self.latency_saved = 0.0
+
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="story-speculation")
+        self._sessions = OrderedDict()  # session_id -> (anchor, {choice: _Speculation})
+        self._window_start = time.monotonic()
+        self._window_tokens = 0
+        self._reserved = 0  # Tokens reserved by speculations not charged or refunded yet
+        self._lock = threading.Lock()
+
+    def speculate(self, session_id, story_context, choices):
+        """Start generating the continuation for each choice, replacing the session's earlier speculations"""
+        history = story_context['history']
+        anchor = self._anchor(history)
+        with self._lock:
+            self._discard(session_id)
+            speculations = {}
+            for choice in choices[:self.max_choices]:
+                if not self._reserve():
+                    self.skipped += 1
+                    continue
+                branch = history.copy()
+                branch.append({'role': 'user', 'content': choice})
+                context = dict(story_context, history=branch)
+                speculation = _Speculation(choice)
+                speculation.future = self._executor.submit(self._generate, speculation, context)
+                speculations[choice.strip()] = speculation
+                self.started += 1
+            if speculations:
+                self._sessions[session_id] = (anchor, speculations)
+                while len(self._sessions) > self.max_sessions:
+                    self._discard(next(iter(self._sessions)))
+
+    def take(self, session_id, story_context, choice):
+        """Return (continuation, choices) precomputed for this choice, or None on a miss.
+
+        story_context must already end with the user's choice. A matching speculation
+        that is still queued is cancelled, and one that is running is waited for up to
+        max_wait seconds, since it started before the click and usually finishes first.
+        """
+        requested_at = time.monotonic()
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+            speculation = None
+            if entry is not None:
+                anchor, speculations = entry
+                # The story must not have moved on (e.g. a command) since the choices were offered
+                if anchor == self._anchor(story_context['history'][:-1]):
+                    speculation = speculations.pop(choice.strip(), None)
+                for other in speculations.values():
+                    self._cancel(other)
+            # Still queued behind other sessions' speculations: a direct call starts sooner
+            if speculation is not None and speculation.future.cancel():
+                self._refund()
+                speculation = None
+            if speculation is None:
+                self.misses += 1
+                return None
+
+        try:
+            result = speculation.future.result(self.max_wait)
+        except FutureTimeout:
+            with self._lock:
+                self._cancel(speculation)
+                self.timeouts += 1
+            result = None
+        except Exception as e:
+            print(f"Error in speculative continuation: {e}")
+            result = None
+
+        with self._lock:
+            if result is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            if speculation.started_at is not None:
+                self.latency_saved += max(0.0, min(speculation.finished_at, requested_at) - speculation.started_at)
+        return result
+
+    def stats(self):
+        """Speculation counters: hit rate, wasted tokens and latency saved"""
+        with self._lock:
+            taken = self.hits + self.misses
+            return {
+                'started': self.started,
+                'skipped': self.skipped,
+                'hits': self.hits,
+                'misses': self.misses,
+                'timeouts': self.timeouts,
+                'hit_rate': self.hits / taken if taken else 0.0,
+                'wasted_tokens': self.wasted_tokens,
+                'latency_saved_seconds': round(self.latency_saved, 3)
+            }
+
+    def _generate(self, speculation, story_context):
+        speculation.started_at = time.monotonic()
+        try:
+            with background(), usage_tally() as usage:
+                text, choices, _ = self.generator.generate_continuation(
+                    story_context, speculation.choice, include_image=False
+                )
+        finally:
+            speculation.finished_at = time.monotonic()
+
+        # A discarded speculation wasted its prompt as well as its completion
+        tokens = usage.tokens if usage.responses else count_tokens(text)
+        with self._lock:
+            speculation.tokens = tokens
+            self._refund()
+            self._window_tokens += tokens
+            if speculation.discarded:
+                self.wasted_tokens += tokens
+
+        # The generator reports failures as story text; those are never served
+        if text.startswith("Error generating story continuation"):
+            return None
+        return text, choices
+
+    def _discard(self, session_id):
+        entry = self._sessions.pop(session_id, None)
+        if entry is not None:
+            for speculation in entry[1].values():
+                self._cancel(speculation)
+
+    def _cancel(self, speculation):
+        speculation.discarded = True
+        if speculation.future.cancel():
+            self._refund()
+        elif speculation.tokens is not None:
+            self.wasted_tokens += speculation.tokens
+
+    def _reserve(self):
+        now = time.monotonic()
+        if now - self._window_start >= self.budget_window:
+            # Speculations still running are charged to the new window, which their reservations carry into
+            self._window_start = now
+            self._window_tokens = self._reserved
+        if self._window_tokens + self.RESERVED_TOKENS > self.token_budget:
+            return False
+        self._window_tokens += self.RESERVED_TOKENS
+        self._reserved += self.RESERVED_TOKENS
+        return True
+
+    def _refund(self):
+        # Release a reservation, when its speculation is cancelled or charged its real usage
+        self._reserved -= self.RESERVED_TOKENS
+        self._window_tokens = max(0, self._window_tokens - self.RESERVED_TOKENS)
+
+    def _anchor(self, history):
+        # Fingerprint of the history the choices were offered for
+        if not history:
+            return None
+        last = history[-1]['content'].encode('utf-8')
+        return f"{len(history)}:{hashlib.sha1(last).hexdigest()}"
@@ -17,6 +17,7 @@ document.addEventListener('DOMContentLoaded', function() {
     const selectedTraitsContainer = document.getElementById('selected-traits-container');
     const characterTextarea = document.getElementById('character');
     const moodInput = document.getElementById('mood');
+    const storyLog = new StoryLog(storyText);
 
     // Story state
     let currentChoices = [];
@@ -26,6 +27,11 @@ document.addEventListener('DOMContentLoaded', function() {
     let selectedTraits = [];
     let selectedGenre = '';
     const MAX_CYCLES = 5; // Number of choice cycles before ending the story
+    const IMAGE_POLL_INTERVAL = 1500; // Milliseconds between image job status checks
+    const REQUEST_TIMEOUT = 90000; // Milliseconds before a story request is retried
+    const REQUEST_RETRIES = 2; // Retries after a timeout or gateway error, sent with the same idempotency key
+    const STREAM_TURNS = document.body.dataset.streamTurns === 'true' && !!window.ReadableStream;
+    let latestImageJob = null;
 
     // Event Listeners
     preferencesForm.addEventListener('submit', initializeStory);
@@ -222,27 +228,19 @@ document.addEventListener('DOMContentLoaded', function() {
         choiceCycles = 0;
         
         // Show loading state
-        storyText.innerHTML = '<p class="loading">Creating your story...</p>';
+        storyLog.reset();
+        storyLog.append('<p class="loading">Creating your story...</p>', { transient: true });
         storySetup.classList.add('hidden');
         storyContent.classList.remove('hidden');
         
         // Send request to backend
-        fetch('/initialize_story', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({ genre, character, mood }),
-        })
-        .then(response => response.json())
+        requestStory('/initialize_story', { genre, character, mood }, newRequestKey())
         .then(data => {
             // Display story introduction
-            storyText.innerHTML = formatStoryText(data.introduction);
+            storyLog.reset(formatStoryText(data.introduction));
             
-            // Display story image if available
-            if (data.image_url) {
-                displayStoryImage(data.image_url);
-            }
+            // Display story image if available, or wait for the background job
+            showStoryImage(data);
             
             // Display choices
             displayChoices(data.choices);
@@ -257,7 +255,7 @@ document.addEventListener('DOMContentLoaded', function() {
         })
         .catch(error => {
             console.error('Error initializing story:', error);
-            storyText.innerHTML = '<p class="error">Error creating your story. Please try again.</p>';
+            storyLog.reset('<p class="error">Error creating your story. Please try again.</p>');
             storyInProgress = false;
         });
     }
@@ -265,7 +263,7 @@ document.addEventListener('DOMContentLoaded', function() {
     /**
      * Continue the story based on user's choice
      */
-    function continueStory(choice) {
+    function continueStory(choice, requestKey) {
         if (!storyInProgress) return;
         
         // Increment choice cycles
@@ -273,20 +271,13 @@ document.addEventListener('DOMContentLoaded', function() {
         
         // Show loading state
         appendToStory(`<p class="user-choice">You chose: ${choice}</p>`);
-        appendToStory('<p class="loading">Continuing your story...</p>');
+        appendToStory('<p class="loading">Continuing your story...</p>', true);
         
         // Disable choice buttons while loading
         disableChoiceButtons();
         
         // Send request to backend
-        fetch('/continue_story', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({ choice }),
-        })
-        .then(response => response.json())
+        requestStory('/continue_story', { choice }, requestKey)
         .then(data => {
             // Remove loading message
             removeLoadingMessage();
@@ -294,10 +285,8 @@ document.addEventListener('DOMContentLoaded', function() {
             // Display story continuation
             appendToStory(formatStoryText(data.continuation));
             
-            // Display story image if available
-            if (data.image_url) {
-                displayStoryImage(data.image_url);
-            }
+            // Display story image if available, or wait for the background job
+            showStoryImage(data);
             
             // Check if we should end the story
             if (choiceCycles >= MAX_CYCLES && !storyEndingTriggered) {
@@ -326,7 +315,7 @@ document.addEventListener('DOMContentLoaded', function() {
             }
             
             // Scroll to the new content
-            storyText.lastChild.scrollIntoView({ behavior: 'smooth' });
+            storyLog.scrollToEnd();
         })
         .catch(error => {
             console.error('Error continuing story:', error);
@@ -351,20 +340,13 @@ document.addEventListener('DOMContentLoaded', function() {
         
         // Show loading state
         appendToStory(`<p class="user-command">Command: ${command}</p>`);
-        appendToStory('<p class="loading">Modifying your story...</p>');
+        appendToStory('<p class="loading">Modifying your story...</p>', true);
         
         // Disable choice buttons while loading
         disableChoiceButtons();
         
         // Send request to backend
-        fetch('/modify_story', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({ command }),
-        })
-        .then(response => response.json())
+        requestStory('/modify_story', { command }, newRequestKey())
         .then(data => {
             // Remove loading message
             removeLoadingMessage();
@@ -372,10 +354,8 @@ document.addEventListener('DOMContentLoaded', function() {
             // Display story modification
             appendToStory(formatStoryText(data.continuation));
             
-            // Display story image if available
-            if (data.image_url) {
-                displayStoryImage(data.image_url);
-            }
+            // Display story image if available, or wait for the background job
+            showStoryImage(data);
             
             // Display new choices
             displayChoices(data.choices);
@@ -387,7 +367,7 @@ document.addEventListener('DOMContentLoaded', function() {
             commandInput.value = '';
             
             // Scroll to the new content
-            storyText.lastChild.scrollIntoView({ behavior: 'smooth' });
+            storyLog.scrollToEnd();
             
             // If command was to start over, reset choice cycles
             if (command.toLowerCase().includes('start over')) {
@@ -404,11 +384,162 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
+    /**
+     * Request a story turn, streaming its text into the page when the server supports it
+     */
+    function requestStory(path, payload, requestKey) {
+        // The server answers a repeated key with the stored turn, so a retry never plays the turn twice
+        const attempt = retriesLeft => {
+            const controller = new AbortController();
+            // A stream is only timed until it starts; its text then arrives for as long as it takes
+            const timer = setTimeout(() => controller.abort(), REQUEST_TIMEOUT);
+            const options = storyRequestOptions(payload, requestKey);
+            options.signal = controller.signal;
+            return fetch(STREAM_TURNS ? `/stream${path}` : path, options).then(response => {
+                clearTimeout(timer);
+                if ([502, 503, 504].includes(response.status) && retriesLeft > 0) {
+                    // An overloaded server says when to come back; retrying sooner only adds to its queue
+                    const delay = (parseFloat(response.headers.get('Retry-After')) || 0) * 1000;
+                    return new Promise(resolve => setTimeout(resolve, delay)).then(() => attempt(retriesLeft - 1));
+                }
+                if (!response.ok) {
+                    throw new Error(`Story request failed with status ${response.status}`);
+                }
+                return STREAM_TURNS ? readStoryStream(response) : response.json();
+            }, error => {
+                clearTimeout(timer);
+                if (retriesLeft > 0) return attempt(retriesLeft - 1);
+                throw error;
+            });
+        };
+        return attempt(REQUEST_RETRIES);
+    }
+
+    /**
+     * Fetch options for a story request, tagged with its idempotency key
+     */
+    function storyRequestOptions(payload, requestKey) {
+        const headers = { 'Content-Type': 'application/json' };
+        if (requestKey) headers['Idempotency-Key'] = requestKey;
+        return { method: 'POST', headers, body: JSON.stringify(payload) };
+    }
+
+    /**
+     * A fresh key identifying one user action across retries
+     */
+    function newRequestKey() {
+        if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+        return Date.now().toString(36) + Math.random().toString(36).slice(2);
+    }
+
+    /**
+     * Read a Server-Sent Events response, showing text deltas as they arrive.
+     * Resolves with the finished turn, in the same shape as the JSON routes return.
+     */
+    function readStoryStream(response) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        const liveText = document.createElement('div');
+        liveText.className = 'streaming-text';
+        let buffer = '';
+        let finished = false;
+        let liveEntry = null;
+
+        return new Promise((resolve, reject) => {
+            function handleEvent(frame) {
+                let event = 'message';
+                let data = '';
+                frame.split('\n').forEach(line => {
+                    if (line.startsWith('event:')) {
+                        event = line.slice(6).trim();
+                    } else if (line.startsWith('data:')) {
+                        data += line.slice(5).trim();
+                    }
+                });
+                if (!data) return;
+
+                const payload = JSON.parse(data);
+                if (event === 'delta') {
+                    // Replace the loading message with the text as it is written
+                    if (!liveEntry) {
+                        removeLoadingMessage();
+                        liveEntry = storyLog.appendElement(liveText, { transient: true });
+                    }
+                    liveText.textContent += payload.text;
+                } else if (event === 'done') {
+                    finished = true;
+                    resolve(payload);
+                } else if (event === 'image' && payload.image_url) {
+                    displayStoryImage(payload.image_url);
+                }
+            }
+
+            function pump() {
+                reader.read().then(({ done, value }) => {
+                    if (done) {
+                        if (!finished) reject(new Error('Story stream ended early'));
+                        return;
+                    }
+                    buffer += decoder.decode(value, { stream: true });
+                    let boundary;
+                    while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                        handleEvent(buffer.slice(0, boundary));
+                        buffer = buffer.slice(boundary + 2);
+                    }
+                    pump();
+                }).catch(reject);
+            }
+
+            pump();
+        });
+    }
+
+    /**
+     * Show the image returned with a story response, polling for it if it is still being generated
+     */
+    function showStoryImage(data) {
+        latestImageJob = data.image_job_id || null;
+        if (data.image_url) {
+            displayStoryImage(data.image_url);
+        } else if (latestImageJob) {
+            pollImageJob(latestImageJob);
+        }
+    }
+
+    /**
+     * Poll a background image job until it finishes
+     */
+    function pollImageJob(jobId) {
+        setTimeout(() => {
+            // A newer story turn has replaced this image
+            if (jobId !== latestImageJob) return;
+
+            fetch(`/image_status/${jobId}`)
+            .then(response => response.json())
+            .then(job => {
+                if (jobId !== latestImageJob) return;
+                if (job.status === 'done' && job.image_url) {
+                    displayStoryImage(job.image_url);
+                } else if (job.status === 'pending' || job.status === 'running') {
+                    pollImageJob(jobId);
+                }
+            })
+            .catch(error => {
+                console.error('Error checking image status:', error);
+            });
+        }, IMAGE_POLL_INTERVAL);
+    }
+
     /**
      * Display story image
      */
     function displayStoryImage(imageUrl) {
-        storyImage.innerHTML = `<img src="${imageUrl}" alt="Story scene">`;
+        // Images served from our own image store come in smaller sizes for narrow screens
+        const srcset = imageUrl.startsWith('/images/')
+            ? ` srcset="${imageUrl}?w=256 256w, ${imageUrl}?w=384 384w, ${imageUrl} 512w" sizes="(max-width: 600px) 100vw, 512px"`
+            : '';
+        // Reserve the image's box and decode it off the main thread, so it neither shifts nor stalls the page
+        storyImage.innerHTML = `<img src="${imageUrl}"${srcset} width="512" height="512" loading="lazy" decoding="async" alt="Story scene">`;
         storyImage.classList.remove('hidden');
     }
 
@@ -418,16 +549,9 @@ document.addEventListener('DOMContentLoaded', function() {
     function triggerStoryEnding() {
         storyEndingTriggered = true;
         
-        appendToStory('<p class="loading">Preparing to conclude your story...</p>');
+        appendToStory('<p class="loading">Preparing to conclude your story...</p>', true);
         
-        fetch('/modify_story', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({ command: "Please provide a satisfying conclusion to this story" }),
-        })
-        .then(response => response.json())
+        requestStory('/modify_story', { command: "Please provide a satisfying conclusion to this story" }, newRequestKey())
         .then(data => {
             // Remove loading message
             removeLoadingMessage();
@@ -436,10 +560,8 @@ document.addEventListener('DOMContentLoaded', function() {
             appendToStory('<p class="story-ending-header">The Conclusion</p>');
             appendToStory(formatStoryText(data.continuation));
             
-            // Display story image if available
-            if (data.image_url) {
-                displayStoryImage(data.image_url);
-            }
+            // Display story image if available, or wait for the background job
+            showStoryImage(data);
             
             // Add ending message
             appendToStory('<p class="story-complete">Your story has reached its conclusion. You can start a new adventure or modify this ending.</p>');
@@ -448,7 +570,7 @@ document.addEventListener('DOMContentLoaded', function() {
             document.getElementById('story-choices').classList.add('hidden');
             
             // Scroll to the ending
-            storyText.lastChild.scrollIntoView({ behavior: 'smooth' });
+            storyLog.scrollToEnd();
         })
         .catch(error => {
             console.error('Error ending story:', error);
@@ -465,11 +587,12 @@ document.addEventListener('DOMContentLoaded', function() {
         // Clear previous choices
         choicesButtons.innerHTML = '';
         
-        // Create a button for each choice
-        choices.forEach(choice => {
+        // Create a button for each choice; repeated clicks on one button send the same request key
+        const offerKey = newRequestKey();
+        choices.forEach((choice, index) => {
             const button = document.createElement('button');
             button.textContent = choice;
-            button.addEventListener('click', () => continueStory(choice));
+            button.addEventListener('click', () => continueStory(choice, `${offerKey}-${index}`));
             choicesButtons.appendChild(button);
         });
         
@@ -503,17 +626,14 @@ document.addEventListener('DOMContentLoaded', function() {
      * Remove loading message
      */
     function removeLoadingMessage() {
-        const loadingMessages = storyText.querySelectorAll('.loading');
-        loadingMessages.forEach(msg => msg.remove());
+        storyLog.removeTransient();
     }
 
     /**
-     * Append text to the story container
+     * Append text to the story log; transient entries are removed with the loading message
      */
-    function appendToStory(html) {
-        const div = document.createElement('div');
-        div.innerHTML = html;
-        storyText.appendChild(div);
+    function appendToStory(html, transient = false) {
+        storyLog.append(html, { transient });
     }
 
     /**
@@ -557,7 +677,8 @@ document.addEventListener('DOMContentLoaded', function() {
         storyContent.classList.add('hidden');
         
         // Clear story text and image
-        storyText.innerHTML = '';
+        latestImageJob = null;
+        storyLog.reset();
         storyImage.innerHTML = '';
         storyImage.classList.add('hidden');
     }
@@ -0,0 +1,163 @@
+// Windowed story log: keeps every turn of the story but only renders the ones near the visible part
+
+/**
+ * Story log rendered into a scroll container.
+ *
+ * Entries are HTML strings, or elements updated in place (like streamed text). Only the
+ * entries within `overscan` pixels of the visible area are in the DOM; the rest are
+ * replaced by two spacers of their measured (or estimated) height, and the nodes of
+ * entries scrolling out are reused for entries scrolling in. All DOM writes are batched
+ * into one animation frame, followed by one round of height measurements.
+ */
+class StoryLog {
+    constructor(container, options = {}) {
+        this.container = container;
+        this.document = container.ownerDocument;
+        this.estimatedHeight = options.estimatedHeight ?? 120; // Pixels assumed for an entry not rendered yet
+        this.overscan = options.overscan ?? 600; // Pixels rendered above and below the visible area
+        this.poolSize = options.poolSize ?? 20; // Detached entry nodes kept for reuse
+        const view = this.document.defaultView;
+        this.requestFrame = options.requestFrame || (callback => view.requestAnimationFrame(callback));
+
+        this.entries = [];
+        this.rendered = new Map(); // entry -> node currently in the container
+        this.pool = [];
+        this.frame = null;
+        this.pinToEnd = false;
+
+        this.topSpacer = this.createSpacer();
+        this.bottomSpacer = this.createSpacer();
+        container.replaceChildren(this.topSpacer, this.bottomSpacer);
+
+        const schedule = () => this.schedule();
+        container.addEventListener('scroll', schedule, { passive: true });
+        view.addEventListener('resize', schedule, { passive: true });
+    }
+
+    /**
+     * Add an entry from HTML; transient entries (loading messages) go with removeTransient()
+     */
+    append(html, options = {}) {
+        return this.add({ html, transient: !!options.transient });
+    }
+
+    /**
+     * Add an element the caller keeps updating, such as text streamed in as it is written
+     */
+    appendElement(element, options = {}) {
+        return this.add({ element, transient: !!options.transient });
+    }
+
+    /**
+     * Drop loading messages and streamed text
+     */
+    removeTransient() {
+        this.entries = this.entries.filter(entry => !entry.transient);
+        this.schedule();
+    }
+
+    /**
+     * Replace the whole story, e.g. with a new introduction
+     */
+    reset(html) {
+        this.entries = [];
+        if (html !== undefined) this.append(html);
+        this.schedule();
+    }
+
+    /**
+     * Scroll to the latest entry once it is rendered
+     */
+    scrollToEnd() {
+        this.pinToEnd = true;
+        this.schedule();
+    }
+
+    add(entry) {
+        entry.height = null;
+        this.entries.push(entry);
+        this.schedule();
+        return entry;
+    }
+
+    schedule() {
+        if (this.frame === null) {
+            this.frame = this.requestFrame(() => this.render());
+        }
+    }
+
+    /**
+     * Bring the DOM in line with the entries in view; runs once per animation frame
+     */
+    render() {
+        this.frame = null;
+        const heights = this.entries.map(entry => entry.height || this.estimatedHeight);
+        const total = heights.reduce((sum, height) => sum + height, 0);
+        const viewHeight = this.container.clientHeight;
+        const viewTop = this.pinToEnd ? Math.max(0, total - viewHeight) : this.container.scrollTop;
+
+        // Entries overlapping the visible area plus the overscan on either side
+        let first = 0;
+        let offset = 0;
+        while (first < this.entries.length - 1 && offset + heights[first] < viewTop - this.overscan) {
+            offset += heights[first++];
+        }
+        const above = offset;
+        let last = first;
+        while (last < this.entries.length && offset < viewTop + viewHeight + this.overscan) {
+            offset += heights[last++];
+        }
+        const visible = this.entries.slice(first, last);
+        const visibleSet = new Set(visible);
+
+        // Writes: detach entries that left the window, then place the visible ones between the spacers
+        this.rendered.forEach((node, entry) => {
+            if (visibleSet.has(entry)) return;
+            node.remove();
+            this.rendered.delete(entry);
+            if (entry.html !== undefined && this.pool.length < this.poolSize) this.pool.push(node);
+        });
+        let cursor = this.topSpacer;
+        visible.forEach(entry => {
+            const node = this.rendered.get(entry) || this.createNode(entry);
+            if (cursor.nextSibling !== node) this.container.insertBefore(node, cursor.nextSibling);
+            cursor = node;
+        });
+        this.topSpacer.style.height = `${above}px`;
+        this.bottomSpacer.style.height = `${total - offset}px`;
+
+        // Reads: measure what was rendered, so spacers match the real heights next time
+        visible.forEach(entry => {
+            const height = this.rendered.get(entry).offsetHeight;
+            if (height) entry.height = height;
+        });
+
+        if (this.pinToEnd) {
+            this.pinToEnd = false;
+            this.container.scrollTop = this.container.scrollHeight;
+            if (cursor !== this.topSpacer) cursor.scrollIntoView({ behavior: 'smooth', block: 'nearest' });
+        }
+    }
+
+    createNode(entry) {
+        let node = entry.element;
+        if (!node) {
+            node = this.pool.pop() || this.document.createElement('div');
+            node.className = 'story-entry';
+            node.innerHTML = entry.html;
+        }
+        this.rendered.set(entry, node);
+        return node;
+    }
+
+    createSpacer() {
+        const spacer = this.document.createElement('div');
+        spacer.className = 'story-spacer';
+        spacer.setAttribute('aria-hidden', 'true');
+        return spacer;
+    }
+}
+
+if (typeof module !== 'undefined') {
+    module.exports = StoryLog;
+}
@@ -1,297 +1,347 @@
 import os
-from dotenv import load_dotenv
-import openai
 import json
-import requests
-from io import BytesIO
-import base64
+from dotenv import load_dotenv
+from lazy_import import LazyModule
+from streaming import ChoicesStreamParser, parse_story_output
+from response_cache import LRUCacheBackend
+from resilience import ResilientCaller
+from model_router import ModelRouter
+from metrics import NULL_METRICS, tally_usage
+from context_window import count_message_tokens
+import prompts
+from rate_limiter import background
+
+# Importing the OpenAI client library takes most of the app's startup time, so it is
+# loaded on the first API call rather than when this module is imported
+openai = LazyModule('openai')
 
 class StoryGenerator:
     """Enhanced class to handle all OpenAI API interactions for story generation"""
     
-    def __init__(self):
-        # Load environment variables
-        load_dotenv()
-        
-        # Configure OpenAI API
+    def __init__(self, context_window=None, cache=None, inline_image_prompt=False, resilience=None, metrics=None,
+                 image_store=None, router=None):
+        # Configure OpenAI API; app.py and batch.py have already loaded .env, other callers may not have
         api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            load_dotenv()
+            api_key = os.getenv("OPENAI_API_KEY")
         if not api_key or api_key == "your_openai_api_key_here":
             raise ValueError("Please set your OpenAI API key in the .env file")
         
         openai.api_key = api_key
-        self.model = "gpt-3.5-turbo"
-        self.image_size = "512x512"  # Default image size
+        openai.max_retries = 0  # Retries are handled by self.resilience
+        self.api_key = api_key
+        
+        # Model, max_tokens, temperature and timeout per task, with SLO-based fallback (see model_router.py)
+        self.router = router or ModelRouter()
+        
+        # Optional bounded history (see context_window.py); None sends the full history
+        self.context_window = context_window
+        
+        # Callbacks called as hook(task, prompt_tokens) for every prompt that is built
+        self.prompt_hooks = []
+        
+        # Optional ResponseCache for introductions and image prompts (see response_cache.py)
+        self.cache = cache
+        
+        # Ask for the image prompt in the story response's trailer instead of a separate completion
+        self.inline_image_prompt = inline_image_prompt
+        self._inline_image_prompts = LRUCacheBackend(max_entries=256, ttl=600)
+        
+        # Deadlines, retries and circuit breakers for every OpenAI call (see resilience.py)
+        self.resilience = resilience or ResilientCaller()
+        
+        # Stage timings and token usage (see metrics.py); the default records nothing
+        self.metrics = metrics or NULL_METRICS
+        
+        # Optional ImageStore; images are then served from our host instead of the expiring upstream URL
+        self.image_store = image_store
     
-    def generate_introduction(self, genre, character, mood):
+    def generate_introduction(self, genre, character, mood, include_image=True, use_cache=True):
         """Generate a story introduction based on user preferences with embedded choices and image"""
-        try:
-            prompt = f"""
-            Create a compelling introduction (2-3 paragraphs) for an interactive story with the following parameters:
-            - Genre/Theme: {genre}
-            - Main Character: {character}
-            - Mood/Feeling: {mood}
+        with self.resilience.turn():
+            # Serve a pre-generated variant when the cache holds enough of them for these preferences
+            cached = self._cached_introduction(genre, character, mood) if use_cache else None
+            if cached is not None:
+                image_url = cached['image_url']
+                if include_image and not image_url:
+                    image_url = self.generate_illustration(genre, character, mood, cached['text'])
+                return cached['text'], cached['choices'], image_url
             
-            The introduction should set the scene and introduce the characters. Make it engaging and immersive.
-            
-            After the introduction, provide 3 possible choices for what could happen next in the story.
-            Format the choices as a JSON array at the end of your response, like this:
-            CHOICES: ["First option", "Second option", "Third option"]
-            
-            Make sure the choices are diverse and would lead to different narrative paths.
-            """
-            
-            response = openai.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are an expert storyteller creating an interactive narrative."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=700,
-                temperature=0.7
-            )
-            
-            content = response.choices[0].message.content
-            
-            # Extract choices from the content
-            choices = self._extract_choices(content)
-            
-            # Remove the CHOICES section from the content
-            introduction = self._remove_choices_section(content)
-            
-            # Generate an image for the introduction
-            image_prompt = self._generate_image_prompt(genre, character, mood, introduction)
-            image_url = self._generate_image(image_prompt)
-            
-            return introduction, choices, image_url
-        except Exception as e:
-            print(f"Error generating story introduction: {e}")
-            return f"Error generating story introduction: {str(e)}", ["Continue the story", "Try a different approach", "Start over"], None
+            try:
+                response = self._chat('introduction', self._introduction_messages(genre, character, mood))
+                
+                # Split off the choices (and inline image prompt) trailer
+                introduction, choices = self._parse_story(response.choices[0].message.content)
+                
+                # Generate an image for the introduction (skipped when the caller queues it separately)
+                image_url = None
+                if include_image:
+                    image_url = self.generate_illustration(genre, character, mood, introduction, use_cache)
+                
+                self._remember_introduction(genre, character, mood, introduction, choices, image_url)
+                return introduction, choices, image_url
+            except Exception as e:
+                print(f"Error generating story introduction: {e}")
+                return f"Error generating story introduction: {str(e)}", ["Continue the story", "Try a different approach", "Start over"], None
     
     def generate_choices(self, story_context):
         """Generate 2-3 choices for the next part of the story - this is now handled within the continuation"""
         try:
-            history_text = "\n".join([item['content'] for item in story_context['history']])
-            
-            prompt = f"""
-            Based on the following story so far:
-            
-            {history_text}
-            
-            Generate 3 interesting choices for what could happen next in the story. 
-            Format them as a JSON array of strings, each representing a possible choice.
-            Example: ["Investigate the strange noise", "Return to the village", "Follow the glowing trail"]
-            
-            Make sure the choices are diverse and would lead to different narrative paths.
-            """
-            
-            response = openai.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are an expert storyteller creating interactive narrative choices."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=200,
-                temperature=0.8
-            )
+            response = self._chat('choices', self._choices_messages(story_context))
             
             # Parse the response to extract the choices
-            choices_text = response.choices[0].message.content
-            try:
-                # Try to extract JSON array from the response
-                choices = json.loads(choices_text)
-                if not isinstance(choices, list) or len(choices) == 0:
-                    choices = ["Explore further", "Turn back", "Wait and observe"]
-            except:
-                # Fallback if JSON parsing fails
-                choices = ["Explore further", "Turn back", "Wait and observe"]
-            
-            return choices
+            return self._parse_choices_list(response.choices[0].message.content)
         except Exception as e:
             print(f"Error generating story choices: {e}")
             return ["Continue the adventure", "Take a different path", "Rest and reconsider"]
     
-    def generate_continuation(self, story_context, choice):
+    def generate_continuation(self, story_context, choice, include_image=True):
         """Generate the next part of the story based on the user's choice with embedded choices and image"""
-        try:
-            history_text = "\n".join([item['content'] for item in story_context['history']])
-            
-            prompt = f"""
-            Based on the following story so far:
-            
-            {history_text}
-            
-            The user has chosen: "{choice}"
-            
-            Continue the story for 2-3 paragraphs based on this choice. Make it engaging and immersive, 
-            maintaining the established {story_context['genre']} genre and {story_context['mood']} mood.
-            
-            Include rich descriptions, dramatic tension, and emotional involvement.
-            
-            After your continuation, provide 3 possible choices for what could happen next in the story.
-            Format the choices as a JSON array at the end of your response, like this:
-            CHOICES: ["First option", "Second option", "Third option"]
-            
-            Make sure the choices are diverse and would lead to different narrative paths.
-            """
-            
-            response = openai.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are an expert storyteller creating an interactive narrative."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=700,
-                temperature=0.7
-            )
-            
-            content = response.choices[0].message.content
-            
-            # Extract choices from the content
-            choices = self._extract_choices(content)
-            
-            # Remove the CHOICES section from the content
-            continuation = self._remove_choices_section(content)
-            
-            # Generate an image for the continuation
-            image_prompt = self._generate_image_prompt(
-                story_context['genre'], 
-                story_context.get('character', 'protagonist'), 
-                story_context['mood'], 
-                continuation
-            )
-            image_url = self._generate_image(image_prompt)
-            
-            return continuation, choices, image_url
-        except Exception as e:
-            print(f"Error generating story continuation: {e}")
-            return f"Error generating story continuation: {str(e)}", ["Continue the adventure", "Take a different path", "Rest and reconsider"], None
+        with self.resilience.turn():
+            try:
+                response = self._chat('continuation', self._continuation_messages(story_context, choice))
+                
+                # Split off the choices (and inline image prompt) trailer
+                continuation, choices = self._parse_story(response.choices[0].message.content)
+                
+                # Generate an image for the continuation
+                image_url = None
+                if include_image:
+                    image_url = self.generate_illustration(
+                        story_context['genre'], 
+                        story_context.get('character', 'protagonist'), 
+                        story_context['mood'], 
+                        continuation
+                    )
+                
+                return continuation, choices, image_url
+            except Exception as e:
+                print(f"Error generating story continuation: {e}")
+                return f"Error generating story continuation: {str(e)}", ["Continue the adventure", "Take a different path", "Rest and reconsider"], None
     
-    def generate_modification(self, story_context, command):
+    def generate_modification(self, story_context, command, include_image=True):
         """Generate a modified story continuation based on the user's command with embedded choices and image"""
+        with self.resilience.turn():
+            try:
+                response = self._chat('modification', self._modification_messages(story_context, command))
+                
+                # Split off the choices (and inline image prompt) trailer
+                modification, choices = self._parse_story(response.choices[0].message.content)
+                
+                # Generate an image for the modification
+                image_url = None
+                if include_image:
+                    image_url = self.generate_illustration(
+                        story_context['genre'], 
+                        story_context.get('character', 'protagonist'), 
+                        self._modification_mood(story_context, command), 
+                        modification
+                    )
+                
+                return modification, choices, image_url
+            except Exception as e:
+                print(f"Error generating story modification: {e}")
+                return f"Error generating story modification: {str(e)}", ["Continue the adventure", "Take a different path", "Rest and reconsider"], None
+    
+    def stream_introduction(self, genre, character, mood):
+        """Stream a story introduction, yielding text deltas and then the parsed choices"""
+        return self._stream_story(
+            'introduction',
+            self._introduction_messages(genre, character, mood),
+            error_message="Error generating story introduction",
+            fallback_choices=["Continue the story", "Try a different approach", "Start over"]
+        )
+    
+    def stream_continuation(self, story_context, choice):
+        """Stream the next part of the story based on the user's choice"""
+        return self._stream_story(
+            'continuation',
+            self._continuation_messages(story_context, choice),
+            error_message="Error generating story continuation",
+            fallback_choices=["Continue the adventure", "Take a different path", "Rest and reconsider"]
+        )
+    
+    def stream_modification(self, story_context, command):
+        """Stream a modified story continuation based on the user's command"""
+        return self._stream_story(
+            'modification',
+            self._modification_messages(story_context, command),
+            error_message="Error generating story modification",
+            fallback_choices=["Continue the adventure", "Take a different path", "Rest and reconsider"]
+        )
+    
+    def _stream_story(self, task, messages, error_message, fallback_choices):
+        """Yield {'type': 'delta'} events as the completion streams in, then a final {'type': 'done'} event"""
+        parser = ChoicesStreamParser()
         try:
-            history_text = "\n".join([item['content'] for item in story_context['history'][:-1]])  # Exclude the command
-            
-            prompt = f"""
-            Based on the following story so far:
-            
-            {history_text}
-            
-            The user has issued this command: "{command}"
-            
-            Modify the story to incorporate this change. Write 2-3 paragraphs that continue the narrative 
-            while adapting to the requested modification. Maintain character continuity and coherence.
-            
-            If the command is to change the mood, adjust the tone accordingly.
-            If the command is to change a character role, reframe the narrative from that perspective.
-            If the command is to change the setting, transition the story to that new environment.
-            If the command is to start over with a new genre, begin a new story in that genre.
-            
-            After your continuation, provide 3 possible choices for what could happen next in the story.
-            Format the choices as a JSON array at the end of your response, like this:
-            CHOICES: ["First option", "Second option", "Third option"]
-            
-            Make sure the choices are diverse and would lead to different narrative paths.
-            """
-            
-            response = openai.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are an expert storyteller creating an interactive narrative."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=700,
-                temperature=0.8
-            )
-            
-            content = response.choices[0].message.content
-            
-            # Extract choices from the content
-            choices = self._extract_choices(content)
-            
-            # Remove the CHOICES section from the content
-            modification = self._remove_choices_section(content)
+            stream = self._chat(task, messages, stream=True)
             
-            # Update mood if it was changed in the command
-            mood = story_context['mood']
-            if "change the mood to" in command.lower():
-                mood = command.lower().replace("change the mood to", "").strip()
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                text = parser.feed(chunk.choices[0].delta.content or "")
+                if text:
+                    yield {'type': 'delta', 'text': text}
             
-            # Generate an image for the modification
-            image_prompt = self._generate_image_prompt(
-                story_context['genre'], 
-                story_context.get('character', 'protagonist'), 
-                mood, 
-                modification
-            )
-            image_url = self._generate_image(image_prompt)
+            text = parser.close()
+            if text:
+                yield {'type': 'delta', 'text': text}
             
-            return modification, choices, image_url
+            self._remember_image_prompt(parser.text, parser.image_prompt)
+            yield {'type': 'done', 'text': parser.text, 'choices': parser.choices or fallback_choices}
         except Exception as e:
-            print(f"Error generating story modification: {e}")
-            return f"Error generating story modification: {str(e)}", ["Continue the adventure", "Take a different path", "Rest and reconsider"], None
+            print(f"{error_message}: {e}")
+            yield {'type': 'done', 'text': f"{error_message}: {str(e)}", 'choices': fallback_choices}
+    
+    def generate_illustration(self, genre, character, mood, story_text, use_cache=True):
+        """Generate an image for a story passage; safe to call from a background worker"""
+        # While image generation is failing, serve the story text alone instead of waiting on it
+        if not self.resilience.available('images'):
+            return None
+        with self.metrics.span('image_prompt'):
+            image_prompt = self._generate_image_prompt(genre, character, mood, story_text, use_cache)
+        with self.metrics.span('image'):
+            return self._generate_image(image_prompt)
+    
+    def _cached_introduction(self, genre, character, mood):
+        """A cached introduction variant for these preferences, or None"""
+        if self.cache is None:
+            return None
+        return self.cache.get_introduction(genre, character, mood)
+    
+    def _remember_introduction(self, genre, character, mood, introduction, choices, image_url):
+        """Add a successful introduction to the cache's pool of variants"""
+        if self.cache is not None:
+            self.cache.add_introduction(genre, character, mood, {
+                'text': introduction,
+                'choices': choices,
+                'image_url': image_url
+            })
+    
+    def _introduction_messages(self, genre, character, mood):
+        """Build the chat messages for a story introduction"""
+        return self._prompt('introduction', prompts.introduction_messages(
+            genre, character, mood, self.inline_image_prompt
+        ))
+    
+    def _continuation_messages(self, story_context, choice):
+        """Build the chat messages for continuing the story after a choice"""
+        return self._prompt('continuation', prompts.continuation_messages(
+            story_context, choice, self.inline_image_prompt, self._window(story_context)
+        ))
+    
+    def _modification_messages(self, story_context, command):
+        """Build the chat messages for modifying the story with a user command"""
+        return self._prompt('modification', prompts.modification_messages(
+            story_context, command, self.inline_image_prompt, self._window(story_context)
+        ))
+    
+    def _choices_messages(self, story_context):
+        """Build the chat messages for a standalone set of choices"""
+        return self._prompt('choices', prompts.choices_messages(
+            story_context, self.inline_image_prompt, self._window(story_context)
+        ))
+    
+    def _image_prompt_messages(self, genre, mood, story_text):
+        """Build the chat messages that turn a story excerpt into an image prompt"""
+        return self._prompt('image_prompt', prompts.image_prompt_messages(genre, mood, story_text))
+    
+    def _chat(self, task, messages, **kwargs):
+        """Run a chat completion on the task's routed model through the resilience layer, timing it and recording its token usage
+
+        For a stream, the route's latency is the time until the response starts.
+        """
+        with self.router.call(task) as call:
+            with self.metrics.span('chat_completion', 'stream' if kwargs.get('stream') else task):
+                call.response = self.resilience.call(
+                    'chat', openai.chat.completions.create, timeout=call.timeout, **call.chat_request(messages, **kwargs)
+                )
+        self.metrics.record_usage(task, call.response)
+        tally_usage(call.response)
+        return call.response
+    
+    def _window(self, story_context):
+        """The (summary, start, end) history window when a context window is configured, else None for all turns"""
+        if self.context_window is None:
+            return None
+        return self.context_window.window(story_context, self.summarize_story)
+    
+    def _prompt(self, task, messages):
+        """Report the prompt size to the registered hooks and return the messages unchanged"""
+        if self.prompt_hooks:
+            tokens = count_message_tokens(messages)
+            for hook in self.prompt_hooks:
+                hook(task, tokens)
+        return messages
+    
+    def _parse_choices_list(self, choices_text):
+        """Parse a bare JSON array of choices, falling back to defaults"""
+        try:
+            # Try to extract JSON array from the response
+            choices = json.loads(choices_text)
+            if not isinstance(choices, list) or len(choices) == 0:
+                choices = ["Explore further", "Turn back", "Wait and observe"]
+        except:
+            # Fallback if JSON parsing fails
+            choices = ["Explore further", "Turn back", "Wait and observe"]
+        return choices
+    
+    def summarize_story(self, previous_summary, turns):
+        """Fold older story turns into a running summary (called off the request path)"""
+        with background():
+            response = self._chat('summary', prompts.summary_messages(previous_summary, turns))
+        return response.choices[0].message.content.strip()
+    
+    def _modification_mood(self, story_context, command):
+        """Mood to illustrate a modification with, updated if the command changed it"""
+        mood = story_context['mood']
+        if "change the mood to" in command.lower():
+            mood = command.lower().replace("change the mood to", "").strip()
+        return mood
+    
+    def _parse_story(self, content):
+        """Split a story response into text and choices, keeping any inline image prompt for the text"""
+        with self.metrics.span('choice_parsing'):
+            output = parse_story_output(content)
+        self._remember_image_prompt(output.text, output.image_prompt)
+        return output.text, output.choices or ["Continue the adventure", "Take a different path", "Rest and reconsider"]
+    
+    def _remember_image_prompt(self, story_text, image_prompt):
+        """Hold an inline image prompt until the passage is illustrated (possibly by a background worker)"""
+        if image_prompt:
+            self._inline_image_prompts.set(story_text, image_prompt + ", digital art, detailed, atmospheric lighting")
     
     def _extract_choices(self, content):
         """Extract choices from the content"""
-        try:
-            # Check if there's a CHOICES section
-            if "CHOICES:" in content:
-                choices_text = content.split("CHOICES:")[1].strip()
-                # Try to parse as JSON
-                try:
-                    choices = json.loads(choices_text)
-                    if isinstance(choices, list) and len(choices) > 0:
-                        return choices
-                except:
-                    # If JSON parsing fails, try to extract from brackets
-                    if choices_text.startswith("[") and "]" in choices_text:
-                        choices_text = choices_text[choices_text.find("["):choices_text.find("]")+1]
-                        try:
-                            choices = json.loads(choices_text)
-                            if isinstance(choices, list) and len(choices) > 0:
-                                return choices
-                        except:
-                            pass
-            
-            # If we couldn't extract choices, generate them
-            return ["Continue the adventure", "Take a different path", "Rest and reconsider"]
-        except Exception as e:
-            print(f"Error extracting choices: {e}")
-            return ["Continue the adventure", "Take a different path", "Rest and reconsider"]
+        return parse_story_output(content).choices or ["Continue the adventure", "Take a different path", "Rest and reconsider"]
     
     def _remove_choices_section(self, content):
         """Remove the CHOICES section from the content"""
-        if "CHOICES:" in content:
-            return content.split("CHOICES:")[0].strip()
-        return content
+        return parse_story_output(content).text
     
-    def _generate_image_prompt(self, genre, character, mood, story_text):
+    def _generate_image_prompt(self, genre, character, mood, story_text, use_cache=True):
         """Generate a prompt for image generation based on the story"""
+        # The story response may already have described its scene
+        inline = self._inline_image_prompts.get(story_text)
+        if inline is not None:
+            return inline
+        
+        if use_cache and self.cache is not None:
+            cached = self.cache.get_image_prompt(genre, mood, story_text)
+            if cached is not None:
+                return cached
+        
         try:
-            prompt = f"""
-            Based on the following story excerpt:
-            
-            {story_text[:500]}  # Limit to first 500 chars to avoid token limits
-            
-            Create a concise image prompt (max 50 words) that captures a key scene from this {genre} story with a {mood} mood.
-            Focus on the visual elements, setting, and atmosphere. Don't include any instructions about style or quality.
-            Just describe the scene itself in vivid detail.
-            """
-            
-            response = openai.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are an expert at creating concise, vivid image prompts from story excerpts."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=100,
-                temperature=0.7
-            )
+            response = self._chat('image_prompt', self._image_prompt_messages(genre, mood, story_text))
             
             image_prompt = response.choices[0].message.content.strip()
             
             # Add style guidance for consistency
             image_prompt += ", digital art, detailed, atmospheric lighting"
             
+            if self.cache is not None:
+                self.cache.set_image_prompt(genre, mood, story_text, image_prompt)
             return image_prompt
         except Exception as e:
             print(f"Error generating image prompt: {e}")
@@ -300,15 +350,31 @@ class StoryGenerator:
     def _generate_image(self, prompt):
         """Generate an image based on the prompt using OpenAI's DALL-E"""
         try:
-            response = openai.images.generate(
-                model="dall-e-2",  # Using DALL-E 2 for faster generation
-                prompt=prompt,
-                n=1,
-                size=self.image_size
-            )
+            with self.router.call('image') as call:
+                response = call.response = self.resilience.call(
+                    'images', openai.images.generate, timeout=call.timeout,
+                    **call.image_request(prompt, **self._image_format())
+                )
             
             # Return the URL of the generated image
-            return response.data[0].url
+            return self._image_url(response.data[0])
         except Exception as e:
             print(f"Error generating image: {e}")
             return None
+    
+    def _image_format(self):
+        """Ask for the image bytes inline when the image store would only download them again"""
+        if self.image_store is not None and self.image_store.b64:
+            return {'response_format': 'b64_json'}
+        return {}
+    
+    def _image_url(self, image):
+        """URL to hand the page for a generated image: a local one when an image store is configured"""
+        if self.image_store is None:
+            return image.url
+        try:
+            with self.metrics.span('image_store'):
+                return self.image_store.save(image)
+        except Exception as e:
+            print(f"Error storing image: {e}")
+            return image.url
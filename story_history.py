@@ -0,0 +1,119 @@
+import sys
+
+
+class Turn:
+    """One story turn. Reads like the {'role', 'content'} dict it replaces (turn['content'])."""
+
+    __slots__ = ('role', 'content', 'tokens')
+
+    def __init__(self, role, content):
+        self.role = sys.intern(role)  # Two distinct roles shared by every turn
+        self.content = content
+        self.tokens = None  # Counted on first use, see StoryHistory.tokens
+
+    def __getitem__(self, key):
+        if key == 'role':
+            return self.role
+        if key == 'content':
+            return self.content
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def to_dict(self):
+        return {'role': self.role, 'content': self.content}
+
+    def __eq__(self, other):
+        if isinstance(other, (Turn, dict)):
+            return self.role == other.get('role') and self.content == other.get('content')
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"Turn({self.role!r}, {self.content!r})"
+
+
+class StoryHistory:
+    """The turns of a story in order, with the renderings prompts need cached.
+
+    Appending a turn is O(1). The message list is extended from where the previous
+    render stopped instead of being rebuilt from every turn, and each turn's token
+    count is computed once. Indexing, len() and
+    iteration behave like the list of dicts it replaces; messages() is its JSON form.
+    """
+
+    __slots__ = ('_turns', '_roles', '_messages')
+
+    def __init__(self, turns=()):
+        self._turns = []
+        self._roles = {}
+        self._messages = None  # Built the first time messages() is called
+        for turn in turns:
+            self.append(turn)
+
+    @classmethod
+    def of(cls, history):
+        """The history itself if it already is a StoryHistory, else one built from a list of dicts"""
+        return history if isinstance(history, cls) else cls(history)
+
+    def append(self, turn):
+        """Add a turn, given as a Turn or a {'role', 'content'} dict"""
+        if not isinstance(turn, Turn):
+            turn = Turn(turn['role'], turn['content'])
+        self._turns.append(turn)
+        self._roles[turn.role] = self._roles.get(turn.role, 0) + 1
+        if self._messages is not None:
+            self._messages.append(turn.to_dict())
+
+    def role_count(self, role):
+        """Number of turns with this role"""
+        return self._roles.get(role, 0)
+
+    def tokens(self, count, start=0, stop=None):
+        """Token counts of the turns from `start` to `stop`, counting each turn with `count` only once"""
+        counts = []
+        for turn in self._turns[start:stop]:
+            if turn.tokens is None:
+                turn.tokens = count(turn.content)
+            counts.append(turn.tokens)
+        return counts
+
+    def messages(self):
+        """The turns as {'role', 'content'} dicts, e.g. for chat messages or JSON (treat as read-only)"""
+        if self._messages is None:
+            self._messages = [turn.to_dict() for turn in self._turns]
+        return self._messages
+
+    def copy(self):
+        """An independent history with the same turns, sharing what has been rendered so far"""
+        history = StoryHistory()
+        history._turns = list(self._turns)
+        history._roles = dict(self._roles)
+        history._messages = list(self._messages) if self._messages is not None else None
+        return history
+
+    def __len__(self):
+        return len(self._turns)
+
+    def __iter__(self):
+        return iter(self._turns)
+
+    def __getitem__(self, index):
+        return self._turns[index]
+
+    def __eq__(self, other):
+        if isinstance(other, StoryHistory):
+            return self._turns == other._turns
+        if isinstance(other, list):
+            return len(self._turns) == len(other) and all(turn == item for turn, item in zip(self._turns, other))
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"StoryHistory({self._turns!r})"
@@ -0,0 +1,158 @@
+import json
+import sqlite3
+import threading
+import time
+from story_history import StoryHistory
+
+
+class SQLiteStoryStore:
+    """Durable story archive: one row per story plus append-only turn records.
+
+    Stories are owned by the session id that created them and listed newest first
+    with keyset pagination on (owner, created_at). Turns are clustered by
+    (story_id, turn), so reading a page of a story is a single range scan and
+    saving a turn inserts only the rows that are new since the last save.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+        # Create the schema on a connection of its own and close it, so nothing is held open
+        # until a thread needs it: a preloading server forks its workers after this runs
+        connection = sqlite3.connect(self.path, timeout=10)
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(
+                "CREATE TABLE IF NOT EXISTS stories ("
+                "id TEXT PRIMARY KEY, owner TEXT NOT NULL, genre TEXT NOT NULL, character TEXT NOT NULL, "
+                "mood TEXT NOT NULL, created_at REAL NOT NULL, updated_at REAL NOT NULL, "
+                "turn_count INTEGER NOT NULL DEFAULT 0);"
+                "CREATE INDEX IF NOT EXISTS stories_owner_created ON stories (owner, created_at);"
+                "CREATE INDEX IF NOT EXISTS stories_created ON stories (created_at);"
+                "CREATE TABLE IF NOT EXISTS story_turns ("
+                "story_id TEXT NOT NULL, turn INTEGER NOT NULL, role TEXT NOT NULL, content TEXT NOT NULL, "
+                "choices TEXT, image_url TEXT, created_at REAL NOT NULL, "
+                "PRIMARY KEY (story_id, turn)) WITHOUT ROWID;"
+            )
+            connection.commit()
+        finally:
+            connection.close()
+
+    def append(self, owner, context, choices=None, image_url=None):
+        """Record the turns added to the context since it was last appended.
+
+        `choices` and `image_url` belong to the newest turn. The count of stored turns
+        is kept in the context itself, so no read is needed before writing.
+        """
+        start = context.get('stored_turns', 0)
+        history = context['history']
+        if start and start >= len(history):
+            return  # Nothing new since the last append
+        now = time.time()
+        rows = []
+        for turn in range(start, len(history)):
+            item = history[turn]
+            latest = turn == len(history) - 1
+            rows.append((
+                context['story_id'], turn, item['role'], item['content'],
+                json.dumps(choices) if latest and choices is not None else None,
+                image_url if latest else None, now
+            ))
+
+        connection = self._connection()
+        with connection:
+            if start == 0:
+                connection.execute(
+                    "INSERT OR IGNORE INTO stories (id, owner, genre, character, mood, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (context['story_id'], owner, context['genre'], context.get('character', ''), context['mood'],
+                     now, now)
+                )
+            connection.executemany(
+                "INSERT OR REPLACE INTO story_turns (story_id, turn, role, content, choices, image_url, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+            )
+            # Commands can change the genre or mood mid-story
+            connection.execute(
+                "UPDATE stories SET genre = ?, character = ?, mood = ?, updated_at = ?, turn_count = ? WHERE id = ?",
+                (context['genre'], context.get('character', ''), context['mood'], now, len(history),
+                 context['story_id'])
+            )
+        context['stored_turns'] = len(history)
+
+    def list_stories(self, owner, limit=20, before=None):
+        """An owner's stories, newest first, created before the `before` timestamp if given"""
+        rows = self._connection().execute(
+            "SELECT id, genre, character, mood, created_at, updated_at, turn_count FROM stories "
+            "WHERE owner = ? AND created_at < ? ORDER BY created_at DESC LIMIT ?",
+            (owner, before if before is not None else float('inf'), limit)
+        ).fetchall()
+        return [_story(row) for row in rows]
+
+    def get_story(self, story_id):
+        """A story's metadata and owner, or None"""
+        row = self._connection().execute(
+            "SELECT id, genre, character, mood, created_at, updated_at, turn_count, owner FROM stories WHERE id = ?",
+            (story_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return dict(_story(row), owner=row[7])
+
+    def get_turns(self, story_id, after=-1, limit=50):
+        """Up to `limit` turns of a story following turn number `after`"""
+        rows = self._connection().execute(
+            "SELECT turn, role, content, choices, image_url FROM story_turns "
+            "WHERE story_id = ? AND turn > ? ORDER BY turn LIMIT ?",
+            (story_id, after, limit)
+        ).fetchall()
+        return [_turn(row) for row in rows]
+
+    def load_context(self, story_id):
+        """Rebuild a story context for resuming, with its newest turn (None if the story is unknown)"""
+        story = self.get_story(story_id)
+        if story is None:
+            return None, None
+        turns = self.get_turns(story_id, limit=story['turns'])
+        context = {
+            'genre': story['genre'],
+            'character': story['character'],
+            'mood': story['mood'],
+            'story_id': story_id,
+            'history': StoryHistory(turns),
+            'stored_turns': len(turns)
+        }
+        return context, (turns[-1] if turns else None)
+
+    def _connection(self):
+        # sqlite3 connections cannot be shared between threads
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=10)
+            connection.execute("PRAGMA synchronous=NORMAL")  # Still consistent after a crash in WAL mode, with fewer fsyncs
+            self._local.connection = connection
+        return connection
+
+
+def _story(row):
+    return {
+        'id': row[0], 'genre': row[1], 'character': row[2], 'mood': row[3],
+        'created_at': row[4], 'updated_at': row[5], 'turns': row[6]
+    }
+
+
+def _turn(row):
+    return {
+        'turn': row[0], 'role': row[1], 'content': row[2],
+        'choices': json.loads(row[3]) if row[3] else None, 'image_url': row[4]
+    }
+
+
+def create_story_store(backend, path=None):
+    """Build the configured story store ('sqlite' or 'off')"""
+    if backend == 'off':
+        return None
+    if backend == 'sqlite':
+        return SQLiteStoryStore(path or 'stories.db')
+    raise ValueError(f"Unknown story store backend: {backend}")
@@ -0,0 +1,201 @@
+import json
+import re
+from collections import namedtuple
+
+CHOICES_MARKER = "CHOICES:"
+
+# The marker in any case, optionally wrapped in markdown emphasis; shared by complete and streamed responses
+_MARKER_PATTERN = re.compile(r"(?:[*_]+\s*)?CHOICES\s*:\s*[*_]*", re.IGNORECASE)
+# A tail of streamed text that the next delta could still complete into the marker
+_PARTIAL_MARKER_PATTERN = re.compile(r"(?:[*_]+\s*)?(?:C(?:H(?:O(?:I(?:C(?:E(?:S\s*)?)?)?)?)?)?)?\Z", re.IGNORECASE)
+_FENCE_PATTERN = re.compile(r"```(?:json)?", re.IGNORECASE)
+_LIST_ITEM_PATTERN = re.compile(r"^\s*(?:[-*\u2022]|\d+[.)])\s+(.+?)\s*$")
+
+StoryOutput = namedtuple('StoryOutput', ['text', 'choices', 'image_prompt'])
+
+
+class ChoicesStreamParser:
+    """Split a streamed completion into story text and the trailing CHOICES array as deltas arrive.
+
+    Markers are recognised the same way as in parse_story_output, so "**Choices:**" is held back
+    too. Since "choices:" may also be part of the story, text after a marker is only given up as
+    the trailer once it parses; otherwise it is released when a later marker or the end shows it
+    was story text.
+    """
+
+    def __init__(self):
+        self.choices = None
+        self.image_prompt = None
+        self._text = []
+        self._pending = ""  # Tail of the text that could be the start of the marker
+        self._marker = None  # The marker as written, once one has been seen
+        self._trailer = None  # Everything after the marker
+        self._scan = 0  # Position in the trailer to resume looking for a closing bracket
+
+    @property
+    def text(self):
+        """Story text seen so far, without the choices trailer"""
+        return "".join(self._text).strip()
+
+    def feed(self, delta):
+        """Consume a delta and return the part of it that is safe to show as story text"""
+        if self._trailer is not None:
+            self._trailer += delta
+            released = self._later_marker()
+            self._parse_trailer()
+            return released
+
+        buffer = self._pending + delta
+        marker = _MARKER_PATTERN.search(buffer)
+        if marker is not None:
+            self._pending = ""
+            self._start_trailer(marker, buffer)
+            self._parse_trailer()
+            return self._emit(buffer[:marker.start()])
+
+        # Hold back anything that might turn into the marker with the next delta
+        hold = self._partial_marker_length(buffer)
+        self._pending = buffer[len(buffer) - hold:]
+        return self._emit(buffer[:len(buffer) - hold])
+
+    def close(self):
+        """Flush held-back text at the end of the stream and make a last attempt at the choices"""
+        text, self._pending = self._pending, ""
+        if self._trailer is not None and self.choices is None:
+            # Split the held text exactly as parse_story_output would split a complete response
+            content = self._marker + self._trailer
+            start, end = _trailer_span(content)
+            text += content[:start]
+            self.choices, self.image_prompt = parse_trailer(content[end:])
+        elif self._trailer is not None:
+            self.image_prompt = parse_trailer(self._trailer)[1]
+        return self._emit(text)
+
+    def _emit(self, text):
+        if text:
+            self._text.append(text)
+        return text
+
+    def _start_trailer(self, marker, buffer):
+        self._marker = marker.group(0)
+        self._trailer = buffer[marker.end():]
+        self._scan = 0
+
+    def _later_marker(self):
+        # A marker before the trailer has started a JSON value means the previous one was story text
+        if self.choices is not None:
+            return ""
+        marker = _MARKER_PATTERN.search(self._trailer)
+        if marker is None or any(char in "[{" for char in self._trailer[:marker.start()]):
+            return ""
+        content = self._marker + self._trailer
+        offset = len(self._marker)
+        self._start_trailer(marker, self._trailer)
+        return self._emit(content[:offset + marker.start()])
+
+    def _partial_marker_length(self, buffer):
+        return len(buffer) - _PARTIAL_MARKER_PATTERN.search(buffer).start()
+
+    def _parse_trailer(self):
+        # Try each closing bracket once, so parsing stays incremental as the trailer grows
+        if self.choices is not None:
+            return
+        start = self._trailer.find("[")
+        if start == -1:
+            return
+        self._scan = max(self._scan, start)
+        while self.choices is None:
+            end = self._trailer.find("]", self._scan)
+            if end == -1:
+                return
+            self._scan = end + 1
+            self._accept(self._trailer[start:end + 1])
+
+    def _accept(self, candidate):
+        try:
+            choices = json.loads(candidate)
+        except ValueError:
+            return
+        if isinstance(choices, list) and len(choices) > 0:
+            self.choices = choices
+
+
+def parse_story_output(content):
+    """Split a complete response into story text, choices and image prompt.
+
+    The trailer after the CHOICES marker may be a JSON array of choices or a JSON object
+    with "choices" and "image_prompt". Missing or malformed parts come back as None.
+    """
+    start, end = _trailer_span(content)
+    if start < len(content):
+        choices, image_prompt = parse_trailer(content[end:])
+        return StoryOutput(content[:start].strip(), choices, image_prompt)
+
+    # Some responses drop the marker but still end with the JSON trailer on its own line
+    lines = content.rstrip().rsplit("\n", 1)
+    if len(lines) == 2 and lines[1].strip()[:1] in "[{":
+        choices, image_prompt = parse_trailer(lines[1])
+        if choices is not None:
+            return StoryOutput(lines[0].strip(), choices, image_prompt)
+    return StoryOutput(content.strip(), None, None)
+
+
+def _trailer_span(content):
+    """Start and end of the marker that begins the trailer, or (len, len) when there is none"""
+    # "choices:" can also appear in the story itself, so only a marker followed by a usable trailer counts
+    for marker in reversed(list(_MARKER_PATTERN.finditer(content))):
+        if parse_trailer(content[marker.end():])[0] is not None:
+            return marker.start(), marker.end()
+    start = content.find(CHOICES_MARKER)
+    if start != -1:
+        return start, start + len(CHOICES_MARKER)
+    return len(content), len(content)
+
+
+def parse_trailer(trailer):
+    """Parse the text after the CHOICES marker into (choices, image_prompt)"""
+    trailer = _FENCE_PATTERN.sub("", trailer).strip()
+    data = _decode_json(trailer)
+
+    image_prompt = None
+    if isinstance(data, dict):
+        image_prompt = data.get('image_prompt')
+        if not isinstance(image_prompt, str) or not image_prompt.strip():
+            image_prompt = None
+        else:
+            image_prompt = image_prompt.strip()
+        data = data.get('choices')
+
+    choices = _clean_choices(data)
+    if choices is None and data is None:
+        # Fall back to a bulleted or numbered list
+        choices = _clean_choices([match.group(1) for match in map(_LIST_ITEM_PATTERN.match, trailer.splitlines()) if match])
+    return choices, image_prompt
+
+
+def _decode_json(text):
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+    # Take the first JSON value in the text, ignoring anything the model wrote after it
+    decoder = json.JSONDecoder()
+    for index, char in enumerate(text):
+        if char in "[{":
+            try:
+                return decoder.raw_decode(text, index)[0]
+            except ValueError:
+                continue
+    return None
+
+
+def _clean_choices(choices):
+    if not isinstance(choices, list):
+        return None
+    cleaned = [str(choice).strip() for choice in choices if isinstance(choice, (str, int, float)) and str(choice).strip()]
+    return cleaned or None
+
+
+def sse_event(event, data):
+    """Format a Server-Sent Events frame with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
@@ -0,0 +1,54 @@
+import re
+import time
+from email.utils import parsedate_to_datetime
+
+_ASSET_PATTERN = re.compile(r'<(?:link rel="stylesheet" href|script src)="([^"]+)"')
+
+
+class FakeBrowser:
+    """Loads the page and its stylesheets and scripts through a Flask test client like a browser would.
+
+    Responses are kept in an HTTP cache: one that is still fresh (max-age) is reused
+    without a request, and a stale one is revalidated with If-None-Match or
+    If-Modified-Since. load() reports the requests made and the bytes received.
+    """
+
+    def __init__(self, client, accept_encoding='gzip, deflate, br'):
+        self.client = client
+        self.accept_encoding = accept_encoding
+        self.cache = {}  # url -> (fresh until, validator headers)
+
+    def load(self, path='/'):
+        stats = {'requests': 0, 'bytes': 0, 'not_modified': 0, 'cached': 0}
+        page = self.fetch(path, stats)
+        for url in _ASSET_PATTERN.findall(page.get_data(as_text=True)):
+            self.fetch(url, stats)
+        return stats
+
+    def fetch(self, url, stats):
+        fresh_until, validators = self.cache.get(url, (0, {}))
+        if time.time() < fresh_until:
+            stats['cached'] += 1
+            return None
+
+        response = self.client.get(url, headers=dict(validators, **{'Accept-Encoding': self.accept_encoding}))
+        stats['requests'] += 1
+        stats['bytes'] += len(response.get_data())
+        if response.status_code == 304:
+            stats['not_modified'] += 1
+        self._store(url, response)
+        return response
+
+    def _store(self, url, response):
+        validators = {}
+        if response.headers.get('ETag'):
+            validators['If-None-Match'] = response.headers['ETag']
+        if response.headers.get('Last-Modified'):
+            validators['If-Modified-Since'] = response.headers['Last-Modified']
+        max_age = response.cache_control.max_age
+        if response.cache_control.no_cache or response.cache_control.no_store:
+            max_age = 0
+        elif max_age is None and response.headers.get('Expires'):
+            max_age = parsedate_to_datetime(response.headers['Expires']).timestamp() - time.time()
+        if validators or max_age:
+            self.cache[url] = (time.time() + (max_age or 0), validators)
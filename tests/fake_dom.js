@@ -0,0 +1,124 @@
+// Minimal stand-in for the browser DOM, enough to run static/js/story_log.js under plain node.
+//
+// There is no layout: every element's offsetHeight comes from the document's `measure`
+// callback (spacers report their style height), and containers get a clientHeight and a
+// scrollTop the test sets. Animation frames are queued and only run by runFrames(), so a
+// test decides when StoryLog renders.
+
+class FakeElement {
+    constructor(document, tagName) {
+        this.ownerDocument = document;
+        this.tagName = tagName.toUpperCase();
+        this.children = [];
+        this.parentNode = null;
+        this.style = {};
+        this.className = '';
+        this.attributes = {};
+        this.listeners = {};
+        this.clientHeight = 0;
+        this.scrollTop = 0;
+        this.scrolledIntoView = 0;
+        this.html = '';
+    }
+
+    get innerHTML() {
+        return this.html;
+    }
+
+    set innerHTML(html) {
+        this.html = html;
+        this.children.forEach(child => { child.parentNode = null; });
+        this.children = [];
+    }
+
+    get offsetHeight() {
+        if (this.style.height !== undefined) return parseFloat(this.style.height) || 0;
+        return this.ownerDocument.measure(this);
+    }
+
+    get scrollHeight() {
+        return this.children.reduce((sum, child) => sum + child.offsetHeight, 0);
+    }
+
+    get nextSibling() {
+        if (!this.parentNode) return null;
+        const siblings = this.parentNode.children;
+        return siblings[siblings.indexOf(this) + 1] || null;
+    }
+
+    appendChild(node) {
+        return this.insertBefore(node, null);
+    }
+
+    insertBefore(node, reference) {
+        node.remove();
+        const index = reference ? this.children.indexOf(reference) : this.children.length;
+        if (index < 0) throw new Error('insertBefore: reference is not a child');
+        this.children.splice(index, 0, node);
+        node.parentNode = this;
+        return node;
+    }
+
+    remove() {
+        if (!this.parentNode) return;
+        const siblings = this.parentNode.children;
+        siblings.splice(siblings.indexOf(this), 1);
+        this.parentNode = null;
+    }
+
+    replaceChildren(...nodes) {
+        this.children.forEach(child => { child.parentNode = null; });
+        this.children = [];
+        nodes.forEach(node => this.appendChild(node));
+    }
+
+    setAttribute(name, value) {
+        this.attributes[name] = String(value);
+    }
+
+    getAttribute(name) {
+        return name in this.attributes ? this.attributes[name] : null;
+    }
+
+    addEventListener(type, listener) {
+        (this.listeners[type] = this.listeners[type] || []).push(listener);
+    }
+
+    dispatch(type) {
+        (this.listeners[type] || []).forEach(listener => listener({ type, target: this }));
+    }
+
+    scrollIntoView() {
+        this.scrolledIntoView += 1;
+    }
+}
+
+class FakeDocument {
+    /**
+     * `measure(element)` returns the rendered height of an element that has no style height
+     */
+    constructor(measure = () => 0) {
+        this.measure = measure;
+        this.frames = [];
+        this.defaultView = {
+            requestAnimationFrame: callback => this.frames.push(callback),
+            addEventListener: () => {}
+        };
+    }
+
+    createElement(tagName) {
+        return new FakeElement(this, tagName);
+    }
+
+    /**
+     * Run the queued animation frames; returns how many ran
+     */
+    runFrames() {
+        const frames = this.frames;
+        this.frames = [];
+        frames.forEach(callback => callback(0));
+        return frames.length;
+    }
+}
+
+module.exports = { FakeDocument, FakeElement };
@@ -0,0 +1,325 @@
+import asyncio
+import base64
+import hashlib
+import json
+import struct
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+DEFAULT_STORY = "This is a fake story response.\n\nCHOICES: [\"Option 1\", \"Option 2\", \"Option 3\"]"
+DEFAULT_IMAGE_URL = "https://example.com/fake-image.jpg"
+
+
+def _png(width=8, height=8, rgb=(40, 90, 160)):
+    """A tiny solid-colour PNG, built by hand so tests need no imaging library"""
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+    rows = b''.join(b'\x00' + bytes(rgb) * width for _ in range(height))
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(rows)) + chunk(b'IEND', b''))
+
+
+FAKE_PNG = _png()
+
+
+def fake_content(story_text, image_prompt, request):
+    """The completion text the fakes answer a chat request with"""
+    # The image prompt helper is the only caller with such a small token budget
+    if request.get('max_tokens') == 100:
+        return image_prompt
+
+    # Answer prompts whose system prompt asks for an inline image prompt with the JSON object trailer
+    text, marker, trailer = story_text.partition("CHOICES:")
+    if marker and '"image_prompt"' in request['messages'][0]['content']:
+        try:
+            data = {'choices': json.loads(trailer), 'image_prompt': image_prompt}
+        except ValueError:
+            return story_text
+        return f"{text}CHOICES: {json.dumps(data)}"
+    return story_text
+
+
+class FakePromptCache:
+    """Provider-side prompt caching, simplified: the longest run of leading messages seen before is cached.
+
+    The real API caches in 128-token blocks from 1024 tokens up; here any repeated
+    message prefix counts, at the fakes' ~4 characters per token.
+    """
+
+    def __init__(self):
+        self._prefixes = set()
+        self._lock = threading.Lock()
+
+    def cached_tokens(self, messages):
+        digest = hashlib.sha1()
+        prefixes = []
+        chars = 0
+        for message in messages:
+            digest.update(json.dumps(message, sort_keys=True).encode('utf-8'))
+            chars += len(message['content'])
+            prefixes.append((digest.hexdigest(), chars))
+        cached = 0
+        with self._lock:
+            for key, length in prefixes:
+                if key not in self._prefixes:
+                    break
+                cached = length
+            self._prefixes.update(key for key, _ in prefixes)
+        return cached // 4
+
+
+class FakeOpenAI:
+    """Drop-in stand-in for the openai module with configurable latency per endpoint.
+
+    `model_latency` maps chat model names to their own latency, overriding `chat_latency`,
+    to simulate models of different speeds.
+    """
+
+    def __init__(self, story_text=DEFAULT_STORY, image_prompt="A misty forest at dawn",
+                 image_url=DEFAULT_IMAGE_URL, chat_latency=0.0, image_latency=0.0,
+                 stream_chunk_size=8, stream_chunk_delay=0.0, model_latency=None):
+        self.story_text = story_text
+        self.image_prompt = image_prompt
+        self.image_url = image_url
+        self.chat_latency = chat_latency
+        self.model_latency = dict(model_latency or {})
+        self.image_latency = image_latency
+        self.stream_chunk_size = stream_chunk_size
+        self.stream_chunk_delay = stream_chunk_delay
+        self.calls = []
+        self.prompt_cache = FakePromptCache()
+        self._lock = threading.Lock()
+
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create_chat_completion))
+        self.images = SimpleNamespace(generate=self._generate_image)
+
+    def call_count(self, endpoint=None):
+        """Number of upstream calls made, optionally filtered by endpoint ('chat' or 'images')"""
+        with self._lock:
+            return len([c for c in self.calls if endpoint is None or c[0] == endpoint])
+
+    def _content(self, kwargs):
+        return fake_content(self.story_text, self.image_prompt, kwargs)
+
+    def _chat_latency(self, kwargs):
+        return self.model_latency.get(kwargs.get('model'), self.chat_latency)
+
+    def _completion(self, kwargs, content):
+        # Usage is estimated at ~4 characters per token
+        prompt_tokens = sum(len(message['content']) for message in kwargs['messages']) // 4
+        details = SimpleNamespace(cached_tokens=self.prompt_cache.cached_tokens(kwargs['messages']))
+        usage = SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=len(content) // 4,
+                                prompt_tokens_details=details)
+        message = SimpleNamespace(role='assistant', content=content)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason='stop')], usage=usage)
+
+    def _record(self, endpoint, kwargs):
+        with self._lock:
+            self.calls.append((endpoint, kwargs))
+
+    def _create_chat_completion(self, **kwargs):
+        self._record('chat', kwargs)
+        time.sleep(self._chat_latency(kwargs))
+
+        content = self._content(kwargs)
+        if kwargs.get('stream'):
+            return self._stream(content)
+        return self._completion(kwargs, content)
+
+    def _stream(self, content):
+        # chat_latency is time to the first chunk, stream_chunk_delay the gap between chunks
+        for i in range(0, len(content), self.stream_chunk_size):
+            if i:
+                time.sleep(self.stream_chunk_delay)
+            delta = SimpleNamespace(role='assistant', content=content[i:i + self.stream_chunk_size])
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta, finish_reason=None)])
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=None), finish_reason='stop')])
+
+    def _generate_image(self, **kwargs):
+        self._record('images', kwargs)
+        time.sleep(self.image_latency)
+        return self._image_response(kwargs)
+
+    def _image_response(self, kwargs):
+        if kwargs.get('response_format') == 'b64_json':
+            return SimpleNamespace(data=[SimpleNamespace(url=None, b64_json=base64.b64encode(FAKE_PNG).decode('ascii'))])
+        return SimpleNamespace(data=[SimpleNamespace(url=self.image_url, b64_json=None)])
+
+
+class FakeAsyncOpenAI(FakeOpenAI):
+    """Async counterpart of FakeOpenAI that also tracks peak request concurrency"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._acreate_chat_completion))
+        self.images = SimpleNamespace(generate=self._agenerate_image)
+
+    async def close(self):
+        pass
+
+    async def _acreate_chat_completion(self, **kwargs):
+        self._record('chat', kwargs)
+        await self._wait(self._chat_latency(kwargs))
+
+        content = self._content(kwargs)
+        if kwargs.get('stream'):
+            return self._astream(content)
+        return self._completion(kwargs, content)
+
+    async def _astream(self, content):
+        for i in range(0, len(content), self.stream_chunk_size):
+            if i:
+                await asyncio.sleep(self.stream_chunk_delay)
+            delta = SimpleNamespace(role='assistant', content=content[i:i + self.stream_chunk_size])
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta, finish_reason=None)])
+
+    async def _agenerate_image(self, **kwargs):
+        self._record('images', kwargs)
+        await self._wait(self.image_latency)
+        return self._image_response(kwargs)
+
+    async def _wait(self, latency):
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(latency)
+        finally:
+            self.in_flight -= 1
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # Load tests open many connections at once
+
+
+class FakeOpenAIServer:
+    """Local HTTP server speaking enough of the (non-streaming) OpenAI API for real clients.
+
+    `latency` and `image_latency` are seconds or zero-argument callables returning
+    seconds, so load tests can draw from a distribution. With `capacity`, at most that
+    many requests are worked on at once and the rest wait their turn, like an
+    upstream that slows down under load. Queue faults per endpoint
+    ('chat' or 'images') with fail(); each queued (status, delay) pair answers one
+    request, after which requests succeed again. Generated images can be downloaded
+    from `file_url` ('files' endpoint) or requested inline with b64_json.
+    """
+
+    def __init__(self, story_text=DEFAULT_STORY, image_prompt="A misty forest at dawn",
+                 image_url=DEFAULT_IMAGE_URL, latency=0.0, image_latency=None, capacity=None):
+        self.story_text = story_text
+        self.image_prompt = image_prompt
+        self.image_url = image_url
+        self.latency = latency
+        self.image_latency = image_latency
+        self._capacity = threading.Semaphore(capacity) if capacity else None
+        self.requests = []
+        self.prompt_cache = FakePromptCache()
+        self._faults = {'chat': [], 'images': [], 'files': []}
+        self._lock = threading.Lock()
+
+        server = self
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # Keep-alive, like the real API
+
+            def do_POST(self):
+                server._handle(self)
+
+            def do_GET(self):
+                server._handle_file(self)
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = _HTTPServer(('127.0.0.1', 0), Handler)
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self._httpd.server_address[1]}/v1"
+
+    @property
+    def file_url(self):
+        """Where FAKE_PNG can be downloaded, for use as `image_url`"""
+        return f"http://127.0.0.1:{self._httpd.server_address[1]}/files/image.png"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def fail(self, endpoint, status, times=1, delay=0.0):
+        """Answer the next `times` requests to an endpoint with this status after `delay` seconds"""
+        with self._lock:
+            self._faults[endpoint].extend([(status, delay)] * times)
+
+    def request_count(self, endpoint=None):
+        with self._lock:
+            return len([r for r in self.requests if endpoint is None or r == endpoint])
+
+    def _delay(self, endpoint):
+        latency = self.image_latency if endpoint == 'images' and self.image_latency is not None else self.latency
+        return latency() if callable(latency) else latency
+
+    def _handle(self, handler):
+        endpoint = 'images' if handler.path.endswith('/images/generations') else 'chat'
+        request = json.loads(handler.rfile.read(int(handler.headers.get('Content-Length', 0))) or b'{}')
+        with self._lock:
+            self.requests.append(endpoint)
+            fault = self._faults[endpoint].pop(0) if self._faults[endpoint] else None
+        status, delay = fault or (200, self._delay(endpoint))
+        if self._capacity is not None and fault is None:
+            with self._capacity:
+                time.sleep(delay)
+        else:
+            time.sleep(delay)
+
+        if status != 200:
+            body = {'error': {'message': f"Injected {status}", 'type': 'server_error', 'code': None}}
+        elif endpoint == 'images' and request.get('response_format') == 'b64_json':
+            body = {'created': 0, 'data': [{'b64_json': base64.b64encode(FAKE_PNG).decode('ascii')}]}
+        elif endpoint == 'images':
+            body = {'created': 0, 'data': [{'url': self.image_url}]}
+        else:
+            content = fake_content(self.story_text, self.image_prompt, request)
+            prompt_tokens = sum(len(message['content']) for message in request['messages']) // 4
+            body = {
+                'id': 'chatcmpl-fake', 'object': 'chat.completion', 'created': 0, 'model': request.get('model'),
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content},
+                             'finish_reason': 'stop'}],
+                'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': len(content) // 4,
+                          'total_tokens': prompt_tokens + len(content) // 4,
+                          'prompt_tokens_details': {
+                              'cached_tokens': self.prompt_cache.cached_tokens(request['messages'])
+                          }}
+            }
+        self._respond(handler, status, 'application/json', json.dumps(body).encode('utf-8'))
+
+    def _handle_file(self, handler):
+        with self._lock:
+            self.requests.append('files')
+            fault = self._faults['files'].pop(0) if self._faults['files'] else None
+        status, delay = fault or (200, 0.0)
+        time.sleep(delay)
+        if status != 200:
+            self._respond(handler, status, 'text/plain', f"Injected {status}".encode('utf-8'))
+        else:
+            self._respond(handler, 200, 'image/png', FAKE_PNG)
+
+    def _respond(self, handler, status, content_type, payload):
+        try:
+            handler.send_response(status)
+            handler.send_header('Content-Type', content_type)
+            handler.send_header('Content-Length', str(len(payload)))
+            handler.end_headers()
+            handler.wfile.write(payload)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # The client gave up waiting
@@ -0,0 +1,121 @@
+// Tests for the windowed story log in static/js/story_log.js, on the DOM stand-in in fake_dom.js.
+//
+// Run with: node --test tests/story_log.test.js
+
+const assert = require('assert');
+const path = require('path');
+const test = require('node:test');
+const { FakeDocument } = require('./fake_dom');
+const StoryLog = require(path.join(__dirname, '..', 'static', 'js', 'story_log.js'));
+
+const VIEW_HEIGHT = 500;
+const ENTRY_HEIGHT = 100;
+
+function createLog(entries = 0, options = {}) {
+    const document = new FakeDocument(() => ENTRY_HEIGHT);
+    const container = document.createElement('div');
+    container.ownerDocument = document;
+    container.clientHeight = VIEW_HEIGHT;
+    const log = new StoryLog(container, options);
+    for (let i = 0; i < entries; i++) log.append(`<p>Entry ${i}</p>`);
+    document.runFrames();
+    return { document, container, log };
+}
+
+function renderedEntries(container) {
+    return container.children.filter(node => node.className === 'story-entry');
+}
+
+function scrollTo(document, container, top) {
+    container.scrollTop = top;
+    container.dispatch('scroll');
+    document.runFrames();
+    document.runFrames(); // A frame after the heights were measured, as the next scroll event would give
+}
+
+test('renders only the entries within the overscan of the visible area', () => {
+    const { document, container, log } = createLog(200, { overscan: 300, estimatedHeight: ENTRY_HEIGHT });
+    scrollTo(document, container, 5000);
+
+    // 300px overscan either side of a 500px view of 100px entries: entries 46 to 57
+    const rendered = renderedEntries(container).map(node => node.innerHTML);
+    assert.deepStrictEqual(rendered, Array.from({ length: 12 }, (_, i) => `<p>Entry ${46 + i}</p>`));
+    const [top, bottom] = [container.children[0], container.children[container.children.length - 1]];
+    assert.strictEqual(top.className, 'story-spacer');
+    assert.strictEqual(top.style.height, `${46 * ENTRY_HEIGHT}px`);
+    assert.strictEqual(bottom.style.height, `${(200 - 58) * ENTRY_HEIGHT}px`);
+    assert.strictEqual(container.scrollHeight, log.entries.length * ENTRY_HEIGHT);
+});
+
+test('spacers use measured heights and the estimate for entries never rendered', () => {
+    const { document, container } = createLog(50, { overscan: 0, estimatedHeight: 40 });
+    // The first frame windowed on the 40px estimate; measuring showed the entries are 100px
+    const bottom = container.children[container.children.length - 1];
+    const rendered = renderedEntries(container).length;
+    assert.strictEqual(rendered, Math.ceil(VIEW_HEIGHT / 40));
+    assert.strictEqual(bottom.style.height, `${(50 - rendered) * 40}px`);
+
+    scrollTo(document, container, 0);
+    assert.strictEqual(renderedEntries(container).length, VIEW_HEIGHT / ENTRY_HEIGHT);
+});
+
+test('nodes scrolled out are reused for entries scrolled in', () => {
+    const { document, container } = createLog(200, { overscan: 0, estimatedHeight: ENTRY_HEIGHT });
+    const before = new Set(renderedEntries(container));
+    assert.strictEqual(before.size, VIEW_HEIGHT / ENTRY_HEIGHT);
+
+    // Entries 99 and 104 are each partly in view, so six are rendered and one node is new
+    scrollTo(document, container, 9950);
+    const after = renderedEntries(container);
+    assert.deepStrictEqual(after.map(node => node.innerHTML),
+                           Array.from({ length: 6 }, (_, i) => `<p>Entry ${99 + i}</p>`));
+    assert.ok([...before].every(node => after.includes(node)), 'expected every detached node to be reused');
+});
+
+test('appends in one tick are rendered in one frame', () => {
+    const { document, log } = createLog(0);
+    for (let i = 0; i < 10; i++) log.append(`<p>Entry ${i}</p>`);
+    log.scrollToEnd();
+    assert.strictEqual(document.runFrames(), 1);
+    assert.strictEqual(document.runFrames(), 0);
+});
+
+test('scrollToEnd renders the latest entry and scrolls to it', () => {
+    const { document, container, log } = createLog(100, { overscan: 0 });
+    log.append('<p>Latest</p>');
+    log.scrollToEnd();
+    document.runFrames();
+
+    const rendered = renderedEntries(container);
+    const latest = rendered[rendered.length - 1];
+    assert.strictEqual(latest.innerHTML, '<p>Latest</p>');
+    assert.strictEqual(latest.scrolledIntoView, 1);
+    assert.strictEqual(container.scrollTop, container.scrollHeight);
+});
+
+test('streamed elements are kept as they are and go with the transient entries', () => {
+    const { document, container, log } = createLog(3);
+    const streamed = document.createElement('div');
+    streamed.innerHTML = 'Once upon';
+    log.appendElement(streamed, { transient: true });
+    log.append('<p class="loading">Loading...</p>', { transient: true });
+    document.runFrames();
+    assert.ok(container.children.includes(streamed));
+    assert.strictEqual(streamed.className, '');
+
+    log.removeTransient();
+    log.append('<p>Once upon a time</p>');
+    document.runFrames();
+    assert.ok(!container.children.includes(streamed));
+    assert.deepStrictEqual(renderedEntries(container).map(node => node.innerHTML),
+                           ['<p>Entry 0</p>', '<p>Entry 1</p>', '<p>Entry 2</p>', '<p>Once upon a time</p>']);
+    assert.ok(!log.pool.includes(streamed), 'a caller-owned element must never be recycled');
+});
+
+test('reset replaces the whole story', () => {
+    const { document, container, log } = createLog(30);
+    log.reset('<p>A new beginning</p>');
+    document.runFrames();
+    assert.deepStrictEqual(renderedEntries(container).map(node => node.innerHTML), ['<p>A new beginning</p>']);
+    assert.strictEqual(container.children[container.children.length - 1].style.height, '0px');
+});
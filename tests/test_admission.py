@@ -0,0 +1,212 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import threading
+import time
+from contextlib import ExitStack
+
+# Add the parent directory to the path so we can import the application modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from admission import AdmissionController, OverloadedError, FULL, DEFER_IMAGE, CACHED_IMAGE, SHORT_TEXT
+from model_router import ModelRouter
+from session_store import MemorySessionStore
+from single_flight import SingleFlight
+from tests.fake_openai import FakeOpenAI
+
+with patch.dict(os.environ, {'OPENAI_API_KEY': 'fake-api-key'}):
+    import app as app_module
+
+# Thresholds no load reaches, for tests about queueing rather than degradation
+NEVER = (100, 200, 300, 400)
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("Condition not met in time")
+        time.sleep(0.005)
+
+
+class TestAdmissionController(unittest.TestCase):
+    """Test cases for bounding, degrading and sharing story turns"""
+
+    def test_levels_follow_load(self):
+        """Each turn admitted into a fuller worker is degraded one more step"""
+        controller = AdmissionController(max_in_flight=4, thresholds=(0.75, 1.0, 1.5, 2.0))
+        with ExitStack() as stack:
+            levels = [stack.enter_context(controller.admit(f"session-{i}")) for i in range(4)]
+        self.assertEqual(levels, [FULL, FULL, DEFER_IMAGE, CACHED_IMAGE])
+        self.assertEqual(controller.stats()['running'], 0)
+        self.assertEqual(controller.level(), FULL)
+
+    def test_rejects_past_last_threshold(self):
+        """Once the load would pass the last threshold, turns are turned away with a Retry-After"""
+        controller = AdmissionController(max_in_flight=1, thresholds=(0.5, 1.0, 1.5, 2.0))
+        with controller.admit("first"):
+            with self.assertRaises(OverloadedError) as raised:
+                with controller.admit("second"):
+                    pass
+        self.assertEqual(raised.exception.reason, 'overloaded')
+        self.assertGreaterEqual(raised.exception.retry_after, 1)
+        self.assertEqual(controller.stats()['rejected'], {'overloaded': 1})
+
+    def test_session_limit(self):
+        """A session cannot hold more than its share of slots"""
+        controller = AdmissionController(max_in_flight=4, per_session=1, thresholds=NEVER)
+        with controller.admit("hog"):
+            with self.assertRaises(OverloadedError) as raised:
+                with controller.admit("hog"):
+                    pass
+            with controller.admit("other") as level:
+                self.assertEqual(level, FULL)
+        self.assertEqual(raised.exception.reason, 'session_limit')
+
+    def test_waiting_too_long(self):
+        """A turn that does not get a slot within max_wait is rejected"""
+        controller = AdmissionController(max_in_flight=1, max_wait=0.05, thresholds=NEVER, target_wait=100)
+        with controller.admit("first"):
+            with self.assertRaises(OverloadedError) as raised:
+                with controller.admit("second"):
+                    pass
+        self.assertEqual(raised.exception.reason, 'timeout')
+        self.assertEqual(controller.stats()['waiting'], 0)
+
+    def test_free_slots_go_round_robin(self):
+        """A session that queued several turns does not get them all before a session queued after it"""
+        controller = AdmissionController(max_in_flight=1, per_session=3, thresholds=NEVER, target_wait=100)
+        order = []
+        threads = []
+
+        def turn(session_id):
+            with controller.admit(session_id):
+                order.append(session_id)
+
+        with controller.admit("holder"):
+            for session_id in ("burst", "burst", "burst", "polite"):
+                thread = threading.Thread(target=turn, args=(session_id,))
+                thread.start()
+                threads.append(thread)
+                wait_for(lambda: controller.stats()['waiting'] == len(threads))
+        for thread in threads:
+            thread.join()
+        self.assertEqual(order, ["burst", "polite", "burst", "burst"])
+
+    def test_token_scale(self):
+        """Only the story text of a turn admitted at the short_text level is shortened"""
+        controller = AdmissionController(max_in_flight=2, thresholds=(0.5, 0.5, 1.0, 5.0), short_tokens=0.4)
+        router = ModelRouter(token_scale=controller.token_scale)
+        self.assertEqual(controller.token_scale('continuation'), 1.0)
+        with controller.admit("first") as first:
+            self.assertEqual(first, CACHED_IMAGE)
+            # The load is at short_text now, but this turn was admitted before it got there
+            self.assertEqual(controller.level(), SHORT_TEXT)
+            self.assertEqual(controller.token_scale('continuation'), 1.0)
+            levels = []
+            thread = threading.Thread(target=lambda: levels.append(self.shortened(controller, router)))
+            thread.start()
+            thread.join()
+        self.assertEqual(levels, [(SHORT_TEXT, 280, 200, 100)])
+        self.assertEqual(controller.token_scale('continuation'), 1.0)
+
+    def shortened(self, controller, router):
+        """Admit a turn and return its level and the max_tokens of its continuation, choices and image prompt"""
+        with controller.admit("second") as level:
+            with router.call('continuation') as story, router.call('choices') as choices, \
+                    router.call('image_prompt') as image_prompt:
+                return level, story.max_tokens, choices.max_tokens, image_prompt.max_tokens
+
+
+class TestDegradedTurns(unittest.TestCase):
+    """Test what the story routes serve at each degradation level"""
+
+    def setUp(self):
+        """Route the app through a fake OpenAI client and start a story at full service"""
+        self.env_patcher = patch.dict(os.environ, {'OPENAI_API_KEY': 'fake-api-key'})
+        self.env_patcher.start()
+        self.fake_openai = FakeOpenAI()
+        self.openai_patcher = patch('story_generator.openai', self.fake_openai)
+        self.openai_patcher.start()
+        self.admission_patcher = patch.object(app_module, 'admission', None)
+        self.admission_patcher.start()
+        self.patchers = [
+            patch.object(app_module, 'session_store', MemorySessionStore()),
+            patch.object(app_module, 'turns_in_flight', SingleFlight(linger=0))
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+        self.use_controller(NEVER)
+
+        self.client = app_module.app.test_client()
+        response = self.client.post('/initialize_story', json={'genre': 'fantasy', 'character': 'knight', 'mood': 'eerie'})
+        self.first_image = response.get_json()['image_url']
+        self.assertIsNotNone(self.first_image)
+
+    def tearDown(self):
+        """Restore the real generator, store and admission settings"""
+        for patcher in reversed(self.patchers):
+            patcher.stop()
+        self.admission_patcher.stop()
+        self.openai_patcher.stop()
+        self.env_patcher.stop()
+
+    def use_controller(self, thresholds):
+        """Admit turns through a controller whose level is fixed by its thresholds"""
+        controller = AdmissionController(max_in_flight=4, thresholds=thresholds, short_tokens=0.5)
+        generator = app_module.StoryGenerator(router=ModelRouter(token_scale=controller.token_scale))
+        for patcher in (patch.object(app_module, 'admission', controller),
+                        patch.object(app_module, 'story_generator', generator)):
+            patcher.start()
+            self.patchers.append(patcher)
+
+    def test_cached_image(self):
+        """At the cached_image level no image is generated and the story's latest one is shown again"""
+        self.use_controller((0, 0, 100, 200))
+        image_calls = self.fake_openai.call_count('images')
+        response = self.client.post('/continue_story', json={'choice': 'Option 1'})
+        body = response.get_json()
+        self.assertEqual(body['degraded'], 'cached_image')
+        self.assertEqual(body['image_url'], self.first_image)
+        self.assertEqual(self.fake_openai.call_count('images'), image_calls)
+
+    def test_short_text(self):
+        """At the short_text level story text is requested with fewer tokens"""
+        self.use_controller((0, 0, 0, 200))
+        response = self.client.post('/modify_story', json={'command': 'Change the mood to hopeful'})
+        self.assertEqual(response.get_json()['degraded'], 'short_text')
+        endpoint, kwargs = self.fake_openai.calls[-1]
+        self.assertEqual((endpoint, kwargs['max_tokens']), ('chat', 350))
+
+    def test_rejected_with_retry_after(self):
+        """Past the last threshold the page gets a 503 telling it when to come back"""
+        self.use_controller((0, 0, 0, 0))
+        chat_calls = self.fake_openai.call_count('chat')
+        response = self.client.post('/continue_story', json={'choice': 'Option 1'})
+        self.assertEqual(response.status_code, 503)
+        self.assertGreaterEqual(int(response.headers['Retry-After']), 1)
+        self.assertEqual(self.fake_openai.call_count('chat'), chat_calls)
+        stats = self.client.get('/admission_stats').get_json()
+        self.assertEqual((stats['enabled'], stats['rejected']), (True, {'overloaded': 1}))
+
+
+    def test_streamed_turns(self):
+        """Streamed turns are admitted like the others: degraded, and the slot held until the stream ends"""
+        self.use_controller((0, 0, 0, 200))
+        response = self.client.post('/stream/continue_story', json={'choice': 'Option 1'})
+        self.assertIn('"degraded": "short_text"', response.get_data(as_text=True))
+        endpoint, kwargs = [call for call in self.fake_openai.calls if call[0] == 'chat'][-1]
+        self.assertEqual((kwargs['stream'], kwargs['max_tokens']), (True, 350))
+        self.assertEqual(app_module.admission.stats()['running'], 0)
+
+        self.use_controller((0, 0, 0, 0))
+        chat_calls = self.fake_openai.call_count('chat')
+        response = self.client.post('/stream/modify_story', json={'command': 'Change the mood to hopeful'})
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response.headers)
+        self.assertEqual(self.fake_openai.call_count('chat'), chat_calls)
+
+
+if __name__ == '__main__':
+    unittest.main()
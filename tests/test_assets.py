@@ -0,0 +1,155 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import gzip
+import shutil
+import subprocess
+import tempfile
+
+# Add the parent directory to the path so we can import the application modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import assets
+from tests.fake_browser import FakeBrowser
+
+with patch.dict(os.environ, {'OPENAI_API_KEY': 'fake-api-key'}):
+    import app as app_module
+
+TRICKY_JS = r"""
+// Comments, strings, templates and regular expressions must survive minification
+const url = "http://example.com/a//b"; /* not a comment: */ const half = 10 / 2 / 5;
+const pattern = /Character traits:.*$/m, klass = /[/]+/g;
+function label(items, n) {
+    return `${items.map(item => `<b>${item}</b>`).join(', ')} // ${n > 1 ? "many" : 'one'}`;
+}
+let total = 1
+total++
+const negated = total - -1;
+console.log(url, half, pattern.test("Character traits: brave"), "a//b".replace(klass, "-"), label(["x", "y"], 2), total, negated);
+"""
+
+SOURCE_FILES = sum(len(sources) for sources in assets.BUNDLES.values())
+
+
+class TestMinify(unittest.TestCase):
+    """Test cases for the CSS and JavaScript minifiers"""
+
+    def test_css(self):
+        """Comments and spacing go, strings and selectors stay intact"""
+        css = '/* theme */\n.a > .b ,\n.c :hover {\n  content: "  x ; y  ";\n  margin: 0 auto;\n}\n'
+        self.assertEqual(assets.minify_css(css), '.a>.b,.c :hover{content:"  x ; y  ";margin:0 auto}\n')
+
+    def test_css_colon_spacing_only_in_declarations(self):
+        """Spaces after colons go in declarations but stay in selectors and at-rule preludes"""
+        css = '@media (min-width: 600px) {\n  a: hover, .b :focus {\n    color: red;\n    font: 12px/1 "a: b";\n  }\n}\n'
+        self.assertEqual(assets.minify_css(css),
+                         '@media (min-width: 600px){a: hover,.b :focus{color:red;font:12px/1 "a: b"}}\n')
+
+    @unittest.skipUnless(shutil.which('node'), "node is not installed")
+    def test_js_behaves_the_same(self):
+        """Minified JavaScript prints exactly what the original prints"""
+        minified = assets.minify_js(TRICKY_JS)
+        self.assertLess(len(minified), len(TRICKY_JS))
+        self.assertNotIn("Comments, strings", minified)
+        run = lambda source: subprocess.run(['node', '-e', source], capture_output=True, text=True, check=True).stdout
+        self.assertEqual(run(minified), run(TRICKY_JS))
+
+    @unittest.skipUnless(shutil.which('node'), "node is not installed")
+    def test_page_script_parses(self):
+        """The page's own script still parses after minification"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            manifest = assets.build(app_module.app.static_folder, tmpdir)
+            path = os.path.join(tmpdir, manifest['assets']['app.js']['file'])
+            subprocess.run(['node', '--check', path], check=True)
+
+
+class TestBuild(unittest.TestCase):
+    """Test cases for building fingerprinted, precompressed bundles"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.static = os.path.join(self.tmpdir.name, 'static')
+        os.makedirs(os.path.join(self.static, 'css'))
+        os.makedirs(os.path.join(self.static, 'js'))
+        self.write('css/styles.css', "body {\n  color: red;\n}\n")
+        self.write('css/additional.css', ".story { margin: 0; }\n")
+        self.write('js/story_log.js', "class StoryLog {}\n")
+        self.write('js/script.js', "// Page script\nconst answer = 42;\n")
+        self.output = os.path.join(self.tmpdir.name, 'dist')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self, name, text):
+        with open(os.path.join(self.static, name), 'w') as f:
+            f.write(text)
+
+    def test_bundles_and_variants(self):
+        """Sources are concatenated in order, named by content and written with a gzip variant"""
+        manifest = assets.build(self.static, self.output)
+        css = manifest['assets']['app.css']
+        self.assertRegex(css['file'], r'^app\.[0-9a-f]{12}\.css$')
+        with open(os.path.join(self.output, css['file']), 'rb') as f:
+            self.assertEqual(f.read(), b"body{color:red}.story{margin:0}\n")
+        with open(os.path.join(self.output, css['file'] + '.gz'), 'rb') as f:
+            self.assertEqual(gzip.decompress(f.read()), b"body{color:red}.story{margin:0}\n")
+        self.assertIn('gzip', css['encodings'])
+
+    def test_rebuilds_when_sources_change(self):
+        """A current build is reused; edited sources get a new fingerprint"""
+        first = assets.load_or_build(self.static, self.output)
+        self.assertEqual(assets.load_or_build(self.static, self.output), first)
+        self.write('js/script.js', "const answer = 43;\n")
+        second = assets.load_or_build(self.static, self.output)
+        self.assertNotEqual(second['assets']['app.js']['file'], first['assets']['app.js']['file'])
+        self.assertEqual(second['assets']['app.css'], first['assets']['app.css'])
+
+
+class TestAssetServing(unittest.TestCase):
+    """Test the bytes and requests of a cold and a warm page load, with and without the pipeline"""
+
+    def setUp(self):
+        self.client = app_module.app.test_client()
+        self.assertIsNotNone(app_module.asset_manifest)
+
+    def source_files(self):
+        return patch.object(app_module, 'asset_manifest', None)
+
+    def test_cold_load_is_smaller(self):
+        """Bundling and compression cut a cold load to fewer requests and well under half the bytes"""
+        with self.source_files():
+            unbundled = FakeBrowser(self.client).load()
+        bundled = FakeBrowser(self.client).load()
+        self.assertEqual((unbundled['requests'], bundled['requests']), (1 + SOURCE_FILES, 1 + len(assets.BUNDLES)))
+        page_bytes = len(self.client.get('/').get_data())
+        self.assertLess(bundled['bytes'] - page_bytes, 0.4 * (unbundled['bytes'] - page_bytes))
+
+    def test_warm_load_skips_assets(self):
+        """Fingerprinted bundles are reused without a request; source files are revalidated every time"""
+        with self.source_files():
+            browser = FakeBrowser(self.client)
+            browser.load()
+            warm = browser.load()
+        self.assertEqual((warm['requests'], warm['not_modified']), (1 + SOURCE_FILES, SOURCE_FILES))
+
+        browser = FakeBrowser(self.client)
+        browser.load()
+        warm = browser.load()
+        self.assertEqual((warm['requests'], warm['cached']), (1, len(assets.BUNDLES)))
+
+    def test_encoding_follows_accept_encoding(self):
+        """gzip is served only to clients that accept it"""
+        with app_module.app.test_request_context():
+            url = app_module.asset_urls('app.js')[0]
+        compressed = self.client.get(url, headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(compressed.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', compressed.headers['Vary'])
+        plain = self.client.get(url, headers={'Accept-Encoding': 'gzip;q=0'})
+        self.assertNotIn('Content-Encoding', plain.headers)
+        self.assertEqual(gzip.decompress(compressed.get_data()), plain.get_data())
+        self.assertEqual(self.client.get('/assets/app.0123456789ab.js').status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
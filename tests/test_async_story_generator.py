@@ -0,0 +1,167 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import asyncio
+import threading
+import time
+
+# Add the parent directory to the path so we can import the story_generator
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests.fake_openai import FakeAsyncOpenAI
+from response_cache import LRUCacheBackend, ResponseCache
+
+
+class TestAsyncStoryGenerator(unittest.TestCase):
+    """Test cases ported from the enhanced StoryGenerator tests to the asyncio generator"""
+
+    def setUp(self):
+        """Set up the test environment"""
+        self.dotenv_patcher = patch('story_generator.load_dotenv')
+        self.getenv_patcher = patch('story_generator.os.getenv', return_value="fake-api-key")
+        self.mock_dotenv = self.dotenv_patcher.start()
+        self.mock_getenv = self.getenv_patcher.start()
+
+        self.client = FakeAsyncOpenAI(
+            story_text="This is a mock story response.\n\nCHOICES: [\"Option 1\", \"Option 2\", \"Option 3\"]",
+            image_url="https://example.com/mock-image.jpg"
+        )
+
+        from async_story_generator import AsyncStoryGenerator, BlockingStoryGenerator
+        self.AsyncStoryGenerator = AsyncStoryGenerator
+        self.BlockingStoryGenerator = BlockingStoryGenerator
+
+    def tearDown(self):
+        """Clean up after tests"""
+        self.dotenv_patcher.stop()
+        self.getenv_patcher.stop()
+
+    def test_generate_introduction(self):
+        """Test the async generate_introduction method with image generation"""
+        generator = self.AsyncStoryGenerator(client=self.client)
+        introduction, choices, image_url = asyncio.run(
+            generator.generate_introduction("fantasy", "brave knight", "adventurous")
+        )
+
+        self.assertEqual(introduction, "This is a mock story response.")
+        self.assertEqual(choices, ["Option 1", "Option 2", "Option 3"])
+        self.assertEqual(image_url, "https://example.com/mock-image.jpg")
+
+    def test_generate_continuation(self):
+        """Test the async generate_continuation method with image generation"""
+        generator = self.AsyncStoryGenerator(client=self.client)
+        story_context = {
+            'genre': 'fantasy',
+            'mood': 'adventurous',
+            'history': [
+                {'role': 'assistant', 'content': 'Story introduction.'},
+                {'role': 'user', 'content': 'User choice.'}
+            ]
+        }
+
+        continuation, choices, image_url = asyncio.run(
+            generator.generate_continuation(story_context, "User choice")
+        )
+
+        self.assertEqual(continuation, "This is a mock story response.")
+        self.assertEqual(choices, ["Option 1", "Option 2", "Option 3"])
+        self.assertEqual(image_url, "https://example.com/mock-image.jpg")
+
+    def test_generate_modification(self):
+        """Test the async generate_modification method with image generation"""
+        generator = self.AsyncStoryGenerator(client=self.client)
+        story_context = {
+            'genre': 'fantasy',
+            'mood': 'adventurous',
+            'history': [
+                {'role': 'assistant', 'content': 'Story introduction.'},
+                {'role': 'user', 'content': 'User choice.'},
+                {'role': 'assistant', 'content': 'Story continuation.'},
+                {'role': 'user', 'content': 'COMMAND: Change the mood to suspenseful.'}
+            ]
+        }
+
+        modification, choices, image_url = asyncio.run(
+            generator.generate_modification(story_context, "Change the mood to suspenseful")
+        )
+
+        self.assertEqual(modification, "This is a mock story response.")
+        self.assertEqual(choices, ["Option 1", "Option 2", "Option 3"])
+        self.assertEqual(image_url, "https://example.com/mock-image.jpg")
+
+    def test_stream_introduction(self):
+        """Test that the async stream yields deltas and the parsed turn"""
+        generator = self.AsyncStoryGenerator(client=self.client)
+
+        async def collect():
+            return [event async for event in generator.stream_introduction("fantasy", "knight", "magical")]
+
+        events = asyncio.run(collect())
+        self.assertEqual(events[-1]['text'], "This is a mock story response.")
+        self.assertEqual(events[-1]['choices'], ["Option 1", "Option 2", "Option 3"])
+
+    def test_concurrency_limit(self):
+        """Concurrent turns overlap on one loop but never exceed max_concurrency requests"""
+        self.client.chat_latency = 0.05
+        generator = self.AsyncStoryGenerator(client=self.client, max_concurrency=5)
+
+        async def run_turns():
+            return await asyncio.gather(*[
+                generator.generate_introduction("fantasy", "knight", "magical", include_image=False)
+                for _ in range(20)
+            ])
+
+        start = time.monotonic()
+        results = asyncio.run(run_turns())
+        elapsed = time.monotonic() - start
+
+        self.assertEqual(len(results), 20)
+        self.assertEqual(self.client.peak_in_flight, 5)
+        self.assertLess(elapsed, 20 * self.client.chat_latency / 2)
+
+    def test_blocking_facade(self):
+        """The blocking facade keeps the synchronous return contract"""
+        generator = self.BlockingStoryGenerator(self.AsyncStoryGenerator(client=self.client))
+        introduction, choices, image_url = generator.generate_introduction("fantasy", "knight", "magical")
+        self.assertEqual(introduction, "This is a mock story response.")
+        self.assertEqual(image_url, "https://example.com/mock-image.jpg")
+
+        events = list(generator.stream_introduction("fantasy", "knight", "magical"))
+        self.assertEqual(events[-1]['type'], 'done')
+
+    def test_summaries_use_the_async_client(self):
+        """The context window's summaries run on the generator's loop through its async client"""
+        generator = self.BlockingStoryGenerator(self.AsyncStoryGenerator(client=self.client))
+        generator.generate_choices({'genre': 'fantasy', 'mood': 'magical', 'history': []})
+        chats = self.client.call_count('chat')
+
+        # Called from a plain thread, as the context window's summary worker does
+        with patch('story_generator.openai') as sync_openai:
+            summary = generator.generator.summarize_story("", ["Once upon a time"])
+        self.assertEqual(summary, "This is a mock story response.\n\nCHOICES: [\"Option 1\", \"Option 2\", \"Option 3\"]")
+        self.assertEqual(self.client.call_count('chat'), chats + 1)
+        sync_openai.chat.completions.create.assert_not_called()
+
+    def test_cache_kept_off_the_loop(self):
+        """Response cache reads and writes, which may hit SQLite, run on worker threads"""
+        threads = []
+
+        class RecordingBackend(LRUCacheBackend):
+            def get(self, key):
+                threads.append(threading.current_thread())
+                return super().get(key)
+
+        generator = self.AsyncStoryGenerator(client=self.client, cache=ResponseCache(RecordingBackend()))
+
+        async def introduce():
+            await generator.generate_introduction("fantasy", "knight", "magical")
+            return threading.current_thread()
+
+        loop_thread = asyncio.run(introduce())
+        self.assertTrue(threads)
+        self.assertNotIn(loop_thread, threads)
+
+
+if __name__ == '__main__':
+    unittest.main()
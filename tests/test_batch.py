@@ -0,0 +1,153 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import json
+import tempfile
+import time
+
+# Add the parent directory to the path so we can import the application modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import batch
+from batch import BatchRunner, completed_ids, read_seeds
+from response_cache import create_response_cache
+from resilience import ResilientCaller
+from image_store import ImageStore
+from tests.fake_openai import FakeOpenAI
+
+
+def seed(story_id, choices=(1, "Open the door")):
+    return {'id': story_id, 'genre': 'fantasy', 'character': 'knight', 'mood': 'eerie', 'choices': list(choices)}
+
+
+class TestBatchRunner(unittest.TestCase):
+    """Test cases for batch story generation against a fake OpenAI client"""
+
+    def setUp(self):
+        """Route the generator through a fake OpenAI client and prepare an output file"""
+        self.fake_openai = FakeOpenAI(chat_latency=0.02)
+        self.patchers = [
+            patch.dict(os.environ, {'OPENAI_API_KEY': 'fake-api-key'}),
+            patch('story_generator.openai', self.fake_openai)
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+        from story_generator import StoryGenerator
+        self.generator = StoryGenerator(inline_image_prompt=True, resilience=ResilientCaller(retries=0))
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.output = os.path.join(self.tmpdir.name, "library.jsonl")
+
+    def tearDown(self):
+        for patcher in reversed(self.patchers):
+            patcher.stop()
+        self.tmpdir.cleanup()
+
+    def records(self):
+        with open(self.output) as f:
+            return [json.loads(line) for line in f]
+
+    def test_generates_choice_paths(self):
+        """Each seed becomes one record with a turn per choice, picking offered choices by index"""
+        report = BatchRunner(self.generator, workers=4).run([seed(str(i)) for i in range(8)], self.output)
+
+        self.assertEqual(report['stories'], 8)
+        self.assertEqual(report['turns'], 24)
+        records = self.records()
+        self.assertEqual(sorted(r['id'] for r in records), [str(i) for i in range(8)])
+        turns = records[0]['turns']
+        self.assertEqual([turn['choice'] for turn in turns], [None, "Option 1", "Open the door"])
+        self.assertEqual(turns[0]['text'], "This is a fake story response.")
+        self.assertEqual(self.fake_openai.call_count('images'), 0)
+
+    def test_workers_run_concurrently(self):
+        """The pool overlaps stories instead of playing them one after another"""
+        seeds = [seed(str(i), choices=()) for i in range(8)]
+        start = time.perf_counter()
+        BatchRunner(self.generator, workers=8).run(seeds, self.output)
+        self.assertLess(time.perf_counter() - start, 8 * 0.02)
+
+    def test_resume_skips_finished_stories(self):
+        """A rerun only generates stories that are missing or failed"""
+        create = self.fake_openai.chat.completions.create
+        calls = []
+
+        def fail_first(**kwargs):
+            calls.append(1)
+            if len(calls) == 1:
+                raise ValueError("boom")
+            return create(**kwargs)
+
+        self.fake_openai.chat.completions.create = fail_first
+        runner = BatchRunner(self.generator, workers=1, attempts=1)
+        report = runner.run([seed('a', choices=()), seed('b', choices=())], self.output)
+        self.assertEqual((report['stories'], report['failed']), (1, 1))
+        self.assertIn("boom", self.records()[0]['error'])
+
+        # A run killed mid-write leaves a partial line behind
+        with open(self.output, 'a') as f:
+            f.write('{"id": "c", "tur')
+        report = runner.run([seed('a', choices=()), seed('b', choices=()), seed('c', choices=())], self.output)
+        self.assertEqual((report['stories'], report['skipped']), (2, 1))
+        self.assertEqual(completed_ids(self.output), {'a', 'b', 'c'})
+
+    def test_bad_choice_index(self):
+        """A choice index the story did not offer fails the story"""
+        report = BatchRunner(self.generator, attempts=1).run([seed('a', choices=(7,))], self.output)
+        self.assertEqual(report['failed'], 1)
+        self.assertIn("Choice 7", self.records()[0]['error'])
+
+    def test_turn_pacing(self):
+        """turns_per_minute spaces turns out across workers"""
+        seeds = [seed(str(i), choices=()) for i in range(4)]
+        start = time.perf_counter()
+        BatchRunner(self.generator, workers=4, turns_per_minute=600).run(seeds, self.output)
+        self.assertGreaterEqual(time.perf_counter() - start, 3 * 0.1)
+
+    def test_command_line_shares_cache_and_rate_limits(self):
+        """The CLI uses the web app's response cache and rate limit settings"""
+        seeds_path = os.path.join(self.tmpdir.name, "seeds.jsonl")
+        with open(seeds_path, 'w') as f:
+            f.write("".join(json.dumps(seed(str(i), choices=())) + "\n" for i in range(4)))
+        cache_db = os.path.join(self.tmpdir.name, "cache.db")
+        limits_db = os.path.join(self.tmpdir.name, "limits.db")
+        env = {'RESPONSE_CACHE': 'sqlite', 'RESPONSE_CACHE_DB': cache_db, 'RESPONSE_CACHE_VARIANTS': '2',
+               'RATE_LIMIT': 'sqlite', 'RATE_LIMIT_DB': limits_db}
+        argv = ['batch.py', seeds_path, '--output', self.output, '--workers', '1', '--use-cache']
+        with patch.dict(os.environ, env), patch.object(sys, 'argv', argv), patch('sys.stdout'), patch('sys.stderr'):
+            self.assertEqual(batch.main(), 0)
+
+        # Two introductions fill the shared pool and the other two stories are served from it
+        self.assertEqual(self.fake_openai.call_count('chat'), 2)
+        cache = create_response_cache('sqlite', path=cache_db, variants=2)
+        self.assertIsNotNone(cache.get_introduction('fantasy', 'knight', 'eerie'))
+        self.assertTrue(os.path.exists(limits_db))
+
+    def test_command_line_keeps_images(self):
+        """With IMAGE_STORE the CLI's library links to stored images instead of expiring upstream URLs"""
+        seeds_path = os.path.join(self.tmpdir.name, "seeds.jsonl")
+        with open(seeds_path, 'w') as f:
+            f.write(json.dumps(seed("a", choices=(1,))) + "\n")
+        image_dir = os.path.join(self.tmpdir.name, "images")
+        env = {'IMAGE_STORE': 'true', 'IMAGE_STORE_DIR': image_dir, 'IMAGE_B64': 'true', 'RESPONSE_CACHE': 'off'}
+        argv = ['batch.py', seeds_path, '--output', self.output, '--images']
+        with patch.dict(os.environ, env), patch.object(sys, 'argv', argv), patch('sys.stdout'), patch('sys.stderr'):
+            self.assertEqual(batch.main(), 0)
+
+        image_urls = [turn['image_url'] for turn in self.records()[0]['turns']]
+        self.assertEqual(len(image_urls), 2)
+        for image_url in image_urls:
+            self.assertTrue(image_url.startswith('/images/'))
+            self.assertIsNotNone(ImageStore(image_dir).path(image_url.rsplit('/', 1)[1])[0])
+
+    def test_read_seeds(self):
+        """Seeds without an id are named after their line"""
+        path = os.path.join(self.tmpdir.name, "seeds.jsonl")
+        with open(path, 'w') as f:
+            f.write('{"genre": "sci-fi"}\n\n{"id": "x", "genre": "noir"}\n')
+        self.assertEqual([s['id'] for s in read_seeds(path)], ['line-1', 'x'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+
+# Add the parent directory to the path so we can import the application modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from context_window import ContextWindow, count_tokens
+from prompts import introduction_messages, story_messages
+from session_store import MemorySessionStore
+from tests.fake_openai import FakeOpenAI
+
+
+def make_context(turns, story_id="story-1"):
+    """A story context with numbered turns of roughly 100 tokens each"""
+    history = [{'role': 'assistant', 'content': f"Turn {i}. " + "word " * 100} for i in range(turns)]
+    return {'genre': 'fantasy', 'mood': 'magical', 'story_id': story_id, 'history': history}
+
+
+def summarize(previous, turns):
+    """Deterministic summarizer that records how many turns it has folded in"""
+    count = int(previous.split()[0]) if previous else 0
+    return f"{count + len(turns)} turns summarized"
+
+
+def history_text(window, context):
+    """The history part of the prompt built from the window, as one text"""
+    introduction = introduction_messages(context['genre'], 'protagonist', context['mood'])
+    messages = story_messages(context, window=window.window(context, summarize))
+    return "\n".join(message['content'] for message in messages[len(introduction):])
+
+
+class TestContextWindow(unittest.TestCase):
+    """Test cases for the bounded prompt context"""
+
+    def setUp(self):
+        """Create a window backed by an in-memory store"""
+        self.store = MemorySessionStore()
+        self.window = ContextWindow(self.store, recent_turns=4, token_budget=600, fold_turns=2)
+
+    def test_short_history_is_verbatim(self):
+        """Histories inside the window are rendered in full"""
+        text = history_text(self.window, make_context(3))
+        self.assertEqual(text.count("Turn "), 3)
+        self.assertNotIn("Summary", text)
+
+    def test_budget_enforced_before_summary_exists(self):
+        """Until the summary catches up, the oldest turns are dropped to stay in budget"""
+        text = history_text(self.window, make_context(30))
+        self.assertLessEqual(count_tokens(text), 600)
+        self.assertIn("Turn 29.", text)
+
+    def test_turns_dropped_for_budget_are_summarized(self):
+        """Turns trimmed to fit the budget are queued for the summary even while still within recent_turns"""
+        window = ContextWindow(self.store, recent_turns=20, token_budget=600, fold_turns=2)
+        context = make_context(30)
+        summary, start, end = window.window(context, summarize)
+        self.assertGreater(start, 10)
+        window.wait()
+        self.assertEqual(window.window(context, summarize), (f"{start} turns summarized", start, end))
+
+    def test_summary_replaces_old_turns(self):
+        """Older turns are folded into the summary in the background"""
+        context = make_context(10)
+        history_text(self.window, context)
+        self.window.wait()
+
+        text = history_text(self.window, context)
+        self.assertTrue(text.startswith("Summary of the story so far: 6 turns summarized"))
+        self.assertEqual(text.count("Turn "), 4)
+        self.assertIn("Turn 6.", text)
+
+        # The summary is extended as the story grows, up to the oldest turn the budget still leaves verbatim
+        context['history'].extend(make_context(3)['history'])
+        history_text(self.window, context)
+        self.window.wait()
+        text = history_text(self.window, context)
+        self.assertIn("10 turns summarized", text)
+        self.assertEqual(text.count("Turn "), 3)
+        self.assertLessEqual(count_tokens(text), 600)
+
+    def test_prefix_stable_between_folds(self):
+        """Until the next block is folded, each window keeps the previous one's summary and first turn"""
+        window = ContextWindow(self.store, recent_turns=4, token_budget=10000, fold_turns=4)
+        context = make_context(8)
+        window.window(context, summarize)
+        window.wait()
+        self.assertEqual(window.window(context, summarize), ("4 turns summarized", 4, 8))
+        for turns in range(9, 12):
+            context['history'].extend(make_context(1)['history'])
+            self.assertEqual(window.window(context, summarize), ("4 turns summarized", 4, turns))
+            window.wait()
+        context['history'].extend(make_context(1)['history'])
+        window.window(context, summarize)
+        window.wait()
+        self.assertEqual(window.window(context, summarize), ("8 turns summarized", 8, 12))
+
+    def test_stale_summary_ignored(self):
+        """A summary no longer matching the history (e.g. after starting over) is not used"""
+        context = make_context(10)
+        history_text(self.window, context)
+        self.window.wait()
+
+        context['history'] = [{'role': 'assistant', 'content': f"New turn {i}"} for i in range(8)]
+        self.assertNotIn("Summary", history_text(self.window, context))
+
+    def test_prompt_size_plateaus(self):
+        """Prompt tokens reported through the hook stop growing as the story gets longer"""
+        with patch('story_generator.load_dotenv'), \
+                patch('story_generator.os.getenv', return_value="fake-api-key"), \
+                patch('story_generator.openai', FakeOpenAI(story_text="Passage. " + "word " * 150)):
+            from story_generator import StoryGenerator
+            generator = StoryGenerator(context_window=self.window)
+            sizes = []
+            generator.prompt_hooks.append(lambda task, tokens: sizes.append(tokens) if task == 'continuation' else None)
+
+            context = make_context(1)
+            for _ in range(40):
+                context['history'].append({'role': 'user', 'content': "Go on"})
+                text, choices, image_url = generator.generate_continuation(context, "Go on", include_image=False)
+                context['history'].append({'role': 'assistant', 'content': text})
+                self.window.wait()
+
+        self.assertEqual(len(sizes), 40)
+        self.assertLess(max(sizes[10:]) - min(sizes[10:]), 200)
+        self.assertLess(max(sizes), 1000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import threading
+import time
+
+# Add the parent directory to the path so we can import the application modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from image_jobs import ImageJobQueue, QueueFullError
+from tests.fake_openai import FakeOpenAI, DEFAULT_IMAGE_URL
+
+with patch.dict(os.environ, {'OPENAI_API_KEY': 'fake-api-key'}):
+    import app as app_module
+
+
+class TestImageJobQueue(unittest.TestCase):
+    """Test cases for the background image job queue"""
+
+    def test_job_completes(self):
+        """A submitted job reports its image URL once done"""
+        jobs = ImageJobQueue(workers=1)
+        job_id = jobs.submit(lambda prompt: f"https://example.com/{prompt}.png", "forest")
+        state = jobs.wait(job_id, timeout=2)
+        self.assertEqual(state['status'], 'done')
+        self.assertEqual(state['image_url'], "https://example.com/forest.png")
+
+    def test_job_failure(self):
+        """Errors and empty results are reported as failed jobs"""
+        jobs = ImageJobQueue(workers=1)
+
+        def broken():
+            raise RuntimeError("upstream error")
+
+        self.assertEqual(jobs.wait(jobs.submit(broken), timeout=2)['status'], 'failed')
+        self.assertEqual(jobs.wait(jobs.submit(lambda: None), timeout=2)['status'], 'failed')
+
+    def test_job_timeout(self):
+        """A job that runs past its deadline is reported as timed out"""
+        jobs = ImageJobQueue(workers=1, timeout=0.05)
+        job_id = jobs.submit(time.sleep, 0.3)
+        time.sleep(0.1)
+        self.assertEqual(jobs.status(job_id)['status'], 'timeout')
+
+    def test_bounded_queue(self):
+        """Submissions beyond the queue bound are rejected"""
+        release = threading.Event()
+        jobs = ImageJobQueue(workers=1, max_queue=1)
+        jobs.submit(release.wait)
+        time.sleep(0.05)  # Let the worker pick up the first job
+        jobs.submit(release.wait)
+        with self.assertRaises(QueueFullError):
+            jobs.submit(release.wait)
+        release.set()
+
+    def test_unknown_job(self):
+        """Unknown job ids have no status"""
+        self.assertIsNone(ImageJobQueue().status("missing"))
+
+
+class TestDeferredImages(unittest.TestCase):
+    """Test that story text no longer waits on image generation"""
+
+    def setUp(self):
+        """Route the app through a fake OpenAI client with a slow image endpoint"""
+        self.env_patcher = patch.dict(os.environ, {'OPENAI_API_KEY': 'fake-api-key'})
+        self.env_patcher.start()
+        self.fake_openai = FakeOpenAI(image_latency=0.5)
+        self.openai_patcher = patch('story_generator.openai', self.fake_openai)
+        self.openai_patcher.start()
+
+        self.generator_patcher = patch.object(app_module, 'story_generator', app_module.StoryGenerator())
+        self.jobs_patcher = patch.object(app_module, 'image_jobs', ImageJobQueue(workers=1))
+        self.generator_patcher.start()
+        self.jobs_patcher.start()
+        app_module.app.config['ASYNC_IMAGES'] = True
+
+        self.client = app_module.app.test_client()
+
+    def tearDown(self):
+        """Restore the real generator and queue"""
+        app_module.app.config['ASYNC_IMAGES'] = False
+        self.jobs_patcher.stop()
+        self.generator_patcher.stop()
+        self.openai_patcher.stop()
+        self.env_patcher.stop()
+
+    def test_generator_skips_image(self):
+        """include_image=False returns the text without calling the images API"""
+        generator = app_module.story_generator
+        text, choices, image_url = generator.generate_introduction(
+            "fantasy", "brave knight", "adventurous", include_image=False
+        )
+        self.assertEqual(text, "This is a fake story response.")
+        self.assertEqual(choices, ["Option 1", "Option 2", "Option 3"])
+        self.assertIsNone(image_url)
+        self.assertEqual(self.fake_openai.call_count('images'), 0)
+
+    def test_text_returned_before_image(self):
+        """The route responds before the image is ready, and the job delivers it later"""
+        start = time.monotonic()
+        response = self.client.post('/initialize_story', json={
+            'genre': 'fantasy', 'character': 'brave knight', 'mood': 'adventurous'
+        })
+        elapsed = time.monotonic() - start
+
+        data = response.get_json()
+        self.assertEqual(response.status_code, 200)
+        self.assertLess(elapsed, self.fake_openai.image_latency)
+        self.assertIsNone(data['image_url'])
+        self.assertEqual(data['introduction'], "This is a fake story response.")
+
+        self.assertEqual(app_module.image_jobs.wait(data['image_job_id'], timeout=5)['status'], 'done')
+        status = self.client.get(f"/image_status/{data['image_job_id']}").get_json()
+        self.assertEqual(status['status'], 'done')
+        self.assertEqual(status['image_url'], DEFAULT_IMAGE_URL)
+
+    def test_unknown_image_status(self):
+        """Polling an unknown job returns 404"""
+        self.assertEqual(self.client.get('/image_status/missing').status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,170 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import base64
+import hashlib
+import tempfile
+
+# Add the parent directory to the path so we can import the application modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import image_store as image_store_module
+from image_store import ImageStore
+from session_store import MemorySessionStore
+from tests.fake_openai import FAKE_PNG, FakeOpenAI, FakeOpenAIServer
+
+with patch.dict(os.environ, {'OPENAI_API_KEY': 'fake-api-key'}):
+    import app as app_module
+
+FAKE_ID = hashlib.sha256(FAKE_PNG).hexdigest()
+
+
+class TestImageStore(unittest.TestCase):
+    """Test cases for downloading, deduplicating and evicting stored images"""
+
+    def setUp(self):
+        """Start a server to download images from and an empty store"""
+        self.server = FakeOpenAIServer().start()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.store = ImageStore(self.tmpdir.name)
+
+    def tearDown(self):
+        self.server.stop()
+        self.tmpdir.cleanup()
+
+    def test_download_once(self):
+        """An image is stored under the hash of its bytes and not written twice"""
+        image_id = self.store.save_url(self.server.file_url)
+        self.assertEqual(image_id, FAKE_ID)
+        self.assertEqual(self.store.save_b64(base64.b64encode(FAKE_PNG)), FAKE_ID)
+
+        path, fmt = self.store.path(image_id)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), FAKE_PNG)
+        self.assertEqual(fmt, 'png')
+        self.assertEqual(self.store.size(), len(FAKE_PNG))
+        self.assertEqual(os.listdir(os.path.dirname(path)), [f"{FAKE_ID}.png"])  # No leftover temp files
+
+    def test_failed_download(self):
+        """A failed download raises and leaves nothing behind"""
+        self.server.fail('files', 500)
+        with self.assertRaises(Exception):
+            self.store.save_url(self.server.file_url)
+        self.assertEqual(os.listdir(self.tmpdir.name), [])
+
+    def test_unknown_ids(self):
+        """Ids that are not stored, or not hashes at all, are not found"""
+        self.assertEqual(self.store.path("0" * 64), (None, None))
+        self.assertEqual(self.store.path("../../etc/passwd"), (None, None))
+
+    def test_eviction(self):
+        """The least recently served image is evicted once the store is full"""
+        store = ImageStore(self.tmpdir.name, max_bytes=2 * len(FAKE_PNG) + 10)
+        first = store.save_b64(base64.b64encode(FAKE_PNG))
+        second = store.save_b64(base64.b64encode(FAKE_PNG + b'2'))
+        store.path(first)
+        store.save_b64(base64.b64encode(FAKE_PNG + b'3'))
+
+        self.assertIsNotNone(store.path(first)[0])
+        self.assertIsNone(store.path(second)[0])
+
+        # A restarted store picks up the files left on disk
+        self.assertEqual(ImageStore(self.tmpdir.name).size(), store.size())
+
+    def test_bound_shared_between_processes(self):
+        """Stores on one directory (one per worker process) keep the bound together, variants included"""
+        bound = 2 * len(FAKE_PNG) + 10
+        worker_a, worker_b = ImageStore(self.tmpdir.name, max_bytes=bound), ImageStore(self.tmpdir.name, max_bytes=bound)
+        first = worker_a.save_b64(base64.b64encode(FAKE_PNG))
+        variant = worker_a._path(first, '256.webp')
+        with open(variant, 'wb') as f:
+            f.write(b'v' * 5)  # As Pillow would have transcoded it
+        worker_b.save_b64(base64.b64encode(FAKE_PNG + b'2'))
+        worker_b.save_b64(base64.b64encode(FAKE_PNG + b'3'))
+
+        self.assertIsNone(worker_a.path(first)[0])
+        self.assertFalse(os.path.exists(variant))
+        self.assertLessEqual(worker_b.size(), bound)
+
+    def test_variant_without_pillow(self):
+        """Without Pillow a variant request is answered with the original"""
+        image_id = self.store.save_b64(base64.b64encode(FAKE_PNG))
+        with patch.object(image_store_module, 'Image', None):
+            path, fmt = self.store.path(image_id, width=384)
+        self.assertEqual(fmt, 'png')
+
+    @unittest.skipIf(image_store_module.Image is None, "Pillow is not installed")
+    def test_variant(self):
+        """Smaller variants are transcoded once and reused"""
+        image_id = self.store.save_b64(base64.b64encode(FAKE_PNG))
+        path, fmt = self.store.path(image_id, width=300, fmt='jpeg')
+        self.assertEqual(fmt, 'jpeg')
+        self.assertTrue(path.endswith(f"{image_id}.384.jpeg"))
+        self.assertEqual(self.store.path(image_id, width=300, fmt='jpeg'), (path, fmt))
+
+
+class TestImageRoute(unittest.TestCase):
+    """Test that generated images are served from our host"""
+
+    def setUp(self):
+        """Route the app through a fake OpenAI client whose images can be downloaded"""
+        self.server = FakeOpenAIServer().start()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.env_patcher = patch.dict(os.environ, {'OPENAI_API_KEY': 'fake-api-key'})
+        self.env_patcher.start()
+        self.fake_openai = FakeOpenAI(image_url=self.server.file_url)
+        self.openai_patcher = patch('story_generator.openai', self.fake_openai)
+        self.openai_patcher.start()
+        self.client = app_module.app.test_client()
+
+    def tearDown(self):
+        """Restore the real generator and store"""
+        for patcher in reversed(self.patchers):
+            patcher.stop()
+        self.openai_patcher.stop()
+        self.env_patcher.stop()
+        self.server.stop()
+        self.tmpdir.cleanup()
+
+    def use_store(self, **kwargs):
+        store = ImageStore(self.tmpdir.name, **kwargs)
+        self.patchers = [
+            patch.object(app_module, 'image_store', store),
+            patch.object(app_module, 'story_generator', app_module.StoryGenerator(image_store=store)),
+            patch.object(app_module, 'session_store', MemorySessionStore())
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def test_served_with_cache_headers(self):
+        """The page gets a local URL, served with an ETag and a long-lived Cache-Control"""
+        self.use_store()
+        data = self.client.post('/initialize_story', json={'genre': 'fantasy', 'character': 'knight',
+                                                           'mood': 'magical'}).get_json()
+        self.assertEqual(data['image_url'], f"/images/{FAKE_ID}")
+        self.assertEqual(self.server.request_count('files'), 1)
+
+        response = self.client.get(data['image_url'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, FAKE_PNG)
+        self.assertEqual(response.mimetype, 'image/png')
+        self.assertIn('immutable', response.headers['Cache-Control'])
+        self.assertIn('max-age=31536000', response.headers['Cache-Control'])
+
+        cached = self.client.get(data['image_url'], headers={'If-None-Match': response.headers['ETag']})
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(self.client.get('/images/' + "0" * 64).status_code, 404)
+
+    def test_b64_skips_download(self):
+        """With b64 the image arrives inline and nothing is downloaded"""
+        self.use_store(b64=True)
+        data = self.client.post('/initialize_story', json={'genre': 'fantasy', 'character': 'knight',
+                                                           'mood': 'magical'}).get_json()
+        self.assertEqual(data['image_url'], f"/images/{FAKE_ID}")
+        self.assertEqual(self.server.request_count('files'), 0)
+        self.assertEqual(self.fake_openai.calls[-1][1]['response_format'], 'b64_json')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+
+# Add the parent directory to the path so we can import the application modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from metrics import Metrics, NULL_METRICS
+from session_store import MemorySessionStore
+from tests.fake_openai import FakeOpenAI
+
+with patch.dict(os.environ, {'OPENAI_API_KEY': 'fake-api-key'}):
+    import app as app_module
+
+
+class TestMetrics(unittest.TestCase):
+    """Test cases for stage histograms and token counters"""
+
+    def test_histogram_rendering(self):
+        """Observations land in cumulative buckets with sum and count"""
+        metrics = Metrics(buckets=(0.1, 1.0))
+        metrics.observe('image', '', 0.5)
+        metrics.observe('image', '', 2.0, failed=True)
+        text = metrics.render()
+        self.assertIn('story_stage_seconds_bucket{stage="image",task="",le="0.1"} 0', text)
+        self.assertIn('story_stage_seconds_bucket{stage="image",task="",le="1.0"} 1', text)
+        self.assertIn('story_stage_seconds_bucket{stage="image",task="",le="+Inf"} 2', text)
+        self.assertIn('story_stage_seconds_count{stage="image",task=""} 2', text)
+        self.assertIn('story_stage_errors_total{stage="image",task=""} 1', text)
+
+    def test_span_records_failures(self):
+        """A span that raises is still timed and counted as an error"""
+        metrics = Metrics()
+        with self.assertRaises(ValueError):
+            with metrics.span('choice_parsing'):
+                raise ValueError()
+        self.assertEqual(metrics.summary()['stages']['choice_parsing']['count'], 1)
+
+    def test_disabled_is_shared_noop(self):
+        """Disabled metrics hand out one reusable no-op context manager"""
+        self.assertIs(NULL_METRICS.span('a'), NULL_METRICS.span('b', 'task'))
+        with NULL_METRICS.span('a'):
+            pass
+
+
+class TestMetricsEndpoint(unittest.TestCase):
+    """Test that a turn through the app is broken down by stage"""
+
+    def setUp(self):
+        """Route the app through a fake OpenAI client with metrics enabled"""
+        self.env_patcher = patch.dict(os.environ, {'OPENAI_API_KEY': 'fake-api-key'})
+        self.env_patcher.start()
+        self.openai_patcher = patch('story_generator.openai', FakeOpenAI())
+        self.openai_patcher.start()
+        self.metrics = Metrics()
+        self.patchers = [
+            patch.object(app_module, 'metrics', self.metrics),
+            patch.object(app_module, 'story_generator', app_module.StoryGenerator(metrics=self.metrics)),
+            patch.object(app_module, 'session_store', MemorySessionStore())
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+        self.client = app_module.app.test_client()
+
+    def tearDown(self):
+        """Restore the real generator, store and metrics"""
+        for patcher in reversed(self.patchers):
+            patcher.stop()
+        self.openai_patcher.stop()
+        self.env_patcher.stop()
+
+    def test_turn_stages(self):
+        """Every stage of a turn and its token usage shows up at /metrics"""
+        self.client.post('/initialize_story', json={'genre': 'fantasy', 'character': 'knight', 'mood': 'magical'})
+        self.client.post('/continue_story', json={'choice': 'Option 1'})
+
+        stages = self.metrics.summary()['stages']
+        for stage in ('chat_completion', 'choice_parsing', 'image_prompt', 'image', 'session_load', 'session_save'):
+            self.assertIn(stage, stages)
+        self.assertGreater(self.metrics.summary()['tokens']['continuation:completion'], 0)
+
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('story_stage_seconds_count{stage="chat_completion",task="continuation"} 1', response.get_data(as_text=True))
+        self.assertIn('openai_tokens_total{task="introduction",kind="prompt"}', response.get_data(as_text=True))
+
+    def test_disabled_endpoint(self):
+        """Without metrics there is no endpoint"""
+        with patch.object(app_module, 'metrics', NULL_METRICS):
+            self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
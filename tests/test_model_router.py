@@ -0,0 +1,135 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import json
+import tempfile
+
+# Add the parent directory to the path so we can import the application modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from model_router import ModelRouter, load_routes
+from metrics import Metrics
+from resilience import ResilientCaller
+from story_history import StoryHistory
+from tests.fake_openai import FakeOpenAI
+
+with patch.dict(os.environ, {'OPENAI_API_KEY': 'fake-api-key'}):
+    import app as app_module
+
+
+def story_context():
+    return {'genre': 'fantasy', 'character': 'knight', 'mood': 'magical',
+            'history': StoryHistory([{'role': 'assistant', 'content': "Intro."}])}
+
+
+class TestRouteTable(unittest.TestCase):
+    """Test cases for configuring the per-task routes"""
+
+    def test_overrides_merge_with_defaults(self):
+        """Overriding one setting keeps the task's other defaults"""
+        router = ModelRouter({'choices': {'model': 'gpt-4o-mini'}, 'continuation': {'timeout': 10}})
+        self.assertEqual((router.route('choices').model, router.route('choices').max_tokens), ('gpt-4o-mini', 200))
+        self.assertEqual((router.route('continuation').model, router.route('continuation').timeout),
+                         ('gpt-3.5-turbo', 10))
+        self.assertEqual(router.route('image').model, 'dall-e-2')
+
+    def test_load_routes(self):
+        """Routes come from inline JSON or a JSON file, and unknown settings are rejected"""
+        self.assertEqual(load_routes(''), {})
+        self.assertEqual(load_routes('{"choices": {"model": "gpt-4o-mini"}}'), {'choices': {'model': 'gpt-4o-mini'}})
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+            json.dump({'summary': {'max_tokens': 300}}, f)
+        try:
+            self.assertEqual(load_routes(f.name), {'summary': {'max_tokens': 300}})
+        finally:
+            os.remove(f.name)
+        with self.assertRaises(ValueError):
+            load_routes('{"choices": {"modle": "gpt-4o-mini"}}')
+
+
+class TestModelRouting(unittest.TestCase):
+    """Test that each task's calls follow its route, with a fake client simulating models of different speeds"""
+
+    def setUp(self):
+        """Patch in a fake client where the primary model is slow and the fallback is fast"""
+        self.env_patcher = patch.dict(os.environ, {'OPENAI_API_KEY': 'fake-api-key'})
+        self.env_patcher.start()
+        self.fake_openai = FakeOpenAI(model_latency={'big-model': 0.05, 'small-model': 0.0})
+        self.openai_patcher = patch('story_generator.openai', self.fake_openai)
+        self.openai_patcher.start()
+
+    def tearDown(self):
+        self.openai_patcher.stop()
+        self.env_patcher.stop()
+
+    def generator(self, routes, **kwargs):
+        self.router = ModelRouter(routes, **kwargs)
+        return app_module.StoryGenerator(router=self.router, resilience=ResilientCaller(retries=0))
+
+    def chat_calls(self):
+        return [kwargs for endpoint, kwargs in self.fake_openai.calls if endpoint == 'chat']
+
+    def test_tasks_use_their_route(self):
+        """Each task is sent with its own model, max_tokens, temperature and timeout"""
+        generator = self.generator({'choices': {'model': 'small-model', 'max_tokens': 120, 'timeout': 5},
+                                    'image': {'model': 'dall-e-3', 'size': '1024x1024'}})
+        generator.generate_continuation(story_context(), "Open the door")
+        generator.generate_choices(story_context())
+
+        continuation, choices = self.chat_calls()[0], self.chat_calls()[-1]
+        self.assertEqual((continuation['model'], continuation['max_tokens'], continuation['temperature']),
+                         ('gpt-3.5-turbo', 700, 0.7))
+        self.assertEqual((choices['model'], choices['max_tokens'], choices['timeout']), ('small-model', 120, 5))
+        image = next(kwargs for endpoint, kwargs in self.fake_openai.calls if endpoint == 'images')
+        self.assertEqual((image['model'], image['size']), ('dall-e-3', '1024x1024'))
+
+        stats = self.router.stats()
+        self.assertEqual(stats['choices']['small-model']['calls'], 1)
+        self.assertGreater(stats['continuation']['gpt-3.5-turbo']['prompt_tokens'], 0)
+
+    def test_falls_back_while_over_slo(self):
+        """A primary over its latency SLO hands the task to the fallback until a probe meets the SLO"""
+        generator = self.generator(
+            {'continuation': {'model': 'big-model', 'fallback': 'small-model', 'slo': 0.02}},
+            window=5, min_samples=3, probe_interval=60
+        )
+        for _ in range(4):
+            generator.generate_continuation(story_context(), "Open the door", include_image=False)
+        self.assertEqual([call['model'] for call in self.chat_calls()], ['big-model'] * 3 + ['small-model'])
+        self.assertTrue(self.router.using_fallback('continuation'))
+
+        # Once the primary is fast again, the next probe moves the task back
+        self.fake_openai.model_latency['big-model'] = 0.0
+        self.router.probe_interval = 0
+        generator.generate_continuation(story_context(), "Open the door", include_image=False)
+        generator.generate_continuation(story_context(), "Open the door", include_image=False)
+        self.assertEqual([call['model'] for call in self.chat_calls()[-2:]], ['big-model', 'big-model'])
+        self.assertFalse(self.router.using_fallback('continuation'))
+
+    def test_streams_are_routed(self):
+        """Streamed turns use the route of the task they tell"""
+        generator = self.generator({'modification': {'model': 'small-model', 'temperature': 0.9}})
+        events = list(generator.stream_modification(story_context(), "make me the villain"))
+        self.assertEqual(events[-1]['type'], 'done')
+        self.assertEqual((self.chat_calls()[0]['model'], self.chat_calls()[0]['temperature']), ('small-model', 0.9))
+
+    def test_route_metrics(self):
+        """Per-route latency, calls and tokens are exposed on /metrics"""
+        metrics = Metrics()
+        router = ModelRouter(metrics=metrics)
+        app_module.StoryGenerator(router=router).generate_choices(story_context())
+        text = metrics.render()
+        self.assertIn('openai_route_calls{task="choices",model="gpt-3.5-turbo"} 1', text)
+        self.assertIn('openai_route_latency_p95_seconds{task="choices",model="gpt-3.5-turbo"}', text)
+
+    def test_model_stats_route(self):
+        """The app reports its route table and per-route stats"""
+        body = app_module.app.test_client().get('/model_stats').get_json()
+        self.assertEqual(body['routes']['continuation']['max_tokens'], 700)
+        self.assertFalse(body['routes']['continuation']['fallback_active'])
+        self.assertIn('stats', body)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import threading
+import time
+
+# Add the parent directory to the path so we can import the application modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from profiling import SamplingProfiler, MemoryProfiler, deep_size, largest
+from response_cache import LRUCacheBackend, ResponseCache
+from session_store import MemorySessionStore
+from story_history import StoryHistory
+from tests.fake_openai import FakeOpenAI
+
+with patch.dict(os.environ, {'OPENAI_API_KEY': 'fake-api-key'}):
+    import app as app_module
+
+
+def spin(seconds):
+    """Busy work for the profiler to find"""
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def sampler_threads():
+    return [thread for thread in threading.enumerate() if thread.name == "profile-sampler" and thread.is_alive()]
+
+
+class TestSamplingProfiler(unittest.TestCase):
+    """Test cases for the request-sampling profiler"""
+
+    def test_samples_picked_requests(self):
+        """A picked request's stacks are counted in collapsed form"""
+        profiler = SamplingProfiler(rate=1.0, interval=0.001)
+        try:
+            self.assertTrue(profiler.begin('continue_story'))
+            spin(0.1)
+            profiler.end()
+            spin(0.02)
+            lines = profiler.collapsed().splitlines()
+            self.assertTrue(lines)
+            self.assertTrue(all(line.startswith('continue_story;') for line in lines))
+            self.assertIn('test_profiling:spin', lines[0].rsplit(' ', 1)[0].split(';'))
+            busiest = max(profiler.top(100), key=lambda entry: entry['self'])
+            self.assertIn(busiest['function'], ('test_profiling:spin', 'time:perf_counter'))
+        finally:
+            profiler.configure(rate=0)
+
+    def test_off_costs_nothing(self):
+        """With a rate of 0 no sampler thread runs and no request is picked"""
+        profiler = SamplingProfiler(rate=0.5, interval=0.001)
+        self.assertTrue(profiler.running)
+        profiler.configure(rate=0)
+        time.sleep(0.02)
+        self.assertFalse(profiler.running)
+        self.assertFalse(profiler.begin('continue_story'))
+        self.assertEqual(sampler_threads(), [])
+
+
+class TestMemoryReports(unittest.TestCase):
+    """Test cases for tracemalloc snapshots and per-object sizes"""
+
+    def test_snapshot_changes(self):
+        """A second snapshot reports what was allocated since the first"""
+        profiler = MemoryProfiler(frames=5)
+        self.assertIsNone(profiler.snapshot())
+        profiler.configure(True)
+        try:
+            profiler.snapshot()
+            kept = [bytearray(1000) for _ in range(200)]
+            report = profiler.snapshot(limit=5)
+            self.assertGreater(report['traced_bytes'], 200 * 1000)
+            self.assertGreater(report['changes'][0]['bytes_diff'], 150 * 1000)
+            self.assertIn(__file__, report['changes'][0]['where'][0])
+            del kept
+        finally:
+            profiler.configure(False)
+        self.assertFalse(profiler.tracing)
+
+    def test_largest_session_contexts(self):
+        """Session contexts are ranked by everything they hold"""
+        store = MemorySessionStore()
+        for session_id, turns in (('short', 2), ('long', 50)):
+            history = StoryHistory()
+            for turn in range(turns):
+                history.append({'role': 'assistant', 'content': f"Turn {turn} " * 50})
+            store.set(session_id, {'genre': 'fantasy', 'mood': 'eerie', 'history': history})
+        report = largest(store.items(), limit=1)
+        self.assertEqual(report['count'], 2)
+        self.assertEqual([entry['key'] for entry in report['largest']], ['long'])
+        self.assertGreater(report['largest'][0]['bytes'], 50 * 400)
+        self.assertGreater(deep_size(store.get('long')), deep_size(store.get('short')))
+
+
+class TestProfilingRoutes(unittest.TestCase):
+    """Test the admin profiling routes of the Flask app"""
+
+    def setUp(self):
+        """A profiling token, a fresh profiler and a slow fake OpenAI client"""
+        self.env_patcher = patch.dict(os.environ, {'OPENAI_API_KEY': 'fake-api-key'})
+        self.env_patcher.start()
+        self.openai_patcher = patch('story_generator.openai', FakeOpenAI(chat_latency=0.05))
+        self.openai_patcher.start()
+        cache = ResponseCache(LRUCacheBackend())
+        self.patchers = [
+            patch.object(app_module, 'profiling_token', 'secret'),
+            patch.object(app_module, 'profiler', SamplingProfiler(interval=0.002)),
+            patch.object(app_module, 'memory_profiler', MemoryProfiler()),
+            patch.object(app_module, 'session_store', MemorySessionStore()),
+            patch.object(app_module, 'response_cache', cache),
+            patch.object(app_module, 'story_generator', app_module.StoryGenerator(cache=cache))
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+        self.client = app_module.app.test_client()
+        self.headers = {'Authorization': 'Bearer secret'}
+
+    def tearDown(self):
+        """Switch profiling off and restore the app"""
+        app_module.profiler.configure(rate=0)
+        app_module.memory_profiler.configure(False)
+        for patcher in reversed(self.patchers):
+            patcher.stop()
+        self.openai_patcher.stop()
+        self.env_patcher.stop()
+
+    def test_hidden_without_token(self):
+        """The admin routes do not exist for requests without the right token"""
+        for path in ('/admin/profile', '/admin/profile/cpu', '/admin/profile/memory'):
+            self.assertEqual(self.client.get(path).status_code, 404)
+            self.assertEqual(self.client.get(path, headers={'Authorization': 'Bearer wrong'}).status_code, 404)
+        with patch.object(app_module, 'profiling_token', None):
+            self.assertEqual(self.client.get('/admin/profile', headers={'Authorization': 'Bearer '}).status_code, 404)
+
+    def test_toggle_and_read_profiles(self):
+        """Sampling switched on at runtime profiles story requests, and switching it off stops the sampler"""
+        state = self.client.post('/admin/profile', json={'sample_rate': 1.0, 'memory': True},
+                                 headers=self.headers).get_json()
+        self.assertEqual((state['cpu']['rate'], state['cpu']['running'], state['memory']['tracing']), (1.0, True, True))
+
+        self.client.post('/initialize_story', json={'genre': 'fantasy', 'character': 'knight', 'mood': 'eerie'})
+        collapsed = self.client.get('/admin/profile/cpu', headers=self.headers).get_data(as_text=True)
+        self.assertIn('initialize_story;', collapsed)
+        self.assertIn('app:initialize_turn', collapsed)
+        top = self.client.get('/admin/profile/cpu?format=json', headers=self.headers).get_json()
+        self.assertEqual(top['stats']['requests_sampled'], 1)
+
+        memory = self.client.get('/admin/profile/memory?limit=5', headers=self.headers).get_json()
+        self.assertEqual(memory['sessions']['count'], 1)
+        self.assertGreater(memory['cache']['count'], 0)
+        self.assertLessEqual(len(memory['tracemalloc']['top']), 5)
+
+        state = self.client.post('/admin/profile', json={'sample_rate': 0, 'memory': False},
+                                 headers=self.headers).get_json()
+        self.assertEqual((state['cpu']['running'], state['memory']['tracing']), (False, False))
+        self.assertEqual(self.client.post('/admin/profile', json={'sample_rate': 'often'},
+                                          headers=self.headers).status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import json
+
+# Add the parent directory to the path so we can import the application modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import prompts
+from context_window import ContextWindow
+from metrics import Metrics
+from session_store import MemorySessionStore
+from story_history import StoryHistory
+from tests.fake_openai import FakeOpenAI
+
+with patch.dict(os.environ, {'OPENAI_API_KEY': 'fake-api-key'}):
+    import app as app_module
+
+
+def story_context(*turns):
+    return {'genre': 'fantasy', 'character': 'knight', 'mood': 'magical',
+            'history': StoryHistory({'role': role, 'content': content} for role, content in turns)}
+
+
+def shared_prefix(first, second):
+    """Number of leading messages two requests have in common"""
+    count = 0
+    for a, b in zip(first, second):
+        if a != b:
+            break
+        count += 1
+    return count
+
+
+class TestPrompts(unittest.TestCase):
+    """Test cases for the chat prompt templates"""
+
+    def test_turns_become_messages(self):
+        """The story so far follows the system prompt and preamble as assistant/user messages"""
+        context = story_context(('assistant', "Intro."), ('user', "Open the door"))
+        messages = prompts.continuation_messages(context, "Open the door")
+        self.assertEqual([message['role'] for message in messages], ['system', 'user', 'assistant', 'user'])
+        self.assertEqual(messages[0]['content'], prompts.STORY_SYSTEM_PROMPT)
+        self.assertIn("Genre/Theme: fantasy", messages[1]['content'])
+        self.assertEqual(messages[-1]['content'], "Open the door")
+
+        # A reply the caller has not recorded yet is added
+        context = story_context(('assistant', "Intro."))
+        self.assertEqual(prompts.modification_messages(context, "make me the villain")[-1]['content'],
+                         "COMMAND: make me the villain")
+
+    def test_window_uses_summary(self):
+        """With a context window, older turns are replaced by the summary"""
+        context = story_context(*[('assistant', f"Turn {i}") for i in range(5)])
+        messages = prompts.story_messages(context, window=("Long ago.", 3, 5))
+        self.assertEqual([message['content'] for message in messages[2:]],
+                         [prompts.summary_text("Long ago."), "Turn 3", "Turn 4"])
+
+
+class TestPromptPrefix(unittest.TestCase):
+    """Test that each turn's request extends the previous one byte for byte"""
+
+    def setUp(self):
+        """Route the app through a fake OpenAI client with metrics enabled"""
+        self.env_patcher = patch.dict(os.environ, {'OPENAI_API_KEY': 'fake-api-key'})
+        self.env_patcher.start()
+        self.fake_openai = FakeOpenAI()
+        self.openai_patcher = patch('story_generator.openai', self.fake_openai)
+        self.openai_patcher.start()
+        self.metrics = Metrics()
+        generator = app_module.StoryGenerator(inline_image_prompt=True, metrics=self.metrics)
+        self.patchers = [
+            patch.object(app_module, 'metrics', self.metrics),
+            patch.object(app_module, 'story_generator', generator),
+            patch.object(app_module, 'session_store', MemorySessionStore())
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+        self.client = app_module.app.test_client()
+
+    def tearDown(self):
+        """Restore the real generator and store"""
+        for patcher in reversed(self.patchers):
+            patcher.stop()
+        self.openai_patcher.stop()
+        self.env_patcher.stop()
+
+    def story_requests(self):
+        """Serialized messages of each story completion, in order"""
+        return [json.dumps(kwargs['messages']) for endpoint, kwargs in self.fake_openai.calls
+                if endpoint == 'chat' and kwargs['max_tokens'] == 700]
+
+    def test_prefix_is_stable_across_turns(self):
+        """Every request starts with the whole previous request, so only the new turns differ"""
+        self.client.post('/initialize_story', json={'genre': 'fantasy', 'character': 'knight', 'mood': 'magical'})
+        self.client.post('/continue_story', json={'choice': 'Option 1'})
+        self.client.post('/modify_story', json={'command': 'Make me the villain'})
+        self.client.post('/continue_story', json={'choice': 'Option 2'})
+
+        requests = self.story_requests()
+        self.assertEqual(len(requests), 4)
+        for previous, current in zip(requests, requests[1:]):
+            self.assertTrue(current.startswith(previous[:-1]))  # Up to the closing bracket of the list
+
+    def test_prefix_is_stable_with_context_window(self):
+        """With a context window, requests keep extending each other and only change when a block is folded"""
+        window = ContextWindow(MemorySessionStore(), recent_turns=4, token_budget=100000, fold_turns=8)
+        generator = app_module.StoryGenerator(context_window=window, inline_image_prompt=True, metrics=self.metrics)
+        with patch.object(app_module, 'story_generator', generator):
+            self.client.post('/initialize_story', json={'genre': 'fantasy', 'character': 'knight', 'mood': 'magical'})
+            for turn in range(16):
+                self.client.post('/continue_story', json={'choice': f'Option {turn % 3 + 1}'})
+                window.wait()
+
+        requests = [json.loads(request) for request in self.story_requests()[1:]]
+        shared = [shared_prefix(previous, current) for previous, current in zip(requests, requests[1:])]
+        extended = [count == len(previous) for count, previous in zip(shared, requests)]
+        # Each turn adds a choice and a passage, so a block of 8 turns is folded every 4 requests
+        folds = [i for i, extends in enumerate(extended) if not extends]
+        self.assertEqual(len(folds), 3)
+        self.assertEqual([b - a for a, b in zip(folds, folds[1:])], [4, 4])
+
+    def test_cached_tokens_are_reported(self):
+        """Cached prompt tokens from the responses are counted per task"""
+        self.client.post('/initialize_story', json={'genre': 'fantasy', 'character': 'knight', 'mood': 'magical'})
+        self.client.post('/continue_story', json={'choice': 'Option 1'})
+        self.client.post('/continue_story', json={'choice': 'Option 2'})
+
+        tokens = self.metrics.summary()['tokens']
+        self.assertGreater(tokens['continuation:cached'], 0)
+        self.assertLess(tokens['continuation:cached'], tokens['continuation:prompt'])
+        self.assertIn('openai_tokens_total{task="continuation",kind="cached"}', self.metrics.render())
+
+
+if __name__ == '__main__':
+    unittest.main()
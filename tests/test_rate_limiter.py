@@ -0,0 +1,145 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import asyncio
+import tempfile
+import threading
+import time
+
+# Add the parent directory to the path so we can import the application modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from metrics import Metrics
+from rate_limiter import RateLimiter, SQLiteBucketBackend, background, create_rate_limiter
+from resilience import ResilientCaller, TurnBudgetExceeded
+
+CHAT = {'messages': [{'role': 'user', 'content': 'Go on'}], 'max_tokens': 10}
+
+
+def limiter(**kwargs):
+    """A limiter allowing 10 chat requests a second with a burst of 2, and no token limit"""
+    settings = dict(chat_rpm=600, chat_tpm=0, image_rpm=600, burst=0.2, reserve=0.5)
+    settings.update(kwargs)
+    return RateLimiter(**settings)
+
+
+def timed(func, *args, **kwargs):
+    start = time.monotonic()
+    result = func(*args, **kwargs)
+    return result, time.monotonic() - start
+
+
+class TestRateLimiter(unittest.TestCase):
+    """Test cases for the token buckets and priorities"""
+
+    def test_bucket_refills(self):
+        """Calls beyond the burst wait for the bucket to refill"""
+        rate_limiter = limiter()
+        for _ in range(2):
+            self.assertLess(timed(rate_limiter.acquire, 'chat', CHAT)[1], 0.02)
+        acquired, waited = timed(rate_limiter.acquire, 'chat', CHAT)
+        self.assertTrue(acquired)
+        self.assertGreater(waited, 0.07)
+
+    def test_endpoints_are_separate(self):
+        """An exhausted chat bucket does not hold up images"""
+        rate_limiter = limiter()
+        for _ in range(2):
+            rate_limiter.acquire('chat', CHAT)
+        self.assertLess(timed(rate_limiter.acquire, 'images', {'n': 1})[1], 0.02)
+
+    def test_token_bucket(self):
+        """Chat calls are charged their prompt tokens plus max_tokens"""
+        rate_limiter = limiter(chat_rpm=0, chat_tpm=6000, burst=1)  # 100 tokens
+        self.assertGreaterEqual(rate_limiter.costs('chat', CHAT)['chat_tokens'], 10)
+        rate_limiter.acquire('chat', dict(CHAT, max_tokens=90))
+        self.assertFalse(rate_limiter.acquire('chat', dict(CHAT, max_tokens=90), max_wait=0.05))
+
+    def test_costs_counted_once_per_call(self):
+        """A call that waits through several polls counts its message tokens only once"""
+        rate_limiter = limiter()
+        for _ in range(2):
+            rate_limiter.acquire('chat', CHAT)
+        with patch('rate_limiter.count_message_tokens', return_value=1) as count, \
+                patch('rate_limiter.MAX_POLL', 0.01):
+            self.assertTrue(rate_limiter.acquire('chat', CHAT))
+            self.assertTrue(asyncio.run(rate_limiter.aacquire('chat', CHAT)))
+        self.assertEqual(count.call_count, 2)
+
+    def test_background_leaves_reserve(self):
+        """Background calls cannot dip into the share kept for interactive calls"""
+        rate_limiter = limiter()
+        rate_limiter.acquire('chat', CHAT)
+        with background():
+            self.assertFalse(rate_limiter.acquire('chat', CHAT, max_wait=0.01))
+        self.assertTrue(rate_limiter.acquire('chat', CHAT, max_wait=0.01))
+
+    def test_background_yields_to_waiting_interactive(self):
+        """Queued interactive calls go first once capacity frees up"""
+        rate_limiter = limiter(reserve=0.0)
+        for _ in range(2):
+            rate_limiter.acquire('chat', CHAT)
+        order = []
+
+        def call(name, priority_background):
+            if priority_background:
+                with background():
+                    rate_limiter.acquire('chat', CHAT)
+            else:
+                rate_limiter.acquire('chat', CHAT)
+            order.append(name)
+
+        threads = [threading.Thread(target=call, args=("background", True))]
+        threads += [threading.Thread(target=call, args=(f"interactive-{i}", False)) for i in range(2)]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.005)
+        for thread in threads:
+            thread.join()
+        self.assertEqual(order[-1], "background")
+
+    def test_shared_between_processes(self):
+        """Limiters on the same SQLite file draw from the same buckets"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "rate_limits.db")
+            first = limiter(backend=SQLiteBucketBackend(path))
+            second = limiter(backend=SQLiteBucketBackend(path))
+            first.acquire('chat', CHAT)
+            first.acquire('chat', CHAT)
+            self.assertFalse(second.acquire('chat', CHAT, max_wait=0.01))
+            self.assertIsNone(create_rate_limiter('off'))
+
+    def test_metrics(self):
+        """Wait times are observed and queue depth is rendered as a gauge"""
+        metrics = Metrics()
+        rate_limiter = limiter(metrics=metrics)
+        for _ in range(3):
+            rate_limiter.acquire('chat', CHAT)
+        self.assertEqual(metrics.summary()['stages']['rate_limit_wait']['count'], 3)
+        self.assertIn('openai_rate_limit_queue_depth{endpoint="chat",priority="interactive"} 0', metrics.render())
+
+
+class TestResilientCallerLimits(unittest.TestCase):
+    """Test that upstream calls wait for rate limit capacity"""
+
+    def test_calls_are_limited(self):
+        """Every attempt takes from the buckets"""
+        caller = ResilientCaller(limiter=limiter())
+        calls = []
+        for _ in range(3):
+            caller.call('chat', lambda timeout, **kwargs: calls.append(time.monotonic()), **CHAT)
+        self.assertGreater(calls[2] - calls[0], 0.07)
+
+    def test_wait_is_capped_by_turn_budget(self):
+        """A turn that cannot get capacity in time fails fast"""
+        caller = ResilientCaller(turn_budget=0.05, limiter=limiter(chat_rpm=6))
+        caller.call('chat', lambda timeout, **kwargs: None, **CHAT)
+        with caller.turn():
+            with self.assertRaises(TurnBudgetExceeded):
+                caller.call('chat', lambda timeout, **kwargs: None, **CHAT)
+        self.assertTrue(caller.available('chat'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,188 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import time
+
+import openai
+
+# Add the parent directory to the path so we can import the application modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from resilience import CircuitBreaker, CircuitOpenError, ResilientCaller, TurnBudgetExceeded, is_retryable
+from tests.fake_openai import FakeOpenAIServer
+
+
+class UpstreamError(Exception):
+    """Stand-in for an API error carrying an HTTP status"""
+
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def flaky(*statuses):
+    """A callable failing with the given statuses before succeeding"""
+    calls = []
+
+    def func(timeout):
+        calls.append(timeout)
+        if len(calls) <= len(statuses):
+            raise UpstreamError(statuses[len(calls) - 1])
+        return "ok"
+    return func, calls
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    """Test cases for the circuit breaker states"""
+
+    def test_opens_and_recovers(self):
+        """The breaker opens after repeated failures and a successful trial closes it"""
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, 'closed')
+        breaker.record_failure()
+        self.assertEqual(breaker.state, 'open')
+        self.assertFalse(breaker.allow())
+
+        time.sleep(0.1)
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())  # Only one trial at a time
+        breaker.record_success()
+        self.assertEqual(breaker.state, 'closed')
+
+    def test_failed_trial_reopens(self):
+        """A failing trial call opens the breaker again"""
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+        breaker.record_failure()
+        time.sleep(0.1)
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, 'open')
+
+
+class TestResilientCaller(unittest.TestCase):
+    """Test cases for retries, deadlines and fast failure"""
+
+    def test_retries_retryable_errors(self):
+        """Rate limits and server errors are retried with backoff"""
+        caller = ResilientCaller(retries=2, backoff=0.01)
+        func, calls = flaky(429, 500)
+        self.assertEqual(caller.call('chat', func), "ok")
+        self.assertEqual(len(calls), 3)
+
+    def test_client_errors_not_retried(self):
+        """Bad requests fail immediately and do not count against the breaker"""
+        caller = ResilientCaller(retries=2, backoff=0.01, failure_threshold=1)
+        func, calls = flaky(400)
+        with self.assertRaises(UpstreamError):
+            caller.call('chat', func)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(caller.breaker('chat').state, 'closed')
+
+    def test_fast_fail_when_open(self):
+        """Once the breaker opens, calls fail without reaching upstream"""
+        caller = ResilientCaller(retries=0, failure_threshold=2)
+        for _ in range(2):
+            with self.assertRaises(UpstreamError):
+                caller.call('chat', flaky(503)[0])
+        func, calls = flaky()
+        with self.assertRaises(CircuitOpenError):
+            caller.call('chat', func)
+        self.assertEqual(calls, [])
+        self.assertTrue(caller.available('images'))
+
+    def test_turn_budget(self):
+        """Call timeouts are capped by the turn budget and an exhausted budget fails fast"""
+        caller = ResilientCaller(timeout=30, turn_budget=0.05)
+        func, calls = flaky()
+        with caller.turn():
+            caller.call('chat', func)
+            self.assertLessEqual(calls[0], 0.05)
+            time.sleep(0.06)
+            with self.assertRaises(TurnBudgetExceeded):
+                caller.call('chat', func)
+
+    def test_is_retryable(self):
+        """Status codes and connection errors are classified"""
+        self.assertTrue(is_retryable(UpstreamError(429)))
+        self.assertTrue(is_retryable(UpstreamError(502)))
+        self.assertFalse(is_retryable(UpstreamError(401)))
+        self.assertTrue(is_retryable(ConnectionResetError()))
+        self.assertFalse(is_retryable(ValueError()))
+
+
+class TestAgainstFakeServer(unittest.TestCase):
+    """Run the story generator through a real OpenAI client against a faulty local server"""
+
+    def setUp(self):
+        """Start the server and point the generator's OpenAI client at it"""
+        self.server = FakeOpenAIServer().start()
+        client = openai.OpenAI(api_key="fake-api-key", base_url=self.server.base_url, max_retries=0)
+        self.patchers = [
+            # Other test modules replace the openai module; the real client lazily imports from it
+            patch.dict(sys.modules, {'openai': openai}),
+            patch('story_generator.load_dotenv'),
+            patch('story_generator.os.getenv', return_value="fake-api-key"),
+            patch('story_generator.openai', client)
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+        from story_generator import StoryGenerator
+        self.StoryGenerator = StoryGenerator
+        self.context = {
+            'genre': 'fantasy',
+            'mood': 'magical',
+            'history': [{'role': 'assistant', 'content': 'Story introduction.'}]
+        }
+
+    def tearDown(self):
+        """Stop patches and the server"""
+        for patcher in reversed(self.patchers):
+            patcher.stop()
+        self.server.stop()
+
+    def test_recovers_from_429_and_500(self):
+        """A rate limit and a server error are retried transparently"""
+        generator = self.StoryGenerator(resilience=ResilientCaller(backoff=0.01))
+        self.server.fail('chat', 429)
+        self.server.fail('chat', 500)
+        text, choices, image_url = generator.generate_continuation(self.context, "Go on", include_image=False)
+        self.assertEqual(text, "This is a fake story response.")
+        self.assertEqual(self.server.request_count('chat'), 3)
+
+    def test_slow_upstream_times_out(self):
+        """A hung upstream costs one deadline, not a stalled worker"""
+        generator = self.StoryGenerator(resilience=ResilientCaller(timeout=0.2, retries=0))
+        self.server.fail('chat', 200, delay=1.0)
+        start = time.monotonic()
+        text, choices, image_url = generator.generate_continuation(self.context, "Go on", include_image=False)
+        self.assertLess(time.monotonic() - start, 0.8)
+        self.assertTrue(text.startswith("Error generating story continuation"))
+
+    def test_image_brownout_serves_text_only(self):
+        """While image generation keeps failing, turns come back as text without trying images"""
+        generator = self.StoryGenerator(resilience=ResilientCaller(retries=0, failure_threshold=2))
+        self.server.fail('images', 500, times=2)
+        for _ in range(2):
+            generator.generate_continuation(self.context, "Go on")
+
+        text, choices, image_url = generator.generate_continuation(self.context, "Go on")
+        self.assertEqual(text, "This is a fake story response.")
+        self.assertIsNone(image_url)
+        self.assertEqual(self.server.request_count('images'), 2)
+
+    def test_turn_budget_skips_image(self):
+        """A turn whose text used up the budget returns without an image"""
+        generator = self.StoryGenerator(resilience=ResilientCaller(turn_budget=0.4))
+        self.server.latency = 0.3
+        start = time.monotonic()
+        text, choices, image_url = generator.generate_continuation(self.context, "Go on")
+        self.assertLess(time.monotonic() - start, 0.6)
+        self.assertEqual(text, "This is a fake story response.")
+        self.assertIsNone(image_url)
+
+
+if __name__ == '__main__':
+    unittest.main()
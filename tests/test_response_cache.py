@@ -0,0 +1,154 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import tempfile
+import time
+
+# Add the parent directory to the path so we can import the application modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from response_cache import LRUCacheBackend, SQLiteCacheBackend, ResponseCache, create_response_cache
+from tests.fake_openai import FakeOpenAI
+
+
+class TestCacheBackends(unittest.TestCase):
+    """Test cases for the response cache backends"""
+
+    def test_lru_eviction(self):
+        """The least recently used entry is evicted and counted"""
+        backend = LRUCacheBackend(max_entries=2)
+        backend.set("a", 1)
+        backend.set("b", 2)
+        backend.get("a")
+        backend.set("c", 3)
+        self.assertIsNone(backend.get("b"))
+        self.assertEqual(backend.get("a"), 1)
+        self.assertEqual(backend.evictions, 1)
+
+    def test_ttl_expiry(self):
+        """Entries expire after their time to live"""
+        backend = LRUCacheBackend(ttl=0.05)
+        backend.set("a", 1)
+        time.sleep(0.1)
+        self.assertIsNone(backend.get("a"))
+        self.assertEqual(backend.evictions, 1)
+
+    def test_sqlite_backend(self):
+        """The SQLite backend persists entries and bounds its size"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "cache.db")
+            SQLiteCacheBackend(path).set("a", ["variant"])
+            self.assertEqual(SQLiteCacheBackend(path).get("a"), ["variant"])
+
+            backend = SQLiteCacheBackend(path, max_entries=2)
+            backend.set("b", 2)
+            time.sleep(0.01)
+            backend.set("c", 3)
+            self.assertEqual(len(backend), 2)
+            self.assertIsNone(backend.get("a"))
+            self.assertEqual(backend.evictions, 1)
+
+    def test_unknown_backend(self):
+        """Unknown backends are rejected and 'off' disables caching"""
+        self.assertIsNone(create_response_cache('off'))
+        with self.assertRaises(ValueError):
+            create_response_cache('redis')
+
+    def test_off_unless_configured(self):
+        """Without RESPONSE_CACHE every story is generated fresh"""
+        from components import response_cache_from_env
+        with patch.dict(os.environ, {}, clear=True):
+            self.assertIsNone(response_cache_from_env())
+        with patch.dict(os.environ, {'RESPONSE_CACHE': 'memory'}):
+            self.assertIsNotNone(response_cache_from_env())
+
+
+class TestResponseCache(unittest.TestCase):
+    """Test cases for introduction pools and image prompt memoization"""
+
+    def setUp(self):
+        """Route the generator through a fake OpenAI client and a small cache"""
+        self.fake = FakeOpenAI()
+        self.patchers = [
+            patch('story_generator.load_dotenv'),
+            patch('story_generator.os.getenv', return_value="fake-api-key"),
+            patch('story_generator.openai', self.fake)
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+        from story_generator import StoryGenerator
+        self.cache = ResponseCache(LRUCacheBackend(), variants=2)
+        self.generator = StoryGenerator(cache=self.cache)
+
+    def tearDown(self):
+        """Stop patches"""
+        for patcher in reversed(self.patchers):
+            patcher.stop()
+
+    def test_pool_served_once_full(self):
+        """Introductions are generated until the pool of variants is full, then served from it"""
+        for _ in range(2):
+            self.generator.generate_introduction("Fantasy", "Knight", "Magical")
+        calls = self.fake.call_count()
+        hits = self.cache.stats()['hits']
+
+        # Case and whitespace differences share the same cache entry
+        text, choices, image_url = self.generator.generate_introduction(" fantasy", "knight ", "MAGICAL")
+        self.assertEqual(self.fake.call_count(), calls)
+        self.assertEqual(text, "This is a fake story response.")
+        self.assertEqual(choices, ["Option 1", "Option 2", "Option 3"])
+        self.assertIsNotNone(image_url)
+        self.assertEqual(self.cache.stats()['hits'], hits + 1)
+
+    def test_expired_image_urls_not_served(self):
+        """A variant whose upstream image URL has expired gets a fresh image and leaves the pool"""
+        self.cache.image_url_ttl = 0.05
+        for _ in range(2):
+            self.generator.generate_introduction("fantasy", "knight", "magical")
+        self.assertIsNotNone(self.generator.generate_introduction("fantasy", "knight", "magical")[2])
+        time.sleep(0.06)
+
+        images = self.fake.call_count('images')
+        text, choices, image_url = self.generator.generate_introduction("fantasy", "knight", "magical")
+        self.assertEqual(text, "This is a fake story response.")
+        self.assertIsNotNone(image_url)
+        self.assertEqual(self.fake.call_count('images'), images + 1)
+
+        # The pool refills with a freshly generated introduction
+        calls = self.fake.call_count('chat')
+        self.generator.generate_introduction("fantasy", "knight", "magical")
+        self.assertGreater(self.fake.call_count('chat'), calls)
+
+    def test_misses_skip_filling_pools(self):
+        """While this process is filling a pool, misses do not read the backend"""
+        backend = LRUCacheBackend()
+        cache = ResponseCache(backend, variants=2)
+        with patch.object(backend, 'get', wraps=backend.get) as get:
+            self.assertIsNone(cache.get_introduction("fantasy", "knight", "magical"))
+            cache.add_introduction("fantasy", "knight", "magical", {'text': "One", 'choices': [], 'image_url': None})
+            reads = get.call_count
+            self.assertIsNone(cache.get_introduction("fantasy", "knight", "magical"))
+            self.assertEqual(get.call_count, reads)
+            cache.add_introduction("fantasy", "knight", "magical", {'text': "Two", 'choices': [], 'image_url': None})
+            self.assertIn(cache.get_introduction("fantasy", "knight", "magical")['text'], ("One", "Two"))
+
+    def test_bypass(self):
+        """use_cache=False always generates a fresh introduction"""
+        for _ in range(2):
+            self.generator.generate_introduction("fantasy", "knight", "magical")
+        calls = self.fake.call_count('chat')
+        self.generator.generate_introduction("fantasy", "knight", "magical", include_image=False, use_cache=False)
+        self.assertEqual(self.fake.call_count('chat'), calls + 1)
+
+    def test_image_prompt_memoized(self):
+        """The same passage only costs one image prompt completion"""
+        self.generator.generate_illustration("fantasy", "knight", "magical", "A dragon lands.")
+        self.generator.generate_illustration("fantasy", "knight", "magical", "A dragon lands.")
+        self.assertEqual(self.fake.call_count('chat'), 1)
+        self.assertEqual(self.fake.call_count('images'), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import runpy
+import stat
+import tempfile
+
+# Add the parent directory to the path so we can import the application modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from session_store import MemorySessionStore
+
+with patch.dict(os.environ, {'OPENAI_API_KEY': 'fake-api-key'}):
+    import app as app_module
+
+GUNICORN_CONF = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'gunicorn.conf.py')
+
+
+class TestSecretKey(unittest.TestCase):
+    """Test cases for the session signing key shared by all workers"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "secret")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_environment_wins(self):
+        """SECRET_KEY is used as is and no key file is written"""
+        with patch.dict(os.environ, {'SECRET_KEY': 'configured'}):
+            self.assertEqual(app_module.load_secret_key(self.path), 'configured')
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_generated_once(self):
+        """Without SECRET_KEY a private key file is created once and reused"""
+        with patch.dict(os.environ, {'SECRET_KEY': ''}):
+            first = app_module.load_secret_key(self.path)
+            self.assertEqual(app_module.load_secret_key(self.path), first)
+        self.assertEqual(len(first), 32)
+        self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode), 0o600)
+        self.assertEqual(os.listdir(self.tmpdir.name), ["secret"])
+
+
+class TestHealthChecks(unittest.TestCase):
+    """Test cases for the liveness and readiness routes"""
+
+    def setUp(self):
+        self.store = MemorySessionStore()
+        self.patcher = patch.object(app_module, 'session_store', self.store)
+        self.patcher.start()
+        self.client = app_module.app.test_client()
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def test_ready(self):
+        """Both checks answer without touching OpenAI"""
+        self.assertEqual(self.client.get('/healthz').get_json(), {'status': 'ok'})
+        response = self.client.get('/readyz')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['checks']['session_store'], 'ok')
+
+    def test_unready_store(self):
+        """A failing session store takes the worker out of rotation"""
+        with patch.object(self.store, 'get', side_effect=OSError("disk I/O error")):
+            response = self.client.get('/readyz')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.get_json()['checks']['session_store'], "error: disk I/O error")
+
+
+class TestGunicornConfig(unittest.TestCase):
+    """Test cases for the production server settings"""
+
+    def test_workers_follow_session_store(self):
+        """Per-process session stores get one threaded worker, shared stores one per CPU"""
+        with patch.dict(os.environ, {'SESSION_STORE': 'memory', 'WEB_CONCURRENCY': ''}):
+            config = runpy.run_path(GUNICORN_CONF)
+        self.assertEqual((config['workers'], config['worker_class']), (1, 'gthread'))
+        self.assertTrue(config['preload_app'])
+
+        with patch.dict(os.environ, {'SESSION_STORE': 'sqlite', 'WEB_CONCURRENCY': ''}):
+            self.assertEqual(runpy.run_path(GUNICORN_CONF)['workers'], os.cpu_count())
+        with patch.dict(os.environ, {'WEB_CONCURRENCY': '3'}):
+            self.assertEqual(runpy.run_path(GUNICORN_CONF)['workers'], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import tempfile
+import time
+
+# Add the parent directory to the path so we can import the application modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from session_store import MemorySessionStore, SQLiteSessionStore, create_session_store
+from story_history import StoryHistory
+from tests.fake_openai import FakeOpenAI
+
+with patch.dict(os.environ, {'OPENAI_API_KEY': 'fake-api-key'}):
+    import app as app_module
+
+
+class TestMemorySessionStore(unittest.TestCase):
+    """Test cases for the in-process LRU session store"""
+
+    def test_get_and_set(self):
+        """Stored contexts are returned by id"""
+        store = MemorySessionStore()
+        store.set("a", {'history': []})
+        self.assertEqual(store.get("a"), {'history': []})
+        self.assertIsNone(store.get("missing"))
+
+    def test_contexts_are_copies(self):
+        """A request's changes reach the store only when it sets the context again"""
+        store = MemorySessionStore()
+        context = {'history': StoryHistory([{'role': 'assistant', 'content': 'Hi'}])}
+        store.set("a", context)
+        context['history'].append({'role': 'user', 'content': 'Not stored'})
+        first, second = store.get("a"), store.get("a")
+        first['history'].append({'role': 'user', 'content': 'Tab one'})
+        first['mood'] = 'tense'
+        self.assertEqual(len(second['history']), 1)
+        self.assertEqual(store.get("a"), {'history': [{'role': 'assistant', 'content': 'Hi'}]})
+
+    def test_lru_eviction(self):
+        """The least recently used session is evicted beyond max_entries"""
+        store = MemorySessionStore(max_entries=2)
+        store.set("a", {})
+        store.set("b", {})
+        store.get("a")
+        store.set("c", {})
+        self.assertIsNone(store.get("b"))
+        self.assertIsNotNone(store.get("a"))
+        self.assertEqual(len(store), 2)
+
+    def test_ttl_expiry(self):
+        """Sessions expire after their time to live"""
+        store = MemorySessionStore(ttl=0.05)
+        store.set("a", {})
+        time.sleep(0.1)
+        self.assertIsNone(store.get("a"))
+
+
+class TestSQLiteSessionStore(unittest.TestCase):
+    """Test cases for the SQLite session store"""
+
+    def setUp(self):
+        """Create a throwaway database"""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "sessions.db")
+
+    def tearDown(self):
+        """Remove the database"""
+        self.tmpdir.cleanup()
+
+    def test_shared_between_instances(self):
+        """A second store on the same file (another worker) sees the session"""
+        SQLiteSessionStore(self.path).set("a", {'history': [{'role': 'assistant', 'content': 'Hi'}]})
+        self.assertEqual(SQLiteSessionStore(self.path).get("a")['history'][0]['content'], 'Hi')
+
+    def test_connects_on_first_use(self):
+        """Building the store opens no connection that a forked worker would inherit"""
+        store = SQLiteSessionStore(self.path)
+        self.assertIsNone(getattr(store._local, 'connection', None))
+        self.assertIsNone(store.get("a"))
+        self.assertIsNotNone(store._local.connection)
+
+    def test_expiry_and_delete(self):
+        """Expired and deleted sessions are gone"""
+        store = SQLiteSessionStore(self.path, ttl=-1)
+        store.set("a", {})
+        self.assertIsNone(store.get("a"))
+
+        store = SQLiteSessionStore(self.path)
+        store.set("b", {})
+        store.delete("b")
+        self.assertIsNone(store.get("b"))
+
+    def test_unknown_backend(self):
+        """Unknown backends are rejected"""
+        with self.assertRaises(ValueError):
+            create_session_store("redis")
+
+
+class TestServerSideSessions(unittest.TestCase):
+    """Test that the routes keep story history on the server"""
+
+    def setUp(self):
+        """Route the app through a fake OpenAI client and a fresh store"""
+        self.env_patcher = patch.dict(os.environ, {'OPENAI_API_KEY': 'fake-api-key'})
+        self.env_patcher.start()
+        self.openai_patcher = patch('story_generator.openai', FakeOpenAI())
+        self.openai_patcher.start()
+        self.generator_patcher = patch.object(app_module, 'story_generator', app_module.StoryGenerator())
+        self.store_patcher = patch.object(app_module, 'session_store', MemorySessionStore())
+        self.generator_patcher.start()
+        self.store_patcher.start()
+
+        self.client = app_module.app.test_client()
+
+    def tearDown(self):
+        """Restore the real generator and store"""
+        self.store_patcher.stop()
+        self.generator_patcher.stop()
+        self.openai_patcher.stop()
+        self.env_patcher.stop()
+
+    def test_history_kept_server_side(self):
+        """Every turn is recorded while the cookie only holds the session id"""
+        self.client.post('/initialize_story', json={'genre': 'fantasy', 'character': 'knight', 'mood': 'magical'})
+        self.client.post('/continue_story', json={'choice': 'Option 1'})
+        self.client.post('/modify_story', json={'command': 'Make me the villain'})
+
+        with self.client.session_transaction() as sess:
+            self.assertEqual(list(sess.keys()), ['session_id'])
+            context = app_module.session_store.get(sess['session_id'])
+        self.assertEqual(len(context['history']), 5)
+        self.assertEqual(context['character_role'], 'villain')
+
+    def test_failed_turn_not_stored(self):
+        """A turn whose generation raises leaves the stored history as it was"""
+        self.client.post('/initialize_story', json={'genre': 'fantasy', 'character': 'knight', 'mood': 'magical'})
+        with patch.object(app_module.story_generator, 'generate_continuation', side_effect=RuntimeError("down")):
+            try:
+                self.client.post('/continue_story', json={'choice': 'Option 1'})
+            except RuntimeError:
+                pass
+
+        with self.client.session_transaction() as sess:
+            context = app_module.session_store.get(sess['session_id'])
+        self.assertEqual([turn['role'] for turn in context['history']], ['assistant'])
+
+    def test_continue_without_story(self):
+        """Continuing without a story in progress is a client error"""
+        response = self.client.post('/continue_story', json={'choice': 'Option 1'})
+        self.assertEqual(response.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
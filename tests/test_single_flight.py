@@ -0,0 +1,179 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import json
+import threading
+import time
+
+# Add the parent directory to the path so we can import the application modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from single_flight import SingleFlight
+from session_store import MemorySessionStore
+from tests.fake_openai import FakeOpenAI
+
+with patch.dict(os.environ, {'OPENAI_API_KEY': 'fake-api-key'}):
+    import app as app_module
+
+
+def run_concurrently(count, func):
+    """Call func from `count` threads at once and return the results"""
+    results = [None] * count
+    barrier = threading.Barrier(count)
+
+    def worker(i):
+        barrier.wait()
+        results[i] = func()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+class TestSingleFlight(unittest.TestCase):
+    """Test cases for sharing one call between identical callers"""
+
+    def test_concurrent_callers_share_one_call(self):
+        """Callers with the same key wait for the first call instead of repeating it"""
+        flight = SingleFlight()
+        calls = []
+
+        def slow():
+            calls.append(1)
+            time.sleep(0.1)
+            return "result"
+
+        results = run_concurrently(5, lambda: flight.do("key", slow))
+        self.assertEqual(results, ["result"] * 5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(flight.stats(), {'calls': 1, 'shared': 4, 'in_flight': 0})
+
+    def test_linger(self):
+        """A finished result is reused briefly, then the key runs again"""
+        flight = SingleFlight(linger=0.05)
+        calls = []
+        flight.do("key", lambda: calls.append(1))
+        flight.do("key", lambda: calls.append(1))
+        time.sleep(0.1)
+        flight.do("key", lambda: calls.append(1))
+        self.assertEqual(len(calls), 2)
+
+    def test_errors_are_shared_not_kept(self):
+        """Waiters see the error, and the next call tries again"""
+        flight = SingleFlight()
+
+        def failing():
+            time.sleep(0.05)
+            raise ValueError("boom")
+
+        def call():
+            try:
+                return flight.do("key", failing)
+            except ValueError as e:
+                return str(e)
+
+        self.assertEqual(run_concurrently(3, call), ["boom"] * 3)
+        self.assertEqual(flight.do("key", lambda: "ok"), "ok")
+
+
+class TestDuplicateTurns(unittest.TestCase):
+    """Test that duplicate turn requests cost one generation"""
+
+    def setUp(self):
+        """Route the app through a slow fake OpenAI client and a fresh store"""
+        self.env_patcher = patch.dict(os.environ, {'OPENAI_API_KEY': 'fake-api-key'})
+        self.env_patcher.start()
+        self.fake_openai = FakeOpenAI(chat_latency=0.2)
+        self.openai_patcher = patch('story_generator.openai', self.fake_openai)
+        self.openai_patcher.start()
+        self.store = MemorySessionStore()
+        self.patchers = [
+            patch.object(app_module, 'story_generator', app_module.StoryGenerator(inline_image_prompt=True)),
+            patch.object(app_module, 'session_store', self.store),
+            patch.object(app_module, 'turns_in_flight', SingleFlight())
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+        self.client = app_module.app.test_client()
+        self.client.post('/initialize_story', json={'genre': 'fantasy', 'character': 'knight', 'mood': 'magical'})
+        self.cookie = self.client.get_cookie('session').value
+
+    def tearDown(self):
+        """Restore the real generator and store"""
+        for patcher in reversed(self.patchers):
+            patcher.stop()
+        self.openai_patcher.stop()
+        self.env_patcher.stop()
+
+    def same_browser(self):
+        """Another client carrying this browser's session cookie"""
+        client = app_module.app.test_client()
+        client.set_cookie('session', self.cookie)
+        return client
+
+    def session_id(self):
+        with self.client.session_transaction() as session:
+            return session['session_id']
+
+    def test_concurrent_duplicates(self):
+        """N identical concurrent requests make one upstream call and append the choice once"""
+        chat_calls = self.fake_openai.call_count('chat')
+        clients = [self.same_browser() for _ in range(5)]
+        responses = run_concurrently(5, lambda: clients.pop().post('/continue_story', json={'choice': 'Option 1'}))
+
+        self.assertEqual({response.status_code for response in responses}, {200})
+        self.assertEqual(len({response.get_data() for response in responses}), 1)
+        self.assertEqual(self.fake_openai.call_count('chat') - chat_calls, 1)
+        history = self.store.get(self.session_id())['history']
+        self.assertEqual([item['content'] for item in history].count('Option 1'), 1)
+
+    def test_retry_with_idempotency_key(self):
+        """A retry after the first attempt finished gets the stored response back"""
+        headers = {'Idempotency-Key': 'offer-1-0'}
+        first = self.client.post('/continue_story', json={'choice': 'Option 1'}, headers=headers)
+        chat_calls = self.fake_openai.call_count('chat')
+        with patch.object(app_module, 'turns_in_flight', SingleFlight(linger=0)):
+            retry = self.client.post('/continue_story', json={'choice': 'Option 1'}, headers=headers)
+
+        self.assertEqual(retry.get_json(), first.get_json())
+        self.assertEqual(self.fake_openai.call_count('chat'), chat_calls)
+        self.assertEqual(len(self.store.get(self.session_id())['history']), 3)
+
+        # A new key is a new turn
+        self.client.post('/continue_story', json={'choice': 'Option 1'}, headers={'Idempotency-Key': 'offer-2-0'})
+        self.assertEqual(len(self.store.get(self.session_id())['history']), 5)
+
+
+    def test_start_over_with_same_preferences(self):
+        """Starting over with the same preferences is a new story, not the last introduction replayed"""
+        chat_calls = self.fake_openai.call_count('chat')
+        story_ids = []
+        for _ in range(2):
+            self.client.post('/initialize_story', json={'genre': 'fantasy', 'character': 'knight', 'mood': 'magical',
+                                                        'use_cache': False})
+            story_ids.append(self.store.get(self.session_id())['story_id'])
+        self.assertEqual(self.fake_openai.call_count('chat') - chat_calls, 2)
+        self.assertNotEqual(story_ids[0], story_ids[1])
+
+    def test_stream_retry_with_idempotency_key(self):
+        """A retried stream request replays the finished turn instead of generating another"""
+        headers = {'Idempotency-Key': 'offer-1-0'}
+        first = self.client.post('/stream/continue_story', json={'choice': 'Option 1'}, headers=headers)
+        done = first.get_data(as_text=True).split("event: done\ndata: ")[1].split("\n\n")[0]
+        chat_calls = self.fake_openai.call_count('chat')
+
+        retry = self.client.post('/stream/continue_story', json={'choice': 'Option 1'}, headers=headers)
+        replayed = retry.get_data(as_text=True)
+        self.assertTrue(replayed.startswith("event: done\n"))
+        self.assertEqual(json.loads(replayed.split("data: ")[1])['continuation'], json.loads(done)['continuation'])
+        self.assertEqual(self.fake_openai.call_count('chat'), chat_calls)
+        self.assertEqual(len(self.store.get(self.session_id())['history']), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,214 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import time
+
+# Add the parent directory to the path so we can import the application modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from speculation import Speculator
+from session_store import MemorySessionStore
+from tests.fake_openai import FakeOpenAI
+
+with patch.dict(os.environ, {'OPENAI_API_KEY': 'fake-api-key'}):
+    import app as app_module
+
+CHOICES = ["Option 1", "Option 2", "Option 3"]
+
+
+def make_context():
+    return {'genre': 'fantasy', 'mood': 'magical', 'history': [{'role': 'assistant', 'content': 'Introduction.'}]}
+
+
+def wait_until_running(speculator, timeout=2):
+    """Wait for the session's first speculation to be picked up by a worker"""
+    first = next(iter(speculator._sessions["session"][1].values()))
+    deadline = time.monotonic() + timeout
+    while first.started_at is None:
+        if time.monotonic() > deadline:
+            raise AssertionError("Speculation did not start")
+        time.sleep(0.002)
+
+
+class TestSpeculator(unittest.TestCase):
+    """Test cases for speculative pre-generation of the next turn"""
+
+    def setUp(self):
+        """Route the generator through a fake OpenAI client"""
+        self.fake = FakeOpenAI(chat_latency=0.02)
+        self.patchers = [
+            patch('story_generator.load_dotenv'),
+            patch('story_generator.os.getenv', return_value="fake-api-key"),
+            patch('story_generator.openai', self.fake)
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+        from story_generator import StoryGenerator
+        self.generator = StoryGenerator()
+
+    def tearDown(self):
+        """Stop patches"""
+        for patcher in reversed(self.patchers):
+            patcher.stop()
+
+    def pick(self, speculator, context, choice):
+        """Record the user's choice and take the matching speculation"""
+        context['history'].append({'role': 'user', 'content': choice})
+        return speculator.take("session", context, choice)
+
+    def test_hit(self):
+        """The picked choice is served from the speculation and losers count as wasted tokens"""
+        speculator = Speculator(self.generator)
+        context = make_context()
+        speculator.speculate("session", context, CHOICES)
+        time.sleep(0.1)
+
+        text, choices = self.pick(speculator, context, "Option 2")
+        self.assertEqual(text, "This is a fake story response.")
+        self.assertEqual(choices, CHOICES)
+        speculator._executor.shutdown(wait=True)
+
+        stats = speculator.stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['hit_rate'], 1.0)
+        self.assertGreater(stats['latency_saved_seconds'], 0)
+        self.assertGreater(stats['wasted_tokens'], 0)
+
+    def test_story_moved_on(self):
+        """Speculations for an older state of the story are not served"""
+        speculator = Speculator(self.generator)
+        context = make_context()
+        speculator.speculate("session", context, CHOICES)
+        context['history'].append({'role': 'assistant', 'content': 'A command changed the story.'})
+
+        self.assertIsNone(self.pick(speculator, context, "Option 1"))
+        self.assertEqual(speculator.stats()['misses'], 1)
+
+    def test_unknown_choice(self):
+        """A typed-in choice that was not offered is a miss"""
+        speculator = Speculator(self.generator)
+        context = make_context()
+        speculator.speculate("session", context, CHOICES)
+        self.assertIsNone(self.pick(speculator, context, "Something else"))
+
+    def test_losers_cancelled(self):
+        """Speculations still queued when the choice is made never reach the API"""
+        speculator = Speculator(self.generator, workers=1)
+        context = make_context()
+        speculator.speculate("session", context, CHOICES)
+        wait_until_running(speculator)
+
+        self.pick(speculator, context, "Option 1")
+        speculator._executor.shutdown(wait=True)
+        self.assertEqual(self.fake.call_count('chat'), 1)
+
+    def test_queued_pick_cancelled(self):
+        """A picked speculation still queued behind others is cancelled rather than waited for"""
+        speculator = Speculator(self.generator, workers=1)
+        context = make_context()
+        speculator.speculate("session", context, CHOICES)
+        wait_until_running(speculator)
+
+        self.assertIsNone(self.pick(speculator, context, "Option 3"))
+        speculator._executor.shutdown(wait=True)
+        self.assertEqual(self.fake.call_count('chat'), 1)
+        self.assertEqual(speculator.stats()['misses'], 1)
+
+    def test_running_pick_bounded(self):
+        """A picked speculation that runs past max_wait is given up on and counted as wasted"""
+        self.fake.chat_latency = 0.5
+        speculator = Speculator(self.generator, max_wait=0.05)
+        context = make_context()
+        speculator.speculate("session", context, CHOICES)
+        wait_until_running(speculator)
+
+        start = time.monotonic()
+        self.assertIsNone(self.pick(speculator, context, "Option 1"))
+        self.assertLess(time.monotonic() - start, 0.4)
+        speculator._executor.shutdown(wait=True)
+        stats = speculator.stats()
+        self.assertEqual((stats['misses'], stats['timeouts']), (1, 1))
+        self.assertGreater(stats['wasted_tokens'], 0)
+
+    def test_waste_includes_prompts(self):
+        """Discarded speculations are charged their prompt and completion tokens"""
+        speculator = Speculator(self.generator)
+        context = make_context()
+        speculator.speculate("session", context, CHOICES)
+        for speculation in speculator._sessions["session"][1].values():
+            speculation.future.result()
+        speculator.speculate("session", context, [])  # Discards the finished three
+
+        # The fake reports ~4 characters per token for the prompt and for the completion
+        prompts = [sum(len(message['content']) for message in kwargs['messages']) // 4 for _, kwargs in self.fake.calls]
+        completion = len(self.fake.story_text) // 4
+        self.assertEqual(speculator.stats()['wasted_tokens'], sum(prompts) + 3 * completion)
+
+    def test_budget_window_carries_reservations(self):
+        """Speculations running when the budget window rolls over are charged to the new window"""
+        self.fake.chat_latency = 0.2
+        speculator = Speculator(self.generator, budget_window=0.05)
+        speculator.speculate("session", make_context(), CHOICES)
+        time.sleep(0.1)
+        speculator.speculate("other", make_context(), CHOICES[:1])  # Reserved in a new window
+        speculator._executor.shutdown(wait=True)
+        self.assertGreater(speculator._window_tokens, 0)
+        self.assertEqual(speculator._reserved, 0)
+
+    def test_token_budget(self):
+        """Choices beyond the token budget are not speculated on"""
+        speculator = Speculator(self.generator, token_budget=2 * Speculator.RESERVED_TOKENS)
+        speculator.speculate("session", make_context(), CHOICES)
+        stats = speculator.stats()
+        self.assertEqual(stats['started'], 2)
+        self.assertEqual(stats['skipped'], 1)
+
+
+class TestSpeculativeRoutes(unittest.TestCase):
+    """Test that /continue_story serves speculated turns"""
+
+    def setUp(self):
+        """Route the app through a fake OpenAI client, a fresh store and a speculator"""
+        self.env_patcher = patch.dict(os.environ, {'OPENAI_API_KEY': 'fake-api-key'})
+        self.env_patcher.start()
+        self.openai_patcher = patch('story_generator.openai', FakeOpenAI())
+        self.openai_patcher.start()
+        generator = app_module.StoryGenerator()
+        self.speculator = Speculator(generator)
+        self.patchers = [
+            patch.object(app_module, 'story_generator', generator),
+            patch.object(app_module, 'session_store', MemorySessionStore()),
+            patch.object(app_module, 'speculator', self.speculator)
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+        self.client = app_module.app.test_client()
+
+    def tearDown(self):
+        """Restore the real generator, store and speculator"""
+        self.speculator._executor.shutdown(wait=True)
+        for patcher in reversed(self.patchers):
+            patcher.stop()
+        self.openai_patcher.stop()
+        self.env_patcher.stop()
+
+    def test_continue_served_from_speculation(self):
+        """Picking an offered choice is a speculation hit and the history stays consistent"""
+        self.client.post('/initialize_story', json={'genre': 'fantasy', 'character': 'knight', 'mood': 'magical'})
+        response = self.client.post('/continue_story', json={'choice': 'Option 1'})
+        self.assertEqual(response.get_json()['continuation'], "This is a fake story response.")
+
+        stats = self.client.get('/speculation_stats').get_json()
+        self.assertTrue(stats['enabled'])
+        self.assertEqual(stats['hits'], 1)
+
+        with self.client.session_transaction() as sess:
+            context = app_module.session_store.get(sess['session_id'])
+        self.assertEqual([item['role'] for item in context['history']], ['assistant', 'user', 'assistant'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import subprocess
+
+# Add the parent directory to the path so we can import the application modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lazy_import import LazyModule
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TestLazyModule(unittest.TestCase):
+    """Test cases for modules imported on first use"""
+
+    def test_attributes_set_before_import_are_applied(self):
+        """Configuration set on the proxy reaches the module once it is imported"""
+        module = LazyModule('json')
+        module.sentinel = 42
+        self.assertEqual(repr(module), "<lazy module 'json' (not loaded)>")
+        self.assertEqual(module.dumps([1]), "[1]")
+        self.assertEqual(sys.modules['json'].sentinel, 42)
+        del sys.modules['json'].sentinel
+
+    def test_missing_module_fails_on_use(self):
+        """A missing module only raises once it is needed"""
+        module = LazyModule('not_an_installed_module')
+        with self.assertRaises(ImportError):
+            module.anything
+
+
+class TestStartup(unittest.TestCase):
+    """Test that importing the app leaves the heavy client libraries for the first request"""
+
+    def test_import_app_is_lazy(self):
+        """`import app` builds the generator without importing openai, requests or tiktoken"""
+        probe = "import sys, app; print(sorted(m for m in ('openai', 'requests', 'tiktoken') if m in sys.modules))"
+        with patch.dict(os.environ, {'OPENAI_API_KEY': 'fake-api-key', 'SECRET_KEY': 'test-secret'}):
+            result = subprocess.run([sys.executable, '-c', probe], cwd=ROOT, capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip(), "[]")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -16,9 +16,9 @@ class MockOpenAI:
 # Add the parent directory to the path so we can import the story_generator
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-# Mock the openai module
-sys.modules['openai'] = MagicMock()
-sys.modules['openai'].chat.completions.create = MockOpenAI.ChatCompletion.create
+# Mock the openai module; story_generator imports it on first use, so it is patched in for each test
+mock_openai = MagicMock()
+mock_openai.chat.completions.create = MockOpenAI.ChatCompletion.create
 
 # Now import the StoryGenerator
 from story_generator import StoryGenerator
@@ -37,10 +37,14 @@ class TestStoryGenerator(unittest.TestCase):
         self.mock_getenv = self.getenv_patcher.start()
         self.mock_getenv.return_value = "fake-api-key"
         
+        self.openai_patcher = patch('story_generator.openai', mock_openai)
+        self.openai_patcher.start()
+        
     def tearDown(self):
         """Clean up after tests"""
         self.dotenv_patcher.stop()
         self.getenv_patcher.stop()
+        self.openai_patcher.stop()
     
     def test_generate_introduction(self):
         """Test the generate_introduction method"""
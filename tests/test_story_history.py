@@ -0,0 +1,76 @@
+import unittest
+import sys
+import os
+import tempfile
+
+# Add the parent directory to the path so we can import the application modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from story_history import StoryHistory, Turn
+from session_store import SQLiteSessionStore
+
+
+def turns(count):
+    return [{'role': 'assistant' if i % 2 == 0 else 'user', 'content': f"Turn {i}"} for i in range(count)]
+
+
+class TestStoryHistory(unittest.TestCase):
+    """Test cases for the compact story history"""
+
+    def test_reads_like_a_list_of_dicts(self):
+        """Indexing, slicing, iteration and equality match the list of dicts it replaces"""
+        history = StoryHistory(turns(3))
+        self.assertEqual(len(history), 3)
+        self.assertEqual(history[-1]['content'], "Turn 2")
+        self.assertEqual(history[0].get('role'), 'assistant')
+        self.assertEqual([item['role'] for item in history[:2]], ['assistant', 'user'])
+        self.assertEqual(history, turns(3))
+        self.assertEqual(StoryHistory(), [])
+        self.assertEqual(history.role_count('assistant'), 2)
+        with self.assertRaises(KeyError):
+            history[0]['missing']
+
+    def test_incremental_messages(self):
+        """The message list grows with the history and matches the turns"""
+        history = StoryHistory()
+        for i, item in enumerate(turns(6)):
+            history.append(item)
+            self.assertEqual(history.messages(), turns(i + 1))
+        self.assertEqual(StoryHistory().messages(), [])
+
+    def test_tokens_are_counted_once(self):
+        """Each turn is run through the token counter a single time"""
+        counted = []
+
+        def count(text):
+            counted.append(text)
+            return len(text)
+
+        history = StoryHistory(turns(4))
+        self.assertEqual(history.tokens(count), [6, 6, 6, 6])
+        self.assertEqual(history.tokens(count, 2), [6, 6])
+        self.assertEqual(len(counted), 4)
+
+    def test_copy_is_independent(self):
+        """Appending to a copy leaves the original and its rendering alone"""
+        history = StoryHistory(turns(2))
+        history.messages()
+        branch = history.copy()
+        branch.append(Turn('user', "Branch"))
+        self.assertEqual(len(history), 2)
+        self.assertEqual(history.messages(), turns(2))
+        self.assertEqual(branch.messages(), turns(2) + [{'role': 'user', 'content': "Branch"}])
+
+    def test_serializes_through_the_session_store(self):
+        """The SQLite session store saves the history as plain messages"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            store = SQLiteSessionStore(os.path.join(tmpdir, "sessions.db"))
+            history = StoryHistory(turns(2))
+            history.messages()
+            history.append({'role': 'assistant', 'content': "Turn 2"})
+            store.set("a", {'history': history})
+            self.assertEqual(store.get("a")['history'], turns(3))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+import os
+import json
+import shutil
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def jsdom_available():
+    if not shutil.which('node'):
+        return False
+    result = subprocess.run(['node', '-e', "require.resolve('jsdom')"], cwd=ROOT, capture_output=True)
+    return result.returncode == 0
+
+
+@unittest.skipUnless(shutil.which('node'), "node is not installed")
+class TestStoryLog(unittest.TestCase):
+    """Run the windowed story log's node tests against the DOM stand-in in tests/fake_dom.js"""
+
+    def test_story_log(self):
+        """Window math, spacers, node recycling, batching into frames and transient entries"""
+        result = subprocess.run(['node', '--test', os.path.join('tests', 'story_log.test.js')],
+                                cwd=ROOT, capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+
+
+@unittest.skipUnless(jsdom_available(), "node with jsdom is not installed")
+class TestStoryLogBenchmark(unittest.TestCase):
+    """Test that the windowed story log keeps the page's DOM small however long the story gets"""
+
+    def test_long_story_stays_small(self):
+        """A 200-turn story renders a bounded number of nodes, also while scrolling through it"""
+        result = subprocess.run(['node', os.path.join('benchmarks', 'bench_story_render.js'), '--turns', '200', '--json'],
+                                cwd=ROOT, capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        summary = json.loads(result.stdout)
+        self.assertGreater(summary['append']['nodes'], 1000)
+        self.assertLess(summary['story_log']['nodes'], 100)
+        self.assertLess(summary['story_log']['max_scroll_nodes'], 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
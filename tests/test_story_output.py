@@ -0,0 +1,137 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+
+# Add the parent directory to the path so we can import the application modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from streaming import ChoicesStreamParser, parse_story_output
+from tests.fake_openai import FakeOpenAI
+
+
+class TestParseStoryOutput(unittest.TestCase):
+    """Test cases for parsing complete responses, including malformed ones"""
+
+    def test_legacy_array(self):
+        """The plain CHOICES array still parses"""
+        output = parse_story_output("Story text.\n\nCHOICES: [\"A\", \"B\", \"C\"]")
+        self.assertEqual(output, ("Story text.", ["A", "B", "C"], None))
+
+    def test_object_trailer(self):
+        """A JSON object trailer carries the choices and the image prompt"""
+        output = parse_story_output('Story.\nCHOICES: {"choices": ["A", "B"], "image_prompt": " A dark tower "}')
+        self.assertEqual(output, ("Story.", ["A", "B"], "A dark tower"))
+
+    def test_code_fence_and_emphasis(self):
+        """Markdown around the marker or the JSON is ignored"""
+        output = parse_story_output('Story.\n**Choices:**\n```json\n{"choices": ["A", "B"], "image_prompt": "Ship"}\n```')
+        self.assertEqual(output, ("Story.", ["A", "B"], "Ship"))
+
+    def test_text_after_json(self):
+        """Commentary after the JSON value does not break parsing"""
+        output = parse_story_output('Story.\nCHOICES: ["A", "B"] I hope you enjoy these!')
+        self.assertEqual(output.choices, ["A", "B"])
+
+    def test_choices_word_in_story(self):
+        """A "choices:" phrase inside the story is not mistaken for the marker"""
+        output = parse_story_output('She had two choices: run or hide.\n\nCHOICES: ["Run", "Hide"]')
+        self.assertEqual(output.text, "She had two choices: run or hide.")
+        self.assertEqual(output.choices, ["Run", "Hide"])
+
+    def test_missing_marker(self):
+        """A trailing JSON line without the marker is still recognized"""
+        output = parse_story_output('Story.\n{"choices": ["A", "B"], "image_prompt": "Cave"}')
+        self.assertEqual(output, ("Story.", ["A", "B"], "Cave"))
+
+    def test_numbered_list(self):
+        """A numbered list after the marker becomes the choices"""
+        output = parse_story_output("Story.\nCHOICES:\n1. Open the door\n2. Walk away")
+        self.assertEqual(output.choices, ["Open the door", "Walk away"])
+
+    def test_truncated_json(self):
+        """A trailer cut off mid-JSON leaves the text clean and the choices unset"""
+        output = parse_story_output('Story.\nCHOICES: {"choices": ["A", "B')
+        self.assertEqual(output, ("Story.", None, None))
+
+    def test_invalid_fields(self):
+        """Wrongly typed fields are dropped instead of leaking into the page"""
+        output = parse_story_output('Story.\nCHOICES: {"choices": "A or B", "image_prompt": 42}')
+        self.assertEqual(output, ("Story.", None, None))
+
+        output = parse_story_output('Story.\nCHOICES: ["A", "", null, {"x": 1}, "B"]')
+        self.assertEqual(output.choices, ["A", "B"])
+
+    def test_image_prompt_without_choices(self):
+        """An image prompt is kept even when the choices are unusable"""
+        output = parse_story_output('Story.\nCHOICES: {"choices": [], "image_prompt": "Castle"}')
+        self.assertEqual(output, ("Story.", None, "Castle"))
+
+    def test_no_trailer(self):
+        """Plain text is returned unchanged"""
+        self.assertEqual(parse_story_output("  Just a story.  "), ("Just a story.", None, None))
+
+    def test_stream_parser_image_prompt(self):
+        """The streaming parser picks up the image prompt from an object trailer"""
+        parser = ChoicesStreamParser()
+        for delta in ['Story.\nCHOI', 'CES: {"choices": ["A"', ', "B"], "image_prompt": "Forest"}']:
+            parser.feed(delta)
+        parser.close()
+        self.assertEqual(parser.text, "Story.")
+        self.assertEqual(parser.choices, ["A", "B"])
+        self.assertEqual(parser.image_prompt, "Forest")
+
+
+class TestInlineImagePrompt(unittest.TestCase):
+    """Test that the image prompt rides along with the story completion"""
+
+    def setUp(self):
+        """Route the generator through a fake OpenAI client"""
+        self.fake = FakeOpenAI()
+        self.patchers = [
+            patch('story_generator.load_dotenv'),
+            patch('story_generator.os.getenv', return_value="fake-api-key"),
+            patch('story_generator.openai', self.fake)
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+        from story_generator import StoryGenerator
+        self.StoryGenerator = StoryGenerator
+        self.context = {
+            'genre': 'fantasy',
+            'mood': 'magical',
+            'history': [{'role': 'assistant', 'content': 'Story introduction.'}]
+        }
+
+    def tearDown(self):
+        """Stop patches"""
+        for patcher in reversed(self.patchers):
+            patcher.stop()
+
+    def test_two_calls_per_turn(self):
+        """With the inline image prompt a turn costs one chat and one image call"""
+        generator = self.StoryGenerator(inline_image_prompt=True)
+        text, choices, image_url = generator.generate_continuation(self.context, "Go on")
+        self.assertEqual(text, "This is a fake story response.")
+        self.assertEqual(choices, ["Option 1", "Option 2", "Option 3"])
+        self.assertEqual(self.fake.call_count('chat'), 1)
+        self.assertEqual(self.fake.call_count('images'), 1)
+        self.assertTrue(self.fake.calls[1][1]['prompt'].startswith("A misty forest at dawn"))
+
+    def test_deferred_illustration_reuses_prompt(self):
+        """An image generated later (e.g. by a background worker) still uses the inline prompt"""
+        generator = self.StoryGenerator(inline_image_prompt=True)
+        text, choices, image_url = generator.generate_continuation(self.context, "Go on", include_image=False)
+        generator.generate_illustration('fantasy', 'knight', 'magical', text)
+        self.assertEqual(self.fake.call_count('chat'), 1)
+
+    def test_fallback_to_separate_prompt(self):
+        """Without an image prompt in the response, a separate completion writes one"""
+        generator = self.StoryGenerator()
+        generator.generate_continuation(self.context, "Go on")
+        self.assertEqual(self.fake.call_count('chat'), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,178 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import tempfile
+
+# Add the parent directory to the path so we can import the application modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from story_store import SQLiteStoryStore
+from session_store import MemorySessionStore
+from tests.fake_openai import FakeOpenAI
+
+with patch.dict(os.environ, {'OPENAI_API_KEY': 'fake-api-key'}):
+    import app as app_module
+
+
+def story(story_id, turns):
+    return {
+        'genre': 'fantasy', 'character': 'knight', 'mood': 'magical', 'story_id': story_id,
+        'history': [{'role': 'assistant' if i % 2 == 0 else 'user', 'content': f"Turn {i}"} for i in range(turns)]
+    }
+
+
+class TestStoryStore(unittest.TestCase):
+    """Test cases for the SQLite story archive"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.store = SQLiteStoryStore(os.path.join(self.tmpdir.name, "stories.db"))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_appends_only_new_turns(self):
+        """Saving a turn inserts the new rows and leaves earlier ones alone"""
+        context = story("s1", 1)
+        self.store.append("owner", context, choices=["A", "B"])
+        context['history'] += [{'role': 'user', 'content': "A"}, {'role': 'assistant', 'content': "Turn 2"}]
+        context['mood'] = 'tense'
+        self.store.append("owner", context, choices=["C"], image_url="/images/x")
+
+        turns = self.store.get_turns("s1")
+        self.assertEqual([turn['content'] for turn in turns], ["Turn 0", "A", "Turn 2"])
+        self.assertEqual(turns[0]['choices'], ["A", "B"])
+        self.assertEqual((turns[2]['choices'], turns[2]['image_url']), (["C"], "/images/x"))
+        self.assertEqual(self.store.get_story("s1")['mood'], 'tense')
+        self.assertEqual(self.store.get_story("s1")['turns'], 3)
+
+        self.store.append("owner", context)  # Nothing new
+        self.assertEqual(len(self.store.get_turns("s1")), 3)
+
+    def test_connects_on_first_use(self):
+        """The schema is created without leaving a connection open for a preloading server to fork"""
+        self.assertIsNone(getattr(self.store._local, 'connection', None))
+        self.assertEqual(self.store.list_stories("owner"), [])
+
+    def test_pagination(self):
+        """Stories list newest first and turns read in pages"""
+        for i in range(5):
+            self.store.append("owner", story(f"s{i}", 7))
+        self.store.append("someone else", story("other", 1))
+
+        first = self.store.list_stories("owner", limit=3)
+        self.assertEqual([s['id'] for s in first], ["s4", "s3", "s2"])
+        rest = self.store.list_stories("owner", limit=3, before=first[-1]['created_at'])
+        self.assertEqual([s['id'] for s in rest], ["s1", "s0"])
+
+        page = self.store.get_turns("s0", after=2, limit=3)
+        self.assertEqual([turn['turn'] for turn in page], [3, 4, 5])
+
+    def test_load_context(self):
+        """A stored story rebuilds the context it was saved from"""
+        original = story("s1", 3)
+        self.store.append("owner", original, choices=["Go"])
+        context, latest = self.store.load_context("s1")
+        self.assertEqual(context['history'], original['history'])
+        self.assertEqual(latest['choices'], ["Go"])
+        self.assertEqual(self.store.load_context("missing"), (None, None))
+
+
+class TestStoryRoutes(unittest.TestCase):
+    """Test listing, fetching and resuming stories through the app"""
+
+    def setUp(self):
+        """Route the app through a fake OpenAI client, a fresh session store and a story store"""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.env_patcher = patch.dict(os.environ, {'OPENAI_API_KEY': 'fake-api-key'})
+        self.env_patcher.start()
+        self.openai_patcher = patch('story_generator.openai', FakeOpenAI())
+        self.openai_patcher.start()
+        self.session_store = MemorySessionStore()
+        self.patchers = [
+            patch.object(app_module, 'story_generator', app_module.StoryGenerator()),
+            patch.object(app_module, 'session_store', self.session_store),
+            patch.object(app_module, 'story_store', SQLiteStoryStore(os.path.join(self.tmpdir.name, "s.db")))
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+        self.client = app_module.app.test_client()
+
+    def tearDown(self):
+        """Restore the real generator and stores"""
+        for patcher in reversed(self.patchers):
+            patcher.stop()
+        self.openai_patcher.stop()
+        self.env_patcher.stop()
+        self.tmpdir.cleanup()
+
+    def play(self, genre):
+        self.client.post('/initialize_story', json={'genre': genre, 'character': 'knight', 'mood': 'magical'})
+        self.client.post('/continue_story', json={'choice': 'Option 1'})
+
+    def test_list_fetch_and_resume(self):
+        """Finished turns are listed, paged and can be resumed"""
+        self.play('fantasy')
+        self.play('mystery')
+
+        stories = self.client.get('/stories').get_json()['stories']
+        self.assertEqual([s['genre'] for s in stories], ['mystery', 'fantasy'])
+        story_id = stories[1]['id']
+
+        page = self.client.get(f'/stories/{story_id}?limit=2').get_json()
+        self.assertEqual([turn['role'] for turn in page['turns']], ['assistant', 'user'])
+        rest = self.client.get(f"/stories/{story_id}?after={page['next_after']}").get_json()
+        self.assertEqual(len(rest['turns']), 1)
+        self.assertIsNone(rest['next_after'])
+
+        resumed = self.client.post(f'/stories/{story_id}/resume').get_json()
+        self.assertEqual(resumed['genre'], 'fantasy')
+        self.assertEqual(resumed['choices'], ["Option 1", "Option 2", "Option 3"])
+        self.client.post('/continue_story', json={'choice': 'Option 2'})
+        self.assertEqual(self.client.get(f'/stories/{story_id}').get_json()['turns'][-2]['content'], 'Option 2')
+
+    def test_start_over_is_a_new_story(self):
+        """Starting over records a new story and leaves the old one as it was"""
+        self.play('fantasy')
+        self.client.post('/modify_story', json={'command': 'Start over with mystery genre'})
+        self.client.post('/continue_story', json={'choice': 'Option 2'})
+
+        stories = self.client.get('/stories').get_json()['stories']
+        self.assertEqual([s['genre'] for s in stories], ['mystery', 'fantasy'])
+        new_turns = self.client.get(f"/stories/{stories[0]['id']}").get_json()['turns']
+        self.assertEqual([turn['role'] for turn in new_turns], ['assistant', 'user', 'assistant'])
+        old_turns = self.client.get(f"/stories/{stories[1]['id']}").get_json()['turns']
+        self.assertEqual(len(old_turns), 3)
+        self.assertEqual(old_turns[1]['content'], 'Option 1')
+
+        resumed = self.client.post(f"/stories/{stories[1]['id']}/resume").get_json()
+        self.assertEqual(resumed['genre'], 'fantasy')
+        self.client.post('/continue_story', json={'choice': 'Option 3'})
+        self.assertEqual(self.client.get(f"/stories/{stories[1]['id']}").get_json()['turns'][-2]['content'], 'Option 3')
+        resumed = self.client.post(f"/stories/{stories[0]['id']}/resume").get_json()
+        self.assertEqual(resumed['genre'], 'mystery')
+        self.assertEqual(resumed['continuation'], new_turns[-1]['content'])
+
+    def test_other_browsers_cannot_read(self):
+        """Stories are only visible to the browser that created them"""
+        self.play('fantasy')
+        story_id = self.client.get('/stories').get_json()['stories'][0]['id']
+        stranger = app_module.app.test_client()
+        self.assertEqual(stranger.get(f'/stories/{story_id}').status_code, 404)
+        self.assertEqual(stranger.post(f'/stories/{story_id}/resume').status_code, 404)
+        self.assertEqual(stranger.get('/stories').get_json()['stories'], [])
+
+    def test_survives_session_store_loss(self):
+        """A story continues after the session store forgot it"""
+        self.play('fantasy')
+        self.session_store._entries.clear()
+        response = self.client.post('/continue_story', json={'choice': 'Option 3'})
+        self.assertEqual(response.status_code, 200)
+        story_id = self.client.get('/stories').get_json()['stories'][0]['id']
+        self.assertEqual(len(self.client.get(f'/stories/{story_id}').get_json()['turns']), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
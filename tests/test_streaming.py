@@ -0,0 +1,161 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import json
+import time
+
+# Add the parent directory to the path so we can import the application modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from streaming import ChoicesStreamParser, parse_story_output, sse_event
+from tests.fake_openai import FakeOpenAI
+
+with patch.dict(os.environ, {'OPENAI_API_KEY': 'fake-api-key'}):
+    import app as app_module
+
+
+def feed_all(parser, deltas):
+    """Feed deltas to the parser and return the text it released"""
+    released = "".join(parser.feed(delta) for delta in deltas)
+    return released + parser.close()
+
+
+def parse_events(body):
+    """Split an SSE body into (event, data) pairs"""
+    events = []
+    for frame in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in frame.split("\n"))
+        events.append((lines['event'], json.loads(lines['data'])))
+    return events
+
+
+class TestChoicesStreamParser(unittest.TestCase):
+    """Test cases for incremental parsing of the CHOICES trailer"""
+
+    def test_marker_split_across_deltas(self):
+        """A marker split over several deltas is never released as story text"""
+        parser = ChoicesStreamParser()
+        released = feed_all(parser, ["Once upon a time.\n\nCHO", "IC", "ES: [\"Run\", ", "\"Hide\"]"])
+        self.assertEqual(released, "Once upon a time.\n\n")
+        self.assertEqual(parser.text, "Once upon a time.")
+        self.assertEqual(parser.choices, ["Run", "Hide"])
+
+    def test_choices_parsed_before_close(self):
+        """Choices are available as soon as the closing bracket arrives"""
+        parser = ChoicesStreamParser()
+        parser.feed("Story.\nCHOICES: [\"A\", \"B [")
+        parser.feed("maybe]\", \"C\"]")
+        self.assertEqual(parser.choices, ["A", "B [maybe]", "C"])
+
+    def test_no_marker(self):
+        """Text without a trailer is released in full and has no choices"""
+        parser = ChoicesStreamParser()
+        released = feed_all(parser, ["Just a story", " with a CHOICE word."])
+        self.assertEqual(released, "Just a story with a CHOICE word.")
+        self.assertIsNone(parser.choices)
+
+    def test_malformed_trailer(self):
+        """An unparseable trailer leaves the choices unset"""
+        parser = ChoicesStreamParser()
+        feed_all(parser, ["Story.\nCHOICES: Run, Hide"])
+        self.assertEqual(parser.text, "Story.")
+        self.assertIsNone(parser.choices)
+
+    def test_lenient_marker_split_across_deltas(self):
+        """Bold and lowercase markers are held back like the exact one and split like complete responses"""
+        deltas = ["Once upon a time.\n\n**Cho", "ices:*", "* [\"Run\", \"Hide\"]"]
+        parser = ChoicesStreamParser()
+        released = feed_all(parser, deltas)
+        self.assertEqual(released, "Once upon a time.\n\n")
+        self.assertEqual(parser.text, parse_story_output("".join(deltas)).text)
+        self.assertEqual(parser.choices, ["Run", "Hide"])
+
+    def test_choices_word_in_story(self):
+        """Text after a "choices:" that turns out to be story is released, not dropped"""
+        deltas = ["She had two choices: run", " or hide.\n\nChoices: ", "[\"Run\", \"Hide\"]"]
+        parser = ChoicesStreamParser()
+        released = feed_all(parser, deltas)
+        self.assertEqual(released.strip(), "She had two choices: run or hide.")
+        self.assertEqual(parser.choices, ["Run", "Hide"])
+
+        parser = ChoicesStreamParser()
+        released = feed_all(parser, ["A tale of choices: none", " at all."])
+        self.assertEqual(released, "A tale of choices: none at all.")
+        self.assertIsNone(parser.choices)
+
+    def test_sse_event(self):
+        """Events are framed with a JSON payload and a blank line"""
+        self.assertEqual(sse_event('delta', {'text': 'Hi'}), 'event: delta\ndata: {"text": "Hi"}\n\n')
+
+
+class TestStreamingRoutes(unittest.TestCase):
+    """Test the Server-Sent Events story routes against a fake streaming client"""
+
+    def setUp(self):
+        """Route the app through a fake OpenAI client that streams slowly"""
+        self.env_patcher = patch.dict(os.environ, {'OPENAI_API_KEY': 'fake-api-key'})
+        self.env_patcher.start()
+        self.fake_openai = FakeOpenAI(stream_chunk_delay=0.02)
+        self.openai_patcher = patch('story_generator.openai', self.fake_openai)
+        self.openai_patcher.start()
+        self.generator_patcher = patch.object(app_module, 'story_generator', app_module.StoryGenerator())
+        self.generator_patcher.start()
+
+        self.client = app_module.app.test_client()
+
+    def tearDown(self):
+        """Restore the real generator"""
+        self.generator_patcher.stop()
+        self.openai_patcher.stop()
+        self.env_patcher.stop()
+
+    def test_stream_generator(self):
+        """The generator yields deltas followed by the parsed turn"""
+        events = list(app_module.story_generator.stream_introduction("fantasy", "knight", "magical"))
+        deltas = "".join(e['text'] for e in events if e['type'] == 'delta')
+        self.assertNotIn("CHOICES", deltas)
+        self.assertEqual(events[-1], {
+            'type': 'done',
+            'text': "This is a fake story response.",
+            'choices': ["Option 1", "Option 2", "Option 3"]
+        })
+
+    def test_first_delta_before_completion(self):
+        """The first text delta reaches the client well before the completion finishes"""
+        start = time.monotonic()
+        response = self.client.post('/stream/initialize_story', buffered=False, json={
+            'genre': 'fantasy', 'character': 'brave knight', 'mood': 'adventurous'
+        })
+        self.assertEqual(response.mimetype, 'text/event-stream')
+
+        chunks = response.iter_encoded()
+        first = next(chunks).decode()
+        time_to_first_delta = time.monotonic() - start
+        body = first + b"".join(chunks).decode()
+        total = time.monotonic() - start
+
+        self.assertTrue(first.startswith("event: delta"))
+        self.assertLess(time_to_first_delta, total / 2)
+
+        events = parse_events(body)
+        done = [data for event, data in events if event == 'done'][0]
+        self.assertEqual(done['introduction'], "This is a fake story response.")
+        self.assertEqual(done['choices'], ["Option 1", "Option 2", "Option 3"])
+        self.assertEqual(events[-1], ('image', {'image_url': self.fake_openai.image_url}))
+
+    def test_streamed_turn_joins_history(self):
+        """Streamed turns are recorded in the server-side story history"""
+        self.client.post('/stream/initialize_story', json={
+            'genre': 'fantasy', 'character': 'brave knight', 'mood': 'adventurous'
+        }).get_data()
+        self.client.post('/stream/continue_story', json={'choice': 'Option 1'}).get_data()
+
+        with self.client.session_transaction() as sess:
+            history = app_module.session_store.get(sess['session_id'])['history']
+        self.assertEqual([item['role'] for item in history], ['assistant', 'user', 'assistant'])
+        self.assertEqual(history[0]['content'], "This is a fake story response.")
+
+
+if __name__ == '__main__':
+    unittest.main()